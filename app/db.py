@@ -43,5 +43,28 @@ class ReplicationReservation(Base):
     status = Column(String(32), nullable=False, default="active", index=True)
 
 
+class ReplicationJob(Base):
+    __tablename__ = "replication_jobs"
+    id = Column(String(64), primary_key=True, index=True)
+    manifest = Column(Text, nullable=False)
+    status = Column(String(32), nullable=False, default="queued", index=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class ReplicationTask(Base):
+    __tablename__ = "replication_tasks"
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(64), nullable=False, index=True)
+    node_id = Column(String(128), nullable=False, index=True)
+    sha256 = Column(String(64), nullable=False)
+    status = Column(String(32), nullable=False, default="pending", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, index=True)
+    last_status = Column(String(32), nullable=True)
+    detail = Column(Text, nullable=True)
+    updated_at = Column(DateTime, nullable=False)
+
+
 def init_db():
     Base.metadata.create_all(bind=engine)
@@ -0,0 +1,129 @@
+import asyncio
+import codecs
+import logging
+import threading
+import time
+from typing import Any, Callable
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+
+from .docker_manager import EXEC_STREAM_OUTPUT_MAX_BYTES
+
+logger = logging.getLogger("vpk_uploader")
+
+EXEC_STREAM_CREDITS = 16
+
+
+async def stream_container_exec(websocket: WebSocket, manager_factory: Callable[[], Any], container_id: str, source: str) -> None:
+    """Run one command and relay its output as JSON frames.
+
+    The client sends ``{"command": ...}`` first and may send
+    ``{"type": "cancel"}`` at any time. The reader thread only pulls the next
+    frame from dockerd after the previous one was handed to the socket
+    (``EXEC_STREAM_CREDITS`` frames in flight), so a slow client slows the
+    command's output instead of growing memory.
+    """
+    try:
+        payload = await websocket.receive_json()
+    except (WebSocketDisconnect, ValueError):
+        return
+    command = str(payload.get("command", "")) if isinstance(payload, dict) else ""
+    try:
+        session = await asyncio.to_thread(manager_factory().open_exec, container_id, command)
+    except (ValueError, HTTPException) as exc:
+        await websocket.send_json({"type": "error", "detail": str(exc.detail) if isinstance(exc, HTTPException) else str(exc)})
+        await websocket.close()
+        return
+    except Exception as exc:
+        await websocket.send_json({"type": "error", "detail": f"容器命令执行失败：{exc}"})
+        await websocket.close()
+        return
+
+    loop = asyncio.get_running_loop()
+    frames: asyncio.Queue = asyncio.Queue()
+    credits = threading.Semaphore(EXEC_STREAM_CREDITS)
+
+    def deliver(frame) -> None:
+        try:
+            loop.call_soon_threadsafe(frames.put_nowait, frame)
+        except RuntimeError:
+            pass
+
+    def pump() -> None:
+        try:
+            for frame in session.frames():
+                while not credits.acquire(timeout=1):
+                    if session.cancelled:
+                        return
+                deliver(frame)
+        except Exception as exc:
+            if not session.cancelled:
+                deliver(("error", f"容器命令执行失败：{exc}"))
+        finally:
+            deliver(None)
+
+    async def watch_client() -> None:
+        try:
+            while True:
+                message = await websocket.receive_json()
+                if isinstance(message, dict) and message.get("type") == "cancel":
+                    break
+        except (WebSocketDisconnect, ValueError, RuntimeError):
+            pass
+        if not reader.done():
+            await asyncio.to_thread(session.cancel)
+
+    reader = asyncio.create_task(asyncio.to_thread(pump))
+    watcher = asyncio.create_task(watch_client())
+    decoders = {name: codecs.getincrementaldecoder("utf-8")("replace") for name in ("stdout", "stderr")}
+    sent = 0
+    truncated = False
+    connected = True
+    try:
+        await websocket.send_json({"type": "started", "timeout_seconds": session.timeout_seconds})
+        while True:
+            frame = await frames.get()
+            if frame is None:
+                break
+            stream, data = frame
+            if stream != "error":
+                credits.release()
+            if not connected or truncated:
+                continue
+            try:
+                if stream == "error":
+                    await websocket.send_json({"type": "error", "detail": data})
+                    continue
+                remaining = EXEC_STREAM_OUTPUT_MAX_BYTES - sent
+                if len(data) > remaining:
+                    data = data[:remaining]
+                    truncated = True
+                    asyncio.create_task(asyncio.to_thread(session.cancel))
+                sent += len(data)
+                text = decoders[stream].decode(data)
+                if text:
+                    await websocket.send_json({"type": stream, "data": text})
+            except (WebSocketDisconnect, RuntimeError):
+                connected = False
+                asyncio.create_task(asyncio.to_thread(session.cancel))
+        await reader
+        exit_code = await asyncio.to_thread(session.exit_code)
+        logger.info("%s docker exec stream container=%s exit=%s bytes=%s", source, container_id, exit_code, sent)
+        if connected:
+            for stream, decoder in decoders.items():
+                tail = decoder.decode(b"", final=True)
+                if tail:
+                    await websocket.send_json({"type": stream, "data": tail})
+            await websocket.send_json({
+                "type": "exit",
+                "exit_code": exit_code,
+                "cancelled": session.cancelled and not truncated,
+                "truncated": truncated,
+                "bytes": sent,
+                "duration_ms": int((time.monotonic() - session.started) * 1000),
+            })
+            await websocket.close()
+    except (WebSocketDisconnect, RuntimeError):
+        await asyncio.to_thread(session.cancel)
+    finally:
+        watcher.cancel()
@@ -1,12 +1,46 @@
+import io
+import logging
 import posixpath
+import secrets
+import tarfile
+import threading
 import time
+from collections import deque
+from datetime import datetime, timezone
 from concurrent.futures import ThreadPoolExecutor
-from typing import Optional
+from typing import Any, Callable, Iterator, Optional
 
 
 COMMAND_MAX_LENGTH = 1000
 COMMAND_OUTPUT_MAX_BYTES = 64 * 1024
 COMMAND_TIMEOUT_SECONDS = 15
+CONTAINER_EVENT_ACTIONS = {"create", "start", "stop", "die", "kill", "restart", "pause", "unpause", "destroy", "oom", "rename"}
+RECENT_EVENT_LIMIT = 200
+METADATA_RESYNC_SECONDS = 300
+EXEC_STREAM_TIMEOUT_SECONDS = 600
+EXEC_STREAM_OUTPUT_MAX_BYTES = 16 * 1024 * 1024
+FILE_LIST_DEFAULT_LIMIT = 1000
+FILE_LIST_MAX_LIMIT = 5000
+FILE_LIST_MAX_DEPTH = 8
+FILE_LIST_CACHE_SECONDS = 10
+FILE_LIST_CACHE_ENTRIES = 256
+DOWNLOAD_CHUNK_BYTES = 256 * 1024
+DOWNLOAD_TAR_OVERHEAD_BYTES = 16 * 1024 * 1024
+# dockerd 返回的 mode 是 Go 的 os.FileMode：目录、链接、管道、套接字、设备等类型位
+GO_FILE_MODE_TYPE_MASK = (1 << 31) | (1 << 27) | (1 << 26) | (1 << 25) | (1 << 24) | (1 << 21) | (1 << 19)
+CONTAINER_ACTIONS = ("start", "stop", "restart")
+BULK_ACTION_MAX_TARGETS = 200
+BULK_ACTION_MAX_CONCURRENCY = 16
+ROLLING_READY_TIMEOUT_SECONDS = 120
+ROLLING_POLL_SECONDS = 1.0
+# 取消时在容器内按环境变量标记查找会话进程，避免依赖 pkill
+EXEC_CANCEL_SCRIPT = (
+    'for d in /proc/[0-9]*; do '
+    'tr "\\0" "\\n" 2>/dev/null < "$d/environ" | grep -qx "VPK_EXEC_SESSION=$1" && kill -TERM "${d#/proc/}" 2>/dev/null; '
+    'done; exit 0'
+)
+
+logger = logging.getLogger("vpk_uploader")
 
 
 def _sum_network(stats: dict, key: str) -> int:
@@ -29,62 +63,162 @@ def _cpu_percent(stats: dict) -> float:
     return round(cpu_delta / system_delta * cpu_count * 100, 2)
 
 
+def _container_path(path: Optional[str]) -> str:
+    return posixpath.normpath("/" + (path or "/").lstrip("/"))
+
+
+class _ChunkReader(io.RawIOBase):
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        self.pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.pending:
+            try:
+                self.pending = next(self.chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def _close_stream(chunks) -> None:
+    close = getattr(chunks, "close", None)
+    if close is not None:
+        close()
+
+
+def _tar_member_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    try:
+        with tarfile.open(fileobj=io.BufferedReader(_ChunkReader(iter(chunks)), DOWNLOAD_CHUNK_BYTES), mode="r|") as archive:
+            member = archive.next()
+            handle = archive.extractfile(member) if member is not None else None
+            if handle is None:
+                return
+            while True:
+                data = handle.read(DOWNLOAD_CHUNK_BYTES)
+                if not data:
+                    return
+                yield data
+    finally:
+        _close_stream(chunks)
+
+
+def _capped_chunks(chunks: Iterator[bytes], max_bytes: int) -> Iterator[bytes]:
+    sent = 0
+    try:
+        for chunk in chunks:
+            sent += len(chunk)
+            if sent > max_bytes:
+                raise ValueError("下载内容超过上限，已中止")
+            yield chunk
+    finally:
+        _close_stream(chunks)
+
+
+def _exec_wrapper(timeout_seconds: int) -> str:
+    return (
+        'command -v timeout >/dev/null 2>&1 || '
+        '{ echo "container does not provide the timeout command" >&2; exit 127; }; '
+        f'exec timeout -k 2 {timeout_seconds} sh -lc "$1"'
+    )
+
+
+def _stats_metrics(stats: dict) -> dict:
+    memory = stats.get("memory_stats", {})
+    memory_usage = max(0, int(memory.get("usage", 0)) - int(memory.get("stats", {}).get("cache", 0)))
+    memory_limit = int(memory.get("limit", 0))
+    return {
+        "cpu_percent": _cpu_percent(stats),
+        "memory_usage": memory_usage,
+        "memory_limit": memory_limit,
+        "memory_percent": round(memory_usage / memory_limit * 100, 2) if memory_limit else 0,
+        "network_rx": _sum_network(stats, "rx_bytes"),
+        "network_tx": _sum_network(stats, "tx_bytes"),
+        "block_read": _sum_block_io(stats, "Read"),
+        "block_write": _sum_block_io(stats, "Write"),
+    }
+
+
+def _container_metadata(summary: dict) -> dict:
+    """Static fields for one container from a single ``/containers/json`` row."""
+    container_id = summary["Id"]
+    image = str(summary.get("Image") or "")
+    if image.startswith("sha256:"):
+        image = image[:17]
+    ports: dict[str, Optional[list]] = {}
+    for port in summary.get("Ports") or []:
+        key = f"{port.get('PrivatePort')}/{port.get('Type') or 'tcp'}"
+        ports.setdefault(key, None)
+        if port.get("PublicPort"):
+            ports[key] = [*(ports[key] or []), {"HostIp": port.get("IP", ""), "HostPort": str(port["PublicPort"])}]
+    created = summary.get("Created")
+    if isinstance(created, (int, float)):
+        created = datetime.fromtimestamp(created, timezone.utc).isoformat().replace("+00:00", "Z")
+    names = summary.get("Names") or [container_id[:12]]
+    return {
+        "id": container_id,
+        "short_id": container_id[:12],
+        "name": str(names[0]).lstrip("/"),
+        "status": str(summary.get("State") or ""),
+        "image": image,
+        "created": created,
+        "ports": ports,
+        "mounts": [{
+            "type": mount.get("Type"),
+            "source": mount.get("Source"),
+            "destination": mount.get("Destination"),
+            "writable": bool(mount.get("RW")),
+        } for mount in summary.get("Mounts") or []],
+    }
+
+
+def _container_summary(metadata: dict, stats: dict) -> dict:
+    summary = {key: metadata[key] for key in ("id", "short_id", "name", "status", "image", "created")}
+    summary.update(_stats_metrics(stats))
+    summary["ports"] = metadata["ports"]
+    summary["mounts"] = metadata["mounts"]
+    return summary
+
+
 class DockerManager:
     def __init__(self, client=None):
         if client is None:
             import docker
             client = docker.from_env()
         self.client = client
+        self._file_cache: dict[tuple, tuple[float, dict]] = {}
+        self._file_cache_lock = threading.Lock()
 
     def ping(self) -> bool:
         return bool(self.client.ping())
 
+    def container_metadata(self, container_id: Optional[str] = None) -> list[dict]:
+        filters = {"id": container_id} if container_id else None
+        rows = self.client.api.containers(all=True, filters=filters)
+        return [_container_metadata(row) for row in rows if container_id is None or row["Id"] == container_id]
+
     def list_containers(self) -> list[dict]:
-        containers = self.client.containers.list(all=True)
-        running = [container for container in containers if container.status == "running"]
+        containers = self.container_metadata()
+        running = [item["id"] for item in containers if item["status"] == "running"]
 
-        def read_stats(container):
+        def read_stats(container_id):
             try:
-                return container.id, container.stats(stream=False)
+                return container_id, self.client.api.stats(container_id, stream=False)
             except Exception:
-                return container.id, {}
+                return container_id, {}
 
         stats_by_id = {}
         if running:
             with ThreadPoolExecutor(max_workers=min(8, len(running))) as executor:
                 stats_by_id.update(executor.map(read_stats, running))
 
-        result = []
-        for container in containers:
-            stats = stats_by_id.get(container.id, {})
-            memory = stats.get("memory_stats", {})
-            memory_usage = max(0, int(memory.get("usage", 0)) - int(memory.get("stats", {}).get("cache", 0)))
-            memory_limit = int(memory.get("limit", 0))
-            attrs = container.attrs
-            result.append({
-                "id": container.id,
-                "short_id": container.id[:12],
-                "name": container.name,
-                "status": container.status,
-                "image": (container.image.tags or [container.image.short_id])[0],
-                "created": attrs.get("Created"),
-                "cpu_percent": _cpu_percent(stats),
-                "memory_usage": memory_usage,
-                "memory_limit": memory_limit,
-                "memory_percent": round(memory_usage / memory_limit * 100, 2) if memory_limit else 0,
-                "network_rx": _sum_network(stats, "rx_bytes"),
-                "network_tx": _sum_network(stats, "tx_bytes"),
-                "block_read": _sum_block_io(stats, "Read"),
-                "block_write": _sum_block_io(stats, "Write"),
-                "ports": attrs.get("NetworkSettings", {}).get("Ports") or {},
-                "mounts": [{
-                    "type": mount.get("Type"),
-                    "source": mount.get("Source"),
-                    "destination": mount.get("Destination"),
-                    "writable": bool(mount.get("RW")),
-                } for mount in attrs.get("Mounts", [])],
-            })
-        return result
+        return [_container_summary(item, stats_by_id.get(item["id"], {})) for item in containers]
 
     def action(self, container_id: str, action: str) -> None:
         container = self.client.containers.get(container_id)
@@ -96,8 +230,111 @@ class DockerManager:
             container.restart(timeout=10)
         else:
             raise ValueError("不支持的容器操作")
+        self.invalidate_files(container_id)
 
-    def exec_command(self, container_id: str, command: str) -> dict:
+    def resolve_containers(self, ids=(), names=(), label: str = "") -> tuple[list, list[str]]:
+        found: dict[str, Any] = {}
+        missing = []
+        for reference in [*ids, *names]:
+            reference = str(reference or "").strip()
+            if not reference:
+                continue
+            try:
+                container = self.client.containers.get(reference)
+            except Exception as exc:
+                if getattr(getattr(exc, "response", None), "status_code", None) != 404:
+                    raise
+                missing.append(reference)
+                continue
+            found.setdefault(container.id, container)
+        label = (label or "").strip()
+        if label:
+            for container in self.client.containers.list(all=True, filters={"label": label}):
+                found.setdefault(container.id, container)
+        if not found and not missing:
+            raise ValueError("没有匹配的容器")
+        if len(found) + len(missing) > BULK_ACTION_MAX_TARGETS:
+            raise ValueError(f"批量操作最多 {BULK_ACTION_MAX_TARGETS} 个容器")
+        return list(found.values()), missing
+
+    def bulk_action(
+        self,
+        action: str,
+        ids=(),
+        names=(),
+        label: str = "",
+        concurrency: int = 4,
+        rolling: bool = False,
+        max_unavailable: int = 1,
+    ) -> dict:
+        """Apply ``action`` to many containers through a bounded pool.
+
+        In rolling mode at most ``max_unavailable`` containers are being acted
+        on at once, a started container only frees its slot once it is running
+        (and healthy when it has a healthcheck), and the first failure stops
+        the remaining containers from being touched.
+        """
+        if action not in CONTAINER_ACTIONS:
+            raise ValueError("不支持的容器操作")
+        containers, missing = self.resolve_containers(ids, names, label)
+        workers = max(1, min(int(concurrency), BULK_ACTION_MAX_CONCURRENCY))
+        if rolling:
+            workers = max(1, min(int(max_unavailable), workers))
+        halted = threading.Event()
+
+        def run(container) -> dict:
+            result = {"id": container.id, "name": container.name, "ok": False, "status": "skipped", "error": None}
+            if halted.is_set():
+                return result
+            started = time.monotonic()
+            try:
+                self.action(container.id, action)
+                if rolling and action != "stop":
+                    self._wait_until_ready(container)
+                container.reload()
+                result.update(ok=True, status=container.status)
+            except Exception as exc:
+                result.update(status="failed", error=str(exc) or exc.__class__.__name__)
+                if rolling:
+                    halted.set()
+            result["duration_ms"] = int((time.monotonic() - started) * 1000)
+            return result
+
+        started = time.monotonic()
+        results = [
+            {"id": reference, "name": reference, "ok": False, "status": "missing", "error": "容器不存在", "duration_ms": 0}
+            for reference in missing
+        ]
+        if containers:
+            with ThreadPoolExecutor(max_workers=min(workers, len(containers))) as executor:
+                results.extend(executor.map(run, containers))
+        return {
+            "action": action,
+            "rolling": bool(rolling),
+            "concurrency": workers,
+            "ok": all(item["ok"] for item in results),
+            "succeeded": sum(1 for item in results if item["ok"]),
+            "failed": sum(1 for item in results if item["status"] in ("failed", "missing")),
+            "skipped": sum(1 for item in results if item["status"] == "skipped"),
+            "duration_ms": int((time.monotonic() - started) * 1000),
+            "results": results,
+        }
+
+    @staticmethod
+    def _wait_until_ready(container, timeout: float = ROLLING_READY_TIMEOUT_SECONDS) -> None:
+        deadline = time.monotonic() + timeout
+        while True:
+            container.reload()
+            health = ((container.attrs.get("State") or {}).get("Health") or {}).get("Status")
+            if container.status == "running" and health in (None, "healthy"):
+                return
+            if container.status in ("exited", "dead") or health == "unhealthy":
+                raise ValueError(f"容器未能恢复运行（{health or container.status}）")
+            if time.monotonic() >= deadline:
+                raise ValueError("等待容器恢复运行超时")
+            time.sleep(ROLLING_POLL_SECONDS)
+
+    def _exec_target(self, container_id: str, command: str):
         command = (command or "").strip()
         if not command:
             raise ValueError("容器命令不能为空")
@@ -108,14 +345,12 @@ class DockerManager:
         if container.status != "running":
             raise ValueError("只能在运行中的容器执行命令")
         self._assert_exec_mounts_are_safe(container)
+        return container, command
 
-        wrapper = (
-            'command -v timeout >/dev/null 2>&1 || '
-            '{ echo "container does not provide the timeout command" >&2; exit 127; }; '
-            f'exec timeout -k 2 {COMMAND_TIMEOUT_SECONDS} sh -lc "$1"'
-        )
+    def exec_command(self, container_id: str, command: str) -> dict:
+        container, command = self._exec_target(container_id, command)
         started = time.monotonic()
-        result = container.exec_run(["sh", "-c", wrapper, "sh", command], demux=True)
+        result = container.exec_run(["sh", "-c", _exec_wrapper(COMMAND_TIMEOUT_SECONDS), "sh", command], demux=True)
         stdout, stderr = result.output if hasattr(result, "output") else result[1]
         stdout_text, stdout_truncated = self._decode_command_output(stdout or b"")
         stderr_text, stderr_truncated = self._decode_command_output(stderr or b"")
@@ -127,6 +362,10 @@ class DockerManager:
             "duration_ms": int((time.monotonic() - started) * 1000),
         }
 
+    def open_exec(self, container_id: str, command: str) -> "ExecSession":
+        container, command = self._exec_target(container_id, command)
+        return ExecSession(self.client, container, command)
+
     @staticmethod
     def _assert_exec_mounts_are_safe(container) -> None:
         for mount in container.attrs.get("Mounts", []) or []:
@@ -145,10 +384,37 @@ class DockerManager:
             data = data[:COMMAND_OUTPUT_MAX_BYTES]
         return data.decode("utf-8", "replace"), truncated
 
-    def list_files(self, container_id: str, path: Optional[str] = "/") -> dict:
-        path = posixpath.normpath("/" + (path or "/").lstrip("/"))
+    def list_files(
+        self,
+        container_id: str,
+        path: Optional[str] = "/",
+        depth: int = 1,
+        limit: int = FILE_LIST_DEFAULT_LIMIT,
+        refresh: bool = False,
+    ) -> dict:
+        path = _container_path(path)
+        depth = min(max(1, int(depth)), FILE_LIST_MAX_DEPTH)
+        limit = min(max(1, int(limit)), FILE_LIST_MAX_LIMIT)
+        key = (container_id, path, depth, limit)
+        now = time.monotonic()
+        with self._file_cache_lock:
+            cached = self._file_cache.get(key)
+            if cached is not None and cached[0] > now and not refresh:
+                return cached[1]
+
         container = self.client.containers.get(container_id)
-        command = ["sh", "-c", 'find "$1" -mindepth 1 -maxdepth 1 -printf "%y\\t%s\\t%T@\\t%f\\n" 2>/dev/null', "sh", path]
+        # 经过 head 的管道拿不到 find 的退出码，目录不存在或不可读要先检查，否则会当成空目录返回
+        command = [
+            "sh",
+            "-c",
+            'if [ ! -d "$1" ]; then echo "目录不存在：$1" >&2; exit 2; fi; '
+            'if [ ! -r "$1" ] || [ ! -x "$1" ]; then echo "没有权限读取目录：$1" >&2; exit 1; fi; '
+            'find "$1" -mindepth 1 -maxdepth "$2" -printf "%y\\t%s\\t%T@\\t%P\\n" 2>/dev/null | head -n "$3"',
+            "sh",
+            path,
+            str(depth),
+            str(limit + 1),
+        ]
         result = container.exec_run(command, demux=True)
         stdout, stderr = result.output if hasattr(result, "output") else result[1]
         if result.exit_code != 0:
@@ -156,13 +422,349 @@ class DockerManager:
             raise ValueError(message)
         entries = []
         for line in (stdout or b"").decode("utf-8", "replace").splitlines():
-            kind, size, modified, name = line.split("\t", 3)
+            kind, size, modified, relative = line.split("\t", 3)
             entries.append({
-                "name": name,
-                "path": posixpath.join(path, name),
+                "name": posixpath.basename(relative),
+                "path": posixpath.join(path, relative),
                 "type": "directory" if kind == "d" else "file",
                 "size": int(size),
                 "modified": float(modified),
+                "depth": relative.count("/") + 1,
             })
-        entries.sort(key=lambda item: (item["type"] != "directory", item["name"].lower()))
-        return {"path": path, "parent": posixpath.dirname(path) if path != "/" else None, "entries": entries}
+        truncated = len(entries) > limit
+        entries = entries[:limit]
+        entries.sort(key=lambda item: (
+            posixpath.dirname(item["path"]),
+            item["type"] != "directory",
+            item["name"].lower(),
+        ))
+        listing = {
+            "path": path,
+            "parent": posixpath.dirname(path) if path != "/" else None,
+            "depth": depth,
+            "truncated": truncated,
+            "entries": entries,
+        }
+        with self._file_cache_lock:
+            self._file_cache[key] = (now + FILE_LIST_CACHE_SECONDS, listing)
+            while len(self._file_cache) > FILE_LIST_CACHE_ENTRIES:
+                self._file_cache.pop(next(iter(self._file_cache)))
+        return listing
+
+    def invalidate_files(self, container_id: str) -> None:
+        with self._file_cache_lock:
+            for key in [key for key in self._file_cache if key[0] == container_id]:
+                del self._file_cache[key]
+
+    def open_download(self, container_id: str, path: Optional[str], max_bytes: int) -> dict:
+        """Start streaming ``path`` out of the container.
+
+        Regular files are unpacked from the archive stream on the fly; any
+        other path is sent as the tar stream dockerd produces. Nothing is
+        buffered beyond one chunk.
+        """
+        path = _container_path(path)
+        if path == "/":
+            raise ValueError("不能下载容器根目录")
+        container = self.client.containers.get(container_id)
+        try:
+            chunks, stat = container.get_archive(path, chunk_size=DOWNLOAD_CHUNK_BYTES)
+        except Exception as exc:
+            if getattr(getattr(exc, "response", None), "status_code", None) == 404:
+                raise FileNotFoundError("容器内路径不存在") from exc
+            raise
+        name = stat.get("name") or posixpath.basename(path)
+        if not int(stat.get("mode", 0)) & GO_FILE_MODE_TYPE_MASK:
+            if int(stat.get("size", 0)) > max_bytes:
+                _close_stream(chunks)
+                raise ValueError(f"文件超过下载上限 {max_bytes // (1024 * 1024)} MB")
+            return {
+                "filename": name,
+                "media_type": "application/octet-stream",
+                "size": int(stat.get("size", 0)),
+                "chunks": _tar_member_chunks(chunks),
+            }
+        used = self._disk_usage_bytes(container, path)
+        if used is not None and used > max_bytes:
+            _close_stream(chunks)
+            raise ValueError(f"目录超过下载上限 {max_bytes // (1024 * 1024)} MB")
+        return {
+            "filename": f"{name}.tar",
+            "media_type": "application/x-tar",
+            "size": None,
+            "chunks": _capped_chunks(chunks, max_bytes + DOWNLOAD_TAR_OVERHEAD_BYTES),
+        }
+
+    @staticmethod
+    def _disk_usage_bytes(container, path: str) -> Optional[int]:
+        result = container.exec_run(["du", "-sk", path], demux=True)
+        stdout, _ = result.output if hasattr(result, "output") else result[1]
+        try:
+            return int((stdout or b"").split()[0]) * 1024
+        except (IndexError, ValueError):
+            return None
+
+
+class ExecSession:
+    """One streaming command started through the Docker exec API.
+
+    ``frames()`` yields ``(stream, bytes)`` pairs as dockerd produces them
+    and must be consumed from a worker thread. Each session exports a random
+    ``VPK_EXEC_SESSION`` marker so ``cancel()`` can signal exactly its own
+    processes from a second exec.
+    """
+
+    def __init__(self, client, container, command: str, timeout_seconds: int = EXEC_STREAM_TIMEOUT_SECONDS):
+        self.client = client
+        self.container = container
+        self.command = command
+        self.timeout_seconds = timeout_seconds
+        self.marker = secrets.token_hex(12)
+        self.exec_id: Optional[str] = None
+        self.cancelled = False
+        self.started = time.monotonic()
+
+    def frames(self):
+        api = self.client.api
+        created = api.exec_create(
+            self.container.id,
+            ["sh", "-c", _exec_wrapper(self.timeout_seconds), "sh", self.command],
+            stdout=True,
+            stderr=True,
+            environment={"VPK_EXEC_SESSION": self.marker},
+        )
+        self.exec_id = created["Id"]
+        for stdout, stderr in api.exec_start(self.exec_id, stream=True, demux=True):
+            if stdout:
+                yield "stdout", stdout
+            if stderr:
+                yield "stderr", stderr
+
+    def exit_code(self) -> Optional[int]:
+        if self.exec_id is None:
+            return None
+        code = self.client.api.exec_inspect(self.exec_id).get("ExitCode")
+        return None if code is None else int(code)
+
+    def cancel(self) -> None:
+        if self.cancelled:
+            return
+        self.cancelled = True
+        try:
+            self.container.exec_run(["sh", "-c", EXEC_CANCEL_SCRIPT, "sh", self.marker])
+        except Exception as exc:
+            logger.warning("docker exec cancel failed container=%s: %s", self.container.id[:12], exc)
+
+
+class DockerStatsCollector:
+    """Container metadata and live stats kept in memory for the dashboards.
+
+    Static fields come from one ``/containers/json`` listing at startup and
+    are then patched per container from the Docker event stream, with a full
+    resync whenever the event stream (re)connects and every
+    ``METADATA_RESYNC_SECONDS`` as a safety net. Each running container has
+    one streaming stats subscription whose latest sample is kept in memory,
+    so ``snapshot()`` never talks to dockerd. ``on_sample`` receives
+    ``(metadata, metrics)`` for every streamed sample; lifecycle events are
+    also kept in a short sequence-numbered log (``events_since``).
+    """
+
+    def __init__(
+        self,
+        manager_factory: Callable[[], DockerManager],
+        refresh_seconds: float = 10.0,
+        on_sample: Optional[Callable[[dict, dict], None]] = None,
+    ):
+        self.manager_factory = manager_factory
+        self.on_sample = on_sample
+        self.refresh_seconds = max(1.0, float(refresh_seconds))
+        self.error: Optional[str] = None
+        self.updated_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._containers: dict[str, dict] = {}
+        self._stats: dict[str, dict] = {}
+        self._streams: dict[str, threading.Thread] = {}
+        self._dirty: set[str] = set()
+        self._resync_needed = True
+        self._synced_at = 0.0
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._events_thread: Optional[threading.Thread] = None
+        self._events_stream = None
+        self._events: deque = deque(maxlen=RECENT_EVENT_LIMIT)
+        self._event_seq = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.updated_at is not None and self.error is None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="docker-stats-refresh", daemon=True)
+        self._thread.start()
+        self._events_thread = threading.Thread(target=self._events_loop, name="docker-events", daemon=True)
+        self._events_thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        thread = self._thread
+        self._thread = None
+        stream = self._events_stream
+        if stream is not None and hasattr(stream, "close"):
+            try:
+                stream.close()
+            except Exception:
+                pass
+        if thread is not None:
+            thread.join(timeout)
+        self._events_thread = None
+        with self._lock:
+            self._streams.clear()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def resync(self) -> None:
+        self._resync_needed = True
+        self.wake()
+
+    def refresh(self) -> None:
+        with self._lock:
+            full = self._resync_needed or time.monotonic() - self._synced_at >= METADATA_RESYNC_SECONDS
+            dirty = set() if full else set(self._dirty)
+            self._dirty.clear()
+            self._resync_needed = False
+        try:
+            manager = self.manager_factory()
+            if full:
+                listed = {item["id"]: item for item in manager.container_metadata()}
+            else:
+                updates = {}
+                for container_id in dirty:
+                    rows = manager.container_metadata(container_id)
+                    updates[container_id] = rows[0] if rows else None
+        except Exception as exc:
+            with self._lock:
+                if full:
+                    self._resync_needed = True
+                self._dirty.update(dirty)
+            message = str(exc) or exc.__class__.__name__
+            if message != self.error:
+                logger.warning("docker stats refresh failed: %s", message)
+            self.error = message
+            return
+
+        with self._lock:
+            if full:
+                self._containers = listed
+                self._synced_at = time.monotonic()
+            else:
+                for container_id, metadata in updates.items():
+                    if metadata is None:
+                        self._containers.pop(container_id, None)
+                    else:
+                        self._containers[container_id] = metadata
+            for container_id in list(self._stats):
+                current = self._containers.get(container_id)
+                if current is None or current["status"] != "running":
+                    del self._stats[container_id]
+            for container_id, metadata in self._containers.items():
+                if metadata["status"] != "running" or container_id in self._streams:
+                    continue
+                thread = threading.Thread(
+                    target=self._stream,
+                    args=(container_id,),
+                    name=f"docker-stats-{container_id[:12]}",
+                    daemon=True,
+                )
+                self._streams[container_id] = thread
+                thread.start()
+        self.error = None
+        self.updated_at = time.time()
+
+    def record_event(self, event: dict) -> Optional[dict]:
+        action = str(event.get("Action") or event.get("status") or "").split(":", 1)[0]
+        if action not in CONTAINER_EVENT_ACTIONS:
+            return None
+        actor = event.get("Actor") or {}
+        attributes = actor.get("Attributes") or {}
+        with self._lock:
+            self._event_seq += 1
+            item = {
+                "seq": self._event_seq,
+                "id": str(actor.get("ID") or event.get("id") or ""),
+                "name": str(attributes.get("name") or ""),
+                "action": action,
+                "exit_code": attributes.get("exitCode"),
+                "time": event.get("time") or int(time.time()),
+            }
+            self._events.append(item)
+            if item["id"]:
+                self._dirty.add(item["id"])
+        self.wake()
+        return item
+
+    def events_since(self, seq: int) -> list[dict]:
+        with self._lock:
+            return [item for item in self._events if item["seq"] > seq]
+
+    @property
+    def event_seq(self) -> int:
+        return self._event_seq
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            containers = list(self._containers.values())
+            stats_by_id = dict(self._stats)
+        return [_container_summary(item, stats_by_id.get(item["id"], {})) for item in containers]
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.is_set():
+            self.refresh()
+            self._wakeup.wait(self.refresh_seconds)
+            self._wakeup.clear()
+
+    def _events_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                client = self.manager_factory().client
+                self._events_stream = client.events(decode=True, filters={"type": "container"})
+                # 事件流断开期间可能漏掉事件，重连后做一次全量同步
+                self.resync()
+                for event in self._events_stream:
+                    if self._stop.is_set():
+                        break
+                    self.record_event(event)
+            except Exception as exc:
+                if not self._stop.is_set():
+                    logger.debug("docker event stream ended: %s", exc)
+            finally:
+                self._events_stream = None
+            self._stop.wait(self.refresh_seconds)
+
+    def _stream(self, container_id: str) -> None:
+        try:
+            api = self.manager_factory().client.api
+            for stats in api.stats(container_id, stream=True, decode=True):
+                if self._stop.is_set():
+                    break
+                with self._lock:
+                    current = self._containers.get(container_id)
+                    if current is None or current["status"] != "running":
+                        break
+                    self._stats[container_id] = stats
+                if self.on_sample is not None:
+                    try:
+                        self.on_sample(current, _stats_metrics(stats))
+                    except Exception:
+                        logger.exception("docker stats sample handler failed")
+        except Exception as exc:
+            logger.debug("docker stats stream for %s ended: %s", container_id[:12], exc)
+        finally:
+            with self._lock:
+                if self._streams.get(container_id) is threading.current_thread():
+                    del self._streams[container_id]
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("vpk_uploader")
+
+SUBSCRIBER_QUEUE_SIZE = 32
+HEARTBEAT_SECONDS = 15.0
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def sse_message(event: str, payload: Any) -> str:
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def container_delta(previous: dict[str, dict], current: dict[str, dict]) -> tuple[list[dict], list[str]]:
+    changed = []
+    for container_id, item in current.items():
+        before = previous.get(container_id)
+        if before is None:
+            changed.append(item)
+            continue
+        fields = {key: value for key, value in item.items() if before.get(key) != value}
+        if fields:
+            changed.append({"id": container_id, **fields})
+    removed = [container_id for container_id in previous if container_id not in current]
+    return changed, removed
+
+
+class DashboardBroadcaster:
+    """One producer task fanning container state out to every SSE client.
+
+    While at least one client is connected the producer reads the collector
+    snapshot once per ``interval``, diffs it against the previous tick and
+    encodes a single message that is handed to every subscriber queue, so the
+    work per tick does not depend on how many dashboards are open. A client
+    whose queue is full is dropped; EventSource reconnects and receives a
+    fresh snapshot.
+    """
+
+    def __init__(self, collector, interval: float = 1.0, clock: Callable[[], str] = _now_iso):
+        self.collector = collector
+        self.interval = interval
+        self.clock = clock
+        self._subscribers: set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._state: Optional[dict[str, dict]] = None
+        self._event_seq = collector.event_seq
+        self._error: Optional[str] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        if self._task is not None and not self._task.done():
+            if self._error is not None:
+                queue.put_nowait(sse_message("failure", {"detail": self._error}))
+            elif self._state is not None:
+                queue.put_nowait(self._snapshot_message(list(self._state.values())))
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._state = None
+            self._event_seq = self.collector.event_seq
+            self._task = asyncio.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    async def stop(self) -> None:
+        task = self._task
+        self._task = None
+        self._subscribers.clear()
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def _snapshot_message(self, containers: list[dict]) -> str:
+        return sse_message("snapshot", {"generated_at": self.clock(), "containers": containers})
+
+    def _publish(self, message: str) -> None:
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def tick(self) -> list[str]:
+        messages = []
+        for event in self.collector.events_since(self._event_seq):
+            self._event_seq = event["seq"]
+            messages.append(sse_message("container", event))
+
+        if not self.collector.ready:
+            error = self.collector.error or "正在读取 Docker 数据"
+            if error != self._error:
+                self._error = error
+                messages.append(sse_message("failure", {"detail": error}))
+            return messages
+
+        current = {item["id"]: item for item in self.collector.snapshot()}
+        if self._error is not None or self._state is None:
+            self._error = None
+            messages.append(self._snapshot_message(list(current.values())))
+        else:
+            changed, removed = container_delta(self._state, current)
+            if changed or removed:
+                messages.append(sse_message("delta", {
+                    "generated_at": self.clock(),
+                    "changed": changed,
+                    "removed": removed,
+                }))
+        self._state = current
+        return messages
+
+    async def _run(self) -> None:
+        while self._subscribers:
+            try:
+                for message in self.tick():
+                    self._publish(message)
+            except Exception:
+                logger.exception("docker dashboard broadcast failed")
+            await asyncio.sleep(self.interval)
+
+    async def stream(self, queue: asyncio.Queue):
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(queue)
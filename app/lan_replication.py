@@ -1,18 +1,48 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import ipaddress
 import json
+import logging
+import math
 import os
 import socket
+import time
+import zlib
 from dataclasses import dataclass, field
-from typing import Any, Iterable, Mapping, Optional
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Mapping, Optional
 from urllib.parse import urlsplit, urlunsplit
 
 import httpx
 
+try:
+    import zstandard
+except ImportError:  # zstd 是可选编码，未安装时只协商 gzip
+    zstandard = None
+
+from .metrics import REPLICATION_BYTES, REPLICATION_SECONDS
+from .tracing import TRACER
+from .vpk_reader import vpk_segments
+
+
+logger = logging.getLogger("vpk_uploader")
 
 PROTOCOL_VERSION = 1
+REPLICATION_FEATURES = ("resume", "relay", "digest", "delta")
+TOPOLOGIES = ("direct", "chain", "tree")
+MAX_RELAY_HOPS = 16
+COMPLETED_STATUSES = frozenset({"completed", "already_present"})
+TRANSFER_CHUNK_BYTES = 1024 * 1024
+# 放置副本时读取的容量信息最多沿用这么久，否则预留变化后权重会长时间滞后
+STORAGE_CACHE_SECONDS = 5
+DIGEST_PREFIX_LENGTH = 2
+COMPRESSION_CHOICES = ("off", "auto", "zstd", "gzip")
+DECOMPRESS_STEP_BYTES = 1024 * 1024
+# zstd 的 RLE 块用约 4 字节就能描述 128 KiB 输出，每次只喂 64 字节，单次调用最多展开约 2 MiB
+ZSTD_FEED_BYTES = 64
+ZSTD_MAX_EXPANSION = 128 * 1024 // 4
 TRUE_VALUES = {"1", "true", "yes", "on"}
 
 
@@ -31,6 +61,31 @@ def _env_int(env: Mapping[str, str], key: str, default: int, minimum: int, maxim
     return max(minimum, min(maximum, value))
 
 
+def _parse_bandwidth_schedule(raw: str) -> tuple[tuple[tuple[int, int, int], ...], tuple[str, ...]]:
+    """解析 ``08:00-23:00=10,23:00-08:00=0``，值为 MB/s，0 表示该时段不限速。"""
+    windows: list[tuple[int, int, int]] = []
+    errors: list[str] = []
+    for part in raw.replace("\n", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            span, limit = part.split("=", 1)
+            start, end = span.split("-", 1)
+            start_hour, start_minute = (int(value) for value in start.strip().split(":", 1))
+            end_hour, end_minute = (int(value) for value in end.strip().split(":", 1))
+            limit_mb = int(limit.strip())
+            if not (0 <= start_hour < 24 and 0 <= end_hour <= 24 and 0 <= start_minute < 60 and 0 <= end_minute < 60):
+                raise ValueError
+            if limit_mb < 0:
+                raise ValueError
+        except ValueError:
+            errors.append(f"LAN_BANDWIDTH_SCHEDULE 时段无效：{part}")
+            continue
+        windows.append((start_hour * 60 + start_minute, end_hour * 60 + end_minute, limit_mb * 1024 * 1024))
+    return tuple(windows), tuple(errors)
+
+
 def _normalize_peer_url(raw_url: str) -> str:
     value = raw_url.strip()
     parsed = urlsplit(value)
@@ -67,6 +122,26 @@ class LanReplicationConfig:
     reservation_ttl_seconds: int = 3600
     retries: int = 1
     max_parallel_peers: int = 3
+    max_streams_per_peer: int = 4
+    send_limit_bytes: int = 0
+    peer_send_limit_bytes: int = 0
+    receive_limit_bytes: int = 0
+    bandwidth_schedule: tuple[tuple[int, int, int], ...] = ()
+    topology: str = "direct"
+    relay_fanout: int = 2
+    keepalive_connections: int = 4
+    keepalive_expiry_seconds: int = 60
+    address_cache_seconds: int = 300
+    capability_cache_seconds: int = 60
+    job_max_attempts: int = 8
+    job_retry_base_seconds: int = 15
+    job_retry_max_seconds: int = 900
+    job_concurrency: int = 4
+    job_retention_days: int = 7
+    anti_entropy_interval_seconds: int = 900
+    compression: str = "off"
+    compression_level: int = 3
+    replication_factor: int = 0
     disk_reserve_bytes: int = 1024 * 1024 * 1024
     errors: tuple[str, ...] = field(default_factory=tuple)
 
@@ -90,6 +165,8 @@ class LanReplicationConfig:
             "node_id": self.node_id,
             "group": self.group,
             "protocol_version": PROTOCOL_VERSION,
+            "topology": self.topology,
+            "replication_factor": self.replication_factor,
             "configured_peer_count": len(self.peers),
             "config_error_count": len(self.errors),
         }
@@ -103,15 +180,20 @@ class ReplicationArtifact:
     path: str
     size: int
     sha256: str
+    # 按副本规则应当持有该文件的节点；接收方记下后，摘要对账只比较双方都应持有的文件
+    holders: tuple[str, ...] = ()
 
     def manifest_item(self) -> dict[str, Any]:
-        return {
+        item: dict[str, Any] = {
             "source_upload_id": self.upload_id,
             "original_name": self.original_name,
             "stored_name": self.stored_name,
             "size": self.size,
             "sha256": self.sha256,
         }
+        if self.holders:
+            item["holders"] = list(self.holders)
+        return item
 
 
 def _parse_peers(raw: str, local_node_id: str) -> tuple[tuple[LanPeer, ...], tuple[str, ...]]:
@@ -189,6 +271,16 @@ def load_lan_replication_config(env: Optional[Mapping[str, str]] = None) -> LanR
         if not str(env.get("LAN_PEER_ALLOWED_CIDRS", "")).strip():
             errors.append("缺少 LAN_PEER_ALLOWED_CIDRS")
     disk_reserve_mb = _env_int(env, "LAN_DISK_RESERVE_MB", 1024, 0, 1024 * 1024)
+    bandwidth_schedule, schedule_errors = _parse_bandwidth_schedule(str(env.get("LAN_BANDWIDTH_SCHEDULE", "")))
+    errors.extend(schedule_errors)
+    compression = str(env.get("LAN_REPLICATION_COMPRESSION", "off")).strip().lower() or "off"
+    if compression not in COMPRESSION_CHOICES:
+        errors.append("LAN_REPLICATION_COMPRESSION 只能是 off、auto、zstd 或 gzip")
+        compression = "off"
+    topology = str(env.get("LAN_REPLICATION_TOPOLOGY", "direct")).strip().lower() or "direct"
+    if topology not in TOPOLOGIES:
+        errors.append("LAN_REPLICATION_TOPOLOGY 只能是 direct、chain 或 tree")
+        topology = "direct"
 
     return LanReplicationConfig(
         node_id=node_id,
@@ -204,6 +296,26 @@ def load_lan_replication_config(env: Optional[Mapping[str, str]] = None) -> LanR
         reservation_ttl_seconds=_env_int(env, "LAN_RESERVATION_TTL_SECONDS", 3600, 300, 7200),
         retries=_env_int(env, "LAN_REPLICATION_RETRIES", 1, 0, 5),
         max_parallel_peers=_env_int(env, "LAN_MAX_PARALLEL_PEERS", 3, 1, 16),
+        max_streams_per_peer=_env_int(env, "LAN_MAX_STREAMS_PER_PEER", 4, 1, 16),
+        send_limit_bytes=_env_int(env, "LAN_BANDWIDTH_LIMIT_MB", 0, 0, 100 * 1024) * 1024 * 1024,
+        peer_send_limit_bytes=_env_int(env, "LAN_PEER_BANDWIDTH_LIMIT_MB", 0, 0, 100 * 1024) * 1024 * 1024,
+        receive_limit_bytes=_env_int(env, "LAN_RECEIVE_BANDWIDTH_LIMIT_MB", 0, 0, 100 * 1024) * 1024 * 1024,
+        bandwidth_schedule=bandwidth_schedule,
+        topology=topology,
+        relay_fanout=_env_int(env, "LAN_RELAY_FANOUT", 2, 1, 8),
+        keepalive_connections=_env_int(env, "LAN_PEER_KEEPALIVE_CONNECTIONS", 4, 1, 32),
+        keepalive_expiry_seconds=_env_int(env, "LAN_PEER_KEEPALIVE_SECONDS", 60, 5, 600),
+        address_cache_seconds=_env_int(env, "LAN_PEER_DNS_CACHE_SECONDS", 300, 0, 3600),
+        capability_cache_seconds=_env_int(env, "LAN_PEER_CAPABILITY_CACHE_SECONDS", 60, 0, 3600),
+        job_max_attempts=_env_int(env, "LAN_JOB_MAX_ATTEMPTS", 8, 1, 100),
+        job_retry_base_seconds=_env_int(env, "LAN_JOB_RETRY_BASE_SECONDS", 15, 1, 3600),
+        job_retry_max_seconds=_env_int(env, "LAN_JOB_RETRY_MAX_SECONDS", 900, 1, 86400),
+        job_concurrency=_env_int(env, "LAN_JOB_CONCURRENCY", 4, 1, 32),
+        job_retention_days=_env_int(env, "LAN_JOB_RETENTION_DAYS", 7, 1, 3650),
+        anti_entropy_interval_seconds=_env_int(env, "LAN_ANTI_ENTROPY_INTERVAL_SECONDS", 900, 0, 86400),
+        compression=compression,
+        compression_level=_env_int(env, "LAN_REPLICATION_COMPRESSION_LEVEL", 3, 1, 19),
+        replication_factor=_env_int(env, "LAN_REPLICATION_FACTOR", 0, 0, 64),
         disk_reserve_bytes=disk_reserve_mb * 1024 * 1024,
         errors=tuple(errors),
     )
@@ -233,13 +345,13 @@ def peer_host_is_private(peer: LanPeer) -> bool:
 
 
 def _auth_headers(config: LanReplicationConfig) -> dict[str, str]:
-    return {
+    return TRACER.inject({
         "Accept": "application/json",
         "Authorization": f"Bearer {config.token}",
         "X-LAN-Group": config.group,
         "X-LAN-Node": config.node_id,
         "User-Agent": "VPK-Uploader-LAN/1.0",
-    }
+    })
 
 
 def _response_detail(response: httpx.Response) -> str:
@@ -254,11 +366,659 @@ def _response_detail(response: httpx.Response) -> str:
     return f"HTTP {response.status_code}"
 
 
+def available_codecs() -> list[str]:
+    """本节点能解压的传输编码，按优先级排列。"""
+    return ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+
+
+def negotiate_codec(config: LanReplicationConfig, capability: Mapping[str, Any]) -> str:
+    """按配置挑选双方都支持的编码；返回空字符串表示不压缩。"""
+    if config.compression == "off":
+        return ""
+    remote = capability.get("codecs") or []
+    if not isinstance(remote, list):
+        return ""
+    preferred = available_codecs() if config.compression == "auto" else [config.compression]
+    for codec in preferred:
+        if codec in remote and codec in available_codecs():
+            return codec
+    return ""
+
+
+def make_compressor(codec: str, level: int) -> Any:
+    if codec == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    if codec == "gzip":
+        return zlib.compressobj(min(9, level), zlib.DEFLATED, 31)
+    raise ValueError(f"不支持的传输编码：{codec}")
+
+
+class BoundedDecompressor:
+    """分步解压：每步最多产出约 step_bytes，调用方可以在每步之后检查累计大小，防止解压炸弹。
+
+    gzip 用 max_length 限制输出；zstd 的解压对象没有输出上限，只能把输入切成小段喂入，
+    因此 zstd 每步的输出可能超出 step_bytes，但不会超过 ZSTD_FEED_BYTES * ZSTD_MAX_EXPANSION。
+    """
+
+    def __init__(self, codec: str, step_bytes: int = DECOMPRESS_STEP_BYTES):
+        if codec == "zstd" and zstandard is not None:
+            self._decoder = zstandard.ZstdDecompressor().decompressobj()
+        elif codec == "gzip":
+            self._decoder = zlib.decompressobj(31)
+        else:
+            raise ValueError(f"不支持的传输编码：{codec}")
+        self.codec = codec
+        self.step_bytes = step_bytes
+        self._pending = memoryview(b"")
+
+    @property
+    def pending(self) -> bool:
+        return len(self._pending) > 0
+
+    def feed(self, data: bytes) -> None:
+        if self.pending:
+            data = bytes(self._pending) + data
+        self._pending = memoryview(data)
+
+    def step(self) -> bytes:
+        output = []
+        produced = 0
+        while self.pending and produced < self.step_bytes:
+            if self.codec == "gzip":
+                piece = self._decoder.decompress(self._pending, self.step_bytes - produced)
+                # gzip 流结束后的多余字节与原来一样忽略
+                self._pending = memoryview(b"" if self._decoder.eof else self._decoder.unconsumed_tail)
+            else:
+                piece = self._decoder.decompress(self._pending[:ZSTD_FEED_BYTES])
+                self._pending = self._pending[ZSTD_FEED_BYTES:]
+            output.append(piece)
+            produced += len(piece)
+        return b"".join(output)
+
+    def flush(self) -> bytes:
+        if self.codec == "gzip":
+            return self._decoder.flush(self.step_bytes)
+        return b""
+
+
+def make_decompressor(codec: str) -> BoundedDecompressor:
+    return BoundedDecompressor(codec)
+
+
+def scheduled_limit(
+    limit_bytes: int,
+    schedule: tuple[tuple[int, int, int], ...],
+    now: datetime,
+) -> int:
+    minute = now.hour * 60 + now.minute
+    for start, end, window_limit in schedule:
+        if start <= end:
+            matched = start <= minute < end
+        else:
+            matched = minute >= start or minute < end
+        if matched:
+            return window_limit
+    return limit_bytes
+
+
+class TokenBucket:
+    """字节令牌桶；速率为 0 时不限速。允许短暂欠账，欠多少就等多少。"""
+
+    def __init__(
+        self,
+        rate_bytes: int,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ) -> None:
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = asyncio.Lock()
+        self.rate = 0
+        self.capacity = 0.0
+        self._tokens = 0.0
+        self._updated = clock()
+        self.set_rate(rate_bytes)
+
+    def set_rate(self, rate_bytes: int) -> None:
+        rate_bytes = max(0, int(rate_bytes))
+        if rate_bytes == self.rate:
+            return
+        self.rate = rate_bytes
+        self.capacity = float(max(rate_bytes, 64 * 1024))
+        self._tokens = self.capacity if rate_bytes else 0.0
+        self._updated = self._clock()
+
+    async def consume(self, amount: int) -> None:
+        if self.rate <= 0 or amount <= 0:
+            return
+        async with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens < 0:
+                await self._sleep(-self._tokens / self.rate)
+
+
+class BandwidthShaper:
+    """复制流量的全局、单节点和接收端限速，并记录每个节点的实际吞吐。"""
+
+    def __init__(
+        self,
+        config: LanReplicationConfig,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+        wall_clock: Callable[[], datetime] = datetime.now,
+    ) -> None:
+        self.config = config
+        self._clock = clock
+        self._sleep = sleep
+        self._wall_clock = wall_clock
+        self._send = TokenBucket(config.send_limit_bytes, clock=clock, sleep=sleep)
+        self._receive = TokenBucket(config.receive_limit_bytes, clock=clock, sleep=sleep)
+        self._peers: dict[str, TokenBucket] = {}
+        self._sent: dict[str, dict[str, float]] = {}
+        self._received: dict[str, dict[str, float]] = {}
+
+    def _apply_schedule(self) -> None:
+        if not self.config.bandwidth_schedule:
+            return
+        now = self._wall_clock()
+        self._send.set_rate(scheduled_limit(self.config.send_limit_bytes, self.config.bandwidth_schedule, now))
+        self._receive.set_rate(scheduled_limit(self.config.receive_limit_bytes, self.config.bandwidth_schedule, now))
+
+    def limits(self) -> dict[str, int]:
+        self._apply_schedule()
+        return {
+            "send_limit_bytes": self._send.rate,
+            "peer_send_limit_bytes": self.config.peer_send_limit_bytes,
+            "receive_limit_bytes": self._receive.rate,
+        }
+
+    async def throttle_send(self, peer: LanPeer, amount: int) -> None:
+        self._apply_schedule()
+        bucket = self._peers.get(peer.node_id)
+        if bucket is None:
+            bucket = TokenBucket(self.config.peer_send_limit_bytes, clock=self._clock, sleep=self._sleep)
+            self._peers[peer.node_id] = bucket
+        await bucket.consume(amount)
+        await self._send.consume(amount)
+
+    async def throttle_receive(self, amount: int) -> None:
+        self._apply_schedule()
+        await self._receive.consume(amount)
+
+    @staticmethod
+    def _record(table: dict[str, dict[str, float]], node_id: str, byte_count: int, seconds: float) -> None:
+        entry = table.setdefault(node_id, {"bytes": 0, "seconds": 0.0, "transfers": 0, "last_bytes_per_second": 0})
+        entry["bytes"] += byte_count
+        entry["seconds"] += max(0.0, seconds)
+        entry["transfers"] += 1
+        if seconds > 0:
+            entry["last_bytes_per_second"] = int(byte_count / seconds)
+
+    def record_sent(self, node_id: str, byte_count: int, seconds: float) -> None:
+        self._record(self._sent, node_id, byte_count, seconds)
+
+    def record_received(self, node_id: str, byte_count: int, seconds: float) -> None:
+        self._record(self._received, node_id, byte_count, seconds)
+
+    @staticmethod
+    def _public(table: dict[str, dict[str, float]]) -> dict[str, dict[str, int]]:
+        return {
+            node_id: {
+                "bytes": int(entry["bytes"]),
+                "transfers": int(entry["transfers"]),
+                "average_bytes_per_second": int(entry["bytes"] / entry["seconds"]) if entry["seconds"] > 0 else 0,
+                "last_bytes_per_second": int(entry["last_bytes_per_second"]),
+            }
+            for node_id, entry in table.items()
+        }
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self.limits(),
+            "sent": self._public(self._sent),
+            "received": self._public(self._received),
+        }
+
+
+class LanPeerPool:
+    """按节点复用的 HTTP 连接池，同时缓存地址检查和节点能力。"""
+
+    def __init__(
+        self,
+        config: LanReplicationConfig,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.config = config
+        self._transport = transport
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._stale_clients: list[httpx.AsyncClient] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.shaper = BandwidthShaper(config)
+        self._address_cache: dict[str, tuple[float, bool]] = {}
+        self._capability_cache: dict[str, tuple[float, dict[str, Any]]] = {}
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=float(self.config.connect_timeout_seconds),
+            read=float(self.config.transfer_timeout_seconds),
+            write=float(self.config.transfer_timeout_seconds),
+            pool=float(self.config.connect_timeout_seconds),
+        )
+
+    def client(self, peer: LanPeer) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 连接绑定在创建它的事件循环上，循环切换后旧连接不能再用，交回旧循环关闭。
+            self._retire_clients(self._loop)
+            self._loop = loop
+        client = self._clients.get(peer.node_id)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=self._timeout(),
+                verify=self.config.verify_tls,
+                follow_redirects=False,
+                transport=self._transport,
+                limits=httpx.Limits(
+                    # 并发分片各占一条连接，另留一条给状态查询和预留完成请求。
+                    max_connections=self.config.max_streams_per_peer + 1,
+                    max_keepalive_connections=self.config.keepalive_connections,
+                    keepalive_expiry=float(self.config.keepalive_expiry_seconds),
+                ),
+            )
+            self._clients[peer.node_id] = client
+        return client
+
+    def _retire_clients(self, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        clients = [client for client in self._clients.values() if not client.is_closed]
+        self._clients = {}
+        if not clients:
+            return
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            for client in clients:
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+        # 旧循环已经停止时无法在它上面关闭连接，留到 aclose 时尽力关闭
+        self._stale_clients.extend(clients)
+        logger.warning("lan peer pool switched event loop; %d client(s) of the previous loop left to aclose", len(clients))
+
+    async def host_is_private(self, peer: LanPeer) -> bool:
+        now = time.monotonic()
+        cached = self._address_cache.get(peer.url)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        is_private = await asyncio.to_thread(peer_host_is_private, peer)
+        if self.config.address_cache_seconds > 0:
+            self._address_cache[peer.url] = (now + self.config.address_cache_seconds, is_private)
+        return is_private
+
+    def cached_capability(self, peer: LanPeer, max_age: Optional[float] = None) -> Optional[dict[str, Any]]:
+        cached = self._capability_cache.get(peer.node_id)
+        limit = float(self.config.capability_cache_seconds)
+        if max_age is not None:
+            limit = min(limit, max_age)
+        if cached is None or time.monotonic() - cached[0] >= limit:
+            return None
+        return cached[1]
+
+    def remember_capability(self, peer: LanPeer, capability: dict[str, Any]) -> None:
+        if self.config.capability_cache_seconds > 0:
+            self._capability_cache[peer.node_id] = (time.monotonic(), capability)
+
+    def forget_peer(self, peer: LanPeer) -> None:
+        self._capability_cache.pop(peer.node_id, None)
+        self._address_cache.pop(peer.url, None)
+
+    async def aclose(self) -> None:
+        clients = list(self._clients.values()) + self._stale_clients
+        self._clients = {}
+        self._stale_clients = []
+        self._capability_cache.clear()
+        self._address_cache.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except (httpx.HTTPError, OSError, RuntimeError):
+                pass
+
+
+async def _peer_capability(
+    config: LanReplicationConfig,
+    pool: LanPeerPool,
+    peer: LanPeer,
+    client: httpx.AsyncClient,
+    headers: dict[str, str],
+    max_age: Optional[float] = None,
+) -> tuple[Optional[dict[str, Any]], Optional[dict[str, Any]]]:
+    capability = pool.cached_capability(peer, max_age)
+    if capability is not None:
+        return capability, None
+
+    capability_response = await client.get(
+        f"{peer.url}/api/lan/replication/capabilities",
+        headers=headers,
+    )
+    if capability_response.status_code != 200:
+        return None, {"status": "offline", "detail": _response_detail(capability_response)}
+    capability = capability_response.json()
+    if not isinstance(capability, dict):
+        return None, {"status": "invalid_response", "detail": "节点能力响应不是 JSON 对象"}
+    if str(capability.get("lan_group", "")) != config.group:
+        return None, {"status": "group_mismatch", "detail": "节点返回的内网组不一致"}
+    if str(capability.get("node_id", "")) != peer.node_id:
+        return None, {"status": "identity_mismatch", "detail": "节点返回的 ID 与配置不一致"}
+    if int(capability.get("protocol_version", 0)) != PROTOCOL_VERSION:
+        return None, {"status": "protocol_mismatch", "detail": "节点复制协议版本不兼容"}
+    pool.remember_capability(peer, capability)
+    return capability, None
+
+
+async def _file_chunks(path: str, offset: int) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file_handle:
+        file_handle.seek(offset)
+        while True:
+            chunk = await asyncio.to_thread(file_handle.read, TRANSFER_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def _segment_chunks(path: str, segments: list[dict[str, Any]]) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file_handle:
+        for segment in segments:
+            file_handle.seek(int(segment["offset"]))
+            remaining = int(segment["length"])
+            while remaining > 0:
+                chunk = await asyncio.to_thread(file_handle.read, min(TRANSFER_CHUNK_BYTES, remaining))
+                if not chunk:
+                    raise OSError("复制源文件在发送过程中被截断")
+                remaining -= len(chunk)
+                yield chunk
+
+
+async def _encoded_chunks(
+    chunks: AsyncIterator[bytes],
+    codec: str,
+    level: int,
+    wire_bytes: list[int],
+    throttle: Optional[Callable[[int], Awaitable[None]]] = None,
+) -> AsyncIterator[bytes]:
+    """边读边压缩；限速和发送统计按实际上线的字节计算。"""
+    compressor = make_compressor(codec, level) if codec else None
+    async for chunk in chunks:
+        if compressor is not None:
+            chunk = await asyncio.to_thread(compressor.compress, chunk)
+        if not chunk:
+            continue
+        if throttle is not None:
+            await throttle(len(chunk))
+        wire_bytes[0] += len(chunk)
+        yield chunk
+    if compressor is not None:
+        tail = compressor.flush()
+        if tail:
+            if throttle is not None:
+                await throttle(len(tail))
+            wire_bytes[0] += len(tail)
+            yield tail
+
+
+def _body_headers(headers: dict[str, str], codec: str, raw_length: int) -> dict[str, str]:
+    body_headers = {**headers, "Content-Type": "application/octet-stream"}
+    if codec:
+        body_headers["Content-Encoding"] = codec
+    else:
+        body_headers["Content-Length"] = str(raw_length)
+    return body_headers
+
+
+def _multipart_quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+
+def _multipart_envelope(boundary: str, fields: dict[str, str], filename: str) -> tuple[bytes, bytes]:
+    """表单字段和文件头作为请求体开头，结束边界作为结尾，文件内容夹在中间流式发送。"""
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        for name, value in fields.items()
+    ]
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{_multipart_quote(filename)}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    )
+    return "".join(parts).encode("utf-8"), f"\r\n--{boundary}--\r\n".encode("ascii")
+
+
+async def _multipart_chunks(head: bytes, path: str, tail: bytes) -> AsyncIterator[bytes]:
+    yield head
+    async for chunk in _file_chunks(path, 0):
+        yield chunk
+    yield tail
+
+
+async def _send_artifact_multipart(
+    config: LanReplicationConfig,
+    peer: LanPeer,
+    pool: LanPeerPool,
+    client: httpx.AsyncClient,
+    headers: dict[str, str],
+    reservation_id: str,
+    artifact: ReplicationArtifact,
+) -> tuple[Optional[dict[str, Any]], str, int]:
+    """不支持续传的节点走一次性表单上传；请求体同样按令牌桶限速。"""
+    last_detail = ""
+    boundary = os.urandom(16).hex()
+    head, tail = _multipart_envelope(boundary, {
+        "reservation_id": reservation_id,
+        "source_node_id": config.node_id,
+        "source_upload_id": str(artifact.upload_id),
+        "original_name": artifact.original_name,
+        "sha256": artifact.sha256,
+        "size": str(artifact.size),
+    }, artifact.stored_name)
+    body_headers = {
+        **headers,
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(len(head) + artifact.size + len(tail)),
+    }
+
+    async def throttle(amount: int) -> None:
+        await pool.shaper.throttle_send(peer, amount)
+
+    for _attempt in range(config.retries + 1):
+        try:
+            started = time.monotonic()
+            wire_bytes = [0]
+            upload_response = await client.post(
+                f"{peer.url}/api/lan/replication/uploads",
+                headers=body_headers,
+                content=_encoded_chunks(_multipart_chunks(head, artifact.path, tail), "", 0, wire_bytes, throttle),
+            )
+            if upload_response.status_code == 200:
+                payload = upload_response.json()
+                if isinstance(payload, dict):
+                    pool.shaper.record_sent(peer.node_id, artifact.size, time.monotonic() - started)
+                    return payload, "", artifact.size
+            last_detail = _response_detail(upload_response)
+        except (OSError, httpx.HTTPError) as exc:
+            last_detail = str(exc)[:500]
+    return None, last_detail, 0
+
+
+async def _send_artifact_resumable(
+    config: LanReplicationConfig,
+    peer: LanPeer,
+    pool: LanPeerPool,
+    client: httpx.AsyncClient,
+    headers: dict[str, str],
+    reservation_id: str,
+    artifact: ReplicationArtifact,
+    codec: str = "",
+) -> tuple[Optional[dict[str, Any]], str, int]:
+    """按接收端已提交的偏移续传；重试只补发缺少的字节。"""
+    item_url = f"{peer.url}/api/lan/replication/reservations/{reservation_id}/items/{artifact.sha256}"
+    last_detail = ""
+    sent_bytes = 0
+
+    async def throttle(amount: int) -> None:
+        await pool.shaper.throttle_send(peer, amount)
+
+    for _attempt in range(config.retries + 1):
+        try:
+            status_response = await client.get(item_url, headers=headers)
+            if status_response.status_code != 200:
+                last_detail = _response_detail(status_response)
+                continue
+            state = status_response.json()
+            if not isinstance(state, dict):
+                last_detail = "节点分片状态不是 JSON 对象"
+                continue
+            if str(state.get("status", "")) != "pending":
+                return state, "", sent_bytes
+            offset = int(state.get("offset", 0))
+            if offset < 0 or offset > artifact.size:
+                last_detail = "节点返回的分片偏移无效"
+                continue
+
+            if offset == artifact.size:
+                content_range = f"bytes */{artifact.size}"
+            else:
+                content_range = f"bytes {offset}-{artifact.size - 1}/{artifact.size}"
+            body_codec = codec if offset < artifact.size else ""
+            wire_bytes = [0]
+            started = time.monotonic()
+            upload_response = await client.put(
+                item_url,
+                headers={
+                    **_body_headers(headers, body_codec, artifact.size - offset),
+                    "Content-Range": content_range,
+                },
+                content=_encoded_chunks(
+                    _file_chunks(artifact.path, offset),
+                    body_codec,
+                    config.compression_level,
+                    wire_bytes,
+                    throttle,
+                ),
+            )
+            if upload_response.status_code == 200:
+                pool.shaper.record_sent(peer.node_id, wire_bytes[0], time.monotonic() - started)
+                sent_bytes += wire_bytes[0]
+                payload = upload_response.json()
+                if isinstance(payload, dict) and str(payload.get("status", "")) != "pending":
+                    return payload, "", sent_bytes
+            last_detail = _response_detail(upload_response)
+        except (OSError, httpx.HTTPError, ValueError, TypeError) as exc:
+            last_detail = str(exc)[:500]
+    return None, last_detail, sent_bytes
+
+
+async def _send_artifact_delta(
+    peer: LanPeer,
+    pool: LanPeerPool,
+    client: httpx.AsyncClient,
+    headers: dict[str, str],
+    reservation_id: str,
+    artifact: ReplicationArtifact,
+    codec: str = "",
+    level: int = 3,
+) -> Optional[tuple[dict[str, Any], str, int]]:
+    """先发 VPK 条目清单，只传接收端本地找不到的条目；不适用或失败时返回 None，改走续传。"""
+    try:
+        segments = await asyncio.to_thread(vpk_segments, artifact.path)
+    except (OSError, ValueError):
+        return None
+    delta_url = f"{peer.url}/api/lan/replication/reservations/{reservation_id}/items/{artifact.sha256}/delta"
+    try:
+        plan_response = await client.post(delta_url, headers=headers, json={"segments": segments})
+        if plan_response.status_code != 200:
+            return None
+        plan = plan_response.json()
+        if not isinstance(plan, dict):
+            return None
+        if str(plan.get("status", "")) in COMPLETED_STATUSES:
+            return plan, "", 0
+        if str(plan.get("status", "")) != "delta":
+            return None
+        needed = [segments[int(index)] for index in plan.get("need", [])]
+        need_bytes = sum(int(segment["length"]) for segment in needed)
+
+        async def throttle(amount: int) -> None:
+            await pool.shaper.throttle_send(peer, amount)
+
+        body_codec = codec if need_bytes else ""
+        wire_bytes = [0]
+        started = time.monotonic()
+        upload_response = await client.put(
+            delta_url,
+            headers=_body_headers(headers, body_codec, need_bytes),
+            content=_encoded_chunks(_segment_chunks(artifact.path, needed), body_codec, level, wire_bytes, throttle),
+        )
+        if upload_response.status_code != 200:
+            return None
+        payload = upload_response.json()
+    except (OSError, httpx.HTTPError, ValueError, TypeError, IndexError):
+        return None
+    if not isinstance(payload, dict) or str(payload.get("status", "")) == "pending":
+        return None
+    pool.shaper.record_sent(peer.node_id, wire_bytes[0], time.monotonic() - started)
+    return payload, "", wire_bytes[0]
+
+
+async def _send_artifact(
+    config: LanReplicationConfig,
+    peer: LanPeer,
+    pool: LanPeerPool,
+    client: httpx.AsyncClient,
+    headers: dict[str, str],
+    reservation_id: str,
+    artifact: ReplicationArtifact,
+    capability: dict[str, Any],
+) -> tuple[Optional[dict[str, Any]], str, int]:
+    with TRACER.span(
+        "lan.send",
+        kind="client",
+        peer=peer.node_id,
+        file=artifact.original_name,
+        sha256=artifact.sha256,
+        size=artifact.size,
+    ) as span:
+        # 请求头里的 traceparent 换成本文件的 span，接收端的处理挂在这一段下面
+        headers = TRACER.inject(dict(headers))
+        features = capability.get("features") or []
+        codec = negotiate_codec(config, capability)
+        outcome: Optional[tuple[Optional[dict[str, Any]], str, int]] = None
+        if isinstance(features, list) and "delta" in features:
+            span.set(mode="delta")
+            outcome = await _send_artifact_delta(
+                peer,
+                pool,
+                client,
+                headers,
+                reservation_id,
+                artifact,
+                codec,
+                config.compression_level,
+            )
+        if outcome is None and isinstance(features, list) and "resume" in features:
+            span.set(mode="resumable")
+            outcome = await _send_artifact_resumable(config, peer, pool, client, headers, reservation_id, artifact, codec)
+        if outcome is None:
+            span.set(mode="multipart")
+            outcome = await _send_artifact_multipart(config, peer, pool, client, headers, reservation_id, artifact)
+        span.set(codec=codec or "off", bytes_sent=outcome[2])
+        if outcome[0] is None:
+            span.fail(outcome[1] or "请求失败")
+        return outcome
+
+
 async def _replicate_to_peer(
     config: LanReplicationConfig,
     peer: LanPeer,
     artifacts: tuple[ReplicationArtifact, ...],
-    transport: Optional[httpx.AsyncBaseTransport] = None,
+    pool: LanPeerPool,
 ) -> dict[str, Any]:
     result: dict[str, Any] = {
         "node_id": peer.node_id,
@@ -267,164 +1027,381 @@ async def _replicate_to_peer(
         "uploaded": [],
         "already_present": [],
     }
-    if not config.allow_public_peers and not await asyncio.to_thread(peer_host_is_private, peer):
+    if not config.allow_public_peers and not await pool.host_is_private(peer):
         result.update(status="rejected_address", detail="节点地址没有解析到私网地址")
         return result
 
-    timeout = httpx.Timeout(
-        connect=float(config.connect_timeout_seconds),
-        read=float(config.transfer_timeout_seconds),
-        write=float(config.transfer_timeout_seconds),
-        pool=float(config.connect_timeout_seconds),
-    )
     reservation_id = ""
     headers = _auth_headers(config)
+    client = pool.client(peer)
     try:
-        async with httpx.AsyncClient(
-            timeout=timeout,
-            verify=config.verify_tls,
-            follow_redirects=False,
-            transport=transport,
-        ) as client:
-            capability_response = await client.get(
-                f"{peer.url}/api/lan/replication/capabilities",
-                headers=headers,
-            )
-            if capability_response.status_code != 200:
-                result.update(status="offline", detail=_response_detail(capability_response))
-                return result
-            capability = capability_response.json()
-            if not isinstance(capability, dict):
-                result.update(status="invalid_response", detail="节点能力响应不是 JSON 对象")
-                return result
-            if str(capability.get("lan_group", "")) != config.group:
-                result.update(status="group_mismatch", detail="节点返回的内网组不一致")
-                return result
-            if str(capability.get("node_id", "")) != peer.node_id:
-                result.update(status="identity_mismatch", detail="节点返回的 ID 与配置不一致")
-                return result
-            if int(capability.get("protocol_version", 0)) != PROTOCOL_VERSION:
-                result.update(status="protocol_mismatch", detail="节点复制协议版本不兼容")
-                return result
-
-            preflight_response = await client.post(
-                f"{peer.url}/api/lan/replication/preflight",
-                headers=headers,
-                json={
-                    "source_node_id": config.node_id,
-                    "lan_group": config.group,
-                    "reservation_ttl_seconds": config.reservation_ttl_seconds,
-                    "artifacts": [artifact.manifest_item() for artifact in artifacts],
-                },
+        capability, failure = await _peer_capability(config, pool, peer, client, headers)
+        if failure is not None:
+            result.update(failure)
+            return result
+        result["compression"] = negotiate_codec(config, capability or {}) or "off"
+
+        preflight_response = await client.post(
+            f"{peer.url}/api/lan/replication/preflight",
+            headers=headers,
+            json={
+                "source_node_id": config.node_id,
+                "lan_group": config.group,
+                "reservation_ttl_seconds": config.reservation_ttl_seconds,
+                "artifacts": [artifact.manifest_item() for artifact in artifacts],
+            },
+        )
+        if preflight_response.status_code != 200:
+            result.update(status="preflight_failed", detail=_response_detail(preflight_response))
+            return result
+        preflight = preflight_response.json()
+        if not isinstance(preflight, dict):
+            result.update(status="invalid_response", detail="节点预检响应不是 JSON 对象")
+            return result
+
+        result["storage"] = preflight.get("storage", {})
+        result["already_present"] = preflight.get("already_present", [])
+        preflight_status = str(preflight.get("status", ""))
+        if preflight_status == "already_present":
+            result["status"] = "already_present"
+            return result
+        if preflight_status == "insufficient_capacity":
+            result.update(
+                status="skipped_capacity",
+                detail=str(preflight.get("detail", "目标节点容量不足")),
+                required_bytes=int(preflight.get("required_bytes", 0)),
             )
-            if preflight_response.status_code != 200:
-                result.update(status="preflight_failed", detail=_response_detail(preflight_response))
-                return result
-            preflight = preflight_response.json()
-            if not isinstance(preflight, dict):
-                result.update(status="invalid_response", detail="节点预检响应不是 JSON 对象")
-                return result
-
-            result["storage"] = preflight.get("storage", {})
-            result["already_present"] = preflight.get("already_present", [])
-            preflight_status = str(preflight.get("status", ""))
-            if preflight_status == "already_present":
-                result["status"] = "already_present"
-                return result
-            if preflight_status == "insufficient_capacity":
-                result.update(
-                    status="skipped_capacity",
-                    detail=str(preflight.get("detail", "目标节点容量不足")),
-                    required_bytes=int(preflight.get("required_bytes", 0)),
+            return result
+        if preflight_status != "reserved":
+            result.update(status="preflight_failed", detail="节点没有返回有效的容量预留")
+            return result
+
+        reservation_id = str(preflight.get("reservation_id", ""))
+        accepted_hashes = {
+            str(item.get("sha256", ""))
+            for item in preflight.get("accepted", [])
+            if isinstance(item, dict)
+        }
+        if not reservation_id or not accepted_hashes:
+            result.update(status="preflight_failed", detail="节点容量预留内容为空")
+            return result
+
+        accepted = [artifact for artifact in artifacts if artifact.sha256 in accepted_hashes]
+        stream_semaphore = asyncio.Semaphore(config.max_streams_per_peer)
+
+        async def send(artifact: ReplicationArtifact) -> tuple[Optional[dict[str, Any]], str, int]:
+            async with stream_semaphore:
+                return await _send_artifact(
+                    config,
+                    peer,
+                    pool,
+                    client,
+                    headers,
+                    reservation_id,
+                    artifact,
+                    capability,
                 )
-                return result
-            if preflight_status != "reserved":
-                result.update(status="preflight_failed", detail="节点没有返回有效的容量预留")
-                return result
-
-            reservation_id = str(preflight.get("reservation_id", ""))
-            accepted_hashes = {
-                str(item.get("sha256", ""))
-                for item in preflight.get("accepted", [])
-                if isinstance(item, dict)
-            }
-            if not reservation_id or not accepted_hashes:
-                result.update(status="preflight_failed", detail="节点容量预留内容为空")
-                return result
-
-            for artifact in artifacts:
-                if artifact.sha256 not in accepted_hashes:
-                    continue
-                last_detail = ""
-                uploaded_payload: Optional[dict[str, Any]] = None
-                for _attempt in range(config.retries + 1):
-                    try:
-                        with open(artifact.path, "rb") as file_handle:
-                            upload_response = await client.post(
-                                f"{peer.url}/api/lan/replication/uploads",
-                                headers=headers,
-                                data={
-                                    "reservation_id": reservation_id,
-                                    "source_node_id": config.node_id,
-                                    "source_upload_id": str(artifact.upload_id),
-                                    "original_name": artifact.original_name,
-                                    "sha256": artifact.sha256,
-                                    "size": str(artifact.size),
-                                },
-                                files={
-                                    "file": (
-                                        artifact.stored_name,
-                                        file_handle,
-                                        "application/octet-stream",
-                                    )
-                                },
-                            )
-                        if upload_response.status_code == 200:
-                            payload = upload_response.json()
-                            if isinstance(payload, dict):
-                                uploaded_payload = payload
-                                break
-                        last_detail = _response_detail(upload_response)
-                    except (OSError, httpx.HTTPError) as exc:
-                        last_detail = str(exc)[:500]
-
-                if uploaded_payload is None:
-                    result.update(
-                        status="partial",
-                        detail=f"{artifact.original_name} 复制失败：{last_detail or '请求失败'}",
-                    )
-                    return result
-                if str(uploaded_payload.get("status", "")) == "already_present":
-                    result["already_present"].append(uploaded_payload.get("upload", {}))
-                else:
-                    result["uploaded"].append(uploaded_payload.get("upload", {}))
-
-            result["status"] = "completed"
+
+        started = time.monotonic()
+        outcomes = await asyncio.gather(*(send(artifact) for artifact in accepted))
+        elapsed = time.monotonic() - started
+        sent_bytes = sum(outcome[2] for outcome in outcomes)
+        result["bytes_sent"] = sent_bytes
+        result["transfer_ms"] = int(elapsed * 1000)
+        result["throughput_bytes_per_second"] = int(sent_bytes / elapsed) if elapsed > 0 else 0
+        failed: list[dict[str, Any]] = []
+        for artifact, (uploaded_payload, last_detail, _) in zip(accepted, outcomes):
+            if uploaded_payload is None:
+                failed.append({
+                    "original_name": artifact.original_name,
+                    "sha256": artifact.sha256,
+                    "detail": last_detail or "请求失败",
+                })
+            elif str(uploaded_payload.get("status", "")) == "already_present":
+                result["already_present"].append(uploaded_payload.get("upload", {}))
+            else:
+                result["uploaded"].append(uploaded_payload.get("upload", {}))
+
+        if failed:
+            result.update(
+                status="partial",
+                detail=f"{failed[0]['original_name']} 复制失败：{failed[0]['detail']}",
+                failed=failed,
+            )
             return result
+        result["status"] = "completed"
+        return result
     except (httpx.HTTPError, OSError, ValueError, TypeError) as exc:
+        pool.forget_peer(peer)
         result.update(status="offline", detail=str(exc)[:500])
         return result
     finally:
         if reservation_id:
             try:
-                async with httpx.AsyncClient(
-                    timeout=timeout,
-                    verify=config.verify_tls,
-                    follow_redirects=False,
-                    transport=transport,
-                ) as client:
-                    await client.post(
-                        f"{peer.url}/api/lan/replication/reservations/{reservation_id}/complete",
-                        headers=headers,
-                    )
+                await client.post(
+                    f"{peer.url}/api/lan/replication/reservations/{reservation_id}/complete",
+                    headers=headers,
+                )
             except (httpx.HTTPError, OSError):
                 pass
 
 
+def relay_plan(
+    peers: tuple[LanPeer, ...],
+    topology: str,
+    fanout: int,
+) -> list[tuple[LanPeer, tuple[LanPeer, ...]]]:
+    """把节点分成种子直发的头节点和由它们继续转发的下游节点。"""
+    if topology == "chain":
+        fanout = 1
+    elif topology != "tree":
+        return [(peer, ()) for peer in peers]
+    fanout = max(1, fanout)
+    heads = peers[:fanout]
+    rest = peers[fanout:]
+    return [(head, rest[index::len(heads)]) for index, head in enumerate(heads)]
+
+
+async def _request_relay(
+    config: LanReplicationConfig,
+    pool: LanPeerPool,
+    head: LanPeer,
+    artifacts: tuple[ReplicationArtifact, ...],
+    downstream: tuple[LanPeer, ...],
+    relay_depth: int,
+) -> Optional[list[dict[str, Any]]]:
+    """请求已校验完文件的节点继续转发；失败时返回 None，由种子节点直接补发。"""
+    try:
+        response = await pool.client(head).post(
+            f"{head.url}/api/lan/replication/relay",
+            headers=_auth_headers(config),
+            json={
+                "source_node_id": config.node_id,
+                "lan_group": config.group,
+                "topology": config.topology,
+                "fanout": config.relay_fanout,
+                "hops": relay_depth + 1,
+                "targets": [peer.node_id for peer in downstream],
+                "artifacts": [artifact.manifest_item() for artifact in artifacts],
+            },
+        )
+        if response.status_code != 200:
+            return None
+        payload = response.json()
+    except (httpx.HTTPError, OSError, ValueError):
+        pool.forget_peer(head)
+        return None
+    if not isinstance(payload, dict) or not isinstance(payload.get("peers"), list):
+        return None
+    wanted = {peer.node_id for peer in downstream}
+    results = []
+    for item in payload["peers"]:
+        if isinstance(item, dict) and str(item.get("node_id", "")) in wanted:
+            item.setdefault("via", head.node_id)
+            results.append(item)
+    return results
+
+
+def replication_digest(items: Mapping[str, tuple[int, str]]) -> dict[str, Any]:
+    """按 SHA-256 前缀分桶汇总 (sha256, size, state)，根哈希覆盖所有非空桶。
+
+    items: sha256 -> (size, state)，state 为 active 或 deleted。
+    """
+    buckets: dict[str, list[str]] = {}
+    for sha256, (size, state) in items.items():
+        buckets.setdefault(sha256[:DIGEST_PREFIX_LENGTH], []).append(f"{sha256}:{int(size)}:{state}")
+    bucket_hashes = {
+        prefix: hashlib.sha256("\n".join(sorted(lines)).encode()).hexdigest()[:16]
+        for prefix, lines in sorted(buckets.items())
+    }
+    root = hashlib.sha256(
+        "\n".join(f"{prefix}={digest}" for prefix, digest in bucket_hashes.items()).encode()
+    ).hexdigest()
+    return {"root": root, "item_count": len(items), "buckets": bucket_hashes}
+
+
+def digest_differences(local: Mapping[str, Any], remote: Mapping[str, Any]) -> list[str]:
+    """返回两边哈希不同的桶前缀；根哈希一致时直接返回空列表。"""
+    if local.get("root") == remote.get("root"):
+        return []
+    local_buckets = local.get("buckets") or {}
+    remote_buckets = remote.get("buckets") or {}
+    if not isinstance(remote_buckets, dict):
+        remote_buckets = {}
+    prefixes = set(local_buckets) | {str(prefix) for prefix in remote_buckets}
+    return sorted(prefix for prefix in prefixes if local_buckets.get(prefix) != remote_buckets.get(prefix))
+
+
+async def reconcile_peer(
+    config: LanReplicationConfig,
+    pool: LanPeerPool,
+    peer: LanPeer,
+    local_items: Mapping[str, tuple[int, str]],
+) -> tuple[Optional[dict[str, Any]], Optional[dict[str, Any]]]:
+    """和节点交换摘要。
+
+    local_items 应当只包含本节点认为双方都该持有的文件，对方的摘要接口同样按请求方筛选，
+    稳态下两边的桶一致，不需要列出前缀。
+
+    返回 ``missing``（本节点有效持有、对方没有的 SHA-256）、``deleted``（对方主动删除过的）、
+    ``holders``（对方为列出的文件记录的持有节点）以及对方在能力响应中公布的 ``storage``。
+    """
+    if not config.allow_public_peers and not await pool.host_is_private(peer):
+        return None, {"status": "rejected_address", "detail": "节点地址没有解析到私网地址"}
+    headers = _auth_headers(config)
+    client = pool.client(peer)
+    try:
+        capability, failure = await _peer_capability(config, pool, peer, client, headers)
+        if failure is not None:
+            return None, failure
+        capability = capability or {}
+        if "digest" not in capability.get("features", []):
+            return None, {"status": "unsupported", "detail": "节点不支持摘要对账"}
+        storage = capability.get("storage") if isinstance(capability.get("storage"), dict) else {}
+
+        local_digest = replication_digest(local_items)
+        response = await client.post(f"{peer.url}/api/lan/replication/digest", headers=headers, json={})
+        if response.status_code != 200:
+            return None, {"status": "offline", "detail": _response_detail(response)}
+        prefixes = digest_differences(local_digest, response.json())
+        if not prefixes:
+            return {"missing": [], "deleted": [], "holders": {}, "storage": storage}, None
+
+        response = await client.post(
+            f"{peer.url}/api/lan/replication/digest",
+            headers=headers,
+            json={"prefixes": prefixes},
+        )
+        if response.status_code != 200:
+            return None, {"status": "offline", "detail": _response_detail(response)}
+        payload = response.json()
+        remote_items = payload.get("items", []) if isinstance(payload, dict) else []
+        remote_states = {
+            str(item.get("sha256", "")): str(item.get("state", ""))
+            for item in remote_items
+            if isinstance(item, dict)
+        }
+        remote_holders = {
+            str(item.get("sha256", "")): [str(node_id) for node_id in item["holders"]]
+            for item in remote_items
+            if isinstance(item, dict) and isinstance(item.get("holders"), list)
+        }
+    except (httpx.HTTPError, OSError, ValueError, TypeError) as exc:
+        pool.forget_peer(peer)
+        return None, {"status": "offline", "detail": str(exc)[:500]}
+
+    wanted = set(prefixes)
+    candidates = [
+        sha256
+        for sha256, (_, state) in sorted(local_items.items())
+        if state == "active" and sha256[:DIGEST_PREFIX_LENGTH] in wanted
+    ]
+    return {
+        "missing": [sha256 for sha256 in candidates if sha256 not in remote_states],
+        "deleted": [sha256 for sha256 in candidates if remote_states.get(sha256) == "deleted"],
+        "holders": remote_holders,
+        "storage": storage,
+    }, None
+
+
+def storage_weight(storage: Optional[Mapping[str, Any]]) -> int:
+    """节点公布的剩余可用空间，作为 rendezvous 权重。
+
+    available_bytes 已经扣除了进行中复制的容量预留，所以正在接收大量文件的节点也会暂时少分到新副本。
+    """
+    if not storage:
+        return 1
+    try:
+        return max(1, int(storage.get("available_bytes", 0)))
+    except (TypeError, ValueError):
+        return 1
+
+
+def rendezvous_order(key: str, weights: Mapping[str, int]) -> list[str]:
+    """加权 rendezvous 哈希：同一个 key 在各节点上得到相同顺序，容量越大越靠前。"""
+
+    def score(node_id: str) -> float:
+        digest = hashlib.sha256(f"{key}:{node_id}".encode()).digest()
+        fraction = (int.from_bytes(digest[:8], "big") + 1) / (2 ** 64 + 2)
+        return max(1, weights[node_id]) / -math.log(fraction)
+
+    return sorted(weights, key=lambda node_id: (-score(node_id), node_id))
+
+
+def place_artifact(
+    config: LanReplicationConfig,
+    sha256: str,
+    size: int,
+    storage: Mapping[str, Optional[Mapping[str, Any]]],
+    holders: Iterable[str] = (),
+    excluded: Iterable[str] = (),
+) -> list[str]:
+    """选出应当持有该文件的节点 ID（包括本节点和已持有的节点）。
+
+    storage 为 节点 ID -> 公布的容量（None 表示当前不可达）。`replication_factor` 为 0 时
+    返回全部节点。已持有的节点（例如收到上传的本节点）先计入副本数，剩余名额按 rendezvous
+    顺序补齐，跳过不可达、明确删除过或放不下的节点，所以节点离开后排在后面的节点会自动补上副本。
+    权重取剩余可用空间，已有副本不会因为权重变化而迁移；可达但没有公布容量的旧节点（空字典）
+    按权重 1 参与放置。返回的节点数少于副本数时，说明当前凑不齐副本。
+    """
+    members = [config.node_id, *(peer.node_id for peer in config.peers)]
+    excluded_ids = set(excluded)
+    if config.replication_factor <= 0:
+        return [node_id for node_id in members if node_id not in excluded_ids]
+    holder_ids = set(holders)
+    weights = {node_id: storage_weight(storage.get(node_id)) for node_id in members}
+    order = [node_id for node_id in rendezvous_order(sha256, weights) if node_id not in excluded_ids]
+    chosen = [node_id for node_id in order if node_id in holder_ids]
+    for node_id in order:
+        if len(chosen) >= config.replication_factor:
+            break
+        if node_id in holder_ids:
+            continue
+        node_storage = storage.get(node_id)
+        if node_storage is None:
+            continue
+        if "available_bytes" in node_storage and int(node_storage.get("available_bytes") or 0) < size:
+            continue
+        chosen.append(node_id)
+    return chosen
+
+
+async def peer_storage(config: LanReplicationConfig, pool: LanPeerPool) -> dict[str, Optional[dict[str, Any]]]:
+    """并发读取各节点能力响应中的容量信息；不可达的节点记为 None。
+
+    容量随预留变化很快，能力缓存最多沿用 STORAGE_CACHE_SECONDS 秒。
+    """
+
+    async def fetch(peer: LanPeer) -> Optional[dict[str, Any]]:
+        if not config.allow_public_peers and not await pool.host_is_private(peer):
+            return None
+        try:
+            capability, failure = await _peer_capability(
+                config,
+                pool,
+                peer,
+                pool.client(peer),
+                _auth_headers(config),
+                max_age=STORAGE_CACHE_SECONDS,
+            )
+        except (httpx.HTTPError, OSError, ValueError, TypeError):
+            pool.forget_peer(peer)
+            return None
+        if failure is not None or capability is None:
+            return None
+        storage = capability.get("storage")
+        return storage if isinstance(storage, dict) else {}
+
+    results = await asyncio.gather(*(fetch(peer) for peer in config.peers))
+    return {peer.node_id: result for peer, result in zip(config.peers, results)}
+
+
 async def replicate_artifacts(
     config: LanReplicationConfig,
     artifacts: Iterable[ReplicationArtifact],
     transport: Optional[httpx.AsyncBaseTransport] = None,
+    pool: Optional[LanPeerPool] = None,
+    relay_depth: int = 0,
 ) -> dict[str, Any]:
     artifact_tuple = tuple(artifacts)
     if not artifact_tuple:
@@ -455,16 +1432,60 @@ async def replicate_artifacts(
             "peers": peer_results,
         }
 
+    owned_pool = pool is None
+    if pool is None:
+        pool = LanPeerPool(config, transport=transport)
     semaphore = asyncio.Semaphore(config.max_parallel_peers)
 
     async def run(peer: LanPeer) -> dict[str, Any]:
         async with semaphore:
-            return await _replicate_to_peer(config, peer, artifact_tuple, transport=transport)
+            started = time.perf_counter()
+            with TRACER.span("lan.replicate", kind="client", peer=peer.node_id, artifact_count=len(artifact_tuple)) as span:
+                result = await _replicate_to_peer(config, peer, artifact_tuple, pool)
+                status = str(result.get("status", "failed"))
+                span.set(status=status, bytes_sent=result.get("bytes_sent"), transfer_ms=result.get("transfer_ms"))
+                if status not in COMPLETED_STATUSES and status != "skipped_capacity":
+                    span.fail(str(result.get("detail", status)))
+            REPLICATION_SECONDS.labels(peer=peer.node_id, status=status).observe(time.perf_counter() - started)
+            REPLICATION_BYTES.labels(peer=peer.node_id, status=status).inc(int(result.get("bytes_sent", 0) or 0))
+            return result
+
+    async def run_branch(head: LanPeer, downstream: tuple[LanPeer, ...]) -> list[dict[str, Any]]:
+        head_result = await run(head)
+        if not downstream:
+            return [head_result]
+        relayed: Optional[list[dict[str, Any]]] = None
+        if head_result.get("status") in COMPLETED_STATUSES and relay_depth < MAX_RELAY_HOPS:
+            with TRACER.span(
+                "lan.relay",
+                kind="client",
+                peer=head.node_id,
+                targets=",".join(peer.node_id for peer in downstream),
+            ) as span:
+                relayed = await _request_relay(config, pool, head, artifact_tuple, downstream, relay_depth)
+                if relayed is None:
+                    span.fail("中继请求失败，改由本节点直接发送")
+        relayed = relayed or []
+        relayed_ids = {str(item.get("node_id", "")) for item in relayed}
+        fallback = [peer for peer in downstream if peer.node_id not in relayed_ids]
+        direct = await asyncio.gather(*(run(peer) for peer in fallback))
+        return [head_result, *relayed, *direct]
 
-    peer_results = list(await asyncio.gather(*(run(peer) for peer in config.peers)))
-    completed_statuses = {"completed", "already_present"}
+    try:
+        branches = await asyncio.gather(*(
+            run_branch(head, downstream)
+            for head, downstream in relay_plan(config.peers, config.topology, config.relay_fanout)
+        ))
+    finally:
+        if owned_pool:
+            await pool.aclose()
+    order = {peer.node_id: index for index, peer in enumerate(config.peers)}
+    peer_results = sorted(
+        (item for branch in branches for item in branch),
+        key=lambda item: order.get(str(item.get("node_id", "")), len(order)),
+    )
     skipped_statuses = {"skipped_capacity"}
-    completed_count = sum(item.get("status") in completed_statuses for item in peer_results)
+    completed_count = sum(item.get("status") in COMPLETED_STATUSES for item in peer_results)
     skipped_count = sum(item.get("status") in skipped_statuses for item in peer_results)
     failed_count = len(peer_results) - completed_count - skipped_count
     return {
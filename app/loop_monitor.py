@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from .metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+
+logger = logging.getLogger("vpk_uploader")
+
+LOOP_KEEP_SAMPLES = 600
+LOOP_KEEP_STALLS = 50
+LOOP_STACK_DEPTH = 30
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _percentile_ms(ordered: list[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return round(ordered[index] * 1000, 1)
+
+
+def _format_stack(frame) -> tuple[list[str], str]:
+    frames = traceback.extract_stack(frame)[-LOOP_STACK_DEPTH:]
+    lines = [f"{os.path.basename(item.filename)}:{item.lineno} {item.name}  {(item.line or '').strip()}" for item in frames]
+    # 最内层的本项目代码通常就是卡住事件循环的调用点，库代码只是它往下调用的地方
+    culprit = next(
+        (line for item, line in zip(reversed(frames), reversed(lines)) if item.filename.startswith(_APP_DIR)),
+        lines[-1] if lines else "",
+    )
+    return lines, culprit
+
+
+class LoopMonitor:
+    """持续测量事件循环的调度延迟；调试模式下由看门狗线程抓取卡住事件循环的调用栈。"""
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1, debug: bool = False, keep: int = LOOP_KEEP_STALLS):
+        self.interval = max(0.0, interval)
+        self.threshold = max(0.001, threshold)
+        self.debug = debug
+        self._lock = threading.Lock()
+        self._samples: deque[float] = deque(maxlen=LOOP_KEEP_SAMPLES)
+        self._stalls: deque[dict[str, Any]] = deque(maxlen=keep)
+        self._stall_count = 0
+        self._max_lag = 0.0
+        self._due: Optional[float] = None
+        self._captured: Optional[tuple[float, float, list[str], str]] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog_stop: Optional[threading.Event] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def start(self) -> None:
+        if not self.enabled or (self._task is not None and not self._task.done()):
+            return
+        self._loop_thread = threading.get_ident()
+        self._task = asyncio.create_task(self._run())
+        if self.debug:
+            self._start_watchdog()
+
+    async def stop(self) -> None:
+        self._stop_watchdog()
+        task = self._task
+        self._task = None
+        self._due = None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def set_debug(self, debug: bool) -> None:
+        self.debug = debug
+        if not debug:
+            self._stop_watchdog()
+        elif self._task is not None and not self._task.done():
+            self._start_watchdog()
+        logger.info("event loop monitor debug=%s", debug)
+
+    def _start_watchdog(self) -> None:
+        if self._watchdog_stop is not None:
+            return
+        stop = threading.Event()
+        self._watchdog_stop = stop
+        threading.Thread(target=self._watch, args=(stop,), name="vpk-loop-watchdog", daemon=True).start()
+
+    def _stop_watchdog(self) -> None:
+        stop = self._watchdog_stop
+        self._watchdog_stop = None
+        if stop is not None:
+            stop.set()
+
+    async def _run(self) -> None:
+        while True:
+            due = time.monotonic() + self.interval
+            self._due = due
+            await asyncio.sleep(self.interval)
+            self._record(max(0.0, time.monotonic() - due), due)
+
+    def _watch(self, stop: threading.Event) -> None:
+        poll = max(0.005, self.threshold / 4)
+        while not stop.wait(poll):
+            due = self._due
+            if due is None or self._loop_thread is None:
+                continue
+            blocked = time.monotonic() - due
+            captured = self._captured
+            if blocked < self.threshold or (captured is not None and captured[0] == due):
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            # 探针醒来前事件循环一直卡着，这时事件循环线程上的栈就是卡住它的那段同步代码
+            lines, culprit = _format_stack(frame)
+            del frame
+            self._captured = (due, blocked, lines, culprit)
+
+    def _record(self, lag: float, due: float) -> None:
+        LOOP_LAG_SECONDS.observe(lag)
+        with self._lock:
+            self._samples.append(lag)
+            self._max_lag = max(self._max_lag, lag)
+        if lag < self.threshold:
+            return
+        stall: dict[str, Any] = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "lag_ms": round(lag * 1000, 1),
+        }
+        captured = self._captured
+        if captured is not None and captured[0] == due:
+            stall.update({"captured_after_ms": round(captured[1] * 1000, 1), "culprit": captured[3], "stack": captured[2]})
+        LOOP_STALLS.inc()
+        with self._lock:
+            self._stall_count += 1
+            self._stalls.append(stall)
+        if "stack" in stall:
+            logger.warning(
+                "event loop blocked for %.0f ms at %s\n%s",
+                lag * 1000,
+                stall["culprit"],
+                "\n".join(stall["stack"]),
+            )
+        else:
+            logger.warning("event loop blocked for %.0f ms", lag * 1000)
+
+    def status(self, limit: int = 20) -> dict[str, Any]:
+        with self._lock:
+            samples = list(self._samples)
+            stalls = list(self._stalls)[-limit:] if limit > 0 else []
+            stall_count = self._stall_count
+            max_lag = self._max_lag
+        ordered = sorted(samples)
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "debug": self.debug,
+            "interval_ms": round(self.interval * 1000, 1),
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "window_samples": len(samples),
+            "lag_ms": round(samples[-1] * 1000, 1) if samples else 0.0,
+            "p50_ms": _percentile_ms(ordered, 50),
+            "p99_ms": _percentile_ms(ordered, 99),
+            "window_max_ms": round(ordered[-1] * 1000, 1) if ordered else 0.0,
+            "max_ms": round(max_lag * 1000, 1),
+            "stalls": stall_count,
+            "recent_stalls": list(reversed(stalls)),
+        }
@@ -9,30 +9,65 @@ import logging
 import threading
 import time
 import select
+import zlib
 import subprocess
+import socket
 from contextlib import contextmanager
-from urllib.parse import quote
+from dataclasses import replace
+from urllib.parse import quote, urlsplit
 from datetime import datetime, timedelta, timezone
-from typing import Any, Optional
+from typing import Any, Callable, Iterable, Mapping, Optional
 
-from fastapi import FastAPI, Request, UploadFile, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, PlainTextResponse, JSONResponse
+from fastapi import FastAPI, Request, UploadFile, Form, HTTPException, WebSocket
+from fastapi.routing import APIRoute
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, PlainTextResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from itsdangerous import URLSafeSerializer, BadSignature
 
 from .vpkcheck import validate_vpk, ValidationResult
 from .vpk_tools import process_server_vpk
-from .vpk_reader import open_vpk
+from .vpk_reader import open_vpk, verify_vpk_crc, vpk_segments
 from .db import init_db, SessionLocal, Upload, AppSetting, ReplicationReservation
-from .docker_manager import DockerManager
+from .docker_exec import stream_container_exec
+from .docker_manager import DockerManager, DockerStatsCollector
+from .docker_stream import DashboardBroadcaster
+from .metrics import (
+    CAPACITY_LOCK_HOLD_SECONDS,
+    CAPACITY_LOCK_WAIT_SECONDS,
+    CLEANUP_SECONDS,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    REGISTRY as METRICS_REGISTRY,
+    SFTP_SCAN_SECONDS,
+    UPLOAD_DEDUP_HITS,
+    UPLOAD_INGESTED_BYTES,
+    UPLOAD_STAGE_SECONDS,
+    VALIDATION_FAILURES,
+    observe_storage,
+    validation_failure_rules,
+)
+from .metrics_history import MetricsHistory
+from .profiling import PROFILE_MAX_ARMED, Profiler, profile_handler, profile_links
+from .loop_monitor import LoopMonitor
+from .tracing import TRACE_ID_HEADER, TRACEPARENT_HEADER, TRACER, configure_tracing, format_trace, parse_traceparent
 from .aggregation import client_ip_is_allowed, token_is_valid
 from .lan_replication import (
+    DIGEST_PREFIX_LENGTH,
+    MAX_RELAY_HOPS,
     PROTOCOL_VERSION,
+    REPLICATION_FEATURES,
+    TOPOLOGIES,
+    LanPeerPool,
     ReplicationArtifact,
+    available_codecs,
     load_lan_replication_config,
+    make_decompressor,
+    place_artifact,
+    reconcile_peer,
     replicate_artifacts,
+    replication_digest,
 )
+from .replication_queue import ReplicationQueue
 
 APP_SECRET = os.getenv("APP_SECRET", "dev-secret-change-me")
 ADMIN_USER = os.getenv("ADMIN_USER", "admin")
@@ -41,6 +76,13 @@ INSTANCE_NAME = os.getenv("INSTANCE_NAME", "VPK Uploader")
 FEDERATION_API_TOKEN = os.getenv("FEDERATION_API_TOKEN", "")
 FEDERATION_ALLOWED_CIDRS = os.getenv("FEDERATION_ALLOWED_CIDRS", "")
 LAN_REPLICATION = load_lan_replication_config()
+LAN_PEER_POOL = LanPeerPool(LAN_REPLICATION)
+LAN_REPLICATION_QUEUE = ReplicationQueue(
+    LAN_REPLICATION,
+    pool=LAN_PEER_POOL,
+    local_storage=lambda: _local_replication_storage(),
+    on_placed=lambda holders: _record_lan_holders(holders),
+)
 logger = logging.getLogger("vpk_uploader")
 DEFAULT_MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "1024"))
 DEFAULT_TOTAL_UPLOAD_LIMIT_MB = int(os.getenv("MAX_TOTAL_UPLOAD_MB", "0"))
@@ -63,6 +105,12 @@ TMP_MAX_AGE_MIN = int(os.getenv("TMP_MAX_AGE_MIN", "30"))
 WORK_MAX_AGE_MIN = int(os.getenv("WORK_MAX_AGE_MIN", "60"))
 SFTP_IMPORT_MIN_AGE_SECONDS = int(os.getenv("SFTP_IMPORT_MIN_AGE_SECONDS", "30"))
 SFTP_SCAN_INTERVAL_SECONDS = max(5, int(os.getenv("SFTP_SCAN_INTERVAL_SECONDS", "60")))
+DOCKER_STATS_REFRESH_SECONDS = max(0, int(os.getenv("DOCKER_STATS_REFRESH_SECONDS", "10")))
+DOCKER_DOWNLOAD_MAX_MB = max(1, int(os.getenv("DOCKER_DOWNLOAD_MAX_MB", "2048")))
+DOCKER_METRICS_MAX_CONTAINERS = max(1, int(os.getenv("DOCKER_METRICS_MAX_CONTAINERS", "200")))
+DOCKER_METRICS_HISTORY_DIR = os.getenv("DOCKER_METRICS_HISTORY_DIR", "")
+DOCKER_METRICS_SPILL_INTERVAL_SECONDS = 300
+DOCKER_METRICS_MAX_WINDOW_SECONDS = 30 * 24 * 3600
 
 BASE_DIR = os.path.dirname(__file__)
 DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(BASE_DIR), "data"))
@@ -75,8 +123,42 @@ TMP_DIR = os.getenv("TMP_DIR", "/tmp")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(TMP_DIR, exist_ok=True)
 CAPACITY_LOCK_PATH = os.path.join(DATA_DIR, ".capacity.lock")
+PROFILER = Profiler(os.path.join(DATA_DIR, "profiles"))
+
+# 链路追踪：off 不记录；jsonl 写本地文件；otlp 按 OTLP/HTTP JSON 发给收集端
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "off")
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", os.path.join(DATA_DIR, "traces", "spans.jsonl"))
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "vpk-uploader")
+configure_tracing(
+    TRACE_EXPORTER,
+    TRACE_JSONL_PATH,
+    TRACE_OTLP_ENDPOINT,
+    {
+        "service.name": TRACE_SERVICE_NAME,
+        "service.instance.id": LAN_REPLICATION.node_id or socket.gethostname(),
+    },
+)
+
+# 事件循环延迟监测：间隔为 0 时关闭；调试模式下超过阈值会抓取卡住事件循环的调用栈
+LOOP_MONITOR_INTERVAL_MS = max(0, int(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100")))
+LOOP_STALL_THRESHOLD_MS = max(1, int(os.getenv("LOOP_STALL_THRESHOLD_MS", "100")))
+LOOP_MONITOR_DEBUG = os.getenv("LOOP_MONITOR_DEBUG", "0") == "1"
+LOOP_MONITOR = LoopMonitor(
+    interval=LOOP_MONITOR_INTERVAL_MS / 1000,
+    threshold=LOOP_STALL_THRESHOLD_MS / 1000,
+    debug=LOOP_MONITOR_DEBUG,
+)
+
+class _ProfiledRoute(APIRoute):
+    """给路由处理函数套上 profile_handler，请求剖析只记录处理函数本身（同步路由在线程池里）。"""
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        super().__init__(path, profile_handler(endpoint), **kwargs)
+
 
 app = FastAPI(title="VPK Uploader")
+app.router.route_class = _ProfiledRoute
 app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
 templates.env.filters['tojson'] = lambda v: json.dumps(v, ensure_ascii=False, indent=2)
@@ -85,6 +167,22 @@ signer = URLSafeSerializer(APP_SECRET, salt="session")
 init_db()
 _sftp_scan_lock = threading.Lock()
 _sftp_scan_task: Optional[asyncio.Task] = None
+_lan_anti_entropy_task: Optional[asyncio.Task] = None
+_lan_partial_hashes: dict[str, tuple[int, Any]] = {}
+_lan_partial_locks: dict[str, asyncio.Lock] = {}
+_lan_delta_plans: dict[str, list[tuple[dict[str, Any], Optional[tuple[str, int, int]]]]] = {}
+_vpk_segment_cache: dict[str, tuple[tuple[int, int], list[dict[str, Any]]]] = {}
+# (crc32, 长度) -> {文件路径: [(偏移, 条目路径, 预载数据 CRC32)]}，与 _vpk_segment_cache 一起按文件增量维护
+_vpk_entry_index: dict[tuple[int, int], dict[str, list[tuple[int, str, int]]]] = {}
+_vpk_index_dirty: set[str] = set()
+_vpk_index_loaded = False
+_vpk_index_lock = threading.Lock()
+MAX_DELTA_SEGMENTS = 65536
+# 接收复制数据时攒够这么多字节再交给线程写盘，避免在事件循环里逐块写入和 flush
+LAN_WRITE_BATCH_BYTES = 4 * 1024 * 1024
+_docker_manager: Optional[DockerManager] = None
+_docker_manager_lock = threading.Lock()
+_docker_metrics_spill_task: Optional[asyncio.Task] = None
 
 
 def now_utc() -> datetime:
@@ -232,12 +330,25 @@ def active_upload_usage_bytes(db) -> int:
 @contextmanager
 def capacity_guard():
     lock_fd = os.open(CAPACITY_LOCK_PATH, os.O_CREAT | os.O_RDWR, 0o600)
+    acquired_at = None
     try:
+        started = time.perf_counter()
         fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        acquired_at = time.perf_counter()
+        CAPACITY_LOCK_WAIT_SECONDS.observe(acquired_at - started)
         yield
     finally:
         fcntl.flock(lock_fd, fcntl.LOCK_UN)
         os.close(lock_fd)
+        if acquired_at is not None:
+            CAPACITY_LOCK_HOLD_SECONDS.observe(time.perf_counter() - acquired_at)
+
+
+@contextmanager
+def upload_stage(stage: str):
+    """上传流水线的一个阶段：同时记入阶段耗时直方图和当前 trace。"""
+    with TRACER.span(f"upload.{stage}"), UPLOAD_STAGE_SECONDS.labels(stage=stage).time():
+        yield
 
 
 def _expire_replication_reservations(db) -> bool:
@@ -430,6 +541,9 @@ def admin_context(
             "settings_saved": settings_saved,
             "upload_error": upload_error,
             "upload_message": upload_message,
+            "profiling": PROFILER.status(),
+            "profiling_max": PROFILE_MAX_ARMED,
+            "profiles": PROFILER.recent(10),
         }
         context.update(storage_context(db))
         return context
@@ -640,7 +754,8 @@ def _archive_vpk_members(archive_path: str, max_count: int) -> list[str]:
 def _extract_archive_vpk_member(archive_path: str, archive_name: str, member: str, max_bytes: int, max_mb: int):
     vpk_name = _ensure_vpk_filename(member)
     tmp_vpk_path = os.path.join(TMP_DIR, f"{secrets.token_hex(6)}.vpk")
-    extracted_bytes = _extract_archive_member_to_file(archive_path, member, tmp_vpk_path, max_bytes, max_mb)
+    with upload_stage("member_extract"):
+        extracted_bytes = _extract_archive_member_to_file(archive_path, member, tmp_vpk_path, max_bytes, max_mb)
 
     return tmp_vpk_path, vpk_name, {
         "source": "archive",
@@ -721,7 +836,37 @@ def _expiry_for_upload(db, role: str, ttl_hours: Optional[int]) -> Optional[date
     return None
 
 
-def _process_vpk_upload(
+def _process_vpk_upload(**kwargs):
+    name = _basename_only(kwargs["source_vpk_name"])
+    with TRACER.span("upload.vpk", file=name, role=kwargs["role"]) as span:
+        with PROFILER.session("upload", name) as profile:
+            up, result = _store_vpk_upload(**kwargs)
+            if profile is not None and up is not None:
+                profile.upload_ids.append(up.id)
+        if up is None:
+            span.fail(str(result.get("error", "")))
+        else:
+            span.set(upload_id=up.id, deduplicated=bool(result.get("deduplicated")))
+    if profile is not None and up is not None:
+        _attach_upload_profile(up.id, profile.id)
+    return up, result
+
+
+def _attach_upload_profile(upload_id: int, profile_id: str) -> None:
+    db = SessionLocal()
+    try:
+        item = db.get(Upload, upload_id)
+        if item is None:
+            return
+        report = json.loads(item.vpk_report or "{}")
+        report["profile"] = profile_links(profile_id)
+        item.vpk_report = json.dumps(report, ensure_ascii=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _store_vpk_upload(
     request: Request,
     role: str,
     ttl_hours: Optional[int],
@@ -735,16 +880,26 @@ def _process_vpk_upload(
     work_base = _safe_base_no_ext(display_name)
 
     try:
-        vr: ValidationResult = validate_vpk(tmp_vpk_path, RULES_FILE, max_size_mb_override=upload_max_mb)
+        with upload_stage("validate"):
+            vr: ValidationResult = validate_vpk(tmp_vpk_path, RULES_FILE, max_size_mb_override=upload_max_mb)
+        if vr.ok:
+            # 条目内容与目录里的 CRC32 不符的图包照样能重打包，但客户端加载时会崩溃
+            with upload_stage("verify_crc"):
+                crc_errors = verify_vpk_crc(tmp_vpk_path)
+            if crc_errors:
+                vr = replace(vr, ok=False, crc_errors=crc_errors)
     except Exception as exc:
         _remove_file_quietly(tmp_vpk_path)
+        VALIDATION_FAILURES.labels(rule="read_error").inc()
         raise HTTPException(status_code=400, detail=f"VPK 读取失败：{exc}")
 
     if not vr.ok:
         _remove_file_quietly(tmp_vpk_path)
+        for rule in validation_failure_rules(vr.to_dict()):
+            VALIDATION_FAILURES.labels(rule=rule).inc()
         return None, {
             "name": display_name,
-            "error": "VPK 不符合要求",
+            "error": "VPK 文件已损坏，部分条目校验失败" if vr.crc_errors else "VPK 不符合要求",
             "report": vr.to_dict(),
         }
 
@@ -754,25 +909,29 @@ def _process_vpk_upload(
         expires_at = _expiry_for_upload(db, role, ttl_hours)
         final_name = _unique_server_filename(db, work_base)
 
-        build_report = process_server_vpk(
-            src_vpk_path=tmp_vpk_path,
-            work_dir_root=TMP_DIR,
-            work_base_name=f"{work_base}_{secrets.token_hex(4)}",
-            output_dir=UPLOAD_DIR,
-            output_filename=final_name,
-        )
+        with upload_stage("build"):
+            build_report = process_server_vpk(
+                src_vpk_path=tmp_vpk_path,
+                work_dir_root=TMP_DIR,
+                work_base_name=f"{work_base}_{secrets.token_hex(4)}",
+                output_dir=UPLOAD_DIR,
+                output_filename=final_name,
+            )
 
         server_path = os.path.join(UPLOAD_DIR, final_name)
         server_size = os.path.getsize(server_path) if os.path.exists(server_path) else 0
-        server_sha256 = _sha256_file(server_path)
+        with upload_stage("hash"):
+            server_sha256 = _sha256_file(server_path)
         upload_source = {**upload_source, "uploaded_sha256": upload_sha256}
         report = {"upload_source": upload_source, "validation": vr.to_dict(), "server_build": build_report}
 
         with capacity_guard():
-            existing = _find_active_upload_by_sha256(db, server_sha256, server_size)
+            with upload_stage("dedup_lookup"):
+                existing = _find_active_upload_by_sha256(db, server_sha256, server_size)
             if existing is not None:
                 _remove_file_quietly(server_path)
                 db.commit()
+                UPLOAD_DEDUP_HITS.inc()
                 result = _upload_item_result(existing)
                 result["deduplicated"] = True
                 return existing, result
@@ -782,22 +941,24 @@ def _process_vpk_upload(
                 _remove_file_quietly(server_path)
                 return None, {"name": display_name, "error": capacity_error}
 
-            up = Upload(
-                original_name=display_name,
-                stored_name=final_name,
-                sha256=server_sha256,
-                size=server_size,
-                role=role,
-                created_at=now_utc(),
-                expires_at=expires_at,
-                vpk_valid=True,
-                vpk_report=json.dumps(report, ensure_ascii=False),
-                status="active",
-                uploader_ip=request.client.host if request.client else None,
-            )
-            db.add(up)
-            db.commit()
-            db.refresh(up)
+            with upload_stage("commit"):
+                up = Upload(
+                    original_name=display_name,
+                    stored_name=final_name,
+                    sha256=server_sha256,
+                    size=server_size,
+                    role=role,
+                    created_at=now_utc(),
+                    expires_at=expires_at,
+                    vpk_valid=True,
+                    vpk_report=json.dumps(report, ensure_ascii=False),
+                    status="active",
+                    uploader_ip=request.client.host if request.client else None,
+                )
+                db.add(up)
+                db.commit()
+                db.refresh(up)
+            _mark_vpk_index_dirty(server_path)
             result = _upload_item_result(up)
             return up, result
     except Exception:
@@ -834,6 +995,7 @@ def sync_sftp_uploads(now_ts: Optional[float] = None) -> dict[str, int | bool]:
     if now_ts is None:
         now_ts = time.time()
 
+    scan_started = time.perf_counter()
     db = None
     try:
         db = SessionLocal()
@@ -911,6 +1073,7 @@ def sync_sftp_uploads(now_ts: Optional[float] = None) -> dict[str, int | bool]:
                     stats["imported"] += 1
 
                 db.commit()
+                _mark_vpk_index_dirty(path)
                 by_name[name] = existing
             except Exception:
                 db.rollback()
@@ -922,6 +1085,7 @@ def sync_sftp_uploads(now_ts: Optional[float] = None) -> dict[str, int | bool]:
         if db is not None:
             db.close()
         _sftp_scan_lock.release()
+        SFTP_SCAN_SECONDS.observe(time.perf_counter() - scan_started)
 
 
 async def _sftp_sync_loop() -> None:
@@ -959,6 +1123,108 @@ async def stop_sftp_sync() -> None:
         pass
 
 
+async def _lan_anti_entropy_loop() -> None:
+    while True:
+        await asyncio.sleep(LAN_REPLICATION.anti_entropy_interval_seconds)
+        try:
+            stats = await run_lan_anti_entropy()
+            if stats["queued"] or stats["errors"]:
+                logger.info("lan anti-entropy completed: %s", stats)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("lan anti-entropy failed")
+
+
+@app.on_event("startup")
+async def start_lan_replication_queue() -> None:
+    global _lan_anti_entropy_task
+    if not LAN_REPLICATION.enabled:
+        return
+    LAN_REPLICATION_QUEUE.start()
+    if LAN_REPLICATION.anti_entropy_interval_seconds and (
+        _lan_anti_entropy_task is None or _lan_anti_entropy_task.done()
+    ):
+        _lan_anti_entropy_task = asyncio.create_task(_lan_anti_entropy_loop())
+
+
+@app.on_event("shutdown")
+async def close_lan_peer_pool() -> None:
+    global _lan_anti_entropy_task
+    task = _lan_anti_entropy_task
+    _lan_anti_entropy_task = None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await LAN_REPLICATION_QUEUE.stop()
+    await LAN_PEER_POOL.aclose()
+
+
+@app.on_event("startup")
+async def start_loop_monitor() -> None:
+    LOOP_MONITOR.start()
+
+
+@app.on_event("shutdown")
+async def stop_loop_monitor() -> None:
+    await LOOP_MONITOR.stop()
+
+
+@app.on_event("shutdown")
+async def flush_trace_exporter() -> None:
+    exporter = TRACER.exporter
+    if exporter is not None:
+        await asyncio.to_thread(exporter.close)
+
+
+async def _docker_metrics_spill_loop() -> None:
+    while True:
+        await asyncio.sleep(DOCKER_METRICS_SPILL_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(METRICS_HISTORY.save)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("docker metrics history spill failed")
+
+
+@app.on_event("startup")
+async def start_docker_stats_collector() -> None:
+    global _docker_metrics_spill_task
+    if not DOCKER_STATS_REFRESH_SECONDS:
+        return
+    if DOCKER_METRICS_HISTORY_DIR:
+        restored = await asyncio.to_thread(METRICS_HISTORY.load)
+        if restored:
+            logger.info("restored docker metrics history for %s containers", restored)
+        if _docker_metrics_spill_task is None or _docker_metrics_spill_task.done():
+            _docker_metrics_spill_task = asyncio.create_task(_docker_metrics_spill_loop())
+    DOCKER_STATS_COLLECTOR.start()
+
+
+@app.on_event("shutdown")
+async def stop_docker_stats_collector() -> None:
+    global _docker_metrics_spill_task
+    task = _docker_metrics_spill_task
+    _docker_metrics_spill_task = None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await DOCKER_DASHBOARD_STREAM.stop()
+    await asyncio.to_thread(DOCKER_STATS_COLLECTOR.stop)
+    if DOCKER_METRICS_HISTORY_DIR and DOCKER_STATS_REFRESH_SECONDS:
+        try:
+            await asyncio.to_thread(METRICS_HISTORY.save)
+        except Exception:
+            logger.exception("docker metrics history spill failed")
+
+
 def cleanup_expired():
     db = SessionLocal()
     try:
@@ -981,6 +1247,7 @@ def cleanup_expired():
             except Exception:
                 pass
             u.status = "deleted"
+            _mark_vpk_index_dirty(path)
 
         if expired:
             db.commit()
@@ -1034,17 +1301,52 @@ def cleanup_tmp_and_work():
                 continue
             path = os.path.join(UPLOAD_DIR, name)
             if os.path.isfile(path) and now_ts - os.path.getmtime(path) > max_partial_age:
-                _remove_file_quietly(path)
+                _discard_lan_partial(path)
     except Exception:
         pass
 
 @app.middleware("http")
 async def tidy_mw(request: Request, call_next):
-    cleanup_tmp_and_work()
-    cleanup_expired()
-    cleanup_replication_reservations()
-    response = await call_next(request)
-    return response
+    with CLEANUP_SECONDS.labels(task="tmp_and_work").time():
+        cleanup_tmp_and_work()
+    with CLEANUP_SECONDS.labels(task="expired_uploads").time():
+        cleanup_expired()
+    with CLEANUP_SECONDS.labels(task="replication_reservations").time():
+        cleanup_replication_reservations()
+    if TRACER.enabled:
+        return await _traced_request(request, call_next)
+    return await _profiled_request(request, call_next)
+
+
+async def _profiled_request(request: Request, call_next):
+    """剖析匹配路由的请求：耗时和内存覆盖到响应头发出为止，流式或文件响应体的发送不计入；
+    cProfile 只在处理函数自己的执行中启用，见 profile_handler。"""
+    if PROFILER.route_armed:
+        path = request.url.path
+        with PROFILER.session("request", f"{request.method} {path}", path=path):
+            return await call_next(request)
+    return await call_next(request)
+
+
+async def _traced_request(request: Request, call_next):
+    # 上游（NewAnneWeb 或发送复制的节点）带来的 traceparent 作为父 span
+    parent = parse_traceparent(request.headers.get(TRACEPARENT_HEADER))
+    with TRACER.span(
+        f"{request.method} {request.url.path}",
+        kind="server",
+        parent=parent,
+        **{"http.method": request.method, "client.address": request.client.host if request.client else None},
+    ) as span:
+        response = await _profiled_request(request, call_next)
+        route = request.scope.get("route")
+        if route is not None and getattr(route, "path", None):
+            span.name = f"{request.method} {route.path}"
+            span.set(**{"http.route": route.path})
+        span.set(**{"http.status_code": response.status_code})
+        if response.status_code >= 500:
+            span.fail(f"HTTP {response.status_code}")
+        response.headers[TRACE_ID_HEADER] = span.context.trace_id
+        return response
 
 
 def get_session(request: Request) -> dict:
@@ -1104,18 +1406,23 @@ async def _handle_upload(
     read_bytes = 0
     sha256 = hashlib.sha256()
 
-    with open(tmp_upload_path, "wb") as out:
-        while True:
-            chunk = await file.read(1024 * 1024)
-            if not chunk:
-                break
-            read_bytes += len(chunk)
-            if read_bytes > max_bytes:
-                out.close()
-                _remove_file_quietly(tmp_upload_path)
-                raise HTTPException(status_code=400, detail=f"文件过大，超过 {upload_max_mb} MB 限制")
-            sha256.update(chunk)
-            out.write(chunk)
+    receive_started = time.perf_counter()
+    with TRACER.span("upload.receive") as receive_span:
+        with open(tmp_upload_path, "wb") as out:
+            while True:
+                chunk = await file.read(1024 * 1024)
+                if not chunk:
+                    break
+                read_bytes += len(chunk)
+                if read_bytes > max_bytes:
+                    out.close()
+                    _remove_file_quietly(tmp_upload_path)
+                    raise HTTPException(status_code=400, detail=f"文件过大，超过 {upload_max_mb} MB 限制")
+                sha256.update(chunk)
+                out.write(chunk)
+        receive_span.set(bytes=read_bytes)
+    UPLOAD_STAGE_SECONDS.labels(stage="receive").observe(time.perf_counter() - receive_started)
+    UPLOAD_INGESTED_BYTES.labels(source="archive" if upload_ext in ARCHIVE_EXTENSIONS else "vpk").inc(read_bytes)
 
     upload_sha256 = sha256.hexdigest()
     uploaded = []
@@ -1124,7 +1431,8 @@ async def _handle_upload(
 
     try:
         if upload_ext in ARCHIVE_EXTENSIONS:
-            archive_members = _archive_vpk_members(tmp_upload_path, archive_vpk_count)
+            with upload_stage("archive_list"):
+                archive_members = _archive_vpk_members(tmp_upload_path, archive_vpk_count)
             for index, member in enumerate(archive_members, start=1):
                 tmp_vpk_path = None
                 try:
@@ -1282,15 +1590,22 @@ def _replication_manifest_items(payload: Any) -> list[dict[str, Any]]:
             raise HTTPException(status_code=400, detail=f"复制文件 {original_name} 大小超出单文件限制")
         if source_upload_id < 1:
             raise HTTPException(status_code=400, detail=f"复制文件 {original_name} 来源 ID 无效")
+        raw_holders = raw_item.get("holders", [])
+        if not isinstance(raw_holders, list) or len(raw_holders) > 64:
+            raise HTTPException(status_code=400, detail=f"复制文件清单第 {index} 项持有节点无效")
+        holders = sorted({str(node_id).strip()[:128] for node_id in raw_holders if str(node_id).strip()})
         seen_hashes.add(sha256)
-        items.append({
+        item = {
             "source_upload_id": source_upload_id,
             "original_name": original_name,
             "stored_name": stored_name,
             "size": size,
             "sha256": sha256,
             "status": "pending",
-        })
+        }
+        if holders:
+            item["holders"] = holders
+        items.append(item)
     return items
 
 
@@ -1355,6 +1670,7 @@ def _replication_preflight(source_node_id: str, payload: Any) -> dict[str, Any]:
                 if existing is None:
                     missing.append(item)
                 else:
+                    _adopt_lan_replica(existing, source_node_id, item.get("holders", ()))
                     already_present.append(_upload_item_result(existing))
             db.commit()
 
@@ -1447,17 +1763,385 @@ def _replication_artifacts_for_uploads(uploads: list[Upload]) -> list[Replicatio
             path=path,
             size=int(upload.size or os.path.getsize(path)),
             sha256=sha256,
+            holders=tuple(_lan_replication_record(upload).get("holders") or ()),
         ))
     return artifacts
 
 
+def _mark_lan_replicated(uploads: list[Upload]) -> None:
+    """给 federation 上传的文件打上内网组标记，之后的摘要对账只比较这类文件。"""
+    db = SessionLocal()
+    try:
+        for upload in uploads:
+            row = db.get(Upload, upload.id)
+            if row is None:
+                continue
+            try:
+                report = json.loads(row.vpk_report or "{}")
+            except json.JSONDecodeError:
+                report = {}
+            report["replication"] = {
+                "lan_group": LAN_REPLICATION.group,
+                "origin_node_id": LAN_REPLICATION.node_id,
+                "queued_at": now_utc().isoformat(),
+            }
+            if LAN_REPLICATION.replication_factor > 0:
+                # 其余持有节点由复制 worker 放置后补记
+                report["replication"]["holders"] = [LAN_REPLICATION.node_id]
+            row.vpk_report = json.dumps(report, ensure_ascii=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _lan_replication_record(row: Upload) -> dict[str, Any]:
+    """上传记录里属于当前内网组的复制信息；不属于时返回空字典。"""
+    try:
+        replication = json.loads(row.vpk_report or "{}").get("replication")
+    except (json.JSONDecodeError, AttributeError):
+        return {}
+    if not isinstance(replication, dict) or replication.get("lan_group") != LAN_REPLICATION.group:
+        return {}
+    return replication
+
+
+def _merge_lan_node_ids(replication: dict[str, Any], key: str, node_ids: Iterable[str]) -> bool:
+    """把节点 ID 并入复制信息的 holders / deleted_by 列表，返回是否有变化。"""
+    current = [str(node_id) for node_id in replication.get(key) or ()]
+    merged = sorted(set(current) | {str(node_id) for node_id in node_ids})
+    if merged == sorted(current):
+        return False
+    replication[key] = merged
+    return True
+
+
+def _adopt_lan_replica(row: Upload, source_node_id: str, holders: Iterable[str] = ()) -> None:
+    """本节点已有同一文件时把它计入内网组副本；否则摘要里没有它，对账会一直认为这里缺少该文件。
+
+    原有的保存期不变：到期后记录变为 deleted，摘要里的删除标记会让同组节点不再推送这张图。
+    """
+    try:
+        report = json.loads(row.vpk_report or "{}")
+    except json.JSONDecodeError:
+        report = {}
+    if not isinstance(report, dict):
+        report = {}
+    replication = _lan_replication_record(row)
+    changed = not replication
+    if changed:
+        replication = {
+            "lan_group": LAN_REPLICATION.group,
+            "adopted_for_node_id": source_node_id,
+            "adopted_at": now_utc().isoformat(),
+        }
+    changed = _merge_lan_node_ids(replication, "holders", holders) or changed
+    if changed:
+        report["replication"] = replication
+        row.vpk_report = json.dumps(report, ensure_ascii=False)
+
+
+def _record_lan_holders(
+    holders: Mapping[str, Iterable[str]],
+    deleted_by: Optional[Mapping[str, Iterable[str]]] = None,
+) -> None:
+    """把放置或对账得知的持有节点、删除过文件的节点合并进本节点的复制记录。"""
+    deleted_by = deleted_by or {}
+    hashes = sorted(set(holders) | set(deleted_by))
+    db = SessionLocal()
+    try:
+        for start in range(0, len(hashes), 500):
+            rows = db.query(Upload).filter(
+                Upload.sha256.in_(hashes[start:start + 500]),
+                Upload.status.in_(("active", "deleted")),
+            ).all()
+            for row in rows:
+                replication = _lan_replication_record(row)
+                if not replication:
+                    continue
+                sha256 = str(row.sha256 or "").lower()
+                changed = _merge_lan_node_ids(replication, "holders", holders.get(sha256, ()))
+                changed = _merge_lan_node_ids(replication, "deleted_by", deleted_by.get(sha256, ())) or changed
+                if changed:
+                    report = json.loads(row.vpk_report)
+                    report["replication"] = replication
+                    row.vpk_report = json.dumps(report, ensure_ascii=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _lan_replicated_uploads(db) -> dict[str, tuple[int, str, Optional[Upload], dict[str, Any]]]:
+    """本节点属于当前内网组的复制文件：sha256 -> (大小, active/deleted, 有效的上传记录, 复制信息)。
+
+    已删除的记录也参与摘要，对方据此不会再把管理员删掉的图包推回来。
+    """
+    rows = db.query(Upload).filter(
+        Upload.status.in_(("active", "deleted")),
+        Upload.vpk_report.contains('"replication"'),
+    ).order_by(Upload.id).all()
+    items: dict[str, tuple[int, str, Optional[Upload], dict[str, Any]]] = {}
+    for row in rows:
+        sha256 = str(row.sha256 or "").lower()
+        if not _valid_sha256(sha256):
+            continue
+        replication = _lan_replication_record(row)
+        if not replication:
+            continue
+        if row.status == "active":
+            items[sha256] = (int(row.size or 0), "active", row, replication)
+        elif sha256 not in items:
+            items[sha256] = (int(row.size or 0), "deleted", None, replication)
+    return items
+
+
+def _lan_pair_items(
+    items: Mapping[str, tuple[int, str, Optional[Upload], dict[str, Any]]],
+    peer_node_id: str,
+) -> dict[str, tuple[int, str]]:
+    """与某个节点对账时比较的文件：按记录的持有节点，双方都应持有的那部分。
+
+    设置了副本数时每个节点只持有一部分文件，全量比较几乎每个桶都不同；只比较双方的交集，
+    稳态下两边的摘要一致。没有记录持有节点的旧文件仍然两两比较，对方删除过的文件按 deleted 计入。
+    """
+    pair = {LAN_REPLICATION.node_id, peer_node_id}
+    selected: dict[str, tuple[int, str]] = {}
+    for sha256, (size, state, _, replication) in items.items():
+        holders = set(replication.get("holders") or ())
+        if LAN_REPLICATION.replication_factor > 0 and holders and not pair <= holders:
+            continue
+        if peer_node_id in (replication.get("deleted_by") or ()):
+            state = "deleted"
+        selected[sha256] = (size, state)
+    return selected
+
+
+def lan_replication_digest_payload(payload: Any, peer_node_id: Optional[str] = None) -> dict[str, Any]:
+    """返回摘要或指定前缀下的文件列表；给出请求方节点时只包含双方都应持有的文件。"""
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="摘要请求必须是 JSON 对象")
+    prefixes = payload.get("prefixes")
+    db = SessionLocal()
+    try:
+        items = _lan_replicated_uploads(db)
+    finally:
+        db.close()
+    if peer_node_id is None:
+        selected = {sha: (size, state) for sha, (size, state, _, _) in items.items()}
+    else:
+        selected = _lan_pair_items(items, peer_node_id)
+    if prefixes is None:
+        return {"ok": True, **replication_digest(selected)}
+    if not isinstance(prefixes, list) or len(prefixes) > 4096:
+        raise HTTPException(status_code=400, detail="摘要前缀列表无效")
+    wanted = {str(prefix) for prefix in prefixes}
+    listing = []
+    for sha256, (size, state) in sorted(selected.items()):
+        if sha256[:DIGEST_PREFIX_LENGTH] not in wanted:
+            continue
+        item: dict[str, Any] = {"sha256": sha256, "size": size, "state": state}
+        holders = items[sha256][3].get("holders")
+        if holders:
+            item["holders"] = list(holders)
+        listing.append(item)
+    return {"ok": True, "items": listing}
+
+
+def _local_replication_storage() -> dict[str, Any]:
+    db = SessionLocal()
+    try:
+        return _public_replication_storage(replication_storage_snapshot(db))
+    finally:
+        db.close()
+
+
+async def run_lan_anti_entropy() -> dict[str, Any]:
+    """与每个同组节点交换摘要，把按副本规则应当持有、但还缺少的复制文件放入复制队列。"""
+    stats: dict[str, Any] = {"peers": 0, "queued": 0, "errors": []}
+    if not LAN_REPLICATION.enabled:
+        return stats
+
+    def load_items():
+        db = SessionLocal()
+        try:
+            items = _lan_replicated_uploads(db)
+            artifacts = _replication_artifacts_for_uploads([row for _, _, row, _ in items.values() if row is not None])
+            return items, {a.sha256: a for a in artifacts}
+        finally:
+            db.close()
+
+    items, artifacts = await asyncio.to_thread(load_items)
+    reports: dict[str, dict[str, Any]] = {}
+    for peer in LAN_REPLICATION.peers:
+        stats["peers"] += 1
+        pair_items = _lan_pair_items(items, peer.node_id)
+        report, failure = await reconcile_peer(LAN_REPLICATION, LAN_PEER_POOL, peer, pair_items)
+        if failure is not None:
+            stats["errors"].append({"node_id": peer.node_id, **failure})
+            continue
+        missing = set(report["missing"])
+        deleted = set(report["deleted"])
+        reports[peer.node_id] = {
+            # 只有双方摘要都覆盖、且对方没有缺少的文件才算对方持有；范围外的由放置结果决定是否推送
+            "holding": {
+                sha256
+                for sha256, (_, state) in pair_items.items()
+                if state == "active" and sha256 not in missing and sha256 not in deleted
+            },
+            "deleted": deleted | {sha256 for sha256, (_, state) in pair_items.items() if state == "deleted"},
+            "deleted_remotely": deleted,
+            "holders": report["holders"],
+            "storage": report["storage"],
+        }
+
+    # 对方记录的持有节点和删除标记合并进本节点的记录，下一轮两边比较的范围一致
+    learned: dict[str, set[str]] = {}
+    deleted_by: dict[str, set[str]] = {}
+    for node_id, report in reports.items():
+        for sha256, holders in report["holders"].items():
+            if sha256 in items:
+                learned.setdefault(sha256, set()).update(holders)
+        for sha256 in report["deleted_remotely"]:
+            deleted_by.setdefault(sha256, set()).add(node_id)
+
+    # 不可达的节点不参与放置，它们的副本会按 rendezvous 顺序转给下一个节点。
+    storage: dict[str, Any] = {node_id: report["storage"] for node_id, report in reports.items()}
+    storage[LAN_REPLICATION.node_id] = await asyncio.to_thread(_local_replication_storage)
+    pushes: dict[str, list[ReplicationArtifact]] = {}
+    for sha256, artifact in artifacts.items():
+        holders = {LAN_REPLICATION.node_id} | {
+            node_id for node_id, report in reports.items() if sha256 in report["holding"]
+        }
+        excluded = {node_id for node_id, report in reports.items() if sha256 in report["deleted"]}
+        placed = place_artifact(LAN_REPLICATION, sha256, artifact.size, storage, holders, excluded)
+        if LAN_REPLICATION.replication_factor > 0:
+            learned.setdefault(sha256, set()).update(artifact.holders, placed)
+            artifact = replace(artifact, holders=tuple(sorted(learned[sha256])))
+        for node_id in placed:
+            if node_id in reports and node_id not in holders:
+                pushes.setdefault(node_id, []).append(artifact)
+    await asyncio.to_thread(_record_lan_holders, learned, deleted_by)
+
+    peers = {peer.node_id: peer for peer in LAN_REPLICATION.peers}
+    for node_id, wanted in pushes.items():
+        queued = LAN_REPLICATION_QUEUE.queued_hashes(node_id)
+        pending = [artifact for artifact in wanted if artifact.sha256 not in queued]
+        # 预检接口一次最多接受 50 个文件。
+        for start in range(0, len(pending), 50):
+            LAN_REPLICATION_QUEUE.enqueue(pending[start:start + 50], peers=[peers[node_id]])
+        stats["queued"] += len(pending)
+    return stats
+
+
+async def relay_lan_replication(source_node_id: str, payload: Any) -> dict[str, Any]:
+    """作为中继节点，把自己已校验保存的文件继续转发给种子节点指定的下游节点。"""
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="中继请求必须是 JSON 对象")
+    if str(payload.get("source_node_id", "")).strip() != source_node_id:
+        raise HTTPException(status_code=400, detail="来源节点 ID 与请求头不一致")
+    if str(payload.get("lan_group", "")).strip() != LAN_REPLICATION.group:
+        raise HTTPException(status_code=409, detail="内网组不一致")
+    if not LAN_REPLICATION.enabled:
+        raise HTTPException(status_code=503, detail="当前节点没有配置可转发的同组节点")
+    try:
+        hops = int(payload.get("hops", 1))
+        fanout = int(payload.get("fanout", LAN_REPLICATION.relay_fanout))
+    except (TypeError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail="中继跳数或扇出无效") from exc
+    if hops < 1 or hops > MAX_RELAY_HOPS:
+        raise HTTPException(status_code=400, detail="中继跳数超出限制")
+    topology = str(payload.get("topology", "chain"))
+    if topology not in TOPOLOGIES:
+        raise HTTPException(status_code=400, detail="中继拓扑无效")
+    raw_targets = payload.get("targets", [])
+    if not isinstance(raw_targets, list) or len(raw_targets) > 64:
+        raise HTTPException(status_code=400, detail="中继目标节点列表无效")
+    items = _replication_manifest_items(payload)
+
+    peers_by_id = {peer.node_id: peer for peer in LAN_REPLICATION.peers}
+    targets = []
+    unknown_results = []
+    for raw_target in raw_targets:
+        node_id = str(raw_target).strip()
+        if node_id in (source_node_id, LAN_REPLICATION.node_id) or any(peer.node_id == node_id for peer in targets):
+            continue
+        peer = peers_by_id.get(node_id)
+        if peer is None:
+            unknown_results.append({
+                "node_id": node_id,
+                "name": node_id,
+                "status": "relay_unknown_peer",
+                "detail": "中继节点没有配置该节点",
+                "uploaded": [],
+                "already_present": [],
+            })
+        else:
+            targets.append(peer)
+
+    db = SessionLocal()
+    try:
+        uploads = []
+        for item in items:
+            existing = _find_active_upload_by_sha256(db, item["sha256"], item["size"])
+            if existing is None:
+                raise HTTPException(status_code=409, detail=f"中继节点缺少文件 {item['original_name']}")
+            uploads.append(existing)
+        db.commit()
+        artifacts = _replication_artifacts_for_uploads(uploads)
+    finally:
+        db.close()
+
+    relay_config = replace(
+        LAN_REPLICATION,
+        peers=tuple(targets),
+        topology=topology,
+        relay_fanout=max(1, min(8, fanout)),
+    )
+    replication = await replicate_artifacts(
+        relay_config,
+        artifacts,
+        pool=LAN_PEER_POOL,
+        relay_depth=hops,
+    )
+    logger.info(
+        "lan replication relay source=%s targets=%s completed=%s failed=%s",
+        source_node_id,
+        len(targets),
+        replication.get("completed_peer_count", 0),
+        replication.get("failed_peer_count", 0),
+    )
+    return {"ok": True, "peers": [*replication.get("peers", []), *unknown_results]}
+
+
+def _shared_docker_manager() -> DockerManager:
+    global _docker_manager
+    with _docker_manager_lock:
+        if _docker_manager is None:
+            _docker_manager = DockerManager()
+        return _docker_manager
+
+
 def get_docker_manager() -> DockerManager:
     try:
-        return DockerManager()
+        return _shared_docker_manager()
     except Exception as exc:
         raise HTTPException(status_code=503, detail=f"无法连接 Docker：{exc}") from exc
 
 
+METRICS_HISTORY = MetricsHistory(max_containers=DOCKER_METRICS_MAX_CONTAINERS, spill_dir=DOCKER_METRICS_HISTORY_DIR)
+DOCKER_STATS_COLLECTOR = DockerStatsCollector(
+    _shared_docker_manager,
+    DOCKER_STATS_REFRESH_SECONDS or 10,
+    on_sample=lambda container, metrics: METRICS_HISTORY.record(container["id"], metrics, name=container["name"]),
+)
+DOCKER_DASHBOARD_STREAM = DashboardBroadcaster(DOCKER_STATS_COLLECTOR)
+
+
+def list_docker_containers() -> list[dict]:
+    if DOCKER_STATS_REFRESH_SECONDS and DOCKER_STATS_COLLECTOR.ready:
+        return DOCKER_STATS_COLLECTOR.snapshot()
+    return get_docker_manager().list_containers()
+
+
 def delete_upload_item(item_id: int) -> None:
     db = SessionLocal()
     try:
@@ -1469,6 +2153,123 @@ def delete_upload_item(item_id: int) -> None:
             os.remove(path)
         item.status = "deleted"
         db.commit()
+        _mark_vpk_index_dirty(path)
+    finally:
+        db.close()
+
+
+def _valid_reservation_id(value: str) -> bool:
+    return len(value) == 48 and all(character in "0123456789abcdef" for character in value)
+
+
+def _reservation_item_response(db, item: dict[str, Any], original_name: str, sha256: str, size: int) -> dict[str, Any]:
+    target_upload_id = int(item.get("target_upload_id", 0))
+    existing = db.get(Upload, target_upload_id) if target_upload_id else None
+    return {
+        "ok": True,
+        "status": "already_present",
+        "upload": _upload_item_result(existing) if existing else {
+            "original_name": original_name,
+            "sha256": sha256,
+            "size": size,
+        },
+    }
+
+
+def _commit_lan_replication_file(
+    tmp_path: str,
+    source_node_id: str,
+    reservation_id: str,
+    source_upload_id: int,
+    original_name: str,
+    expected_sha256: str,
+    expected_size: int,
+) -> dict[str, Any]:
+    """校验已收齐且哈希正确的复制文件，并原子登记为本节点上传。"""
+    try:
+        with TRACER.span("lan.receive.validate", source=source_node_id, sha256=expected_sha256, size=expected_size):
+            validation: ValidationResult = validate_vpk(
+                tmp_path,
+                RULES_FILE,
+                max_size_mb_override=get_upload_max_mb(),
+            )
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail=f"复制的 VPK 读取失败：{exc}") from exc
+    if not validation.ok:
+        raise HTTPException(status_code=400, detail="复制的 VPK 不符合当前节点规则")
+
+    final_path = ""
+    db = SessionLocal()
+    try:
+        with capacity_guard():
+            row = _ensure_active_reservation(db, reservation_id, source_node_id)
+            manifest, item = _reservation_item(row, expected_sha256)
+            if str(item.get("status", "")) != "pending":
+                return _reservation_item_response(db, item, original_name, expected_sha256, expected_size)
+
+            existing = _find_active_upload_by_sha256(db, expected_sha256, expected_size)
+            if existing is not None:
+                _adopt_lan_replica(existing, source_node_id, item.get("holders", ()))
+                item["status"] = "already_present"
+                item["target_upload_id"] = existing.id
+                row.reserved_bytes = max(0, int(row.reserved_bytes or 0) - expected_size)
+                _save_reservation_manifest(row, manifest)
+                db.commit()
+                return {
+                    "ok": True,
+                    "status": "already_present",
+                    "upload": _upload_item_result(existing),
+                }
+
+            work_base = _safe_base_no_ext(original_name)
+            final_name = _unique_server_filename(db, work_base)
+            final_path = os.path.join(UPLOAD_DIR, final_name)
+            os.replace(tmp_path, final_path)
+
+            report = {
+                "upload_source": {
+                    "source": "lan_replication",
+                    "source_node_id": source_node_id,
+                    "source_upload_id": source_upload_id,
+                    "received_sha256": expected_sha256,
+                    "received_size": expected_size,
+                },
+                "validation": validation.to_dict(),
+                "replication": {
+                    "lan_group": LAN_REPLICATION.group,
+                    "received_at": now_utc().isoformat(),
+                },
+            }
+            if item.get("holders"):
+                report["replication"]["holders"] = list(item["holders"])
+            upload = Upload(
+                original_name=original_name,
+                stored_name=final_name,
+                sha256=expected_sha256,
+                size=expected_size,
+                role="admin",
+                created_at=now_utc(),
+                expires_at=None,
+                vpk_valid=True,
+                vpk_report=json.dumps(report, ensure_ascii=False),
+                status="active",
+                uploader_ip=f"lan:{source_node_id}"[:64],
+            )
+            db.add(upload)
+            db.flush()
+            item["status"] = "stored"
+            item["target_upload_id"] = upload.id
+            row.reserved_bytes = max(0, int(row.reserved_bytes or 0) - expected_size)
+            _save_reservation_manifest(row, manifest)
+            db.commit()
+            db.refresh(upload)
+            _mark_vpk_index_dirty(final_path)
+            return {"ok": True, "status": "stored", "upload": _upload_item_result(upload)}
+    except Exception:
+        if final_path:
+            _remove_file_quietly(final_path)
+        db.rollback()
+        raise
     finally:
         db.close()
 
@@ -1486,7 +2287,7 @@ async def receive_lan_replication_upload(
     reservation_id = reservation_id.strip().lower()
     expected_sha256 = expected_sha256.strip().lower()
     original_name = _ensure_vpk_filename(original_name)
-    if len(reservation_id) != 48 or not all(character in "0123456789abcdef" for character in reservation_id):
+    if not _valid_reservation_id(reservation_id):
         raise HTTPException(status_code=400, detail="容量预留 ID 无效")
     if not _valid_sha256(expected_sha256):
         raise HTTPException(status_code=400, detail="复制文件 SHA-256 无效")
@@ -1505,29 +2306,21 @@ async def receive_lan_replication_upload(
         ):
             raise HTTPException(status_code=409, detail="复制文件与容量预留清单不一致")
         if str(item.get("status", "")) != "pending":
-            target_upload_id = int(item.get("target_upload_id", 0))
-            existing = db.get(Upload, target_upload_id) if target_upload_id else None
-            return {
-                "ok": True,
-                "status": "already_present",
-                "upload": _upload_item_result(existing) if existing else {
-                    "original_name": original_name,
-                    "sha256": expected_sha256,
-                    "size": expected_size,
-                },
-            }
+            return _reservation_item_response(db, item, original_name, expected_sha256, expected_size)
     finally:
         db.close()
 
     tmp_path = os.path.join(UPLOAD_DIR, f".lan-{secrets.token_hex(12)}.part")
     read_bytes = 0
     digest = hashlib.sha256()
+    started = time.monotonic()
     try:
         with open(tmp_path, "xb") as output:
             while True:
                 chunk = await file.read(1024 * 1024)
                 if not chunk:
                     break
+                await LAN_PEER_POOL.shaper.throttle_receive(len(chunk))
                 read_bytes += len(chunk)
                 if read_bytes > expected_size:
                     raise HTTPException(status_code=400, detail="复制文件大小超过预留值")
@@ -1537,100 +2330,558 @@ async def receive_lan_replication_upload(
             raise HTTPException(status_code=400, detail="复制文件大小与预留值不一致")
         if not secrets.compare_digest(digest.hexdigest(), expected_sha256):
             raise HTTPException(status_code=400, detail="复制文件 SHA-256 校验失败")
+        LAN_PEER_POOL.shaper.record_received(source_node_id, read_bytes, time.monotonic() - started)
+
+        return await asyncio.to_thread(
+            _commit_lan_replication_file,
+            tmp_path,
+            source_node_id,
+            reservation_id,
+            source_upload_id,
+            original_name,
+            expected_sha256,
+            expected_size,
+        )
+    finally:
+        _remove_file_quietly(tmp_path)
 
-        try:
-            validation: ValidationResult = validate_vpk(
-                tmp_path,
-                RULES_FILE,
-                max_size_mb_override=get_upload_max_mb(),
+
+def _lan_partial_path(reservation_id: str, sha256: str) -> str:
+    return os.path.join(UPLOAD_DIR, f".lan-{reservation_id}-{sha256[:16]}.part")
+
+
+def _hash_partial_file(path: str) -> tuple[int, Any]:
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "rb") as fh:
+            while True:
+                chunk = fh.read(1024 * 1024)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+    except FileNotFoundError:
+        pass
+    return size, digest
+
+
+async def _partial_hash_state(path: str) -> tuple[int, Any]:
+    """返回分片已提交的字节数和对应的滚动哈希；进程重启后从磁盘重新计算。"""
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        size = 0
+    cached = _lan_partial_hashes.get(path)
+    if cached is not None and cached[0] == size:
+        return size, cached[1].copy()
+    size, digest = await asyncio.to_thread(_hash_partial_file, path)
+    _lan_partial_hashes[path] = (size, digest.copy())
+    return size, digest
+
+
+def _discard_lan_partial(path: str) -> None:
+    _lan_delta_plans.pop(path, None)
+    _lan_partial_hashes.pop(path, None)
+    _lan_partial_locks.pop(path, None)
+    _remove_file_quietly(path)
+
+
+def _lan_resume_path(source_node_id: str, sha256: str) -> str:
+    node_key = hashlib.sha256(source_node_id.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(UPLOAD_DIR, f".lan-resume-{node_key}-{sha256}.part")
+
+
+def _stash_lan_partial(source_node_id: str, reservation_id: str, sha256: str) -> None:
+    """预留结束但文件没收完时保留分片，来源节点下一次预留同一文件时从这里续传。
+
+    文件名仍是 .lan-*.part，超过预留有效期无人认领时由 cleanup_tmp_and_work 清理。
+    """
+    path = _lan_partial_path(reservation_id, sha256)
+    try:
+        if os.path.getsize(path) > 0:
+            os.replace(path, _lan_resume_path(source_node_id, sha256))
+    except OSError:
+        pass
+    _discard_lan_partial(path)
+
+
+def _adopt_lan_partial(source_node_id: str, reservation_id: str, sha256: str, size: int) -> None:
+    path = _lan_partial_path(reservation_id, sha256)
+    resume_path = _lan_resume_path(source_node_id, sha256)
+    if os.path.exists(path):
+        return
+    try:
+        if os.path.getsize(resume_path) > size:
+            _remove_file_quietly(resume_path)
+            return
+        os.replace(resume_path, path)
+    except OSError:
+        return
+    _lan_partial_hashes.pop(path, None)
+    logger.info("lan replication resumes %s from an earlier reservation of %s", sha256[:16], source_node_id)
+
+
+def _write_lan_batch(output, pieces: list[bytes], digest) -> int:
+    """在线程里把一批已收到的数据追加到分片并更新滚动哈希，返回写入的字节数。"""
+    written = 0
+    for piece in pieces:
+        output.write(piece)
+        digest.update(piece)
+        written += len(piece)
+    output.flush()
+    return written
+
+
+def _lan_item_key(reservation_id: str, sha256: str) -> tuple[str, str]:
+    reservation_id = reservation_id.strip().lower()
+    sha256 = sha256.strip().lower()
+    if not _valid_reservation_id(reservation_id):
+        raise HTTPException(status_code=400, detail="容量预留 ID 无效")
+    if not _valid_sha256(sha256):
+        raise HTTPException(status_code=400, detail="复制文件 SHA-256 无效")
+    return reservation_id, sha256
+
+
+def _pending_reservation_item(
+    source_node_id: str,
+    reservation_id: str,
+    sha256: str,
+) -> tuple[dict[str, Any], Optional[dict[str, Any]]]:
+    db = SessionLocal()
+    try:
+        row = _ensure_active_reservation(db, reservation_id, source_node_id)
+        _, item = _reservation_item(row, sha256)
+        if str(item.get("status", "")) != "pending":
+            return item, _reservation_item_response(
+                db,
+                item,
+                str(item.get("original_name", "")),
+                sha256,
+                int(item.get("size", 0)),
             )
-        except Exception as exc:
-            raise HTTPException(status_code=400, detail=f"复制的 VPK 读取失败：{exc}") from exc
-        if not validation.ok:
-            raise HTTPException(status_code=400, detail="复制的 VPK 不符合当前节点规则")
+        _adopt_lan_partial(source_node_id, reservation_id, sha256, int(item.get("size", 0)))
+        return item, None
+    finally:
+        db.close()
 
-        final_path = ""
-        db = SessionLocal()
+
+async def lan_replication_item_status(source_node_id: str, reservation_id: str, sha256: str) -> dict[str, Any]:
+    reservation_id, sha256 = _lan_item_key(reservation_id, sha256)
+    item, finished = _pending_reservation_item(source_node_id, reservation_id, sha256)
+    if finished is not None:
+        return finished
+    path = _lan_partial_path(reservation_id, sha256)
+    offset, digest = await _partial_hash_state(path)
+    return {
+        "ok": True,
+        "status": "pending",
+        "offset": offset,
+        "size": int(item.get("size", 0)),
+        "prefix_sha256": digest.hexdigest(),
+    }
+
+
+async def _lan_body_chunks(request: Request, wire_bytes: list[int], max_bytes: int):
+    """读取复制请求体：按线上字节限速和计数，按 Content-Encoding 边收边解压。
+
+    解压后的总字节数超过 max_bytes（本次请求最多应当写入的原始字节）时立即拒绝，
+    每步解压的输出也有上限，压缩炸弹不会在内存里展开。
+    """
+    encoding = request.headers.get("Content-Encoding", "").strip().lower()
+    decoder = None
+    if encoding and encoding != "identity":
         try:
-            with capacity_guard():
-                row = _ensure_active_reservation(db, reservation_id, source_node_id)
-                manifest, item = _reservation_item(row, expected_sha256)
-                if str(item.get("status", "")) != "pending":
-                    target_upload_id = int(item.get("target_upload_id", 0))
-                    existing = db.get(Upload, target_upload_id) if target_upload_id else None
-                    return {
-                        "ok": True,
-                        "status": "already_present",
-                        "upload": _upload_item_result(existing) if existing else {
-                            "original_name": original_name,
-                            "sha256": expected_sha256,
-                            "size": expected_size,
-                        },
-                    }
+            decoder = make_decompressor(encoding)
+        except ValueError as exc:
+            raise HTTPException(status_code=415, detail=str(exc)) from exc
+    decoded = 0
+
+    def accept(piece: bytes) -> bytes:
+        nonlocal decoded
+        decoded += len(piece)
+        if decoded > max_bytes:
+            raise HTTPException(status_code=413, detail="复制数据解压后超过声明的大小")
+        return piece
+
+    async for chunk in request.stream():
+        if not chunk:
+            continue
+        await LAN_PEER_POOL.shaper.throttle_receive(len(chunk))
+        wire_bytes[0] += len(chunk)
+        if decoder is None:
+            yield accept(chunk)
+            continue
+        decoder.feed(chunk)
+        while decoder.pending:
+            try:
+                piece = await asyncio.to_thread(decoder.step)
+            except Exception as exc:
+                raise HTTPException(status_code=400, detail=f"复制数据解压失败：{exc}") from exc
+            if piece:
+                yield accept(piece)
+    if decoder is not None:
+        try:
+            tail = decoder.flush()
+        except Exception as exc:
+            raise HTTPException(status_code=400, detail=f"复制数据解压失败：{exc}") from exc
+        if tail:
+            yield accept(tail)
 
-                existing = _find_active_upload_by_sha256(db, expected_sha256, expected_size)
-                if existing is not None:
-                    item["status"] = "already_present"
-                    item["target_upload_id"] = existing.id
-                    row.reserved_bytes = max(0, int(row.reserved_bytes or 0) - expected_size)
-                    _save_reservation_manifest(row, manifest)
-                    db.commit()
-                    return {
-                        "ok": True,
-                        "status": "already_present",
-                        "upload": _upload_item_result(existing),
-                    }
 
-                work_base = _safe_base_no_ext(original_name)
-                final_name = _unique_server_filename(db, work_base)
-                final_path = os.path.join(UPLOAD_DIR, final_name)
-                os.replace(tmp_path, final_path)
+def _parse_content_range(value: str, size: int) -> tuple[int, int]:
+    """解析 ``bytes start-end/total``；``bytes */total`` 表示只确认已收齐的分片。"""
+    value = (value or "").strip()
+    if not value.startswith("bytes "):
+        raise HTTPException(status_code=400, detail="Content-Range 无效")
+    span, _, total = value[6:].partition("/")
+    try:
+        if int(total) != size:
+            raise HTTPException(status_code=409, detail="Content-Range 总长度与容量预留不一致")
+        if span == "*":
+            return size, size
+        start, _, end = span.partition("-")
+        start_value, end_value = int(start), int(end) + 1
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Content-Range 无效") from exc
+    if start_value < 0 or end_value <= start_value or end_value > size:
+        raise HTTPException(status_code=400, detail="Content-Range 超出文件范围")
+    return start_value, end_value
+
 
-                report = {
-                    "upload_source": {
-                        "source": "lan_replication",
-                        "source_node_id": source_node_id,
-                        "source_upload_id": source_upload_id,
-                        "received_sha256": expected_sha256,
-                        "received_size": expected_size,
-                    },
-                    "validation": validation.to_dict(),
-                    "replication": {
-                        "lan_group": LAN_REPLICATION.group,
-                        "received_at": now_utc().isoformat(),
-                    },
-                }
-                upload = Upload(
-                    original_name=original_name,
-                    stored_name=final_name,
-                    sha256=expected_sha256,
-                    size=expected_size,
-                    role="admin",
-                    created_at=now_utc(),
-                    expires_at=None,
-                    vpk_valid=True,
-                    vpk_report=json.dumps(report, ensure_ascii=False),
-                    status="active",
-                    uploader_ip=f"lan:{source_node_id}"[:64],
+async def append_lan_replication_item(
+    request: Request,
+    source_node_id: str,
+    reservation_id: str,
+    sha256: str,
+) -> Any:
+    reservation_id, sha256 = _lan_item_key(reservation_id, sha256)
+    path = _lan_partial_path(reservation_id, sha256)
+    lock = _lan_partial_locks.setdefault(path, asyncio.Lock())
+    async with lock:
+        item, finished = _pending_reservation_item(source_node_id, reservation_id, sha256)
+        if finished is not None:
+            return finished
+        size = int(item.get("size", 0))
+        start, end = _parse_content_range(request.headers.get("Content-Range", ""), size)
+        offset, digest = await _partial_hash_state(path)
+        if start != offset:
+            return JSONResponse(
+                status_code=409,
+                content={"ok": False, "detail": "分片偏移与已接收字节数不一致", "offset": offset},
+            )
+
+        if end > offset:
+            wire_bytes = [0]
+            started = time.monotonic()
+            pending: list[bytes] = []
+            pending_bytes = 0
+            with open(path, "ab") as output:
+                try:
+                    async for chunk in _lan_body_chunks(request, wire_bytes, end - offset):
+                        if offset + pending_bytes + len(chunk) > end:
+                            raise HTTPException(status_code=400, detail="复制分片长度超过 Content-Range")
+                        pending.append(chunk)
+                        pending_bytes += len(chunk)
+                        if pending_bytes >= LAN_WRITE_BATCH_BYTES:
+                            offset += await asyncio.to_thread(_write_lan_batch, output, pending, digest)
+                            pending, pending_bytes = [], 0
+                            _lan_partial_hashes[path] = (offset, digest.copy())
+                finally:
+                    # 中途断开时已收到的数据仍然有效，写入后续传从这里继续
+                    if pending:
+                        offset += await asyncio.to_thread(_write_lan_batch, output, pending, digest)
+                    _lan_partial_hashes[path] = (offset, digest.copy())
+                    LAN_PEER_POOL.shaper.record_received(
+                        source_node_id,
+                        wire_bytes[0],
+                        time.monotonic() - started,
+                    )
+            if offset != end:
+                return JSONResponse(
+                    status_code=409,
+                    content={"ok": False, "detail": "复制分片长度不足", "offset": offset},
                 )
-                db.add(upload)
-                db.flush()
-                item["status"] = "stored"
-                item["target_upload_id"] = upload.id
-                row.reserved_bytes = max(0, int(row.reserved_bytes or 0) - expected_size)
-                _save_reservation_manifest(row, manifest)
-                db.commit()
-                db.refresh(upload)
-                return {"ok": True, "status": "stored", "upload": _upload_item_result(upload)}
-        except Exception:
-            if final_path:
-                _remove_file_quietly(final_path)
-            db.rollback()
-            raise
+        if offset < size:
+            return {"ok": True, "status": "pending", "offset": offset, "size": size}
+
+        if not secrets.compare_digest(digest.hexdigest(), sha256):
+            _discard_lan_partial(path)
+            raise HTTPException(status_code=400, detail="复制文件 SHA-256 校验失败")
+        try:
+            return await asyncio.to_thread(
+                _commit_lan_replication_file,
+                path,
+                source_node_id,
+                reservation_id,
+                int(item.get("source_upload_id", 0)),
+                str(item.get("original_name", "")),
+                sha256,
+                size,
+            )
+        finally:
+            _discard_lan_partial(path)
+
+
+def _mark_vpk_index_dirty(path: str) -> None:
+    """上传文件新增、替换或删除后调用，下次规划增量复制时只重新读取这些文件。"""
+    with _vpk_index_lock:
+        _vpk_index_dirty.add(path)
+
+
+def _drop_vpk_index_entries(path: str) -> None:
+    cached = _vpk_segment_cache.pop(path, None)
+    if cached is None:
+        return
+    for segment in cached[1]:
+        key = (int(segment["crc32"]), int(segment["length"]))
+        by_path = _vpk_entry_index.get(key)
+        if by_path is not None:
+            by_path.pop(path, None)
+            if not by_path:
+                del _vpk_entry_index[key]
+
+
+def _refresh_vpk_index_entry(path: str) -> None:
+    """按 (mtime, 大小) 判断文件是否变化，变化时重新切分条目；文件已不存在时移出索引。"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        _drop_vpk_index_entries(path)
+        return
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _vpk_segment_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return
+    _drop_vpk_index_entries(path)
+    try:
+        segments = [segment for segment in vpk_segments(path) if segment["crc32"] is not None]
+    except Exception:
+        segments = []
+    _vpk_segment_cache[path] = (signature, segments)
+    for segment in segments:
+        _vpk_entry_index.setdefault((int(segment["crc32"]), int(segment["length"])), {}).setdefault(path, []).append(
+            (int(segment["offset"]), str(segment["path"]), int(segment.get("preload_crc32") or 0))
+        )
+
+
+def _sync_vpk_entry_index() -> dict[tuple[int, int], dict[str, list[tuple[int, str, int]]]]:
+    """本节点已有 VPK 的条目索引，调用方需持有 _vpk_index_lock。
+
+    首次调用时按数据库登记的有效上传建立，之后只处理标记过变化的文件。
+    """
+    global _vpk_index_loaded
+    if not _vpk_index_loaded:
+        db = SessionLocal()
+        try:
+            stored_names = [row.stored_name for row in db.query(Upload.stored_name).filter(Upload.status == "active").all()]
         finally:
             db.close()
-    finally:
-        _remove_file_quietly(tmp_path)
+        _vpk_index_dirty.update(os.path.join(UPLOAD_DIR, name) for name in stored_names)
+        _vpk_index_loaded = True
+    for path in sorted(_vpk_index_dirty):
+        _refresh_vpk_index_entry(path)
+    _vpk_index_dirty.clear()
+    return _vpk_entry_index
+
+
+def _parse_delta_segments(payload: Any, size: int) -> list[dict[str, Any]]:
+    if not isinstance(payload, dict) or not isinstance(payload.get("segments"), list):
+        raise HTTPException(status_code=400, detail="增量复制清单无效")
+    raw_segments = payload["segments"]
+    if not raw_segments or len(raw_segments) > MAX_DELTA_SEGMENTS:
+        raise HTTPException(status_code=400, detail="增量复制清单条目数量无效")
+    segments = []
+    cursor = 0
+    for raw in raw_segments:
+        if not isinstance(raw, dict):
+            raise HTTPException(status_code=400, detail="增量复制清单无效")
+        try:
+            offset = int(raw.get("offset"))
+            length = int(raw.get("length"))
+            crc32 = None if raw.get("crc32") is None else int(raw["crc32"]) & 0xFFFFFFFF
+        except (TypeError, ValueError) as exc:
+            raise HTTPException(status_code=400, detail="增量复制清单无效") from exc
+        if offset != cursor or length <= 0:
+            raise HTTPException(status_code=400, detail="增量复制清单必须连续覆盖整个文件")
+        segments.append({"offset": offset, "length": length, "crc32": crc32, "path": str(raw.get("path") or "")})
+        cursor += length
+    if cursor != size:
+        raise HTTPException(status_code=409, detail="增量复制清单长度与容量预留不一致")
+    return segments
+
+
+def _plan_lan_delta(segments: list[dict[str, Any]]) -> list[tuple[dict[str, Any], Optional[tuple[str, int, int]]]]:
+    """为每个片段找本地可复用的条目，同路径优先；找不到的片段由发送端补发。"""
+    plan = []
+    with _vpk_index_lock:
+        index = _sync_vpk_entry_index()
+        for segment in segments:
+            source = None
+            if segment["crc32"] is not None:
+                candidates = [
+                    (path, offset, entry_path, preload_crc32)
+                    for path, entries in sorted(index.get((segment["crc32"], segment["length"]), {}).items())
+                    for offset, entry_path, preload_crc32 in entries
+                ]
+                same_path = [item for item in candidates if item[2] == segment["path"]]
+                chosen = (same_path or candidates or [None])[0]
+                if chosen is not None:
+                    source = (chosen[0], chosen[1], chosen[3])
+            plan.append((segment, source))
+    return plan
+
+
+async def plan_lan_replication_delta(
+    source_node_id: str,
+    reservation_id: str,
+    sha256: str,
+    payload: Any,
+) -> dict[str, Any]:
+    reservation_id, sha256 = _lan_item_key(reservation_id, sha256)
+    path = _lan_partial_path(reservation_id, sha256)
+    lock = _lan_partial_locks.setdefault(path, asyncio.Lock())
+    async with lock:
+        item, finished = _pending_reservation_item(source_node_id, reservation_id, sha256)
+        if finished is not None:
+            return finished
+        segments = _parse_delta_segments(payload, int(item.get("size", 0)))
+        offset, _ = await _partial_hash_state(path)
+        if offset:
+            # 已有续传分片时继续走续传，避免丢弃已经收到的数据。
+            return {"ok": True, "status": "full", "offset": offset}
+        plan = await asyncio.to_thread(_plan_lan_delta, segments)
+        reuse_bytes = sum(segment["length"] for segment, source in plan if source is not None)
+        if reuse_bytes == 0:
+            return {"ok": True, "status": "full", "offset": 0}
+        _lan_delta_plans[path] = plan
+        need = [index for index, (_, source) in enumerate(plan) if source is None]
+        return {
+            "ok": True,
+            "status": "delta",
+            "need": need,
+            "reuse_bytes": reuse_bytes,
+            "need_bytes": sum(plan[index][0]["length"] for index in need),
+        }
+
+
+def _copy_local_segment(source: tuple[str, int, int], length: int, output, digest) -> int:
+    """把本地 VPK 中的一个条目复制到分片，返回条目的 CRC32。
+
+    目录里的 CRC32 覆盖预载数据和数据区，这里从本地条目预载数据的 CRC32 接着计算，
+    结果可以直接与清单中的 crc32 比较。
+    """
+    checksum = source[2]
+    with open(source[0], "rb") as handle:
+        handle.seek(source[1])
+        remaining = length
+        while remaining > 0:
+            chunk = handle.read(min(1024 * 1024, remaining))
+            if not chunk:
+                raise OSError("本地 VPK 条目被截断")
+            checksum = zlib.crc32(chunk, checksum)
+            output.write(chunk)
+            digest.update(chunk)
+            remaining -= len(chunk)
+    output.flush()
+    return checksum & 0xFFFFFFFF
+
+
+async def apply_lan_replication_delta(
+    request: Request,
+    source_node_id: str,
+    reservation_id: str,
+    sha256: str,
+) -> Any:
+    """按增量计划组装文件：可复用的条目从本地复制，其余片段按顺序从请求体读取。
+
+    组装过程写入续传使用的同一个分片文件，中途失败时已写入的前缀仍然有效，
+    发送端随后按返回的偏移改用续传补齐。
+    """
+    reservation_id, sha256 = _lan_item_key(reservation_id, sha256)
+    path = _lan_partial_path(reservation_id, sha256)
+    lock = _lan_partial_locks.setdefault(path, asyncio.Lock())
+    async with lock:
+        item, finished = _pending_reservation_item(source_node_id, reservation_id, sha256)
+        if finished is not None:
+            return finished
+        size = int(item.get("size", 0))
+        plan = _lan_delta_plans.pop(path, None)
+        offset, digest = await _partial_hash_state(path)
+        if plan is None or offset:
+            return JSONResponse(
+                status_code=409,
+                content={"ok": False, "detail": "增量复制计划不存在或分片已开始", "offset": offset},
+            )
+
+        wire_bytes = [0]
+        stream = _lan_body_chunks(request, wire_bytes, size)
+        buffer = bytearray()
+        received = 0
+        reused = 0
+        started = time.monotonic()
+        try:
+            with open(path, "ab") as output:
+                for segment, source in plan:
+                    length = int(segment["length"])
+                    if source is not None:
+                        before = digest.copy()
+                        checksum = await asyncio.to_thread(_copy_local_segment, source, length, output, digest)
+                        if checksum != segment["crc32"]:
+                            output.truncate(offset)
+                            digest = before
+                            raise ValueError("本地条目 CRC32 与清单不一致")
+                        reused += length
+                    else:
+                        remaining = length
+                        pieces: list[bytes] = []
+                        batched = 0
+                        while remaining > 0:
+                            if not buffer:
+                                buffer.extend(await stream.__anext__())
+                            piece = bytes(buffer[:remaining])
+                            del buffer[:len(piece)]
+                            pieces.append(piece)
+                            batched += len(piece)
+                            remaining -= len(piece)
+                            received += len(piece)
+                            if batched >= LAN_WRITE_BATCH_BYTES or remaining == 0:
+                                await asyncio.to_thread(_write_lan_batch, output, pieces, digest)
+                                pieces, batched = [], 0
+                    offset += length
+                    _lan_partial_hashes[path] = (offset, digest.copy())
+        except (StopAsyncIteration, ValueError, OSError) as exc:
+            if offset == 0:
+                _discard_lan_partial(path)
+            return JSONResponse(
+                status_code=409,
+                content={"ok": False, "detail": f"增量复制中断：{exc}", "offset": offset},
+            )
+        finally:
+            LAN_PEER_POOL.shaper.record_received(source_node_id, wire_bytes[0], time.monotonic() - started)
+        async for chunk in stream:
+            buffer.extend(chunk)
+        if buffer:
+            _discard_lan_partial(path)
+            raise HTTPException(status_code=400, detail="增量复制请求体长度超过清单")
+
+        if offset != size or not secrets.compare_digest(digest.hexdigest(), sha256):
+            _discard_lan_partial(path)
+            raise HTTPException(status_code=400, detail="复制文件 SHA-256 校验失败")
+        try:
+            result = await asyncio.to_thread(
+                _commit_lan_replication_file,
+                path,
+                source_node_id,
+                reservation_id,
+                int(item.get("source_upload_id", 0)),
+                str(item.get("original_name", "")),
+                sha256,
+                size,
+            )
+        finally:
+            _discard_lan_partial(path)
+        return {**result, "delta": {"reused_bytes": reused, "received_bytes": received}}
 
 
 def complete_lan_replication_reservation(source_node_id: str, reservation_id: str) -> dict[str, Any]:
@@ -1641,15 +2892,24 @@ def complete_lan_replication_reservation(source_node_id: str, reservation_id: st
             if row is None or row.source_node_id != source_node_id or row.lan_group != LAN_REPLICATION.group:
                 raise HTTPException(status_code=404, detail="容量预留不存在")
             manifest = _load_reservation_manifest(row)
-            pending_count = 0
+            released = set()
             for item in manifest["artifacts"]:
                 if isinstance(item, dict) and item.get("status") == "pending":
                     item["status"] = "released"
-                    pending_count += 1
+                    released.add(str(item.get("sha256", "")))
+            pending_count = len(released)
             row.reserved_bytes = 0
             row.status = "completed" if pending_count == 0 else "partial"
             _save_reservation_manifest(row, manifest)
             db.commit()
+            for item in manifest["artifacts"]:
+                sha256 = str(item.get("sha256", "")) if isinstance(item, dict) else ""
+                if not _valid_sha256(sha256):
+                    continue
+                if sha256 in released:
+                    _stash_lan_partial(source_node_id, row.id, sha256)
+                else:
+                    _discard_lan_partial(_lan_partial_path(row.id, sha256))
             return {
                 "ok": True,
                 "status": row.status,
@@ -1672,7 +2932,10 @@ def federation_summary_payload() -> dict:
         site = {
             "name": INSTANCE_NAME,
             "upload_count": db.query(Upload).filter(Upload.status == "active").count(),
-            "lan_replication": LAN_REPLICATION.public_status(),
+            "lan_replication": {
+                **LAN_REPLICATION.public_status(),
+                "bandwidth": LAN_PEER_POOL.shaper.stats(),
+            },
             **storage_context(db),
         }
         uploads = [{
@@ -1691,7 +2954,7 @@ def federation_summary_payload() -> dict:
     containers = []
     docker_error = None
     try:
-        containers = get_docker_manager().list_containers()
+        containers = list_docker_containers()
     except Exception as exc:
         docker_error = str(exc.detail) if isinstance(exc, HTTPException) else str(exc)
     return {
@@ -1742,7 +3005,8 @@ async def docker_dashboard(request: Request):
 async def docker_containers(request: Request):
     require_admin(request)
     try:
-        items = get_docker_manager().list_containers()
+        # 统计采集器未就绪时会回退到直接查询 Docker，这是阻塞调用，不能放在事件循环里
+        items = await asyncio.to_thread(list_docker_containers)
     except HTTPException:
         raise
     except Exception as exc:
@@ -1750,13 +3014,37 @@ async def docker_containers(request: Request):
     return {"generated_at": now_utc().isoformat(), "containers": items}
 
 
+@app.get("/api/admin/docker/stream")
+async def docker_dashboard_stream(request: Request):
+    require_admin(request)
+    if not DOCKER_STATS_REFRESH_SECONDS:
+        raise HTTPException(status_code=503, detail="后台容器采集已关闭")
+    queue = DOCKER_DASHBOARD_STREAM.subscribe()
+    return StreamingResponse(
+        DOCKER_DASHBOARD_STREAM.stream(queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/admin/docker/containers/{container_id}/metrics")
+async def docker_container_metrics(request: Request, container_id: str, window: int = 600):
+    require_admin(request)
+    if window < 60 or window > DOCKER_METRICS_MAX_WINDOW_SECONDS:
+        raise HTTPException(status_code=400, detail="时间窗口需在 60 秒到 30 天之间")
+    series = METRICS_HISTORY.series(container_id, window)
+    if series is None:
+        raise HTTPException(status_code=404, detail="暂无该容器的历史数据")
+    return series
+
+
 @app.post("/api/admin/docker/containers/{container_id}/exec")
 async def docker_container_exec(request: Request, container_id: str):
     require_admin(request)
     try:
         payload = await request.json()
         command = str(payload.get("command", "")) if isinstance(payload, dict) else ""
-        result = get_docker_manager().exec_command(container_id, command)
+        result = await asyncio.to_thread(get_docker_manager().exec_command, container_id, command)
         logger.info("admin docker exec container=%s exit=%s", container_id, result["exit_code"])
         return {"ok": True, **result}
     except ValueError as exc:
@@ -1767,11 +3055,33 @@ async def docker_container_exec(request: Request, container_id: str):
         raise HTTPException(status_code=502, detail=f"容器命令执行失败：{exc}") from exc
 
 
+def _websocket_origin_allowed(websocket: WebSocket) -> bool:
+    origin = websocket.headers.get("origin")
+    if not origin:
+        return True
+    return urlsplit(origin).netloc == websocket.headers.get("host", "")
+
+
+@app.websocket("/api/admin/docker/containers/{container_id}/exec/stream")
+async def docker_container_exec_stream(websocket: WebSocket, container_id: str):
+    try:
+        require_admin(websocket)
+    except HTTPException as exc:
+        await websocket.close(code=1008, reason=str(exc.detail))
+        return
+    if not _websocket_origin_allowed(websocket):
+        await websocket.close(code=1008, reason="来源不允许")
+        return
+    await websocket.accept()
+    await stream_container_exec(websocket, get_docker_manager, container_id, "admin")
+
+
 @app.post("/api/admin/docker/containers/{container_id}/{action}")
 async def docker_container_action(request: Request, container_id: str, action: str):
     require_admin(request)
     try:
-        get_docker_manager().action(container_id, action)
+        await asyncio.to_thread(get_docker_manager().action, container_id, action)
+        DOCKER_STATS_COLLECTOR.wake()
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     except HTTPException:
@@ -1781,11 +3091,79 @@ async def docker_container_action(request: Request, container_id: str, action: s
     return {"ok": True, "action": action}
 
 
+def _string_list(value: Any) -> list[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        return [str(item) for item in value]
+    raise ValueError("容器列表格式无效")
+
+
+def run_docker_bulk_action(payload: Any, source: str) -> dict:
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="请求格式无效")
+    try:
+        result = get_docker_manager().bulk_action(
+            str(payload.get("action", "")),
+            ids=_string_list(payload.get("ids")),
+            names=_string_list(payload.get("names")),
+            label=str(payload.get("label") or ""),
+            concurrency=int(payload.get("concurrency") or 4),
+            rolling=bool(payload.get("rolling")),
+            max_unavailable=int(payload.get("max_unavailable") or 1),
+        )
+    except (TypeError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail=f"容器批量操作失败：{exc}") from exc
+    finally:
+        DOCKER_STATS_COLLECTOR.wake()
+    logger.info(
+        "%s docker bulk action=%s rolling=%s succeeded=%s failed=%s skipped=%s",
+        source,
+        result["action"],
+        result["rolling"],
+        result["succeeded"],
+        result["failed"],
+        result["skipped"],
+    )
+    return result
+
+
+@app.post("/api/admin/docker/bulk")
+async def docker_bulk_action(request: Request):
+    require_admin(request)
+    try:
+        payload = await request.json()
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="请求格式无效") from exc
+    return await asyncio.to_thread(run_docker_bulk_action, payload, "admin")
+
+
+def docker_download_response(container_id: str, path: str) -> StreamingResponse:
+    download = get_docker_manager().open_download(container_id, path, DOCKER_DOWNLOAD_MAX_MB * 1024 * 1024)
+    headers = {"Content-Disposition": _disposition_utf8(download["filename"])}
+    if download["size"] is not None:
+        headers["Content-Length"] = str(download["size"])
+    return StreamingResponse(download["chunks"], media_type=download["media_type"], headers=headers)
+
+
 @app.get("/api/admin/docker/containers/{container_id}/files")
-async def docker_container_files(request: Request, container_id: str, path: str = "/"):
+async def docker_container_files(
+    request: Request,
+    container_id: str,
+    path: str = "/",
+    depth: int = 1,
+    limit: int = 1000,
+    refresh: bool = False,
+):
     require_admin(request)
     try:
-        return get_docker_manager().list_files(container_id, path)
+        return await asyncio.to_thread(get_docker_manager().list_files, container_id, path, depth, limit, refresh)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     except HTTPException:
@@ -1794,12 +3172,40 @@ async def docker_container_files(request: Request, container_id: str, path: str
         raise HTTPException(status_code=502, detail=f"读取容器文件失败：{exc}") from exc
 
 
+@app.get("/api/admin/docker/containers/{container_id}/download")
+def docker_container_download(request: Request, container_id: str, path: str):
+    require_admin(request)
+    try:
+        response = docker_download_response(container_id, path)
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail=f"下载容器文件失败：{exc}") from exc
+    logger.info("admin docker download container=%s path=%s", container_id, path)
+    return response
+
+
 @app.get("/api/federation/summary")
 def federation_summary(request: Request):
     require_federation_token(request)
     return federation_summary_payload()
 
 
+@app.get("/metrics")
+def prometheus_metrics(request: Request):
+    require_federation_token(request)
+    db = SessionLocal()
+    try:
+        observe_storage(_public_replication_storage(replication_storage_snapshot(db)))
+    finally:
+        db.close()
+    return PlainTextResponse(METRICS_REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/api/lan/replication/capabilities")
 def lan_replication_capabilities(request: Request):
     require_lan_peer(request)
@@ -1814,6 +3220,8 @@ def lan_replication_capabilities(request: Request):
         "node_id": LAN_REPLICATION.node_id,
         "lan_group": LAN_REPLICATION.group,
         "instance_name": INSTANCE_NAME,
+        "features": list(REPLICATION_FEATURES),
+        "codecs": available_codecs(),
         "storage": storage,
     }
 
@@ -1854,6 +3262,54 @@ async def lan_replication_upload(
     )
 
 
+@app.post("/api/lan/replication/relay")
+async def lan_replication_relay(request: Request):
+    source_node_id = require_lan_peer(request)
+    try:
+        payload = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+        raise HTTPException(status_code=400, detail="中继请求不是合法 JSON") from exc
+    return await relay_lan_replication(source_node_id, payload)
+
+
+@app.post("/api/lan/replication/digest")
+async def lan_replication_digest(request: Request):
+    source_node_id = require_lan_peer(request)
+    try:
+        payload = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+        raise HTTPException(status_code=400, detail="摘要请求不是合法 JSON") from exc
+    return await asyncio.to_thread(lan_replication_digest_payload, payload, source_node_id)
+
+
+@app.get("/api/lan/replication/reservations/{reservation_id}/items/{sha256}")
+async def lan_replication_item(request: Request, reservation_id: str, sha256: str):
+    source_node_id = require_lan_peer(request)
+    return await lan_replication_item_status(source_node_id, reservation_id, sha256)
+
+
+@app.put("/api/lan/replication/reservations/{reservation_id}/items/{sha256}")
+async def lan_replication_item_append(request: Request, reservation_id: str, sha256: str):
+    source_node_id = require_lan_peer(request)
+    return await append_lan_replication_item(request, source_node_id, reservation_id, sha256)
+
+
+@app.post("/api/lan/replication/reservations/{reservation_id}/items/{sha256}/delta")
+async def lan_replication_item_delta_plan(request: Request, reservation_id: str, sha256: str):
+    source_node_id = require_lan_peer(request)
+    try:
+        payload = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+        raise HTTPException(status_code=400, detail="增量复制清单不是合法 JSON") from exc
+    return await plan_lan_replication_delta(source_node_id, reservation_id, sha256, payload)
+
+
+@app.put("/api/lan/replication/reservations/{reservation_id}/items/{sha256}/delta")
+async def lan_replication_item_delta_apply(request: Request, reservation_id: str, sha256: str):
+    source_node_id = require_lan_peer(request)
+    return await apply_lan_replication_delta(request, source_node_id, reservation_id, sha256)
+
+
 @app.post("/api/lan/replication/reservations/{reservation_id}/complete")
 def lan_replication_complete(request: Request, reservation_id: str):
     source_node_id = require_lan_peer(request)
@@ -1878,25 +3334,51 @@ async def federation_upload(request: Request, file: UploadFile):
             content={"ok": False, "detail": detail, **results},
         )
     artifacts = _replication_artifacts_for_uploads(uploads)
-    replication = await replicate_artifacts(LAN_REPLICATION, artifacts)
-    logger.info(
-        "lan replication source=%s peers=%s completed=%s skipped=%s failed=%s",
-        LAN_REPLICATION.node_id or "disabled",
-        len(replication.get("peers", [])),
-        replication.get("completed_peer_count", 0),
-        replication.get("skipped_peer_count", 0),
-        replication.get("failed_peer_count", 0),
-    )
+    if not LAN_REPLICATION.enabled or not artifacts:
+        # 未启用或没有可复制的文件时不入队，直接返回配置状态。
+        replication = await replicate_artifacts(LAN_REPLICATION, artifacts, pool=LAN_PEER_POOL)
+        return {"ok": True, **results, "replication": replication}
+
+    _mark_lan_replicated(uploads)
+    # 目标节点由复制 worker 读取各节点容量后挑选，这里只入队，不等待任何节点往返
+    job = LAN_REPLICATION_QUEUE.enqueue(artifacts, place=True)
+    if job is None:
+        # 副本数已由本节点满足，不需要复制到其他节点。
+        replication = {**LAN_REPLICATION.public_status(), "complete": True, "replica_shortfall": 0, "peers": []}
+    else:
+        replication = {**LAN_REPLICATION.public_status(), "complete": False, **job}
+        logger.info(
+            "lan replication queued source=%s job=%s peers=%s artifacts=%s",
+            LAN_REPLICATION.node_id,
+            job["job_id"],
+            job["peer_count"],
+            job["artifact_count"],
+        )
     return {"ok": True, **results, "replication": replication}
 
 
+@app.get("/api/federation/replication/jobs")
+def federation_replication_jobs(request: Request, limit: int = 20):
+    require_federation_token(request)
+    return {"ok": True, "jobs": LAN_REPLICATION_QUEUE.recent_jobs(max(1, min(100, limit)))}
+
+
+@app.get("/api/federation/replication/jobs/{job_id}")
+def federation_replication_job(request: Request, job_id: str):
+    require_federation_token(request)
+    job = LAN_REPLICATION_QUEUE.job_status(job_id.strip().lower())
+    if job is None:
+        raise HTTPException(status_code=404, detail="复制任务不存在")
+    return {"ok": True, "job": job}
+
+
 @app.post("/api/federation/docker/{container_id}/exec")
 async def federation_docker_exec(request: Request, container_id: str):
     require_federation_token(request)
     try:
         payload = await request.json()
         command = str(payload.get("command", "")) if isinstance(payload, dict) else ""
-        result = get_docker_manager().exec_command(container_id, command)
+        result = await asyncio.to_thread(get_docker_manager().exec_command, container_id, command)
         logger.info("federation docker exec container=%s exit=%s", container_id, result["exit_code"])
         return {"ok": True, **result}
     except ValueError as exc:
@@ -1907,11 +3389,33 @@ async def federation_docker_exec(request: Request, container_id: str):
         raise HTTPException(status_code=502, detail=f"容器命令执行失败：{exc}") from exc
 
 
+@app.post("/api/federation/docker/bulk")
+async def federation_docker_bulk_action(request: Request):
+    require_federation_token(request)
+    try:
+        payload = await request.json()
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="请求格式无效") from exc
+    return await asyncio.to_thread(run_docker_bulk_action, payload, "federation")
+
+
+@app.websocket("/api/federation/docker/{container_id}/exec/stream")
+async def federation_docker_exec_stream(websocket: WebSocket, container_id: str):
+    try:
+        require_federation_token(websocket)
+    except HTTPException as exc:
+        await websocket.close(code=1008, reason=str(exc.detail))
+        return
+    await websocket.accept()
+    await stream_container_exec(websocket, get_docker_manager, container_id, "federation")
+
+
 @app.post("/api/federation/docker/{container_id}/{action}")
 def federation_docker_action(request: Request, container_id: str, action: str):
     require_federation_token(request)
     try:
         get_docker_manager().action(container_id, action)
+        DOCKER_STATS_COLLECTOR.wake()
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     except HTTPException:
@@ -1922,10 +3426,17 @@ def federation_docker_action(request: Request, container_id: str, action: str):
 
 
 @app.get("/api/federation/docker/{container_id}/files")
-def federation_docker_files(request: Request, container_id: str, path: str = "/"):
+def federation_docker_files(
+    request: Request,
+    container_id: str,
+    path: str = "/",
+    depth: int = 1,
+    limit: int = 1000,
+    refresh: bool = False,
+):
     require_federation_token(request)
     try:
-        return get_docker_manager().list_files(container_id, path)
+        return get_docker_manager().list_files(container_id, path, depth, limit, refresh)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     except HTTPException:
@@ -1934,6 +3445,23 @@ def federation_docker_files(request: Request, container_id: str, path: str = "/"
         raise HTTPException(status_code=502, detail=f"读取容器文件失败：{exc}") from exc
 
 
+@app.get("/api/federation/docker/{container_id}/download")
+def federation_docker_download(request: Request, container_id: str, path: str):
+    require_federation_token(request)
+    try:
+        response = docker_download_response(container_id, path)
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail=f"下载容器文件失败：{exc}") from exc
+    logger.info("federation docker download container=%s path=%s", container_id, path)
+    return response
+
+
 @app.post("/api/federation/uploads/{item_id}/delete")
 def federation_upload_delete(request: Request, item_id: int):
     require_federation_token(request)
@@ -1965,6 +3493,83 @@ async def admin_set_settings(
     return RedirectResponse(url="/admin?settings_saved=1", status_code=302)
 
 
+@app.post("/admin/profiling")
+async def admin_arm_profiling(request: Request, count: int = Form(...), route: str = Form("")):
+    require_admin(request)
+    try:
+        PROFILER.arm(count, route)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return RedirectResponse(url="/admin", status_code=302)
+
+
+@app.post("/admin/profiling/stop")
+async def admin_stop_profiling(request: Request):
+    require_admin(request)
+    PROFILER.disarm()
+    return RedirectResponse(url="/admin", status_code=302)
+
+
+@app.get("/api/admin/profiling")
+async def admin_profiling_status(request: Request):
+    require_admin(request)
+    return {**PROFILER.status(), "profiles": PROFILER.recent(50)}
+
+
+@app.get("/admin/profiles/{profile_id}/{extension}")
+async def admin_profile_download(request: Request, profile_id: str, extension: str):
+    require_admin(request)
+    try:
+        path = PROFILER.path_for(profile_id, extension)
+    except ValueError:
+        raise HTTPException(status_code=404)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404)
+    media_type = "application/json" if extension == "json" else "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=f"vpk-profile-{profile_id}.{extension}")
+
+
+@app.get("/api/admin/loop-lag")
+async def admin_loop_lag(request: Request, limit: int = 20):
+    require_admin(request)
+    return LOOP_MONITOR.status(max(0, min(limit, 50)))
+
+
+@app.post("/api/admin/loop-lag/debug")
+async def admin_loop_lag_debug(request: Request, enabled: bool = Form(...)):
+    require_admin(request)
+    if not LOOP_MONITOR.enabled:
+        raise HTTPException(status_code=409, detail="事件循环监测未开启，请设置 LOOP_MONITOR_INTERVAL_MS")
+    LOOP_MONITOR.set_debug(enabled)
+    return LOOP_MONITOR.status(0)
+
+
+def _trace_payload(trace_id: str) -> dict[str, Any]:
+    trace_id = trace_id.strip().lower()
+    spans = TRACER.trace(trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail="本节点没有这条 trace 的记录")
+    return {"trace_id": trace_id, "span_count": len(spans), "spans": spans, "tree": format_trace(spans)}
+
+
+@app.get("/api/admin/traces")
+async def admin_traces(request: Request, limit: int = 20):
+    require_admin(request)
+    return {"enabled": TRACER.enabled, "traces": TRACER.recent_traces(max(1, min(limit, 200)))}
+
+
+@app.get("/api/admin/traces/{trace_id}")
+async def admin_trace(request: Request, trace_id: str):
+    require_admin(request)
+    return _trace_payload(trace_id)
+
+
+@app.get("/api/federation/traces/{trace_id}")
+async def federation_trace(request: Request, trace_id: str):
+    require_federation_token(request)
+    return _trace_payload(trace_id)
+
+
 @app.post("/admin/upload")
 async def admin_upload(request: Request, file: UploadFile, ttl_hours: Optional[int] = Form(None)):
     require_admin(request)
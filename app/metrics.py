@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: dict[tuple[str, ...], object] = {}
+        if not self.labelnames:
+            # 无标签指标从 0 开始输出，方便告警规则直接引用
+            self._children[()] = self._new_child()
+
+    def labels(self, **labels: object):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._new_child()
+                self._children[key] = child
+            return child
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} requires labels {self.labelnames}")
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    @property
+    def family(self) -> str:
+        return self.name
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.family} {self.documentation}", f"# TYPE {self.family} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+    def _items(self) -> list[tuple[tuple[str, ...], object]]:
+        with self._lock:
+            return sorted(self._children.items())
+
+
+class _Value:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = float(value)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    @property
+    def family(self) -> str:
+        # 与 prometheus_client 一致：计数器在 0.0.4 文本格式中以 _total 结尾
+        return f"{self.name}_total"
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def _samples(self) -> Iterator[str]:
+        for key, child in self._items():
+            yield f"{self.family}{_label_text(self.labelnames, key)} {_format_value(child.value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def _samples(self) -> Iterator[str]:
+        for key, child in self._items():
+            yield f"{self.name}{_label_text(self.labelnames, key)} {_format_value(child.value)}"
+
+
+class _HistogramValue:
+    __slots__ = ("_lock", "buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(float(bound) for bound in buckets if not math.isinf(bound)))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _samples(self) -> Iterator[str]:
+        for key, child in self._items():
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                bucket_label = _label_text(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{bucket_label} {cumulative}"
+            labels = _label_text(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """进程内指标注册表，按 Prometheus 文本格式 0.0.4 输出。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+UPLOAD_STAGE_SECONDS = REGISTRY.histogram(
+    "vpk_upload_stage_seconds",
+    "Time spent in each upload pipeline stage.",
+    ("stage",),
+)
+UPLOAD_INGESTED_BYTES = REGISTRY.counter(
+    "vpk_upload_ingested_bytes",
+    "Bytes received from upload request bodies.",
+    ("source",),
+)
+UPLOAD_DEDUP_HITS = REGISTRY.counter(
+    "vpk_upload_dedup_hits",
+    "Uploads that matched an existing active server VPK.",
+)
+VALIDATION_FAILURES = REGISTRY.counter(
+    "vpk_validation_failures",
+    "Rejected VPKs by the validation rule that failed.",
+    ("rule",),
+)
+REPLICATION_BYTES = REGISTRY.counter(
+    "vpk_replication_bytes",
+    "Bytes sent to LAN peers.",
+    ("peer", "status"),
+)
+REPLICATION_SECONDS = REGISTRY.histogram(
+    "vpk_replication_duration_seconds",
+    "Time spent replicating one batch to a LAN peer.",
+    ("peer", "status"),
+)
+CAPACITY_LOCK_WAIT_SECONDS = REGISTRY.histogram(
+    "vpk_capacity_lock_wait_seconds",
+    "Time spent waiting for the capacity lock.",
+)
+CAPACITY_LOCK_HOLD_SECONDS = REGISTRY.histogram(
+    "vpk_capacity_lock_hold_seconds",
+    "Time the capacity lock was held.",
+)
+SFTP_SCAN_SECONDS = REGISTRY.histogram(
+    "vpk_sftp_scan_duration_seconds",
+    "Duration of SFTP upload directory scans.",
+)
+CLEANUP_SECONDS = REGISTRY.histogram(
+    "vpk_cleanup_duration_seconds",
+    "Duration of cleanup tasks.",
+    ("task",),
+)
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "vpk_event_loop_lag_seconds",
+    "How late the event loop woke the lag probe.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_STALLS = REGISTRY.counter(
+    "vpk_event_loop_stalls",
+    "Event loop stalls longer than the configured threshold.",
+)
+STORAGE_BYTES = REGISTRY.gauge(
+    "vpk_storage_bytes",
+    "Storage usage, quota and reservations from the replication storage snapshot.",
+    ("kind",),
+)
+
+
+def validation_failure_rules(report: dict) -> list[str]:
+    rules: list[str] = []
+    if report.get("size_mb", 0) > report.get("max_size_mb", 0):
+        rules.append("max_size_mb")
+    if report.get("missing_required"):
+        rules.append("require_files")
+    if report.get("blocked_hits"):
+        rules.append("block_globs")
+    if report.get("crc_errors"):
+        rules.append("crc32")
+    return rules or ["unknown"]
+
+
+def observe_storage(storage: dict[str, Optional[int]]) -> None:
+    for kind, value in storage.items():
+        if value is not None:
+            STORAGE_BYTES.labels(kind=kind.removesuffix("_bytes")).set(value)
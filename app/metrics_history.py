@@ -0,0 +1,242 @@
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Iterable, Mapping, Optional
+
+logger = logging.getLogger("vpk_uploader")
+
+# 采样指标：cpu/内存按桶取平均值，网络和磁盘是累计计数器，按桶保留最后一次读数
+GAUGE_METRICS = ("cpu_percent", "memory_usage")
+COUNTER_METRICS = ("network_rx", "network_tx", "block_read", "block_write")
+METRICS = GAUGE_METRICS + COUNTER_METRICS
+# (桶宽秒数, 槽位数)：1 秒保留 10 分钟，1 分钟保留 24 小时，15 分钟保留 30 天
+DEFAULT_TIERS = ((1, 600), (60, 1440), (900, 2880))
+SPILL_MIN_STEP_SECONDS = 60
+SPILL_VERSION = 1
+
+
+class RingSeries:
+    """Fixed-size, array-backed ring of time buckets for one resolution.
+
+    Slot ``n % capacity`` holds bucket ``n`` (``n = timestamp // step``); a
+    slot is reset when a newer bucket lands on it, so memory never grows
+    after construction.
+    """
+
+    def __init__(self, step: int, capacity: int):
+        self.step = max(1, int(step))
+        self.capacity = max(1, int(capacity))
+        self.buckets = array("q", [-1]) * self.capacity
+        self.counts = array("I", [0]) * self.capacity
+        self.values = {name: array("f", [0.0]) * self.capacity for name in METRICS}
+
+    @property
+    def span_seconds(self) -> int:
+        return self.step * self.capacity
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.buckets, self.counts, *self.values.values()]
+        return sum(item.itemsize * len(item) for item in arrays)
+
+    def add(self, timestamp: float, sample: Mapping[str, float]) -> None:
+        bucket = int(timestamp // self.step)
+        index = bucket % self.capacity
+        if self.buckets[index] != bucket:
+            if self.buckets[index] > bucket:
+                return
+            self.buckets[index] = bucket
+            self.counts[index] = 0
+            for values in self.values.values():
+                values[index] = 0.0
+        self.counts[index] += 1
+        count = self.counts[index]
+        for name in GAUGE_METRICS:
+            values = self.values[name]
+            values[index] += (float(sample.get(name, 0)) - values[index]) / count
+        for name in COUNTER_METRICS:
+            self.values[name][index] = float(sample.get(name, 0))
+
+    def points(self, start: float, end: float) -> list[tuple[int, dict[str, float]]]:
+        first = int(start // self.step)
+        last = int(end // self.step)
+        result = []
+        for index in range(self.capacity):
+            bucket = self.buckets[index]
+            if bucket < 0 or bucket < first or bucket > last:
+                continue
+            result.append((bucket, {name: self.values[name][index] for name in METRICS}))
+        result.sort(key=lambda item: item[0])
+        return [(bucket * self.step, values) for bucket, values in result]
+
+    def dump(self) -> dict[str, Any]:
+        encode = lambda data: base64.b64encode(data.tobytes()).decode("ascii")
+        return {
+            "step": self.step,
+            "capacity": self.capacity,
+            "buckets": encode(self.buckets),
+            "counts": encode(self.counts),
+            "values": {name: encode(values) for name, values in self.values.items()},
+        }
+
+    def load(self, payload: Mapping[str, Any]) -> None:
+        if int(payload["step"]) != self.step or int(payload["capacity"]) != self.capacity:
+            raise ValueError("ring layout mismatch")
+
+        def decode(typecode: str, data: str) -> array:
+            loaded = array(typecode)
+            loaded.frombytes(base64.b64decode(data))
+            if len(loaded) != self.capacity:
+                raise ValueError("ring length mismatch")
+            return loaded
+
+        buckets = decode("q", payload["buckets"])
+        counts = decode("I", payload["counts"])
+        values = {name: decode("f", payload["values"][name]) for name in METRICS}
+        self.buckets, self.counts, self.values = buckets, counts, values
+
+
+class ContainerHistory:
+    def __init__(self, tiers: Iterable[tuple[int, int]] = DEFAULT_TIERS):
+        self.rings = [RingSeries(step, capacity) for step, capacity in sorted(tiers)]
+        self.name = ""
+
+    @property
+    def nbytes(self) -> int:
+        return sum(ring.nbytes for ring in self.rings)
+
+    def add(self, timestamp: float, sample: Mapping[str, float]) -> None:
+        for ring in self.rings:
+            ring.add(timestamp, sample)
+
+    def ring_for(self, window_seconds: float) -> RingSeries:
+        for ring in self.rings:
+            if ring.span_seconds >= window_seconds:
+                return ring
+        return self.rings[-1]
+
+
+class MetricsHistory:
+    """Per-container metric history with bounded memory.
+
+    Each tracked container costs exactly ``bytes_per_container`` and at most
+    ``max_containers`` are kept (least recently sampled are evicted). When
+    ``spill_dir`` is set, the minute-and-coarser rings are written there by
+    ``save()`` and restored by ``load()`` so long windows survive restarts.
+    """
+
+    def __init__(
+        self,
+        tiers: Iterable[tuple[int, int]] = DEFAULT_TIERS,
+        max_containers: int = 200,
+        spill_dir: str = "",
+        clock=time.time,
+    ):
+        self.tiers = tuple(sorted((int(step), int(capacity)) for step, capacity in tiers))
+        self.max_containers = max(1, int(max_containers))
+        self.spill_dir = spill_dir
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._containers: "OrderedDict[str, ContainerHistory]" = OrderedDict()
+
+    @property
+    def bytes_per_container(self) -> int:
+        return ContainerHistory(self.tiers).nbytes
+
+    def record(self, container_id: str, sample: Mapping[str, float], timestamp: Optional[float] = None, name: str = "") -> None:
+        timestamp = self.clock() if timestamp is None else timestamp
+        with self._lock:
+            history = self._containers.get(container_id)
+            if history is None:
+                history = ContainerHistory(self.tiers)
+                self._containers[container_id] = history
+                while len(self._containers) > self.max_containers:
+                    self._containers.popitem(last=False)
+            else:
+                self._containers.move_to_end(container_id)
+            if name:
+                history.name = name
+            history.add(timestamp, sample)
+
+    def series(self, container_id: str, window_seconds: float, end: Optional[float] = None) -> Optional[dict[str, Any]]:
+        end = self.clock() if end is None else end
+        window_seconds = max(1.0, float(window_seconds))
+        with self._lock:
+            history = self._containers.get(container_id)
+            if history is None:
+                return None
+            ring = history.ring_for(window_seconds)
+            points = ring.points(end - window_seconds, end)
+        return {
+            "container_id": container_id,
+            "resolution_seconds": ring.step,
+            "window_seconds": int(window_seconds),
+            "timestamps": [timestamp for timestamp, _ in points],
+            "series": {name: [round(values[name], 2) for _, values in points] for name in METRICS},
+        }
+
+    def container_ids(self) -> list[str]:
+        with self._lock:
+            return list(self._containers)
+
+    def save(self) -> int:
+        if not self.spill_dir:
+            return 0
+        with self._lock:
+            payload = {
+                "version": SPILL_VERSION,
+                "saved_at": self.clock(),
+                "containers": {
+                    container_id: {
+                        "name": history.name,
+                        "rings": [ring.dump() for ring in history.rings if ring.step >= SPILL_MIN_STEP_SECONDS],
+                    }
+                    for container_id, history in self._containers.items()
+                },
+            }
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, "docker-metrics.json")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            json.dump(payload, handle, separators=(",", ":"))
+        os.replace(temp_path, path)
+        return len(payload["containers"])
+
+    def load(self) -> int:
+        if not self.spill_dir:
+            return 0
+        path = os.path.join(self.spill_dir, "docker-metrics.json")
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                payload = json.load(handle)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as exc:
+            logger.warning("docker metrics history could not be read from %s: %s", path, exc)
+            return 0
+        if payload.get("version") != SPILL_VERSION:
+            return 0
+        loaded = 0
+        with self._lock:
+            for container_id, item in (payload.get("containers") or {}).items():
+                history = self._containers.get(container_id) or ContainerHistory(self.tiers)
+                rings = {ring.step: ring for ring in history.rings}
+                try:
+                    for ring_payload in item.get("rings") or []:
+                        ring = rings.get(int(ring_payload["step"]))
+                        if ring is not None:
+                            ring.load(ring_payload)
+                except (KeyError, TypeError, ValueError) as exc:
+                    logger.warning("docker metrics history for %s skipped: %s", container_id[:12], exc)
+                    continue
+                history.name = history.name or str(item.get("name") or "")
+                self._containers[container_id] = history
+                loaded += 1
+            while len(self._containers) > self.max_containers:
+                self._containers.popitem(last=False)
+        return loaded
@@ -0,0 +1,385 @@
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import fnmatch
+import functools
+import json
+import logging
+import os
+import pstats
+import resource
+import secrets
+import threading
+import time
+import tracemalloc
+import types
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterator, Optional
+
+
+logger = logging.getLogger("vpk_uploader")
+
+PROFILE_MAX_ARMED = 20
+PROFILE_KEEP = 50
+PROFILE_TOP_FUNCTIONS = 15
+PROFILE_EXTENSIONS = ("json", "pstats")
+
+_current: ContextVar[Optional["ProfileSession"]] = ContextVar("vpk_profile_session", default=None)
+_NULL_CONTEXT = nullcontext()
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _peak_rss_bytes() -> int:
+    # Linux 上 ru_maxrss 以 KB 为单位，是进程级高水位
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _top_functions(stats: pstats.Stats, limit: int = PROFILE_TOP_FUNCTIONS) -> list[dict[str, Any]]:
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+    result = []
+    for (filename, line, function), (_, calls, total, cumulative, _) in rows[:limit]:
+        result.append({
+            "function": f"{os.path.basename(filename)}:{line}({function})",
+            "calls": calls,
+            "total_seconds": round(total, 6),
+            "cumulative_seconds": round(cumulative, 6),
+        })
+    return result
+
+
+def _stats(profile: cProfile.Profile) -> Optional[pstats.Stats]:
+    try:
+        return pstats.Stats(profile)
+    except TypeError:
+        # 没有采到任何调用时 pstats 拒绝构造
+        return None
+
+
+def profile_stage(name: str):
+    """标记流水线阶段；未开启剖析时返回共享的空上下文。"""
+    session = _current.get()
+    if session is None:
+        return _NULL_CONTEXT
+    return session.stage(name)
+
+
+def profile_handler(func: Callable[..., Any]) -> Callable[..., Any]:
+    """包装路由处理函数，请求剖析只记录处理函数自己的执行。
+
+    同步路由在线程池线程里剖析；异步路由只在自己的协程执行步内启用剖析器，
+    等待期间事件循环上运行的其他协程不计入。
+    """
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def run_async(*args: Any, **kwargs: Any) -> Any:
+            session = _current.get()
+            if session is None or not session.handler_only:
+                return await func(*args, **kwargs)
+            return await session.profile_coroutine(func(*args, **kwargs))
+        return run_async
+
+    @functools.wraps(func)
+    def run_sync(*args: Any, **kwargs: Any) -> Any:
+        session = _current.get()
+        if session is None or not session.handler_only:
+            return func(*args, **kwargs)
+        return session.profile_call(func, *args, **kwargs)
+    return run_sync
+
+
+class ProfileSession:
+    def __init__(self, kind: str, label: str):
+        self.id = secrets.token_hex(8)
+        self.kind = kind
+        self.label = label
+        # 请求剖析不在中间件所在的事件循环线程上开启根剖析器，由 profile_handler 只剖析处理函数
+        self.handler_only = kind == "request"
+        self.upload_ids: list[int] = []
+        self.stages: list[dict[str, Any]] = []
+        self.started_at = datetime.now(timezone.utc)
+        self._started = 0.0
+        self._root = cProfile.Profile()
+        self._stack: list[cProfile.Profile] = []
+        self._stage_profiles: list[cProfile.Profile] = []
+        self._thread = threading.get_ident()
+        self._owns_tracemalloc = False
+        self._traced_peak = 0
+        self._traced_start = 0
+        self.summary: dict[str, Any] = {}
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        self._traced_start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self._started = time.perf_counter()
+        self._thread = threading.get_ident()
+        if not self.handler_only:
+            self._stack.append(self._root)
+            self._root.enable()
+
+    def profile_call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """在当前线程用会话的根剖析器执行同步处理函数。"""
+        self._thread = threading.get_ident()
+        self._stack.append(self._root)
+        self._root.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._root.disable()
+            self._stack.clear()
+
+    @types.coroutine
+    def profile_coroutine(self, coro: Any) -> Any:
+        """逐步驱动协程，只在它自己的执行步内启用剖析器（含进行中的阶段剖析器）。"""
+        self._stack.append(self._root)
+        value: Any = None
+        error: Optional[BaseException] = None
+        try:
+            while True:
+                self._thread = threading.get_ident()
+                self._stack[-1].enable()
+                try:
+                    yielded = coro.send(value) if error is None else coro.throw(error)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    self._stack[-1].disable()
+                try:
+                    value, error = (yield yielded), None
+                except BaseException as exc:
+                    value, error = None, exc
+        finally:
+            self._stack.clear()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        # 同一线程同时只能有一个 cProfile 生效，进入阶段时暂停外层剖析器；
+        # 在线程池里执行的阶段单独剖析，不动会话线程上的剖析器
+        outer = self._stack[-1] if threading.get_ident() == self._thread and self._stack else None
+        if outer is not None:
+            outer.disable()
+        self._note_peak()
+        profile = cProfile.Profile()
+        traced_before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        if outer is not None:
+            self._stack.append(profile)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - started
+            current, peak = tracemalloc.get_traced_memory()
+            self._traced_peak = max(self._traced_peak, peak)
+            if outer is not None:
+                self._stack.pop()
+            self._stage_profiles.append(profile)
+            stats = _stats(profile)
+            self.stages.append({
+                "name": name,
+                "seconds": round(elapsed, 6),
+                "allocated_bytes": current - traced_before,
+                "traced_peak_bytes": max(0, peak - traced_before),
+                "rss_bytes": _rss_bytes(),
+                "peak_rss_bytes": _peak_rss_bytes(),
+                "top_functions": _top_functions(stats) if stats is not None else [],
+            })
+            if outer is not None:
+                outer.enable()
+
+    def _note_peak(self) -> None:
+        self._traced_peak = max(self._traced_peak, tracemalloc.get_traced_memory()[1])
+
+    def finish(self) -> Optional[pstats.Stats]:
+        self._root.disable()
+        self._stack.clear()
+        self._note_peak()
+        traced_end = tracemalloc.get_traced_memory()[0]
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+        combined = _stats(self._root)
+        for profile in self._stage_profiles:
+            stats = _stats(profile)
+            if stats is None:
+                continue
+            if combined is None:
+                combined = stats
+            else:
+                combined.add(stats)
+        self.summary = {
+            "id": self.id,
+            "kind": self.kind,
+            "label": self.label,
+            "upload_ids": list(self.upload_ids),
+            "started_at": self.started_at.isoformat(),
+            "duration_seconds": round(time.perf_counter() - self._started, 6),
+            "allocated_bytes": traced_end - self._traced_start,
+            "traced_peak_bytes": max(0, self._traced_peak - self._traced_start),
+            "rss_bytes": _rss_bytes(),
+            "peak_rss_bytes": _peak_rss_bytes(),
+            "stages": self.stages,
+            "top_functions": _top_functions(combined) if combined is not None else [],
+        }
+        return combined
+
+
+class Profiler:
+    """按需给接下来的 N 次上传或匹配路由的请求挂上 cProfile 与 tracemalloc。"""
+
+    def __init__(self, output_dir: str, keep: int = PROFILE_KEEP):
+        self.output_dir = output_dir
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._route = ""
+        self._active = False
+
+    @property
+    def route_armed(self) -> bool:
+        return self._remaining > 0 and bool(self._route)
+
+    def arm(self, count: int, route: str = "") -> None:
+        if count < 1 or count > PROFILE_MAX_ARMED:
+            raise ValueError(f"剖析次数必须在 1 到 {PROFILE_MAX_ARMED} 之间")
+        route = route.strip()
+        if route and not route.startswith("/"):
+            raise ValueError("路由必须以 / 开头，可使用 * 通配")
+        with self._lock:
+            self._remaining = count
+            self._route = route
+        logger.info("profiling armed count=%s route=%s", count, route or "-")
+
+    def disarm(self) -> None:
+        with self._lock:
+            self._remaining = 0
+            self._route = ""
+
+    def status(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "armed": self._remaining > 0,
+                "remaining": self._remaining,
+                "route": self._route,
+                "active": self._active,
+            }
+
+    def _claim(self, kind: str, path: str) -> bool:
+        with self._lock:
+            if self._active or self._remaining <= 0:
+                return False
+            if kind == "request":
+                if not self._route or not fnmatch.fnmatchcase(path, self._route):
+                    return False
+            elif self._route:
+                return False
+            self._remaining -= 1
+            self._active = True
+            return True
+
+    def session(self, kind: str, label: str, path: str = ""):
+        if self._remaining <= 0 and _current.get() is None:
+            return _NULL_CONTEXT
+        return self._session(kind, label, path)
+
+    @contextmanager
+    def _session(self, kind: str, label: str, path: str) -> Iterator[Optional[ProfileSession]]:
+        current = _current.get()
+        if current is not None:
+            yield current
+            return
+        if not self._claim(kind, path or label):
+            yield None
+            return
+        session = ProfileSession(kind, label)
+        token = _current.set(session)
+        try:
+            session.start()
+            yield session
+        finally:
+            _current.reset(token)
+            try:
+                self._save(session, session.finish())
+            except Exception:
+                logger.exception("failed to save profile %s", session.id)
+            finally:
+                with self._lock:
+                    self._active = False
+
+    def path_for(self, profile_id: str, extension: str) -> str:
+        if extension not in PROFILE_EXTENSIONS or len(profile_id) != 16:
+            raise ValueError("invalid profile id")
+        int(profile_id, 16)
+        return os.path.join(self.output_dir, f"{profile_id}.{extension}")
+
+    def _save(self, session: ProfileSession, stats: Optional[pstats.Stats]) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        if stats is not None:
+            stats.dump_stats(self.path_for(session.id, "pstats"))
+        json_path = self.path_for(session.id, "json")
+        tmp_path = f"{json_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(session.summary, fh, ensure_ascii=False)
+        os.replace(tmp_path, json_path)
+        logger.info(
+            "profile saved id=%s kind=%s label=%s seconds=%s",
+            session.id,
+            session.kind,
+            session.label,
+            session.summary.get("duration_seconds"),
+        )
+        self._prune()
+
+    def recent(self, limit: int = 10) -> list[dict[str, Any]]:
+        try:
+            names = [name for name in os.listdir(self.output_dir) if name.endswith(".json")]
+        except OSError:
+            return []
+        paths = sorted(
+            (os.path.join(self.output_dir, name) for name in names),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        items = []
+        for path in paths[:limit]:
+            try:
+                with open(path, "r", encoding="utf-8") as fh:
+                    payload = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            items.append({key: payload.get(key) for key in ("id", "kind", "label", "upload_ids", "started_at", "duration_seconds")})
+        return items
+
+    def _prune(self) -> None:
+        names = [name for name in os.listdir(self.output_dir) if name.endswith(".json")]
+        if len(names) <= self.keep:
+            return
+        paths = sorted((os.path.join(self.output_dir, name) for name in names), key=os.path.getmtime)
+        for path in paths[:len(paths) - self.keep]:
+            base = path[: -len(".json")]
+            for extension in PROFILE_EXTENSIONS:
+                try:
+                    os.remove(f"{base}.{extension}")
+                except OSError:
+                    pass
+
+
+def profile_links(profile_id: str) -> dict[str, str]:
+    return {
+        "id": profile_id,
+        "json_url": f"/admin/profiles/{profile_id}/json",
+        "pstats_url": f"/admin/profiles/{profile_id}/pstats",
+    }
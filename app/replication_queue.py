@@ -0,0 +1,643 @@
+import asyncio
+import json
+import logging
+import os
+import secrets
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Iterable, Mapping, Optional
+
+from .db import ReplicationJob, ReplicationTask, SessionLocal
+from .lan_replication import (
+    COMPLETED_STATUSES,
+    LanPeer,
+    LanPeerPool,
+    LanReplicationConfig,
+    ReplicationArtifact,
+    peer_storage,
+    place_artifact,
+    replicate_artifacts,
+)
+from .tracing import TRACER, parse_traceparent
+
+logger = logging.getLogger("vpk_uploader")
+
+TASK_PENDING = "pending"
+TASK_RUNNING = "running"
+TASK_COMPLETED = "completed"
+TASK_FAILED = "failed"
+IDLE_POLL_SECONDS = 30.0
+PRUNE_INTERVAL_SECONDS = 3600
+FINISHED_JOB_STATUSES = ("completed", "partial", "failed")
+# 入队时还没选定目标节点的文件用这个节点 ID 占位，由 worker 按副本数放置后换成各节点的任务
+PLACEMENT_NODE = "*"
+
+Replicator = Callable[..., Awaitable[dict[str, Any]]]
+
+
+def _now_utc() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_aware_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def _iso(dt: Optional[datetime]) -> Optional[str]:
+    value = _as_aware_utc(dt)
+    return value.isoformat() if value else None
+
+
+def retry_delay_seconds(config: LanReplicationConfig, attempts: int) -> int:
+    """第 N 次失败后的等待时间：从基础间隔开始指数翻倍，不超过上限。"""
+    exponent = max(0, attempts - 1)
+    if exponent >= 32:
+        return config.job_retry_max_seconds
+    return min(config.job_retry_max_seconds, config.job_retry_base_seconds * (2 ** exponent))
+
+
+def _job_status(tasks: list[ReplicationTask]) -> str:
+    statuses = {task.status for task in tasks}
+    if not tasks or statuses == {TASK_COMPLETED}:
+        return "completed"
+    if TASK_RUNNING in statuses:
+        return "running"
+    if TASK_PENDING in statuses:
+        return "retrying" if any(task.attempts for task in tasks) else "queued"
+    if TASK_COMPLETED in statuses:
+        return "partial"
+    return "failed"
+
+
+class ReplicationQueue:
+    """把复制任务按「节点 × 文件」写入 SQLite，由后台 worker 执行并按指数退避重试。
+
+    上传接口只负责入队，按副本数挑选目标节点也放在 worker 里做；进程重启后 `recover()`
+    会把中断时仍在执行的任务放回队列。
+    """
+
+    def __init__(
+        self,
+        config: LanReplicationConfig,
+        pool: Optional[LanPeerPool] = None,
+        session_factory: Callable[[], Any] = SessionLocal,
+        replicate: Replicator = replicate_artifacts,
+        clock: Callable[[], datetime] = _now_utc,
+        local_storage: Optional[Callable[[], Mapping[str, Any]]] = None,
+        on_placed: Optional[Callable[[Mapping[str, tuple[str, ...]]], None]] = None,
+    ) -> None:
+        self.config = config
+        self.pool = pool
+        self._session_factory = session_factory
+        self._replicate = replicate
+        self._clock = clock
+        self._local_storage = local_storage
+        self._on_placed = on_placed
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: dict[str, asyncio.Task] = {}
+        self._pruned_at: Optional[datetime] = None
+
+    def enqueue(
+        self,
+        artifacts: Iterable[ReplicationArtifact],
+        peers: Optional[Iterable[LanPeer]] = None,
+        targets: Optional[Mapping[str, Iterable[LanPeer]]] = None,
+        place: bool = False,
+    ) -> Optional[dict[str, Any]]:
+        """入队复制任务；targets 按 SHA-256 指定每个文件的目标节点，未指定时发给 peers。
+
+        place 为真且设置了副本数时只记录待放置的文件，目标节点由 worker 读取各节点容量后挑选。
+        """
+        if place and self.config.replication_factor > 0:
+            if self.config.replication_factor <= 1:
+                # 本节点持有的一份已经满足副本数
+                return None
+            placements = [(artifact, (PLACEMENT_NODE,)) for artifact in artifacts]
+        else:
+            peer_tuple = self.config.peers if peers is None else tuple(peers)
+            placements = [
+                (
+                    artifact,
+                    tuple(peer.node_id for peer in (peer_tuple if targets is None else targets.get(artifact.sha256, ()))),
+                )
+                for artifact in artifacts
+            ]
+        placements = [(artifact, node_ids) for artifact, node_ids in placements if node_ids]
+        if not placements:
+            return None
+        artifact_tuple = tuple(artifact for artifact, _ in placements)
+        job_id = secrets.token_hex(16)
+        now = self._clock()
+        manifest = [{**artifact.manifest_item(), "path": artifact.path} for artifact in artifact_tuple]
+        trace = TRACER.current()
+        if trace is not None:
+            # 后台执行时以入队请求的 span 为父，复制过程和上传落在同一条 trace 里
+            for item in manifest:
+                item["traceparent"] = trace.traceparent
+        db = self._session_factory()
+        try:
+            db.add(ReplicationJob(
+                id=job_id,
+                manifest=json.dumps(manifest, ensure_ascii=False),
+                status="queued",
+                created_at=now,
+                updated_at=now,
+            ))
+            for artifact, node_ids in placements:
+                for node_id in node_ids:
+                    db.add(ReplicationTask(
+                        job_id=job_id,
+                        node_id=node_id,
+                        sha256=artifact.sha256,
+                        status=TASK_PENDING,
+                        attempts=0,
+                        next_attempt_at=now,
+                        updated_at=now,
+                    ))
+            db.commit()
+        finally:
+            db.close()
+        self.notify()
+        return self.job_status(job_id)
+
+    def recover(self) -> int:
+        """进程重启后，把上次没跑完的任务重新标记为待执行。"""
+        db = self._session_factory()
+        try:
+            now = self._clock()
+            count = db.query(ReplicationTask).filter(ReplicationTask.status == TASK_RUNNING).update(
+                {"status": TASK_PENDING, "next_attempt_at": now, "updated_at": now},
+                synchronize_session=False,
+            )
+            db.commit()
+            return int(count)
+        finally:
+            db.close()
+
+    def queued_hashes(self, node_id: str) -> set[str]:
+        """某个节点还在排队或执行中的文件，用于避免对账时重复入队。"""
+        db = self._session_factory()
+        try:
+            rows = db.query(ReplicationTask.sha256).filter(
+                ReplicationTask.node_id == node_id,
+                ReplicationTask.status.in_((TASK_PENDING, TASK_RUNNING)),
+            ).all()
+            return {row[0] for row in rows}
+        finally:
+            db.close()
+
+    def _missing_replicas(self, task: ReplicationTask) -> int:
+        """待放置条目还差几份副本；还没放置过时只有本节点这一份。"""
+        if task.status == TASK_COMPLETED:
+            return 0
+        last_status = task.last_status or ""
+        if last_status.startswith("short:"):
+            try:
+                return max(0, int(last_status[len("short:"):]))
+            except ValueError:
+                pass
+        return max(0, self.config.replication_factor - 1)
+
+    def _status_payload(self, job: ReplicationJob, tasks: list[ReplicationTask]) -> dict[str, Any]:
+        try:
+            manifest = json.loads(job.manifest or "[]")
+        except json.JSONDecodeError:
+            manifest = []
+        names = {str(item.get("sha256", "")): str(item.get("original_name", "")) for item in manifest}
+        peer_names = {peer.node_id: peer.name for peer in self.config.peers}
+        peers: dict[str, dict[str, Any]] = {}
+        placement = []
+        for task in tasks:
+            if task.node_id == PLACEMENT_NODE:
+                placement.append({
+                    "sha256": task.sha256,
+                    "original_name": names.get(task.sha256, ""),
+                    "status": task.status,
+                    "attempts": int(task.attempts or 0),
+                    "missing_replicas": self._missing_replicas(task),
+                    "next_attempt_at": _iso(task.next_attempt_at) if task.status == TASK_PENDING else None,
+                    "detail": task.detail,
+                })
+                continue
+            entry = peers.setdefault(task.node_id, {
+                "node_id": task.node_id,
+                "name": peer_names.get(task.node_id, task.node_id),
+                "artifacts": [],
+            })
+            entry["artifacts"].append({
+                "sha256": task.sha256,
+                "original_name": names.get(task.sha256, ""),
+                "status": task.status,
+                "attempts": int(task.attempts or 0),
+                "next_attempt_at": _iso(task.next_attempt_at) if task.status == TASK_PENDING else None,
+                "last_status": task.last_status,
+                "detail": task.detail,
+            })
+        for entry in peers.values():
+            entry["status"] = _job_status([task for task in tasks if task.node_id == entry["node_id"]])
+        return {
+            "job_id": job.id,
+            "status": _job_status(tasks),
+            "created_at": _iso(job.created_at),
+            "updated_at": _iso(job.updated_at),
+            "artifact_count": len(manifest),
+            "peer_count": len(peers),
+            "completed_task_count": sum(task.status == TASK_COMPLETED for task in tasks),
+            "pending_task_count": sum(task.status in (TASK_PENDING, TASK_RUNNING) for task in tasks),
+            "failed_task_count": sum(task.status == TASK_FAILED for task in tasks),
+            "replica_shortfall": sum(item["missing_replicas"] for item in placement),
+            "placement": placement,
+            "peers": list(peers.values()),
+        }
+
+    def job_status(self, job_id: str) -> Optional[dict[str, Any]]:
+        db = self._session_factory()
+        try:
+            job = db.get(ReplicationJob, job_id)
+            if job is None:
+                return None
+            tasks = db.query(ReplicationTask).filter(ReplicationTask.job_id == job_id).order_by(ReplicationTask.id).all()
+            return self._status_payload(job, tasks)
+        finally:
+            db.close()
+
+    def recent_jobs(self, limit: int = 20) -> list[dict[str, Any]]:
+        db = self._session_factory()
+        try:
+            jobs = db.query(ReplicationJob).order_by(ReplicationJob.created_at.desc()).limit(max(1, limit)).all()
+            payloads = []
+            for job in jobs:
+                tasks = db.query(ReplicationTask).filter(ReplicationTask.job_id == job.id).order_by(ReplicationTask.id).all()
+                payloads.append(self._status_payload(job, tasks))
+            return payloads
+        finally:
+            db.close()
+
+    def _claim_due(self, limit: int, busy: Iterable[str] = ()) -> dict[str, list[tuple[int, str, str]]]:
+        """认领最多 limit 个任务的到期条目；busy 中的任务还在执行，留到它结束后再认领。"""
+        db = self._session_factory()
+        try:
+            now = self._clock()
+            query = db.query(ReplicationTask).filter(
+                ReplicationTask.status == TASK_PENDING,
+                ReplicationTask.next_attempt_at <= now,
+            )
+            busy_ids = list(busy)
+            if busy_ids:
+                query = query.filter(ReplicationTask.job_id.notin_(busy_ids))
+            claimed: dict[str, list[tuple[int, str, str]]] = {}
+            for task in query.order_by(ReplicationTask.id).all():
+                if task.job_id not in claimed and len(claimed) >= limit:
+                    continue
+                task.status = TASK_RUNNING
+                task.attempts = int(task.attempts or 0) + 1
+                task.updated_at = now
+                claimed.setdefault(task.job_id, []).append((int(task.id), task.node_id, task.sha256))
+            for job_id in claimed:
+                job = db.get(ReplicationJob, job_id)
+                if job is not None:
+                    job.status = "running"
+                    job.updated_at = now
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def _load_artifacts(self, job_id: str) -> tuple[dict[str, ReplicationArtifact], str]:
+        """返回 SHA-256 -> 文件，以及入队时记录的 traceparent（没有时为空）。"""
+        db = self._session_factory()
+        try:
+            job = db.get(ReplicationJob, job_id)
+            manifest = json.loads(job.manifest) if job is not None and job.manifest else []
+        finally:
+            db.close()
+        artifacts: dict[str, ReplicationArtifact] = {}
+        traceparent = ""
+        for item in manifest:
+            traceparent = traceparent or str(item.get("traceparent", ""))
+            try:
+                artifact = ReplicationArtifact(
+                    upload_id=int(item["source_upload_id"]),
+                    original_name=str(item["original_name"]),
+                    stored_name=str(item["stored_name"]),
+                    path=str(item["path"]),
+                    size=int(item["size"]),
+                    sha256=str(item["sha256"]),
+                    holders=tuple(str(node_id) for node_id in item.get("holders", ())),
+                )
+            except (KeyError, TypeError, ValueError):
+                continue
+            artifacts[artifact.sha256] = artifact
+        return artifacts, traceparent
+
+    def _finish(self, job_id: str, outcomes: dict[int, tuple[bool, str, str, bool]]) -> None:
+        """outcomes: task_id -> (是否成功, 节点状态, 说明, 是否不再重试)。"""
+        db = self._session_factory()
+        try:
+            now = self._clock()
+            for task_id, (succeeded, last_status, detail, permanent) in outcomes.items():
+                task = db.get(ReplicationTask, task_id)
+                if task is None:
+                    continue
+                task.last_status = last_status[:32] or None
+                task.detail = detail[:1000] or None
+                task.updated_at = now
+                if succeeded:
+                    task.status = TASK_COMPLETED
+                elif permanent or int(task.attempts or 0) >= self.config.job_max_attempts:
+                    task.status = TASK_FAILED
+                else:
+                    task.status = TASK_PENDING
+                    task.next_attempt_at = now + timedelta(seconds=retry_delay_seconds(self.config, int(task.attempts or 0)))
+            job = db.get(ReplicationJob, job_id)
+            if job is not None:
+                tasks = db.query(ReplicationTask).filter(ReplicationTask.job_id == job_id).all()
+                job.status = _job_status(tasks)
+                job.updated_at = now
+            db.commit()
+        finally:
+            db.close()
+
+    async def _storage(self) -> dict[str, Any]:
+        pool = self.pool or LanPeerPool(self.config)
+        try:
+            storage: dict[str, Any] = dict(await peer_storage(self.config, pool))
+        finally:
+            if self.pool is None:
+                await pool.aclose()
+        local = await asyncio.to_thread(self._local_storage) if self._local_storage is not None else {}
+        storage[self.config.node_id] = dict(local)
+        return storage
+
+    async def _place(
+        self,
+        job_id: str,
+        claimed: list[tuple[int, str, str]],
+        artifacts: Mapping[str, ReplicationArtifact],
+    ) -> tuple[dict[int, tuple[bool, str, str, bool]], list[tuple[int, str, str]], dict[str, tuple[str, ...]]]:
+        """为待放置的文件挑选目标节点，写入并认领对应的节点任务。
+
+        本任务里已经分配过的节点连同本节点一起计入副本数，重试时只补缺少的名额。
+        选出的持有节点写回任务清单，随文件发给接收方，最后一项返回 SHA-256 -> 持有节点。
+        """
+        outcomes: dict[int, tuple[bool, str, str, bool]] = {}
+        placeable = []
+        for task_id, _, sha256 in claimed:
+            artifact = artifacts.get(sha256)
+            if artifact is None or not os.path.isfile(artifact.path):
+                outcomes[task_id] = (False, "source_missing", "源文件已删除，无法继续复制", True)
+            else:
+                placeable.append((task_id, artifact))
+        if not placeable:
+            return outcomes, [], {}
+        storage = await self._storage()
+        peer_ids = {peer.node_id for peer in self.config.peers}
+        created: list[tuple[str, ReplicationTask]] = []
+        holders_by_sha: dict[str, tuple[str, ...]] = {}
+        db = self._session_factory()
+        try:
+            now = self._clock()
+            existing: dict[str, set[str]] = {}
+            for node_id, sha256 in db.query(ReplicationTask.node_id, ReplicationTask.sha256).filter(
+                ReplicationTask.job_id == job_id,
+                ReplicationTask.node_id != PLACEMENT_NODE,
+                ReplicationTask.status != TASK_FAILED,
+            ).all():
+                existing.setdefault(sha256, set()).add(node_id)
+            for task_id, artifact in placeable:
+                assigned = existing.get(artifact.sha256, set())
+                holders = {self.config.node_id} | assigned
+                placed = place_artifact(self.config, artifact.sha256, artifact.size, storage, holders=holders)
+                holders_by_sha[artifact.sha256] = tuple(sorted(set(artifact.holders) | set(placed)))
+                for node_id in placed:
+                    if node_id in peer_ids and node_id not in assigned:
+                        task = ReplicationTask(
+                            job_id=job_id,
+                            node_id=node_id,
+                            sha256=artifact.sha256,
+                            status=TASK_RUNNING,
+                            attempts=1,
+                            next_attempt_at=now,
+                            updated_at=now,
+                        )
+                        db.add(task)
+                        created.append((node_id, task))
+                shortfall = self.config.replication_factor - len(placed)
+                if shortfall > 0:
+                    # 不可达或放不下的节点可能稍后恢复，按重试间隔重新放置，补齐剩余副本
+                    outcomes[task_id] = (
+                        False,
+                        f"short:{shortfall}",
+                        f"副本不足：需要 {self.config.replication_factor} 份，目前只能放置 {len(placed)} 份",
+                        False,
+                    )
+                else:
+                    outcomes[task_id] = (True, "placed", "", False)
+            job = db.get(ReplicationJob, job_id)
+            if job is not None and job.manifest:
+                manifest = json.loads(job.manifest)
+                for item in manifest:
+                    if item.get("sha256") in holders_by_sha:
+                        item["holders"] = list(holders_by_sha[item["sha256"]])
+                job.manifest = json.dumps(manifest, ensure_ascii=False)
+            db.commit()
+            return outcomes, [(int(task.id), node_id, task.sha256) for node_id, task in created], holders_by_sha
+        finally:
+            db.close()
+
+    async def _run_job(self, job_id: str, claimed: list[tuple[int, str, str]]) -> None:
+        artifacts, traceparent = self._load_artifacts(job_id)
+        peers = {peer.node_id: peer for peer in self.config.peers}
+        outcomes: dict[int, tuple[bool, str, str, bool]] = {}
+        placing = [task for task in claimed if task[1] == PLACEMENT_NODE]
+        if placing:
+            outcomes, placed, holders = await self._place(job_id, placing, artifacts)
+            claimed = [task for task in claimed if task[1] != PLACEMENT_NODE] + placed
+            for sha256, node_ids in holders.items():
+                artifacts[sha256] = replace(artifacts[sha256], holders=node_ids)
+            if holders and self._on_placed is not None:
+                await asyncio.to_thread(self._on_placed, holders)
+        wanted: dict[str, dict[str, int]] = {}
+        for task_id, node_id, sha256 in claimed:
+            artifact = artifacts.get(sha256)
+            if node_id not in peers:
+                outcomes[task_id] = (False, "configuration_error", "节点已不在 LAN_PEERS 配置中", True)
+            elif artifact is None or not os.path.isfile(artifact.path):
+                outcomes[task_id] = (False, "source_missing", "源文件已删除，无法继续复制", True)
+            else:
+                wanted.setdefault(node_id, {})[sha256] = task_id
+
+        # 同一批文件的节点放在一次调用里，这样 chain/tree 中继拓扑仍然生效。
+        groups: dict[tuple[str, ...], list[str]] = {}
+        for node_id, by_sha in wanted.items():
+            groups.setdefault(tuple(sorted(by_sha)), []).append(node_id)
+        for shas, node_ids in groups.items():
+            config = replace(self.config, peers=tuple(peers[node_id] for node_id in node_ids))
+            try:
+                with TRACER.span(
+                    "replication.job",
+                    parent=parse_traceparent(traceparent),
+                    job_id=job_id,
+                    peers=",".join(node_ids),
+                    artifact_count=len(shas),
+                ):
+                    replication = await self._replicate(config, [artifacts[sha] for sha in shas], pool=self.pool)
+                results = {str(item.get("node_id", "")): item for item in replication.get("peers", [])}
+            except Exception as exc:
+                logger.exception("lan replication job=%s failed", job_id)
+                results = {node_id: {"status": "failed", "detail": str(exc)} for node_id in node_ids}
+            for node_id in node_ids:
+                result = results.get(node_id, {"status": "failed", "detail": "节点没有返回复制结果"})
+                status = str(result.get("status", "failed"))
+                detail = str(result.get("detail", ""))
+                failed_details = {
+                    str(item.get("sha256", "")): str(item.get("detail", ""))
+                    for item in result.get("failed", [])
+                    if isinstance(item, dict)
+                }
+                for sha256, task_id in wanted[node_id].items():
+                    if status in COMPLETED_STATUSES:
+                        outcomes[task_id] = (True, status, "", False)
+                    elif status == "partial":
+                        if sha256 in failed_details:
+                            outcomes[task_id] = (False, status, failed_details[sha256], False)
+                        else:
+                            outcomes[task_id] = (True, "completed", "", False)
+                    else:
+                        outcomes[task_id] = (False, status, detail, False)
+        self._finish(job_id, outcomes)
+
+    def prune(self) -> int:
+        """删除结束超过保留天数的任务及其条目，返回删除的任务数。"""
+        db = self._session_factory()
+        try:
+            now = self._clock()
+            cutoff = now - timedelta(days=self.config.job_retention_days)
+            job_ids = [
+                row[0]
+                for row in db.query(ReplicationJob.id).filter(
+                    ReplicationJob.status.in_(FINISHED_JOB_STATUSES),
+                    ReplicationJob.updated_at < cutoff,
+                ).all()
+            ]
+            for start in range(0, len(job_ids), 500):
+                batch = job_ids[start:start + 500]
+                db.query(ReplicationTask).filter(ReplicationTask.job_id.in_(batch)).delete(synchronize_session=False)
+                db.query(ReplicationJob).filter(ReplicationJob.id.in_(batch)).delete(synchronize_session=False)
+            db.commit()
+            self._pruned_at = now
+        finally:
+            db.close()
+        if job_ids:
+            logger.info("lan replication queue pruned finished jobs=%s", len(job_ids))
+        return len(job_ids)
+
+    async def _run_claimed(self, job_id: str, tasks: list[tuple[int, str, str]]) -> None:
+        try:
+            await self._run_job(job_id, tasks)
+        except Exception:
+            logger.exception("lan replication job=%s could not be recorded", job_id)
+
+    def _job_done(self, job_id: str) -> None:
+        self._running.pop(job_id, None)
+        # 空出并发名额，唤醒主循环认领下一个任务
+        self.notify()
+
+    def _start_due(self) -> tuple[list[asyncio.Task], int]:
+        """按空闲的并发名额认领到期任务，每个任务单独启动，不等待它们结束。"""
+        now = self._clock()
+        if self._pruned_at is None or (now - self._pruned_at).total_seconds() >= PRUNE_INTERVAL_SECONDS:
+            self.prune()
+        free = self.config.job_concurrency - len(self._running)
+        if free <= 0:
+            return [], 0
+        claimed = self._claim_due(free, self._running)
+        started = []
+        for job_id, tasks in claimed.items():
+            task = asyncio.create_task(self._run_claimed(job_id, tasks))
+            self._running[job_id] = task
+            task.add_done_callback(lambda _task, job_id=job_id: self._job_done(job_id))
+            started.append(task)
+        processed = sum(len(tasks) for tasks in claimed.values())
+        if processed:
+            logger.info("lan replication queue started tasks=%s jobs=%s", processed, len(claimed))
+        return started, processed
+
+    async def run_once(self) -> int:
+        """启动已到期的任务并等它们结束，返回本轮处理的任务数；后台循环不等待，见 `_loop`。"""
+        started, processed = self._start_due()
+        if started:
+            await asyncio.gather(*started)
+        return processed
+
+    def _next_due_seconds(self) -> float:
+        if len(self._running) >= self.config.job_concurrency:
+            # 名额占满时不必轮询，任务结束时会唤醒主循环
+            return IDLE_POLL_SECONDS
+        db = self._session_factory()
+        try:
+            query = db.query(ReplicationTask).filter(ReplicationTask.status == TASK_PENDING)
+            if self._running:
+                query = query.filter(ReplicationTask.job_id.notin_(list(self._running)))
+            task = query.order_by(ReplicationTask.next_attempt_at).first()
+            if task is None:
+                return IDLE_POLL_SECONDS
+            due = _as_aware_utc(task.next_attempt_at)
+            delay = (due - self._clock()).total_seconds() if due else 0.0
+            return max(0.0, min(IDLE_POLL_SECONDS, delay))
+        finally:
+            db.close()
+
+    def notify(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                self._start_due()
+                timeout = self._next_due_seconds()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("lan replication queue iteration failed")
+                timeout = IDLE_POLL_SECONDS
+            if self._wake is None:
+                self._wake = asyncio.Event()
+            # 不用 wait_for：任务结束的唤醒和 stop() 的取消同时到达时，wait_for 会吞掉取消
+            waiter = asyncio.ensure_future(self._wake.wait())
+            try:
+                await asyncio.wait((waiter,), timeout=timeout)
+            finally:
+                waiter.cancel()
+            self._wake.clear()
+
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        recovered = self.recover()
+        if recovered:
+            logger.info("lan replication queue resumed interrupted tasks=%s", recovered)
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        task = self._task
+        self._task = None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        # 中断的任务留在 running 状态，下次启动时由 recover() 放回队列
+        running = list(self._running.values())
+        for job in running:
+            job.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
@@ -4,7 +4,13 @@
   const containers = root.querySelector('[data-containers]');
   const summary = root.querySelector('[data-summary]');
   const error = root.querySelector('[data-error]');
+  const historyWindow = root.querySelector('[data-window]');
   const dialog = document.querySelector('[data-file-dialog]');
+  const execDialog = document.querySelector('[data-exec-dialog]');
+  const execOutput = execDialog.querySelector('[data-exec-output]');
+  const execStatus = execDialog.querySelector('[data-exec-status]');
+  let execContainer = null;
+  let execSocket = null;
   let fileContainer = null;
   let currentPath = '/';
   const bytes = value => {
@@ -20,39 +26,194 @@
     if (!response.ok) throw new Error(data.detail || '请求失败');
     return data;
   }
+  function sparkline(values) {
+    if (values.length < 2) return '<svg viewBox="0 0 100 32" preserveAspectRatio="none"></svg>';
+    const max = Math.max(...values) || 1;
+    const points = values.map((value, index) => `${(index / (values.length - 1) * 100).toFixed(2)},${(30 - value / max * 28).toFixed(2)}`).join(' ');
+    return `<svg viewBox="0 0 100 32" preserveAspectRatio="none"><polyline points="${points}"></polyline></svg>`;
+  }
+  function rates(timestamps, rx, tx) {
+    return timestamps.slice(1).map((time, index) => {
+      const seconds = time - timestamps[index] || 1;
+      return Math.max(0, rx[index + 1] - rx[index]) / seconds + Math.max(0, tx[index + 1] - tx[index]) / seconds;
+    });
+  }
+  async function loadHistory(id) {
+    const target = containers.querySelector(`[data-history="${CSS.escape(id)}"]`);
+    if (!target) return;
+    try {
+      const data = await request(`/api/admin/docker/containers/${encodeURIComponent(id)}/metrics?window=${historyWindow.value}`);
+      const s = data.series;
+      const network = rates(data.timestamps, s.network_rx, s.network_tx);
+      target.innerHTML = `<div class="sparkline"><span>CPU 峰值 ${Math.max(0, ...s.cpu_percent).toFixed(1)}%</span>${sparkline(s.cpu_percent)}</div><div class="sparkline"><span>内存峰值 ${bytes(Math.max(0, ...s.memory_usage))}</span>${sparkline(s.memory_usage)}</div><div class="sparkline"><span>网络峰值 ${bytes(Math.max(0, ...network))}/s</span>${sparkline(network)}</div>`;
+      target.hidden = false;
+    } catch (err) { target.hidden = true; }
+  }
+  const state = new Map();
+  const selected = new Set();
+  const bulk = root.querySelector('[data-bulk]');
+  let generatedAt = null;
+  let lastEvent = null;
+  let streaming = false;
+  let pollTimer = null;
+  const metrics = item => ({
+    cpu: `${Number(item.cpu_percent || 0).toFixed(1)}%`,
+    memory: `${bytes(item.memory_usage)} / ${bytes(item.memory_limit)}`,
+    network: `${bytes(item.network_rx)} / ${bytes(item.network_tx)}`,
+    block: `${bytes(item.block_read)} / ${bytes(item.block_write)}`,
+  });
+  function card(item) {
+    const m = metrics(item);
+    return `<article class="container-card" data-card="${esc(item.id)}">
+        <div class="container-title"><div><h3>${esc(item.name)}</h3><code>${esc(item.short_id)} · ${esc(item.image)}</code></div><label class="container-select"><input type="checkbox" data-select="${esc(item.id)}" ${selected.has(item.id) ? 'checked' : ''}><span class="status status-${esc(item.status)}">${esc(item.status)}</span></label></div>
+        <div class="metric-grid"><div><span>CPU</span><strong data-metric="cpu">${m.cpu}</strong></div><div><span>内存</span><strong data-metric="memory">${m.memory}</strong></div><div><span>网络 ↓ / ↑</span><strong data-metric="network">${m.network}</strong></div><div><span>磁盘读 / 写</span><strong data-metric="block">${m.block}</strong></div></div>
+        <div class="sparkline-grid" data-history="${esc(item.id)}" hidden></div>
+        <div class="mount-list"><span class="muted">挂载</span>${item.mounts.length ? item.mounts.map(m => `<code title="${esc(m.source)}">${esc(m.destination)} ${m.writable ? '读写' : '只读'}</code>`).join('') : '<code>无</code>'}</div>
+        <div class="row container-actions"><button data-action="start" data-id="${esc(item.id)}" ${item.status === 'running' ? 'disabled' : ''}>启动</button><button class="secondary" data-action="restart" data-id="${esc(item.id)}" ${item.status !== 'running' ? 'disabled' : ''}>重启</button><button class="danger" data-action="stop" data-id="${esc(item.id)}" ${item.status !== 'running' ? 'disabled' : ''}>停止</button><button class="secondary" data-files-id="${esc(item.id)}" data-name="${esc(item.name)}" ${item.status !== 'running' ? 'disabled' : ''}>文件</button><button class="secondary" data-exec-id="${esc(item.id)}" data-name="${esc(item.name)}" ${item.status !== 'running' ? 'disabled' : ''}>命令</button></div>
+      </article>`;
+  }
+  function renderSummary() {
+    const items = [...state.values()];
+    const running = items.filter(item => item.status === 'running').length;
+    const event = lastEvent ? ` · 最近事件：${esc(lastEvent.name || lastEvent.id.slice(0, 12))} ${esc(lastEvent.action)}` : '';
+    summary.innerHTML = `<strong>${items.length}</strong> 个容器 · <strong>${running}</strong> 个运行中 · ${esc(new Date(generatedAt).toLocaleString())}${event}`;
+  }
+  function renderAll(list) {
+    state.clear();
+    list.forEach(item => state.set(item.id, item));
+    renderSummary();
+    containers.innerHTML = list.map(card).join('') || '<p class="muted">没有容器</p>';
+    list.forEach(item => loadHistory(item.id));
+    renderSelection();
+  }
+  function applyDelta(data) {
+    data.removed.forEach(id => { state.delete(id); containers.querySelector(`[data-card="${CSS.escape(id)}"]`)?.remove(); });
+    data.changed.forEach(change => {
+      const previous = state.get(change.id);
+      const item = {...previous, ...change};
+      state.set(item.id, item);
+      const element = containers.querySelector(`[data-card="${CSS.escape(item.id)}"]`);
+      const layout = ['name', 'image', 'status', 'mounts'].some(key => key in change);
+      if (element && previous && !layout) {
+        const m = metrics(item);
+        element.querySelectorAll('[data-metric]').forEach(node => { node.textContent = m[node.dataset.metric]; });
+        return;
+      }
+      if (element) element.outerHTML = card(item);
+      else {
+        containers.querySelector(':scope > p.muted')?.remove();
+        containers.insertAdjacentHTML('beforeend', card(item));
+      }
+      loadHistory(item.id);
+    });
+    if (!state.size) containers.innerHTML = '<p class="muted">没有容器</p>';
+    renderSummary();
+    if (data.removed.length) renderSelection();
+  }
   async function load() {
     error.hidden = true;
     try {
       const data = await request('/api/admin/docker/containers');
-      const running = data.containers.filter(item => item.status === 'running').length;
-      summary.innerHTML = `<strong>${data.containers.length}</strong> 个容器 · <strong>${running}</strong> 个运行中 · ${esc(new Date(data.generated_at).toLocaleString())}`;
-      containers.innerHTML = data.containers.map(item => `<article class="container-card">
-        <div class="container-title"><div><h3>${esc(item.name)}</h3><code>${esc(item.short_id)} · ${esc(item.image)}</code></div><span class="status status-${esc(item.status)}">${esc(item.status)}</span></div>
-        <div class="metric-grid"><div><span>CPU</span><strong>${item.cpu_percent.toFixed(1)}%</strong></div><div><span>内存</span><strong>${bytes(item.memory_usage)} / ${bytes(item.memory_limit)}</strong></div><div><span>网络 ↓ / ↑</span><strong>${bytes(item.network_rx)} / ${bytes(item.network_tx)}</strong></div><div><span>磁盘读 / 写</span><strong>${bytes(item.block_read)} / ${bytes(item.block_write)}</strong></div></div>
-        <div class="mount-list"><span class="muted">挂载</span>${item.mounts.length ? item.mounts.map(m => `<code title="${esc(m.source)}">${esc(m.destination)} ${m.writable ? '读写' : '只读'}</code>`).join('') : '<code>无</code>'}</div>
-        <div class="row container-actions"><button data-action="start" data-id="${esc(item.id)}" ${item.status === 'running' ? 'disabled' : ''}>启动</button><button class="secondary" data-action="restart" data-id="${esc(item.id)}" ${item.status !== 'running' ? 'disabled' : ''}>重启</button><button class="danger" data-action="stop" data-id="${esc(item.id)}" ${item.status !== 'running' ? 'disabled' : ''}>停止</button><button class="secondary" data-files-id="${esc(item.id)}" data-name="${esc(item.name)}" ${item.status !== 'running' ? 'disabled' : ''}>文件</button></div>
-      </article>`).join('') || '<p class="muted">没有容器</p>';
+      generatedAt = data.generated_at;
+      renderAll(data.containers);
     } catch (err) { error.textContent = err.message; error.hidden = false; containers.innerHTML = ''; }
   }
+  function startPolling() {
+    streaming = false;
+    if (!pollTimer) pollTimer = setInterval(load, 15000);
+    load();
+  }
+  function connect() {
+    if (!window.EventSource) { startPolling(); return; }
+    const source = new EventSource('/api/admin/docker/stream');
+    source.addEventListener('open', () => { streaming = true; });
+    source.addEventListener('snapshot', event => { const data = JSON.parse(event.data); error.hidden = true; generatedAt = data.generated_at; renderAll(data.containers); });
+    source.addEventListener('delta', event => { const data = JSON.parse(event.data); generatedAt = data.generated_at; applyDelta(data); });
+    source.addEventListener('container', event => { lastEvent = JSON.parse(event.data); if (generatedAt) renderSummary(); });
+    source.addEventListener('failure', event => { error.textContent = JSON.parse(event.data).detail; error.hidden = false; });
+    source.addEventListener('error', () => { if (source.readyState === EventSource.CLOSED) startPolling(); });
+  }
   async function action(id, action, button) {
     button.disabled = true;
-    try { await request(`/api/admin/docker/containers/${encodeURIComponent(id)}/${action}`, {method: 'POST'}); await load(); }
+    try { await request(`/api/admin/docker/containers/${encodeURIComponent(id)}/${action}`, {method: 'POST'}); if (!streaming) await load(); }
     catch (err) { error.textContent = err.message; error.hidden = false; button.disabled = false; }
   }
-  async function loadFiles(path) {
+  function appendOutput(text, className) {
+    const stick = execOutput.scrollTop + execOutput.clientHeight >= execOutput.scrollHeight - 4;
+    const span = document.createElement('span');
+    if (className) span.className = className;
+    span.textContent = text;
+    execOutput.append(span);
+    if (stick) execOutput.scrollTop = execOutput.scrollHeight;
+  }
+  function setRunning(running) {
+    execDialog.querySelector('[data-exec-run]').disabled = running;
+    execDialog.querySelector('[data-exec-cancel]').disabled = !running;
+  }
+  function runCommand(command) {
+    execOutput.textContent = '';
+    execStatus.textContent = '正在启动...';
+    setRunning(true);
+    const protocol = location.protocol === 'https:' ? 'wss' : 'ws';
+    const socket = new WebSocket(`${protocol}://${location.host}/api/admin/docker/containers/${encodeURIComponent(execContainer)}/exec/stream`);
+    execSocket = socket;
+    socket.addEventListener('open', () => socket.send(JSON.stringify({command})));
+    socket.addEventListener('message', event => {
+      const data = JSON.parse(event.data);
+      if (data.type === 'started') execStatus.textContent = `运行中（最长 ${data.timeout_seconds} 秒）`;
+      else if (data.type === 'stdout') appendOutput(data.data);
+      else if (data.type === 'stderr') appendOutput(data.data, 'stderr');
+      else if (data.type === 'error') execStatus.textContent = data.detail;
+      else if (data.type === 'exit') execStatus.textContent = `${data.cancelled ? '已中止' : '已结束'} · 退出码 ${data.exit_code ?? '-'} · ${bytes(data.bytes)} · ${(data.duration_ms / 1000).toFixed(1)} 秒${data.truncated ? ' · 输出已截断' : ''}`;
+    });
+    socket.addEventListener('close', () => { if (execSocket === socket) { execSocket = null; setRunning(false); } });
+  }
+  function closeExec() {
+    if (execSocket) execSocket.close();
+    execDialog.close();
+  }
+  const downloadUrl = path => `/api/admin/docker/containers/${encodeURIComponent(fileContainer)}/download?path=${encodeURIComponent(path)}`;
+  function renderSelection() {
+    [...selected].forEach(id => { if (!state.has(id)) selected.delete(id); });
+    bulk.querySelector('[data-bulk-count]').textContent = selected.size ? `已选择 ${selected.size} 个容器` : '未选择容器';
+    bulk.querySelectorAll('[data-bulk-action]').forEach(button => { button.disabled = !selected.size; });
+  }
+  async function bulkAction(action) {
+    const rolling = bulk.querySelector('[data-bulk-rolling]').checked;
+    const body = {action, ids: [...selected], rolling, max_unavailable: Number(bulk.querySelector('[data-bulk-unavailable]').value) || 1};
+    bulk.querySelectorAll('button').forEach(button => { button.disabled = true; });
+    error.hidden = true;
+    try {
+      const data = await request('/api/admin/docker/bulk', {method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(body)});
+      const problems = data.results.filter(item => !item.ok).map(item => `${item.name}：${item.status === 'skipped' ? '已跳过' : item.error}`);
+      if (problems.length) { error.textContent = `成功 ${data.succeeded} 个，失败 ${data.failed} 个，跳过 ${data.skipped} 个。${problems.join('；')}`; error.hidden = false; }
+      if (!streaming) await load();
+    } catch (err) { error.textContent = err.message; error.hidden = false; }
+    renderSelection();
+  }
+  async function loadFiles(path, refresh = false) {
     currentPath = path;
     dialog.querySelector('[data-current-path]').textContent = path;
-    const data = await request(`/api/admin/docker/containers/${encodeURIComponent(fileContainer)}/files?path=${encodeURIComponent(path)}`);
+    dialog.querySelector('[data-download-current]').href = downloadUrl(path);
+    dialog.querySelector('[data-download-current]').hidden = path === '/';
+    const data = await request(`/api/admin/docker/containers/${encodeURIComponent(fileContainer)}/files?path=${encodeURIComponent(path)}${refresh ? '&refresh=true' : ''}`);
     dialog.querySelector('[data-parent]').disabled = !data.parent;
     dialog.querySelector('[data-parent]').dataset.path = data.parent || '';
-    dialog.querySelector('[data-files]').innerHTML = data.entries.map(item => `<button type="button" class="file-entry" ${item.type === 'directory' ? `data-path="${esc(item.path)}"` : 'disabled'}><span>${item.type === 'directory' ? '目录' : '文件'} · ${esc(item.name)}</span><small>${item.type === 'file' ? bytes(item.size) : ''}</small></button>`).join('') || '<p class="muted">目录为空</p>';
+    dialog.querySelector('[data-files]').innerHTML = data.entries.map(item => `<div class="file-entry-row"><button type="button" class="file-entry" ${item.type === 'directory' ? `data-path="${esc(item.path)}"` : 'disabled'}><span>${item.type === 'directory' ? '目录' : '文件'} · ${esc(item.name)}</span><small>${item.type === 'file' ? bytes(item.size) : ''}</small></button><a href="${esc(downloadUrl(item.path))}">下载</a></div>`).join('') || '<p class="muted">目录为空</p>';
   }
-  root.addEventListener('click', event => { const actionButton = event.target.closest('[data-action]'); if (actionButton) action(actionButton.dataset.id, actionButton.dataset.action, actionButton); const fileButton = event.target.closest('[data-files-id]'); if (fileButton) { fileContainer = fileButton.dataset.filesId; dialog.querySelector('[data-file-title]').textContent = `${fileButton.dataset.name} 文件`; dialog.showModal(); loadFiles('/'); } });
+  root.addEventListener('click', event => { const actionButton = event.target.closest('[data-action]'); if (actionButton) action(actionButton.dataset.id, actionButton.dataset.action, actionButton); const fileButton = event.target.closest('[data-files-id]'); if (fileButton) { fileContainer = fileButton.dataset.filesId; dialog.querySelector('[data-file-title]').textContent = `${fileButton.dataset.name} 文件`; dialog.showModal(); loadFiles('/'); } const execButton = event.target.closest('[data-exec-id]'); if (execButton) { execContainer = execButton.dataset.execId; execDialog.querySelector('[data-exec-title]').textContent = `${execButton.dataset.name} 执行命令`; execStatus.textContent = '未运行'; execOutput.textContent = ''; execDialog.showModal(); } });
+  execDialog.querySelector('[data-exec-form]').addEventListener('submit', event => { event.preventDefault(); if (!execSocket) runCommand(event.currentTarget.elements.command.value); });
+  execDialog.querySelector('[data-exec-cancel]').addEventListener('click', () => { if (execSocket && execSocket.readyState === WebSocket.OPEN) execSocket.send(JSON.stringify({type: 'cancel'})); });
+  execDialog.querySelector('[data-exec-close]').addEventListener('click', closeExec);
+  execDialog.addEventListener('cancel', () => { if (execSocket) execSocket.close(); });
   dialog.addEventListener('click', event => { const entry = event.target.closest('[data-path]'); if (entry) loadFiles(entry.dataset.path); });
   root.querySelector('[data-refresh]').addEventListener('click', load);
+  root.addEventListener('change', event => { const box = event.target.closest('[data-select]'); if (!box) return; if (box.checked) selected.add(box.dataset.select); else selected.delete(box.dataset.select); renderSelection(); });
+  bulk.addEventListener('click', event => { const button = event.target.closest('[data-bulk-action]'); if (button) bulkAction(button.dataset.bulkAction); });
+  historyWindow.addEventListener('change', () => state.forEach((_, id) => loadHistory(id)));
   dialog.querySelector('[data-close]').addEventListener('click', () => dialog.close());
   dialog.querySelector('[data-parent]').addEventListener('click', event => loadFiles(event.currentTarget.dataset.path));
-  dialog.querySelector('[data-file-refresh]').addEventListener('click', () => loadFiles(currentPath));
-  load();
-  setInterval(load, 15000);
+  dialog.querySelector('[data-file-refresh]').addEventListener('click', () => loadFiles(currentPath, true));
+  connect();
+  setInterval(() => state.forEach((_, id) => loadHistory(id)), 60000);
 })();
@@ -0,0 +1,439 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Iterator, Mapping, Optional
+
+import httpx
+
+
+logger = logging.getLogger("vpk_uploader")
+
+TRACEPARENT_HEADER = "traceparent"
+TRACE_ID_HEADER = "X-Trace-Id"
+TRACE_EXPORTERS = ("off", "jsonl", "otlp")
+TRACE_KEEP_SPANS = 5000
+JSONL_MAX_BYTES = 64 * 1024 * 1024
+EXPORT_BATCH_SPANS = 256
+EXPORT_FLUSH_SECONDS = 2.0
+EXPORT_QUEUE_SPANS = 10000
+
+_HEX = frozenset("0123456789abcdef")
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    trace_id: str
+    span_id: str
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+def _is_hex(value: str, length: int) -> bool:
+    return len(value) == length and set(value) <= _HEX and set(value) != {"0"}
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """解析 W3C traceparent；格式不对时返回 None，由调用方开启新的 trace。"""
+    parts = (value or "").strip().lower().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or not set(parts[0]) <= _HEX or parts[0] == "ff":
+        return None
+    if not _is_hex(parts[1], 32) or not _is_hex(parts[2], 16):
+        return None
+    return SpanContext(parts[1], parts[2])
+
+
+_current: ContextVar[Optional[SpanContext]] = ContextVar("vpk_trace_context", default=None)
+
+
+class Span:
+    __slots__ = ("name", "kind", "context", "parent_id", "start_ns", "end_ns", "attributes", "status", "error")
+
+    def __init__(self, name: str, kind: str, context: SpanContext, parent_id: str, attributes: dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.context = context
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.status = "ok"
+        self.error = ""
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update((key, value) for key, value in attributes.items() if value is not None)
+
+    def fail(self, error: str) -> None:
+        self.status = "error"
+        self.error = error[:500]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1_000_000, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NullSpan:
+    """追踪关闭时交给调用方的占位 span，set/fail 都不做任何事。"""
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def fail(self, error: str) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+_NULL_CONTEXT = nullcontext(_NULL_SPAN)
+
+
+class _QueuedExporter:
+    """export 只把 span 放进队列，由后台线程按批写出；队列满时丢弃，不阻塞请求和事件循环。"""
+
+    def __init__(self, close_timeout: float = 5.0):
+        self.dropped = 0
+        self._close_timeout = close_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=EXPORT_QUEUE_SPANS)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: dict[str, Any]) -> None:
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _drain(self, first: Optional[dict[str, Any]] = None) -> list[dict[str, Any]]:
+        batch = [first] if first is not None else []
+        while len(batch) < EXPORT_BATCH_SPANS:
+            try:
+                span = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if span is not None:
+                batch.append(span)
+        return batch
+
+    def _open(self) -> AbstractContextManager[Any]:
+        """后台线程整个生命周期内使用的资源，传给 _write。"""
+        return nullcontext()
+
+    def _write(self, sink: Any, batch: list[dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def _run(self) -> None:
+        with self._open() as sink:
+            while not self._stop.is_set():
+                try:
+                    first = self._queue.get(timeout=EXPORT_FLUSH_SECONDS)
+                except queue.Empty:
+                    continue
+                if first is not None:
+                    self._write(sink, self._drain(first))
+            while not self._queue.empty():
+                self._write(sink, self._drain())
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            try:
+                # 唤醒正在等待队列的线程，写完剩余的 span 后退出
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+            self._thread.join(timeout=self._close_timeout + EXPORT_FLUSH_SECONDS)
+
+
+class JsonlExporter(_QueuedExporter):
+    """每个 span 一行 JSON，由后台线程按批追加，文件超过上限时轮转为 .1。"""
+
+    def __init__(self, path: str, max_bytes: int = JSONL_MAX_BYTES):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _write(self, sink: Any, batch: list[dict[str, Any]]) -> None:
+        if not batch:
+            return
+        lines = "".join(json.dumps(span, ensure_ascii=False, default=str) + "\n" for span in batch)
+        try:
+            if os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, f"{self.path}.1")
+        except OSError:
+            pass
+        try:
+            with open(self.path, "a", encoding="utf-8") as fh:
+                fh.write(lines)
+        except OSError as exc:
+            self.dropped += len(batch)
+            logger.warning("trace export failed path=%s error=%s", self.path, exc)
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Mapping[str, Any]) -> list[dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+def otlp_payload(spans: list[dict[str, Any]], resource: Mapping[str, Any]) -> dict[str, Any]:
+    """按 OTLP/HTTP JSON 编码一批 span。"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes(resource)},
+            "scopeSpans": [{
+                "scope": {"name": "vpk_uploader"},
+                "spans": [{
+                    "traceId": span["trace_id"],
+                    "spanId": span["span_id"],
+                    "parentSpanId": span["parent_span_id"],
+                    "name": span["name"],
+                    "kind": _OTLP_KINDS.get(span["kind"], 1),
+                    "startTimeUnixNano": str(span["start_ns"]),
+                    "endTimeUnixNano": str(span["end_ns"]),
+                    "attributes": _otlp_attributes(span["attributes"]),
+                    "status": {"code": 2, "message": span["error"]} if span["status"] == "error" else {"code": 1},
+                } for span in spans],
+            }],
+        }],
+    }
+
+
+class OtlpExporter(_QueuedExporter):
+    """后台线程按批 POST 到 OTLP/HTTP 收集端；队列满或收集端不可用时丢弃，不阻塞请求。"""
+
+    def __init__(self, endpoint: str, resource: Mapping[str, Any], timeout: float = 5.0):
+        super().__init__(close_timeout=timeout)
+        self.endpoint = endpoint
+        self.resource = dict(resource)
+        self.timeout = timeout
+
+    def _open(self) -> httpx.Client:
+        return httpx.Client(timeout=self.timeout)
+
+    def _write(self, client: httpx.Client, batch: list[dict[str, Any]]) -> None:
+        if not batch:
+            return
+        try:
+            response = client.post(self.endpoint, json=otlp_payload(batch, self.resource))
+            if response.status_code >= 300:
+                logger.warning("trace export rejected endpoint=%s status=%s", self.endpoint, response.status_code)
+        except httpx.HTTPError as exc:
+            self.dropped += len(batch)
+            logger.warning("trace export failed endpoint=%s error=%s", self.endpoint, exc)
+
+
+class Tracer:
+    """进程内 tracer：当前 span 放在 ContextVar 里，asyncio 任务和 to_thread 会自动继承。"""
+
+    def __init__(self, keep: int = TRACE_KEEP_SPANS):
+        self.exporter: Optional[Any] = None
+        self.resource: dict[str, Any] = {}
+        self._recent: deque[dict[str, Any]] = deque(maxlen=keep)
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def configure(self, exporter: Optional[Any], resource: Optional[Mapping[str, Any]] = None) -> None:
+        previous = self.exporter
+        self.exporter = exporter
+        self.resource = dict(resource or {})
+        if previous is not None and previous is not exporter:
+            previous.close()
+
+    def span(self, name: str, kind: str = "internal", parent: Optional[SpanContext] = None, **attributes: Any):
+        """开始一个 span；未开启追踪时返回共享的空上下文。"""
+        if self.exporter is None:
+            return _NULL_CONTEXT
+        return self._span(name, kind, parent, attributes)
+
+    @contextmanager
+    def _span(
+        self,
+        name: str,
+        kind: str,
+        parent: Optional[SpanContext],
+        attributes: dict[str, Any],
+    ) -> Iterator[Span]:
+        parent = parent or _current.get()
+        trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        span = Span(
+            name,
+            kind,
+            SpanContext(trace_id, secrets.token_hex(8)),
+            parent.span_id if parent is not None else "",
+            {key: value for key, value in attributes.items() if value is not None},
+        )
+        token = _current.set(span.context)
+        try:
+            yield span
+        except BaseException as exc:
+            if span.status != "error":
+                span.fail(f"{type(exc).__name__}: {exc}")
+            raise
+        finally:
+            _current.reset(token)
+            span.end_ns = time.time_ns()
+            self._finish(span)
+
+    def _finish(self, span: Span) -> None:
+        payload = span.to_dict()
+        payload["resource"] = self.resource
+        self._recent.append(payload)
+        exporter = self.exporter
+        if exporter is None:
+            return
+        try:
+            exporter.export(payload)
+        except Exception:
+            logger.exception("trace export failed span=%s", span.name)
+
+    def current(self) -> Optional[SpanContext]:
+        return _current.get() if self.exporter is not None else None
+
+    def inject(self, headers: dict[str, str]) -> dict[str, str]:
+        """把当前 span 写进请求头，下游节点以它为父 span 继续记录。"""
+        context = self.current()
+        if context is not None:
+            headers[TRACEPARENT_HEADER] = context.traceparent
+        return headers
+
+    def trace(self, trace_id: str) -> list[dict[str, Any]]:
+        return sorted((span for span in list(self._recent) if span["trace_id"] == trace_id), key=lambda span: span["start_ns"])
+
+    def recent_traces(self, limit: int = 20) -> list[dict[str, Any]]:
+        """最近结束的本地根 span（没有父 span 或父 span 来自其他节点）。"""
+        spans = list(self._recent)
+        local_ids = {span["span_id"] for span in spans}
+        roots = [span for span in spans if not span["parent_span_id"] or span["parent_span_id"] not in local_ids]
+        roots.sort(key=lambda span: span["end_ns"], reverse=True)
+        return roots[:limit]
+
+
+TRACER = Tracer()
+
+
+def configure_tracing(
+    exporter_name: str,
+    jsonl_path: str,
+    otlp_endpoint: str,
+    resource: Mapping[str, Any],
+) -> None:
+    name = (exporter_name or "off").strip().lower()
+    if name not in TRACE_EXPORTERS:
+        logger.warning("unknown TRACE_EXPORTER=%s, tracing disabled", exporter_name)
+        name = "off"
+    if name == "jsonl":
+        TRACER.configure(JsonlExporter(jsonl_path), resource)
+    elif name == "otlp":
+        TRACER.configure(OtlpExporter(otlp_endpoint, resource), resource)
+    else:
+        TRACER.configure(None, resource)
+
+
+def spans_from_otlp(payload: Mapping[str, Any]) -> list[dict[str, Any]]:
+    """把 OTLP/HTTP JSON 请求体还原成与 JSONL 导出相同结构的 span。"""
+
+    def plain(attributes: Any) -> dict[str, Any]:
+        values = {}
+        for item in attributes or []:
+            value = item.get("value", {})
+            raw = next(iter(value.values()), None) if isinstance(value, dict) else None
+            if "intValue" in value:
+                raw = int(raw)
+            values[str(item.get("key", ""))] = raw
+        return values
+
+    kinds = {number: name for name, number in _OTLP_KINDS.items()}
+    spans = []
+    for resource_spans in payload.get("resourceSpans", []):
+        resource = plain(resource_spans.get("resource", {}).get("attributes"))
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for item in scope_spans.get("spans", []):
+                start_ns = int(item.get("startTimeUnixNano", 0))
+                end_ns = int(item.get("endTimeUnixNano", 0))
+                status = item.get("status", {})
+                spans.append({
+                    "trace_id": str(item.get("traceId", "")),
+                    "span_id": str(item.get("spanId", "")),
+                    "parent_span_id": str(item.get("parentSpanId", "")),
+                    "name": str(item.get("name", "")),
+                    "kind": kinds.get(item.get("kind"), "internal"),
+                    "start_ns": start_ns,
+                    "end_ns": end_ns,
+                    "duration_ms": round((end_ns - start_ns) / 1_000_000, 3),
+                    "status": "error" if status.get("code") == 2 else "ok",
+                    "error": str(status.get("message", "")),
+                    "attributes": plain(item.get("attributes")),
+                    "resource": resource,
+                })
+    return spans
+
+
+def format_trace(spans: list[dict[str, Any]]) -> list[str]:
+    """把一条 trace 的 span 按父子关系缩进成文本行，方便在终端里看慢在哪一段。"""
+    by_parent: dict[str, list[dict[str, Any]]] = {}
+    ids = {span["span_id"] for span in spans}
+    for span in sorted(spans, key=lambda item: item["start_ns"]):
+        parent = span["parent_span_id"] if span["parent_span_id"] in ids else ""
+        by_parent.setdefault(parent, []).append(span)
+    origin = min((span["start_ns"] for span in spans), default=0)
+    lines: list[str] = []
+
+    def walk(parent: str, depth: int) -> None:
+        for span in by_parent.get(parent, []):
+            node = span.get("resource", {}).get("service.instance.id") or span["attributes"].get("node")
+            offset_ms = (span["start_ns"] - origin) / 1_000_000
+            mark = " !" if span["status"] == "error" else ""
+            lines.append(
+                f"{'  ' * depth}{span['name']} {span['duration_ms']:.1f} ms (+{offset_ms:.1f} ms)"
+                + (f" [{node}]" if node else "")
+                + mark
+            )
+            walk(span["span_id"], depth + 1)
+
+    walk("", 0)
+    return lines
@@ -1,5 +1,9 @@
+import mmap
 import os
-from typing import Tuple
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
 from vpk import VPK
 
@@ -13,6 +17,9 @@ DEFAULT_PATH_ENCODINGS: Tuple[str, ...] = (
     "cp1252",
     "latin-1",
 )
+CRC_BATCH_BYTES = 8 * 1024 * 1024
+CRC_CHUNK_BYTES = 4 * 1024 * 1024
+CRC_MAX_REPORTED = 20
 
 
 def _path_encodings() -> Tuple[str, ...]:
@@ -21,6 +28,13 @@ def _path_encodings() -> Tuple[str, ...]:
     return encodings or DEFAULT_PATH_ENCODINGS
 
 
+def _crc_workers() -> int:
+    raw = os.getenv("VPK_CRC_WORKERS", "")
+    if raw.strip().isdigit() and int(raw) > 0:
+        return int(raw)
+    return min(8, os.cpu_count() or 1)
+
+
 def open_vpk(vpk_path: str):
     """
     Open a VPK and eagerly read its index with a tolerant path encoding fallback.
@@ -52,3 +66,134 @@ def open_vpk(vpk_path: str):
         )
 
     raise ValueError("VPK 目录路径无法读取")
+
+
+def vpk_segments(vpk_path: str) -> List[Dict]:
+    """
+    Split a single-file VPK into contiguous byte ranges ordered by offset.
+
+    Embedded entries carry their path and CRC32; the header, directory tree and
+    any gaps between entries are literal ranges with ``crc32`` set to None.
+    Concatenating the ranges reproduces the file byte for byte, which lets LAN
+    replication send only the entries a receiver does not already hold.
+
+    The directory CRC32 covers an entry's preload bytes (kept in the tree)
+    followed by its data, so each entry also reports ``preload_crc32``, the
+    CRC32 of the preload alone (0 when there is none); seeding ``zlib.crc32``
+    with it lets the data range be checked against ``crc32``.
+    """
+    file_size = os.path.getsize(vpk_path)
+    with open_vpk(vpk_path) as arch:
+        entries = []
+        for path, metadata in arch.tree.items():
+            preload, crc32, _, archive_index, offset, length = metadata
+            if archive_index != 0x7FFF:
+                raise ValueError("多分卷 VPK 不支持按条目切分")
+            if length:
+                entries.append((int(offset), int(length), int(crc32), zlib.crc32(preload or b""), str(path)))
+
+    entries.sort()
+    segments: List[Dict] = []
+    cursor = 0
+    for offset, length, crc32, preload_crc32, path in entries:
+        if offset < cursor:
+            raise ValueError("VPK 条目数据区重叠")
+        if offset > cursor:
+            segments.append({"offset": cursor, "length": offset - cursor, "crc32": None, "path": None})
+        segments.append({
+            "offset": offset,
+            "length": length,
+            "crc32": crc32,
+            "preload_crc32": preload_crc32,
+            "path": path,
+        })
+        cursor = offset + length
+    if cursor > file_size:
+        raise ValueError("VPK 条目超出文件长度")
+    if cursor < file_size:
+        segments.append({"offset": cursor, "length": file_size - cursor, "crc32": None, "path": None})
+    return segments
+
+
+def _crc_batches(entries: List[Tuple], batch_bytes: int) -> List[List[Tuple]]:
+    batches: List[List[Tuple]] = []
+    current: List[Tuple] = []
+    size = 0
+    for entry in entries:
+        current.append(entry)
+        size += entry[1]
+        if size >= batch_bytes:
+            batches.append(current)
+            current, size = [], 0
+    if current:
+        batches.append(current)
+    return batches
+
+
+def verify_vpk_crc(vpk_path: str, workers: Optional[int] = None) -> List[Dict]:
+    """
+    Check every entry of a single-file VPK against the CRC32 in its directory.
+
+    The archive is memory-mapped and entries are hashed in offset-ordered
+    batches on a thread pool; ``zlib.crc32`` releases the GIL on large buffers,
+    so batches run on separate cores. Hashing stops at the first mismatch.
+    Returns the bad entries found (at most ``CRC_MAX_REPORTED``), so an empty
+    list means every entry matched.
+    """
+    file_size = os.path.getsize(vpk_path)
+    entries = []
+    bad: List[Dict] = []
+    with open_vpk(vpk_path) as arch:
+        for path, metadata in arch.tree.items():
+            preload, crc32, _, archive_index, offset, length = metadata
+            offset, length = int(offset), int(length)
+            if archive_index != 0x7FFF and length:
+                bad.append({"path": str(path), "error": "条目数据位于外部分卷"})
+            elif offset + length > file_size:
+                bad.append({"path": str(path), "error": "条目数据超出文件末尾，文件可能被截断"})
+            else:
+                entries.append((offset, length, int(crc32) & 0xFFFFFFFF, preload or b"", str(path)))
+    if bad or not entries:
+        return bad[:CRC_MAX_REPORTED]
+
+    entries.sort()
+    failed = threading.Event()
+    lock = threading.Lock()
+
+    with open(vpk_path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            def check(batch: List[Tuple]) -> None:
+                for offset, length, expected, preload, path in batch:
+                    if failed.is_set():
+                        return
+                    actual = zlib.crc32(preload)
+                    end = offset + length
+                    # 大条目分块计算，其他线程发现错误后能尽快停下
+                    for start in range(offset, end, CRC_CHUNK_BYTES):
+                        if failed.is_set():
+                            return
+                        actual = zlib.crc32(view[start:min(end, start + CRC_CHUNK_BYTES)], actual)
+                    if actual != expected:
+                        with lock:
+                            bad.append({
+                                "path": path,
+                                "error": "CRC32 不匹配",
+                                "expected_crc32": f"{expected:08x}",
+                                "actual_crc32": f"{actual:08x}",
+                            })
+                        failed.set()
+                        return
+
+            batches = _crc_batches(entries, CRC_BATCH_BYTES)
+            worker_count = min(workers or _crc_workers(), len(batches))
+            if worker_count <= 1:
+                for batch in batches:
+                    check(batch)
+            else:
+                with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="vpk-crc") as pool:
+                    for future in [pool.submit(check, batch) for batch in batches]:
+                        future.result()
+        finally:
+            view.release()
+    return bad[:CRC_MAX_REPORTED]
@@ -2,6 +2,7 @@ import os
 import shutil
 from typing import List, Dict
 
+from .profiling import profile_stage
 from .vpk_reader import open_vpk
 from .thirdparty.l4d2_vpk_lib import NewVPK
 
@@ -97,7 +98,8 @@ def process_server_vpk(
     os.makedirs(server_dir, exist_ok=True)
 
     # 1) 解包
-    total_entries = extract_vpk_to_dir(src_vpk_path, ext_dir)
+    with profile_stage("build.extract"):
+        total_entries = extract_vpk_to_dir(src_vpk_path, ext_dir)
 
     # 2) 解包完成后，删除原始 /tmp 的 vpk
     try:
@@ -106,12 +108,14 @@ def process_server_vpk(
         pass
 
     # 3) 白名单筛选
-    stats = _filter_copy(ext_dir, server_dir, SERVER_KEEP_GLOBS)
+    with profile_stage("build.filter"):
+        stats = _filter_copy(ext_dir, server_dir, SERVER_KEEP_GLOBS)
 
     # 4) 重打包到 uploads
     os.makedirs(output_dir, exist_ok=True)
     out_path = os.path.join(output_dir, output_filename)
-    build_vpk_from_dir(server_dir, out_path)
+    with profile_stage("build.repack"):
+        build_vpk_from_dir(server_dir, out_path)
 
     # 5) 清理工作目录
     try:
@@ -1,9 +1,10 @@
 import os
 import fnmatch
 import yaml
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from typing import List, Dict, Optional
 
+from .profiling import profile_stage
 from .vpk_reader import open_vpk
 
 @dataclass
@@ -17,6 +18,7 @@ class ValidationResult:
     warned_hits: List[str]
     file_count: int
     sample_files: List[str]
+    crc_errors: List[Dict] = field(default_factory=list)
 
     def to_dict(self):
         return asdict(self)
@@ -37,24 +39,25 @@ def validate_vpk(vpk_path: str, rules_path: str, max_size_mb_override: Optional[
 
     size_mb = os.path.getsize(vpk_path) / (1024 * 1024)
 
-    with open_vpk(vpk_path) as arch:
+    with profile_stage("validate.read_index"), open_vpk(vpk_path) as arch:
         entries = [_norm(rel) for rel in arch]  # 注意：返回的是路径字符串
 
     file_count = len(entries)
 
     required_present, missing_required = [], []
-    lower_entries = set(entries)
-    for req in require_files:
-        hit = any(e.endswith("/" + req) or e == req for e in lower_entries)
-        (required_present if hit else missing_required).append(req)
-
     blocked_hits, warned_hits = [], []
-    for e in entries:
-        if any(fnmatch.fnmatch(e, pat) for pat in block_globs):
-            blocked_hits.append(e)
-            continue
-        if any(fnmatch.fnmatch(e, pat) for pat in warn_globs):
-            warned_hits.append(e)
+    with profile_stage("validate.rules"):
+        lower_entries = set(entries)
+        for req in require_files:
+            hit = any(e.endswith("/" + req) or e == req for e in lower_entries)
+            (required_present if hit else missing_required).append(req)
+
+        for e in entries:
+            if any(fnmatch.fnmatch(e, pat) for pat in block_globs):
+                blocked_hits.append(e)
+                continue
+            if any(fnmatch.fnmatch(e, pat) for pat in warn_globs):
+                warned_hits.append(e)
 
     ok = size_mb <= max_size_mb and not missing_required and not blocked_hits
 
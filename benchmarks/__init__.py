@@ -0,0 +1 @@
+"""离线性能基准：合成 VPK 生成器与处理引擎微基准。"""
@@ -0,0 +1,443 @@
+"""HTTP 层压测：访客上传、下载、地图列表、详情页和文件列表混合并发。
+
+    python -m benchmarks.http_load                                   # 默认混合负载 20 秒
+    python -m benchmarks.http_load --concurrency 64 --duration 60 --mix download=20,upload_vpk=2
+    python -m benchmarks.http_load --max-p99 download=250 --max-p99 maps=100   # 超出即退出码 1
+    python -m benchmarks.http_load --url http://127.0.0.1:8080      # 压测已运行的实例（无服务端采样）
+
+默认在临时数据目录里用 benchmarks.http_server 启动一个本地 uvicorn，压测结束后汇总
+每个路由的 p50/p95/p99、吞吐、服务端事件循环延迟和 RSS 随时间的变化。
+上传的图包由 benchmarks.synthetic 按递增种子生成，每次上传内容都不同，不会命中去重。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import httpx
+
+from .synthetic import SyntheticSpec, write_synthetic_vpk
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+DEFAULT_OUTPUT = "bench_http_load.json"
+DEFAULT_WORKDIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+DEFAULT_MIX = "upload_vpk=1,upload_archive=1,download=10,maps=5,detail=3,files=3"
+OPERATIONS = ("upload_vpk", "upload_archive", "download", "maps", "detail", "files")
+SEED_UPLOADS = 4
+SERVER_START_TIMEOUT = 30.0
+DETAIL_LOCATION = re.compile(r"/detail/(\d+)")
+
+
+def parse_mix(raw: str) -> dict[str, int]:
+    mix: dict[str, int] = {}
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        try:
+            mix[name] = int(weight or "1")
+        except ValueError:
+            raise ValueError(f"weight for {name} must be an integer")
+        if mix[name] < 0:
+            raise ValueError(f"weight for {name} must not be negative")
+    if not any(mix.values()):
+        raise ValueError("mix must contain at least one operation with a positive weight")
+    return mix
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """最近秩百分位，values 需已排序。"""
+    if not values:
+        return 0.0
+    rank = max(1, int(-(-pct * len(values) // 100)))
+    return values[min(rank, len(values)) - 1]
+
+
+@dataclass
+class Sample:
+    operation: str
+    started: float
+    seconds: float
+    status: int
+    bytes: int = 0
+    error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return not self.error and 200 <= self.status < 400
+
+
+@dataclass
+class LoadState:
+    spec: SyntheticSpec
+    workdir: str
+    upload_ids: list[int] = field(default_factory=list)
+    next_seed: int = 1000
+    samples: list[Sample] = field(default_factory=list)
+
+    def take_seed(self) -> int:
+        self.next_seed += 1
+        return self.next_seed
+
+
+def _vpk_bytes(spec: SyntheticSpec, seed: int, workdir: str) -> bytes:
+    path = os.path.join(workdir, f"load_{seed}.vpk")
+    try:
+        write_synthetic_vpk(SyntheticSpec(**{**spec.to_dict(), "seed": seed}), path)
+        with open(path, "rb") as fh:
+            return fh.read()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _zip_bytes(name: str, payload: bytes) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        archive.writestr(name, payload)
+    return buffer.getvalue()
+
+
+async def _payload(state: LoadState, archive: bool) -> tuple[str, bytes]:
+    seed = state.take_seed()
+    # 生成放在线程里且不计入耗时，避免占住压测端的事件循环
+    body = await asyncio.to_thread(_vpk_bytes, state.spec, seed, state.workdir)
+    name = f"load_{seed}.vpk"
+    if archive:
+        return f"load_{seed}.zip", await asyncio.to_thread(_zip_bytes, name, body)
+    return name, body
+
+
+async def upload(client: httpx.AsyncClient, state: LoadState, operation: str) -> Sample:
+    filename, body = await _payload(state, operation == "upload_archive")
+    started = time.perf_counter()
+    try:
+        response = await client.post("/upload", files={"file": (filename, body, "application/octet-stream")})
+    except httpx.HTTPError as exc:
+        return Sample(operation, started, time.perf_counter() - started, 0, len(body), type(exc).__name__)
+    elapsed = time.perf_counter() - started
+    match = DETAIL_LOCATION.search(response.headers.get("location", ""))
+    if match:
+        state.upload_ids.append(int(match.group(1)))
+    return Sample(operation, started, elapsed, response.status_code, len(body))
+
+
+async def fetch(client: httpx.AsyncClient, operation: str, url: str) -> Sample:
+    """计时到读完最后一个字节，下载的耗时包含整个文件的传输。"""
+    started = time.perf_counter()
+    received = 0
+    try:
+        async with client.stream("GET", url) as response:
+            async for chunk in response.aiter_raw():
+                received += len(chunk)
+    except httpx.HTTPError as exc:
+        return Sample(operation, started, time.perf_counter() - started, 0, received, type(exc).__name__)
+    return Sample(operation, started, time.perf_counter() - started, response.status_code, received)
+
+
+async def run_operation(client: httpx.AsyncClient, state: LoadState, operation: str, rng: random.Random) -> Sample:
+    if operation in ("upload_vpk", "upload_archive"):
+        return await upload(client, state, operation)
+    if operation == "maps":
+        return await fetch(client, operation, "/api/thirdparty-maps")
+    item_id = rng.choice(state.upload_ids)
+    url = {"download": f"/d/{item_id}", "detail": f"/detail/{item_id}", "files": f"/api/uploads/{item_id}/files"}
+    return await fetch(client, operation, url[operation])
+
+
+async def worker(
+    client: httpx.AsyncClient,
+    state: LoadState,
+    mix: dict[str, int],
+    deadline: float,
+    rng: random.Random,
+) -> None:
+    operations = list(mix)
+    weights = [mix[name] for name in operations]
+    while time.perf_counter() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        state.samples.append(await run_operation(client, state, operation, rng))
+
+
+async def seed_uploads(client: httpx.AsyncClient, state: LoadState, count: int) -> None:
+    for _ in range(count):
+        sample = await upload(client, state, "upload_vpk")
+        if not sample.ok:
+            raise RuntimeError(f"seed upload failed with HTTP {sample.status} {sample.error}".strip())
+    if not state.upload_ids:
+        raise RuntimeError("seed uploads did not return /detail/{id} redirects")
+
+
+async def drive(args: argparse.Namespace, base_url: str, workdir: str) -> tuple[LoadState, float, float]:
+    spec = SyntheticSpec(entries=args.entries, median_bytes=args.median_kb * 1024, seed=args.seed)
+    state = LoadState(spec=spec, workdir=workdir)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout, follow_redirects=False) as client:
+        await seed_uploads(client, state, SEED_UPLOADS)
+        state.samples.clear()
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            worker(client, state, args.mix, deadline, random.Random(args.seed * 1000 + index))
+            for index in range(args.concurrency)
+        ))
+        return state, started, time.perf_counter()
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """在独立数据目录里启动 benchmarks.http_server 子进程。"""
+
+    def __init__(self, root: str, env: Optional[dict[str, str]] = None):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.samples_path = os.path.join(root, "server_samples.jsonl")
+        data_dir = os.path.join(root, "data")
+        self.env = {
+            **os.environ,
+            "DATA_DIR": data_dir,
+            "TMP_DIR": os.path.join(data_dir, "tmp"),
+            "RULES_FILE": os.path.join(ROOT_DIR, "rules.yml"),
+            "PYTHONPATH": os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get("PYTHONPATH")])),
+            **(env or {}),
+        }
+        self.process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "LocalServer":
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.http_server", "--port", str(self.port), "--samples", self.samples_path],
+            cwd=ROOT_DIR,
+            env=self.env,
+        )
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server exited with code {self.process.returncode}")
+            try:
+                if httpx.get(f"{self.url}/healthz", timeout=1.0).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        self.__exit__(None, None, None)
+        raise RuntimeError("server did not become healthy in time")
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+    def samples(self) -> list[dict[str, Any]]:
+        if not os.path.isfile(self.samples_path):
+            return []
+        with open(self.samples_path, "r", encoding="utf-8") as fh:
+            return [json.loads(line) for line in fh if line.strip()]
+
+
+def summarize_routes(samples: list[Sample], seconds: float) -> dict[str, dict[str, Any]]:
+    routes: dict[str, dict[str, Any]] = {}
+    for operation in sorted({sample.operation for sample in samples}):
+        items = [sample for sample in samples if sample.operation == operation]
+        latencies = sorted(sample.seconds * 1000 for sample in items)
+        statuses: dict[str, int] = {}
+        for sample in items:
+            key = sample.error or str(sample.status)
+            statuses[key] = statuses.get(key, 0) + 1
+        routes[operation] = {
+            "requests": len(items),
+            "errors": sum(1 for sample in items if not sample.ok),
+            "statuses": statuses,
+            "throughput_rps": round(len(items) / seconds, 2) if seconds > 0 else 0,
+            "bytes": sum(sample.bytes for sample in items),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "max_ms": round(latencies[-1], 2) if latencies else 0,
+        }
+    return routes
+
+
+def timeline(
+    samples: list[Sample],
+    server_samples: list[dict[str, Any]],
+    started: float,
+    finished: float,
+    offset: float,
+    bucket: float = 1.0,
+) -> list[dict[str, Any]]:
+    """按秒汇总完成请求数、服务端最大调度延迟和 RSS。
+
+    offset 是压测开始时刻在服务端采样时间轴上的位置。
+    """
+    count = max(1, int((finished - started) // bucket) + 1)
+    rows = [{"t": round(index * bucket, 3), "completed": 0, "errors": 0, "loop_lag_max_ms": None, "rss_bytes": None}
+            for index in range(count)]
+    for sample in samples:
+        index = min(count - 1, max(0, int((sample.started + sample.seconds - started) // bucket)))
+        rows[index]["completed"] += 1
+        rows[index]["errors"] += 0 if sample.ok else 1
+    for item in server_samples:
+        index = int((item["t"] - offset) // bucket)
+        if not 0 <= index < count:
+            continue
+        row = rows[index]
+        if row["loop_lag_max_ms"] is None or item["lag_ms"] > row["loop_lag_max_ms"]:
+            row["loop_lag_max_ms"] = item["lag_ms"]
+        if item.get("rss_bytes"):
+            row["rss_bytes"] = max(row["rss_bytes"] or 0, item["rss_bytes"])
+    return rows
+
+
+def summarize_server(server_samples: list[dict[str, Any]], offset: float, seconds: float) -> dict[str, Any]:
+    window = [item for item in server_samples if offset <= item["t"] <= offset + seconds]
+    if not window:
+        return {}
+    lags = sorted(item["lag_ms"] for item in window)
+    rss = [item["rss_bytes"] for item in window if item.get("rss_bytes")]
+    return {
+        "samples": len(window),
+        "loop_lag_p50_ms": round(percentile(lags, 50), 3),
+        "loop_lag_p99_ms": round(percentile(lags, 99), 3),
+        "loop_lag_max_ms": round(lags[-1], 3),
+        "rss_start_bytes": rss[0] if rss else None,
+        "rss_max_bytes": max(rss) if rss else None,
+        "rss_end_bytes": rss[-1] if rss else None,
+    }
+
+
+def check_limits(routes: dict[str, dict[str, Any]], limits: dict[str, int]) -> list[str]:
+    failures = []
+    for operation, limit_ms in limits.items():
+        route = routes.get(operation)
+        if route is None:
+            failures.append(f"{operation}: no requests recorded")
+        elif route["p99_ms"] > limit_ms:
+            failures.append(f"{operation}: p99 {route['p99_ms']:.1f} ms > {limit_ms} ms")
+    return failures
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="HTTP load benchmark for upload/download/map-list routes")
+    parser.add_argument("--url", help="target an already running server instead of starting one")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load after seeding")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted operations, default {DEFAULT_MIX}")
+    parser.add_argument("--entries", type=int, default=200, help="entries per uploaded synthetic VPK")
+    parser.add_argument("--median-kb", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--max-p99", action="append", default=[], metavar="OPERATION=MS",
+                        help="fail when an operation's p99 exceeds MS (repeatable)")
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR, help="directory for server data (default: /dev/shm)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args(argv)
+    try:
+        args.mix = parse_mix(args.mix)
+    except ValueError as exc:
+        parser.error(str(exc))
+    args.limits = {}
+    for raw in args.max_p99:
+        name, _, value = raw.partition("=")
+        if name not in OPERATIONS or not value.isdigit():
+            parser.error(f"--max-p99 expects OPERATION=MS, got {raw!r}")
+        args.limits[name] = int(value)
+    if args.concurrency < 1 or args.duration <= 0:
+        parser.error("--concurrency and --duration must be positive")
+    return args
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="http-load-", dir=args.workdir) as root:
+        server_samples: list[dict[str, Any]] = []
+        offset = 0.0
+        if args.url:
+            state, started, finished = asyncio.run(drive(args, args.url.rstrip("/"), root))
+        else:
+            with LocalServer(root) as server:
+                # 服务端采样以自身事件循环启动为零点，这里用最后一条样本对齐两边的时间轴
+                before = server.samples()
+                anchor = (before[-1]["t"] if before else 0.0, time.perf_counter())
+                state, started, finished = asyncio.run(drive(args, server.url, root))
+                server_samples = server.samples()
+            offset = anchor[0] + (started - anchor[1])
+
+    seconds = finished - started
+    routes = summarize_routes(state.samples, seconds)
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "scenario": {
+            "url": args.url or "local",
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": args.mix,
+            "entries": args.entries,
+            "median_kb": args.median_kb,
+            "seed": args.seed,
+        },
+        "seconds": round(seconds, 3),
+        "requests": len(state.samples),
+        "throughput_rps": round(len(state.samples) / seconds, 2) if seconds > 0 else 0,
+        "routes": routes,
+        "server": summarize_server(server_samples, offset, seconds),
+        "timeline": timeline(state.samples, server_samples, started, finished, offset),
+    }
+
+    print(f"{'operation':<15}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for operation, route in routes.items():
+        print(
+            f"{operation:<15}{route['requests']:>9}{route['errors']:>8}{route['throughput_rps']:>9.1f}"
+            f"{route['p50_ms']:>10.1f}{route['p95_ms']:>10.1f}{route['p99_ms']:>10.1f}"
+        )
+    if report["server"]:
+        server = report["server"]
+        print(
+            f"event loop lag p50 {server['loop_lag_p50_ms']:.1f} ms  p99 {server['loop_lag_p99_ms']:.1f} ms  "
+            f"max {server['loop_lag_max_ms']:.1f} ms; RSS max {(server['rss_max_bytes'] or 0) / 1024 / 1024:.1f} MiB"
+        )
+
+    failures = check_limits(routes, args.limits)
+    report["limit_failures"] = failures
+    for failure in failures:
+        print(f"LIMIT {failure}", file=sys.stderr)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+        fh.write("\n")
+    print(f"results written to {args.output}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
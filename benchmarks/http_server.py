@@ -0,0 +1,66 @@
+"""压测用的 uvicorn 启动器：在应用的事件循环里定时记录调度延迟和 RSS。
+
+    python -m benchmarks.http_server --port 18080 --samples samples.jsonl
+
+由 benchmarks.http_load 在子进程中启动，数据目录通过 DATA_DIR/TMP_DIR 环境变量指定。
+每行样本为 {"t": 启动后秒数, "lag_ms": 调度延迟, "rss_bytes": 常驻内存}。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from typing import Optional
+
+import uvicorn
+
+from app.main import app
+from app.profiling import _rss_bytes
+
+
+DEFAULT_INTERVAL = 0.05
+
+
+async def sample_loop(path: str, interval: float) -> None:
+    """sleep(interval) 实际多睡的时间就是事件循环被其他任务占住的时间。"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    with open(path, "a", encoding="utf-8") as fh:
+        while True:
+            before = loop.time()
+            await asyncio.sleep(interval)
+            now = loop.time()
+            fh.write(json.dumps({
+                "t": round(now - started, 4),
+                "lag_ms": round(max(0.0, now - before - interval) * 1000, 3),
+                "rss_bytes": _rss_bytes(),
+            }) + "\n")
+            fh.flush()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="uvicorn launcher with event-loop lag sampling")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--samples", required=True, help="JSONL file for lag/RSS samples")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL)
+    args = parser.parse_args(argv)
+
+    tasks: list[asyncio.Task] = []
+
+    @app.on_event("startup")
+    async def start_sampler() -> None:
+        tasks.append(asyncio.create_task(sample_loop(args.samples, args.interval)))
+
+    @app.on_event("shutdown")
+    async def stop_sampler() -> None:
+        for task in tasks:
+            task.cancel()
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
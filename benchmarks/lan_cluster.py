@@ -0,0 +1,347 @@
+"""进程内的多节点内网复制模拟器。
+
+每个节点都是一份独立导入的 app 包（模块名 ``vpk_sim_<n>``），拥有自己的 DATA_DIR、
+SQLite、LanPeerPool 和复制队列；节点之间的 HTTP 请求经 SimTransport 直接送进目标节点的
+ASGI 应用，并在途中注入延迟、带宽上限和断线。磁盘写满通过抬高节点的磁盘保留量模拟。
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import importlib
+import os
+import shutil
+import sys
+import time
+import types
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Iterable, Optional
+
+import httpx
+
+from .synthetic import SyntheticSpec, write_synthetic_vpk
+
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+RULES_PATH = os.path.join(os.path.dirname(APP_DIR), "rules.yml")
+SUBNET = "10.77.0"
+PEER_PORT = 8080
+SIM_TOKEN = "s" * 64
+MIN_NODES = 2
+MAX_NODES = 10
+
+
+@dataclass
+class LinkProfile:
+    """一条有向链路的故障注入参数。"""
+
+    latency_ms: float = 0.0
+    bandwidth_mb: float = 0.0
+    offline: bool = False
+    # 链路累计发送这么多请求体字节后断开一次，之后恢复；0 表示不断开
+    drop_after_bytes: int = 0
+
+
+@dataclass
+class LinkStats:
+    requests: int = 0
+    request_bytes: int = 0
+    response_bytes: int = 0
+    failures: int = 0
+    dropped: bool = False
+
+    @property
+    def wire_bytes(self) -> int:
+        return self.request_bytes + self.response_bytes
+
+
+class _MeteredStream(httpx.AsyncByteStream):
+    def __init__(
+        self,
+        inner: Any,
+        stats: LinkStats,
+        attribute: str,
+        link: Optional[LinkProfile] = None,
+        request: Optional[httpx.Request] = None,
+    ):
+        self._inner = inner
+        self._stats = stats
+        self._attribute = attribute
+        self._link = link
+        self._request = request
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        sent = 0
+        started = time.monotonic()
+        stats = self._stats
+        async for chunk in self._inner:
+            link = self._link
+            if (
+                link is not None
+                and link.drop_after_bytes
+                and not stats.dropped
+                and stats.request_bytes + len(chunk) > link.drop_after_bytes
+            ):
+                stats.dropped = True
+                stats.failures += 1
+                raise httpx.WriteError("simulated disconnect", request=self._request)
+            sent += len(chunk)
+            setattr(stats, self._attribute, getattr(stats, self._attribute) + len(chunk))
+            if link is not None and link.bandwidth_mb > 0:
+                # 按累计字节计算应到达的时间点，比逐块 sleep 更贴近恒定速率
+                due = started + sent / (link.bandwidth_mb * 1024 * 1024)
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield chunk
+
+    async def aclose(self) -> None:
+        close = getattr(self._inner, "aclose", None)
+        if close is not None:
+            await close()
+
+
+class SimTransport(httpx.AsyncBaseTransport):
+    """把一个节点发出的请求路由到集群里对应节点的 ASGI 应用。"""
+
+    def __init__(self, cluster: "LanCluster", sender: "SimNode"):
+        self.cluster = cluster
+        self.sender = sender
+        self._targets: dict[str, httpx.ASGITransport] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        target = self.cluster.node_by_host(request.url.host)
+        link = self.cluster.link(self.sender.node_id, target.node_id if target else "")
+        stats = self.cluster.link_stats(self.sender.node_id, target.node_id if target else request.url.host)
+        stats.requests += 1
+        if target is None or link.offline:
+            stats.failures += 1
+            raise httpx.ConnectError("simulated host unreachable", request=request)
+        if link.latency_ms > 0:
+            await asyncio.sleep(link.latency_ms / 1000)
+        transport = self._targets.get(target.node_id)
+        if transport is None:
+            transport = httpx.ASGITransport(app=target.main.app, client=(self.sender.ip, 40000 + self.sender.index))
+            self._targets[target.node_id] = transport
+        request.stream = _MeteredStream(request.stream, stats, "request_bytes", link, request)
+        response = await transport.handle_async_request(request)
+        if link.latency_ms > 0:
+            await asyncio.sleep(link.latency_ms / 1000)
+        response.stream = _MeteredStream(response.stream, stats, "response_bytes")
+        return response
+
+
+def _load_app_copy(package_name: str, env: dict[str, str]) -> types.ModuleType:
+    """以新的包名重新导入 app，模块级配置按 env 读取，互不共享全局状态。"""
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        package = types.ModuleType(package_name)
+        package.__path__ = [APP_DIR]
+        sys.modules[package_name] = package
+        return importlib.import_module(f"{package_name}.main")
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class SimNode:
+    def __init__(self, cluster: "LanCluster", index: int, env: dict[str, str]):
+        self.index = index
+        self.node_id = f"node-{index}"
+        self.ip = f"{SUBNET}.{index + 1}"
+        self.url = f"http://{self.ip}:{PEER_PORT}"
+        self.data_dir = os.path.join(cluster.root, self.node_id)
+        self.package = f"vpk_sim_{cluster.instance}_{index}"
+        self.main = _load_app_copy(self.package, env)
+        self.db = sys.modules[f"{self.package}.db"]
+        self.lan = sys.modules[f"{self.package}.lan_replication"]
+        self.pool = self.lan.LanPeerPool(self.main.LAN_REPLICATION, transport=SimTransport(cluster, self))
+        # 路由和后台队列都通过模块全局取连接池，替换后中继请求也走模拟网络
+        self.main.LAN_PEER_POOL = self.pool
+        self.main.LAN_REPLICATION_QUEUE.pool = self.pool
+
+    def fill_disk(self, free_bytes: int = 0) -> None:
+        """让本节点看起来只剩 free_bytes 可用空间：把磁盘保留量抬到实际剩余减去 free_bytes。"""
+        disk_free = shutil.disk_usage(self.main.UPLOAD_DIR).free
+        self.main.LAN_REPLICATION = self.main.replace(
+            self.main.LAN_REPLICATION,
+            disk_reserve_bytes=max(0, disk_free - free_bytes),
+        )
+
+    def seed(self, specs: Iterable[SyntheticSpec]) -> list[Any]:
+        """把合成 VPK 放进本节点的 uploads 并登记，返回可复制的条目。"""
+        artifacts = []
+        db = self.db.SessionLocal()
+        try:
+            for spec in specs:
+                name = f"sim_{spec.seed}_{spec.entries}_server.vpk"
+                path = os.path.join(self.main.UPLOAD_DIR, name)
+                write_synthetic_vpk(spec, path)
+                size = os.path.getsize(path)
+                sha256 = _sha256(path)
+                upload = self.db.Upload(
+                    original_name=name,
+                    stored_name=name,
+                    sha256=sha256,
+                    size=size,
+                    role="admin",
+                    created_at=datetime.now(timezone.utc),
+                    vpk_valid=True,
+                    vpk_report="{}",
+                    status="active",
+                    uploader_ip="simulator",
+                )
+                db.add(upload)
+                db.commit()
+                artifacts.append(self.lan.ReplicationArtifact(
+                    upload_id=upload.id,
+                    original_name=name,
+                    stored_name=name,
+                    path=path,
+                    size=size,
+                    sha256=sha256,
+                ))
+        finally:
+            db.close()
+        return artifacts
+
+    def inventory(self) -> dict[str, int]:
+        db = self.db.SessionLocal()
+        try:
+            rows = db.query(self.db.Upload).filter(self.db.Upload.status == "active").all()
+            return {row.sha256: row.size for row in rows}
+        finally:
+            db.close()
+
+    def reservation_problems(self) -> list[str]:
+        """复制结束后节点上不应留下有效预留、预留字节或半截分片。
+
+        没收完的文件会留下 .lan-resume-*.part 等待下次续传，只有文件已经存下时它才算遗留。
+        """
+        problems = []
+        stored = set()
+        db = self.db.SessionLocal()
+        try:
+            rows = db.query(self.db.ReplicationReservation).all()
+            for row in rows:
+                if row.status == "active":
+                    problems.append(f"{self.node_id}: reservation {row.id} still active")
+                elif row.reserved_bytes:
+                    problems.append(f"{self.node_id}: reservation {row.id} holds {row.reserved_bytes} bytes")
+            for row in db.query(self.db.Upload).filter(self.db.Upload.status == "active").all():
+                path = os.path.join(self.main.UPLOAD_DIR, row.stored_name)
+                if not os.path.isfile(path) or os.path.getsize(path) != row.size:
+                    problems.append(f"{self.node_id}: upload {row.stored_name} missing or wrong size")
+                elif _sha256(path) != row.sha256:
+                    problems.append(f"{self.node_id}: upload {row.stored_name} checksum mismatch")
+                stored.add(row.sha256)
+        finally:
+            db.close()
+        for name in os.listdir(self.main.UPLOAD_DIR):
+            if not (name.startswith(".lan-") and name.endswith(".part")):
+                continue
+            if name.startswith(".lan-resume-") and name[:-len(".part")].rsplit("-", 1)[-1] not in stored:
+                continue
+            problems.append(f"{self.node_id}: partial file {name} left behind")
+        return problems
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LanCluster:
+    """在一个进程里启动 size 个完整节点，节点两两互为 LAN_PEERS。"""
+
+    _instances = 0
+
+    def __init__(self, root: str, size: int = 3, env: Optional[dict[str, str]] = None):
+        if not MIN_NODES <= size <= MAX_NODES:
+            raise ValueError(f"cluster size must be between {MIN_NODES} and {MAX_NODES}")
+        LanCluster._instances += 1
+        self.instance = LanCluster._instances
+        self.root = root
+        self.links: dict[tuple[str, str], LinkProfile] = {}
+        self.stats: dict[tuple[str, str], LinkStats] = {}
+        self.default_link = LinkProfile()
+        self.nodes: list[SimNode] = []
+        peers = ",".join(f"node-{index}=http://{SUBNET}.{index + 1}:{PEER_PORT}" for index in range(size))
+        for index in range(size):
+            data_dir = os.path.join(root, f"node-{index}")
+            node_env = {
+                "DATA_DIR": data_dir,
+                "TMP_DIR": os.path.join(data_dir, "tmp"),
+                "RULES_FILE": RULES_PATH,
+                "LAN_NODE_ID": f"node-{index}",
+                "LAN_GROUP": "simulator",
+                "LAN_PEER_API_TOKEN": SIM_TOKEN,
+                "LAN_PEER_ALLOWED_CIDRS": f"{SUBNET}.0/24",
+                "LAN_PEERS": peers,
+                "LAN_DISK_RESERVE_MB": "0",
+                **(env or {}),
+            }
+            os.makedirs(node_env["TMP_DIR"], exist_ok=True)
+            self.nodes.append(SimNode(self, index, node_env))
+        self._by_host = {node.ip: node for node in self.nodes}
+
+    def node_by_host(self, host: str) -> Optional[SimNode]:
+        return self._by_host.get(host)
+
+    def link(self, sender: str, target: str) -> LinkProfile:
+        return self.links.get((sender, target), self.default_link)
+
+    def set_link(self, sender: str, target: str, profile: LinkProfile) -> None:
+        self.links[(sender, target)] = profile
+
+    def link_stats(self, sender: str, target: str) -> LinkStats:
+        return self.stats.setdefault((sender, target), LinkStats())
+
+    def reset_stats(self) -> None:
+        self.stats.clear()
+
+    def wire_bytes(self) -> int:
+        return sum(item.wire_bytes for item in self.stats.values())
+
+    async def replicate(self, source: SimNode, artifacts: list[Any], **overrides: Any) -> dict[str, Any]:
+        """从 source 复制到其余节点，返回耗时、线路字节和每个节点的状态。"""
+        config = source.main.LAN_REPLICATION
+        if overrides:
+            config = source.main.replace(config, **overrides)
+        self.reset_stats()
+        started = time.perf_counter()
+        result = await source.lan.replicate_artifacts(config, artifacts, pool=source.pool)
+        elapsed = time.perf_counter() - started
+        payload_bytes = sum(item.size for item in artifacts)
+        return {
+            "wall_seconds": round(elapsed, 6),
+            "payload_bytes": payload_bytes,
+            "wire_bytes": self.wire_bytes(),
+            "statuses": {item.get("node_id"): item.get("status") for item in result.get("peers", [])},
+            "result": result,
+        }
+
+    def reservation_problems(self) -> list[str]:
+        problems = []
+        for node in self.nodes:
+            problems.extend(node.reservation_problems())
+        return problems
+
+    async def aclose(self) -> None:
+        for node in self.nodes:
+            await node.pool.aclose()
+
+    def dispose(self) -> None:
+        for node in self.nodes:
+            node.db.engine.dispose()
+            for name in [name for name in sys.modules if name == node.package or name.startswith(f"{node.package}.")]:
+                del sys.modules[name]
+        shutil.rmtree(self.root, ignore_errors=True)
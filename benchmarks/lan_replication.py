@@ -0,0 +1,146 @@
+"""内网复制吞吐基准：在一个进程里启动多个节点，测量复制耗时、线路字节和预留是否收尾。
+
+    python -m benchmarks.lan_replication --nodes 5 --artifacts 4 --latency-ms 2 --bandwidth-mb 100
+    python -m benchmarks.lan_replication --topology chain --full-disk node-3 --offline node-4
+    python -m benchmarks.lan_replication --drop-after-kb 512   # 每条链路传到 512 KiB 时断开一次
+
+每个场景先做一次完整复制，再对同一批文件重复一次（期望全部 already_present），
+两次之后都检查节点上没有残留的有效预留、半截分片，落盘文件与数据库记录一致。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from app.lan_replication import COMPRESSION_CHOICES, TOPOLOGIES
+
+from .lan_cluster import MAX_NODES, MIN_NODES, LanCluster, LinkProfile
+from .synthetic import SyntheticSpec
+
+
+DEFAULT_OUTPUT = "bench_lan_replication.json"
+DEFAULT_WORKDIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+async def run(args: argparse.Namespace, root: str) -> dict[str, Any]:
+    env = {
+        "LAN_REPLICATION_TOPOLOGY": args.topology,
+        "LAN_MAX_STREAMS_PER_PEER": str(args.streams),
+        "LAN_REPLICATION_RETRIES": str(args.retries),
+        "LAN_REPLICATION_COMPRESSION": args.compression,
+    }
+    cluster = LanCluster(os.path.join(root, "cluster"), args.nodes, env)
+    try:
+        link = LinkProfile(
+            latency_ms=args.latency_ms,
+            bandwidth_mb=args.bandwidth_mb,
+            drop_after_bytes=args.drop_after_kb * 1024,
+        )
+        cluster.default_link = link
+        for node_id in args.offline or ():
+            for sender in cluster.nodes:
+                cluster.set_link(sender.node_id, node_id, LinkProfile(offline=True))
+        for node in cluster.nodes:
+            if node.node_id in (args.full_disk or ()):
+                node.fill_disk()
+
+        source = cluster.nodes[0]
+        specs = [
+            SyntheticSpec(entries=args.entries, median_bytes=args.median_kb * 1024, seed=seed)
+            for seed in range(1, args.artifacts + 1)
+        ]
+        artifacts = source.seed(specs)
+        rounds = []
+        for label in ("initial", "repeat"):
+            result = await cluster.replicate(source, artifacts)
+            problems = cluster.reservation_problems()
+            wall = result["wall_seconds"]
+            rounds.append({
+                "round": label,
+                "wall_seconds": wall,
+                "payload_bytes": result["payload_bytes"],
+                "wire_bytes": result["wire_bytes"],
+                "wire_mb_per_second": round(result["wire_bytes"] / wall / 1024 / 1024, 2) if wall > 0 else 0,
+                "statuses": result["statuses"],
+                "reservation_problems": problems,
+            })
+        return {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "scenario": {
+                "nodes": args.nodes,
+                "artifacts": args.artifacts,
+                "entries": args.entries,
+                "median_kb": args.median_kb,
+                "topology": args.topology,
+                "streams": args.streams,
+                "compression": args.compression,
+                "latency_ms": args.latency_ms,
+                "bandwidth_mb": args.bandwidth_mb,
+                "drop_after_kb": args.drop_after_kb,
+                "full_disk": sorted(args.full_disk or ()),
+                "offline": sorted(args.offline or ()),
+            },
+            "rounds": rounds,
+        }
+    finally:
+        await cluster.aclose()
+        cluster.dispose()
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="LAN replication throughput benchmark")
+    parser.add_argument("--nodes", type=int, default=3, help=f"cluster size, {MIN_NODES}-{MAX_NODES}")
+    parser.add_argument("--artifacts", type=int, default=3)
+    parser.add_argument("--entries", type=int, default=200, help="entries per synthetic VPK")
+    parser.add_argument("--median-kb", type=int, default=16)
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="direct")
+    parser.add_argument("--streams", type=int, default=4, help="LAN_MAX_STREAMS_PER_PEER")
+    parser.add_argument("--retries", type=int, default=1, help="LAN_REPLICATION_RETRIES")
+    parser.add_argument("--compression", choices=COMPRESSION_CHOICES, default="off")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="one-way latency per request")
+    parser.add_argument("--bandwidth-mb", type=float, default=0.0, help="per-request bandwidth cap, 0 = unlimited")
+    parser.add_argument("--drop-after-kb", type=int, default=0, help="drop each link once after this many KiB")
+    parser.add_argument("--full-disk", action="append", metavar="NODE_ID", help="node with no free space (repeatable)")
+    parser.add_argument("--offline", action="append", metavar="NODE_ID", help="unreachable node (repeatable)")
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR, help="directory for node data (default: /dev/shm)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args(argv)
+    if not MIN_NODES <= args.nodes <= MAX_NODES:
+        parser.error(f"--nodes must be between {MIN_NODES} and {MAX_NODES}")
+    if args.artifacts < 1:
+        parser.error("--artifacts must be at least 1")
+    return args
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="lan-bench-", dir=args.workdir) as root:
+        report = asyncio.run(run(args, root))
+
+    exit_code = 0
+    for item in report["rounds"]:
+        print(
+            f"{item['round']:<8} {item['wall_seconds'] * 1000:9.1f} ms  "
+            f"wire {item['wire_bytes'] / 1024 / 1024:8.2f} MiB  {item['wire_mb_per_second']:8.2f} MiB/s  "
+            + " ".join(f"{node}={status}" for node, status in item["statuses"].items())
+        )
+        for problem in item["reservation_problems"]:
+            print(f"RESERVATION {problem}", file=sys.stderr)
+            exit_code = 1
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+        fh.write("\n")
+    print(f"results written to {args.output}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""确定性的合成 VPK 生成器，供基准测试和压测使用。
+
+同一组参数和随机种子总是生成逐字节相同的文件。这里直接按 VPK v1 格式写出，
+不依赖被测的打包代码，目录里的 GBK 路径也能按实际字节数计算索引长度。
+"""
+from __future__ import annotations
+
+import os
+import random
+import struct
+import zlib
+from dataclasses import asdict, dataclass
+from typing import Any, Iterable
+
+
+VPK_SIGNATURE = 0x55AA1234
+EMBEDDED_ARCHIVE_INDEX = 0x7FFF
+SIZE_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+NAME_ENCODINGS = ("utf-8", "gbk")
+
+# 与 app.vpk_tools.SERVER_KEEP_GLOBS 对应：这些路径在服务器版中保留
+KEEP_ROOTS = (("maps", ("bsp", "nav", "txt")), ("scripts/vscripts", ("nut", "nuc")), ("missions", ("txt",)))
+DISCARD_ROOTS = (("materials", ("vtf", "vmt")), ("models", ("mdl", "vvd")), ("sound", ("wav", "mp3")))
+CJK_WORDS = ("死亡中心", "地图", "材质", "模型", "声音", "救援", "终章", "教堂")
+ASCII_WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel")
+
+
+@dataclass(frozen=True)
+class SyntheticSpec:
+    entries: int = 500
+    depth: int = 3
+    size_distribution: str = "lognormal"
+    median_bytes: int = 16 * 1024
+    max_bytes: int = 4 * 1024 * 1024
+    keep_ratio: float = 0.3
+    name_encoding: str = "utf-8"
+    cjk_ratio: float = 0.0
+    addoninfo: bool = True
+    seed: int = 1
+
+    def validate(self) -> None:
+        if self.entries < 1:
+            raise ValueError("entries must be at least 1")
+        if self.depth < 1:
+            raise ValueError("depth must be at least 1")
+        if self.size_distribution not in SIZE_DISTRIBUTIONS:
+            raise ValueError(f"size_distribution must be one of {SIZE_DISTRIBUTIONS}")
+        if self.name_encoding not in NAME_ENCODINGS:
+            raise ValueError(f"name_encoding must be one of {NAME_ENCODINGS}")
+        if not 0 <= self.keep_ratio <= 1 or not 0 <= self.cjk_ratio <= 1:
+            raise ValueError("keep_ratio and cjk_ratio must be between 0 and 1")
+        if self.median_bytes < 0 or self.max_bytes < self.median_bytes:
+            raise ValueError("max_bytes must be at least median_bytes")
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def _size(spec: SyntheticSpec, rng: random.Random) -> int:
+    if spec.size_distribution == "fixed":
+        return spec.median_bytes
+    if spec.size_distribution == "uniform":
+        return rng.randint(0, 2 * spec.median_bytes)
+    if spec.median_bytes == 0:
+        return 0
+    return min(spec.max_bytes, int(rng.lognormvariate(0, 1) * spec.median_bytes))
+
+
+def _word(spec: SyntheticSpec, rng: random.Random) -> str:
+    if spec.cjk_ratio and rng.random() < spec.cjk_ratio:
+        return rng.choice(CJK_WORDS)
+    return rng.choice(ASCII_WORDS)
+
+
+def synthetic_entries(spec: SyntheticSpec) -> list[tuple[str, int, bool]]:
+    """返回 (路径, 大小, 是否应保留)，路径不含重复项。"""
+    spec.validate()
+    rng = random.Random(spec.seed)
+    entries: list[tuple[str, int, bool]] = []
+    seen: set[str] = set()
+    if spec.addoninfo:
+        # rules.yml 要求 addoninfo.txt，带上它生成的图包能通过校验
+        entries.append(("addoninfo.txt", 256, True))
+        seen.add("addoninfo.txt")
+    index = 0
+    while len(entries) < spec.entries:
+        keep = rng.random() < spec.keep_ratio
+        root, extensions = rng.choice(KEEP_ROOTS if keep else DISCARD_ROOTS)
+        # maps/*.bsp 只匹配一层目录，其他根目录按 depth 展开
+        levels = 0 if root == "maps" else rng.randint(0, spec.depth - 1)
+        parts = [root, *(_word(spec, rng) for _ in range(levels))]
+        name = f"{_word(spec, rng)}_{index}.{rng.choice(extensions)}"
+        index += 1
+        path = "/".join([*parts, name])
+        if path in seen:
+            continue
+        seen.add(path)
+        entries.append((path, _size(spec, rng), keep))
+    return entries
+
+
+def _tree(entries: Iterable[tuple[str, int, bool]]) -> dict[str, dict[str, list[tuple[str, str, int]]]]:
+    tree: dict[str, dict[str, list[tuple[str, str, int]]]] = {}
+    for path, size, _ in entries:
+        directory, _, filename = path.rpartition("/")
+        stem, _, ext = filename.rpartition(".")
+        tree.setdefault(ext, {}).setdefault(directory or " ", []).append((stem, path, size))
+    return tree
+
+
+def _content(spec: SyntheticSpec, path: str, size: int) -> bytes:
+    rng = random.Random(f"{spec.seed}:{path}")
+    return rng.randbytes(size)
+
+
+def write_synthetic_vpk(spec: SyntheticSpec, dest_path: str) -> dict[str, Any]:
+    """按 spec 写出单文件 VPK v1，返回条目统计。"""
+    entries = synthetic_entries(spec)
+    tree = _tree(entries)
+    encoding = spec.name_encoding
+
+    tree_length = 1
+    for ext, directories in tree.items():
+        tree_length += len(ext.encode(encoding)) + 2
+        for directory, files in directories.items():
+            tree_length += len(directory.encode(encoding)) + 2
+            for stem, _, _ in files:
+                tree_length += len(stem.encode(encoding)) + 1 + 18
+
+    os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+    index = bytearray()
+    data_bytes = 0
+    with open(dest_path, "wb") as fh:
+        # 索引长度事先算好，先把数据区写到索引之后，最后回填头部和索引
+        fh.seek(12 + tree_length)
+        for ext, directories in tree.items():
+            index += ext.encode(encoding) + b"\x00"
+            for directory, files in directories.items():
+                index += directory.encode(encoding) + b"\x00"
+                for stem, path, size in files:
+                    content = _content(spec, path, size)
+                    index += stem.encode(encoding) + b"\x00"
+                    index += struct.pack(
+                        "<IHHIIH",
+                        zlib.crc32(content) & 0xFFFFFFFF,
+                        0,
+                        EMBEDDED_ARCHIVE_INDEX,
+                        data_bytes,
+                        len(content),
+                        0xFFFF,
+                    )
+                    fh.write(content)
+                    data_bytes += len(content)
+                index += b"\x00"
+            index += b"\x00"
+        index += b"\x00"
+        if len(index) != tree_length:
+            raise AssertionError("synthetic VPK tree length mismatch")
+        fh.seek(0)
+        fh.write(struct.pack("<3I", VPK_SIGNATURE, 1, tree_length))
+        fh.write(index)
+
+    return {
+        "path": dest_path,
+        "entries": len(entries),
+        "kept_entries": sum(1 for _, _, keep in entries if keep),
+        "data_bytes": data_bytes,
+        "file_bytes": os.path.getsize(dest_path),
+    }
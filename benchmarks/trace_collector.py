@@ -0,0 +1,105 @@
+"""本地的 OTLP/HTTP JSON 收集端替身，以及按 trace 查看 span 树的小工具。
+
+    python -m benchmarks.trace_collector serve --port 4318 --output traces.jsonl
+    python -m benchmarks.trace_collector show TRACE_ID traces.jsonl node-b/spans.jsonl
+
+节点配置 TRACE_EXPORTER=otlp、TRACE_OTLP_ENDPOINT=http://<本机>:4318/v1/traces 后，
+所有节点的 span 汇总到同一个 JSONL 文件；show 也可以直接读各节点 TRACE_EXPORTER=jsonl 写出的文件。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterable, Optional
+
+from app.tracing import format_trace, spans_from_otlp
+
+
+DEFAULT_PORT = 4318
+DEFAULT_OUTPUT = "traces.jsonl"
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+
+def make_handler(output: str) -> type[BaseHTTPRequestHandler]:
+    lock = threading.Lock()
+
+    class CollectorHandler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            if self.path.rstrip("/") != "/v1/traces":
+                self.send_error(404)
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length <= 0 or length > MAX_BODY_BYTES:
+                self.send_error(413 if length else 411)
+                return
+            try:
+                spans = spans_from_otlp(json.loads(self.rfile.read(length)))
+            except (ValueError, TypeError, AttributeError):
+                self.send_error(400, "expected OTLP/HTTP JSON")
+                return
+            with lock, open(output, "a", encoding="utf-8") as fh:
+                for span in spans:
+                    fh.write(json.dumps(span, ensure_ascii=False) + "\n")
+            body = b"{}"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return CollectorHandler
+
+
+def load_spans(paths: Iterable[str], trace_id: str) -> list[dict[str, Any]]:
+    spans = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                span = json.loads(line)
+                if span.get("trace_id") == trace_id:
+                    spans.append(span)
+    return spans
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="OTLP/HTTP JSON collector stand-in")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="receive spans and append them to a JSONL file")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--output", default=DEFAULT_OUTPUT)
+    show = commands.add_parser("show", help="print one trace as an indented span tree")
+    show.add_argument("trace_id")
+    show.add_argument("files", nargs="+", help="JSONL files written by the collector or TRACE_EXPORTER=jsonl")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(args.output))
+        print(f"collecting spans on http://{args.host}:{args.port}/v1/traces -> {args.output}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return 0
+
+    spans = load_spans(args.files, args.trace_id.strip().lower())
+    if not spans:
+        print(f"trace {args.trace_id} not found", file=sys.stderr)
+        return 1
+    for line in format_trace(spans):
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""VPK 处理引擎微基准。
+
+    python -m benchmarks.vpk_engine                    # 运行并与基线比较
+    python -m benchmarks.vpk_engine --update-baseline  # 重新记录基线
+
+全部输入由 benchmarks.synthetic 在临时目录中生成，不需要网络或真实图包。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+import vpk
+
+from app.thirdparty.l4d2_vpk_lib import NewVPK
+from app.vpk_reader import open_vpk, verify_vpk_crc
+from app.vpk_tools import SERVER_KEEP_GLOBS, _filter_copy, extract_vpk_to_dir, process_server_vpk
+from app.vpkcheck import validate_vpk
+
+from .synthetic import SIZE_DISTRIBUTIONS, NAME_ENCODINGS, SyntheticSpec, write_synthetic_vpk
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baselines", "vpk_engine.json")
+DEFAULT_OUTPUT = "bench_vpk_engine.json"
+DEFAULT_RULES = os.path.join(ROOT_DIR, "rules.yml")
+DEFAULT_THRESHOLD = 0.3
+# 放在内存文件系统里可以排除磁盘回写带来的抖动，只比较 Python 代码本身
+DEFAULT_WORKDIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+@dataclass
+class Benchmark:
+    name: str
+    run: Callable[[str], Any]
+    setup: Optional[Callable[[str], None]] = None
+
+
+class Workspace:
+    """一次基准运行的输入文件和每轮独立的工作目录。"""
+
+    def __init__(self, root: str, spec: SyntheticSpec, rules_path: str):
+        self.root = root
+        self.rules_path = rules_path
+        self.source = os.path.join(root, "source.vpk")
+        self.info = write_synthetic_vpk(spec, self.source)
+        # 记录合成图包是否通过校验，基线里能看出端到端基准走的是成功路径还是失败路径
+        self.info["valid"] = validate_vpk(self.source, rules_path).ok
+        if spec.addoninfo and not self.info["valid"]:
+            raise RuntimeError("synthetic archive failed validate_vpk; the benchmark would measure the failure path")
+        # read_index_iter 需要知道实际路径编码，这里沿用 open_vpk 的回退结果
+        with open_vpk(self.source) as arch:
+            self.path_encoding = arch.path_encoding
+        self.extracted = os.path.join(root, "extracted")
+        extract_vpk_to_dir(self.source, self.extracted)
+        self.filtered = os.path.join(root, "filtered")
+        _filter_copy(self.extracted, self.filtered, SERVER_KEEP_GLOBS)
+
+    def fresh(self, name: str) -> str:
+        path = os.path.join(self.root, "runs", name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        return path
+
+
+def _read_index_iter(workspace: Workspace) -> int:
+    arch = vpk.VPK(workspace.source, path_enc=workspace.path_encoding)
+    return sum(1 for _ in arch.read_index_iter())
+
+
+def _open_vpk(workspace: Workspace) -> int:
+    with open_vpk(workspace.source) as arch:
+        return len(arch.tree)
+
+
+def _process(workspace: Workspace, run_dir: str) -> dict:
+    src = os.path.join(run_dir, "upload.vpk")
+    # process_server_vpk 会删除源文件，复制放在计时之外
+    return process_server_vpk(src, run_dir, "work", os.path.join(run_dir, "out"), "server.vpk")
+
+
+def benchmarks(workspace: Workspace) -> list[Benchmark]:
+    def run_dir(name: str) -> str:
+        return os.path.join(workspace.root, "runs", name)
+
+    def copy_source(name: str) -> None:
+        shutil.copyfile(workspace.source, os.path.join(workspace.fresh(name), "upload.vpk"))
+
+    return [
+        Benchmark("open_vpk", lambda name: _open_vpk(workspace)),
+        Benchmark("read_index_iter", lambda name: _read_index_iter(workspace)),
+        Benchmark("validate_vpk", lambda name: validate_vpk(workspace.source, workspace.rules_path)),
+        Benchmark("verify_vpk_crc", lambda name: verify_vpk_crc(workspace.source)),
+        Benchmark(
+            "extract_vpk_to_dir",
+            lambda name: extract_vpk_to_dir(workspace.source, run_dir(name)),
+            setup=workspace.fresh,
+        ),
+        Benchmark(
+            "filter_copy",
+            lambda name: _filter_copy(workspace.extracted, run_dir(name), SERVER_KEEP_GLOBS),
+            setup=workspace.fresh,
+        ),
+        Benchmark(
+            "new_vpk_save",
+            lambda name: NewVPK(workspace.filtered).save(os.path.join(run_dir(name), "server.vpk")),
+            setup=workspace.fresh,
+        ),
+        Benchmark("process_server_vpk", lambda name: _process(workspace, run_dir(name)), setup=copy_source),
+    ]
+
+
+def measure(benchmark: Benchmark, repeats: int, warmup: int = 1) -> dict[str, Any]:
+    timings = []
+    for iteration in range(warmup + repeats):
+        if benchmark.setup is not None:
+            benchmark.setup(benchmark.name)
+        started = time.perf_counter()
+        benchmark.run(benchmark.name)
+        elapsed = time.perf_counter() - started
+        if iteration >= warmup:
+            timings.append(elapsed)
+    return {
+        "median_seconds": round(statistics.median(timings), 6),
+        "min_seconds": round(min(timings), 6),
+        "max_seconds": round(max(timings), 6),
+        "repeats": repeats,
+    }
+
+
+def run(
+    spec: SyntheticSpec,
+    repeats: int,
+    rules_path: str,
+    only: Optional[set[str]] = None,
+    workdir: Optional[str] = DEFAULT_WORKDIR,
+) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="vpk-bench-", dir=workdir) as root:
+        workspace = Workspace(root, spec, rules_path)
+        results = {}
+        for benchmark in benchmarks(workspace):
+            if only and benchmark.name not in only:
+                continue
+            result = measure(benchmark, repeats)
+            if result["median_seconds"] > 0:
+                result["entries_per_second"] = round(spec.entries / result["median_seconds"], 1)
+            results[benchmark.name] = result
+        return {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scenario": spec.to_dict(),
+            "archive": {key: value for key, value in workspace.info.items() if key != "path"},
+            "results": results,
+        }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], threshold: float) -> list[dict[str, Any]]:
+    """返回最快一轮比基线慢 threshold 以上的基准。
+
+    用最小值而不是中位数比较：读写临时目录的基准受页缓存回写影响，
+    中位数抖动明显，最小值更接近代码本身的开销。
+    不同 Python 版本或平台上记录的基线没有可比性，直接拒绝比较。
+    """
+    if current.get("scenario") != baseline.get("scenario") or current.get("archive") != baseline.get("archive"):
+        raise ValueError("baseline was recorded with a different scenario; rerun with --update-baseline")
+    for key in ("python", "platform"):
+        if baseline.get(key) and current.get(key) != baseline.get(key):
+            raise ValueError(
+                f"baseline was recorded on {key} {baseline[key]!r}, this run is {current.get(key)!r}; "
+                "rerun with --update-baseline on this machine"
+            )
+    regressions = []
+    for name, result in current["results"].items():
+        reference = baseline.get("results", {}).get(name)
+        if not reference or reference["min_seconds"] <= 0:
+            continue
+        ratio = result["min_seconds"] / reference["min_seconds"]
+        if ratio > 1 + threshold:
+            regressions.append({
+                "name": name,
+                "baseline_seconds": reference["min_seconds"],
+                "current_seconds": result["min_seconds"],
+                "ratio": round(ratio, 3),
+            })
+    return regressions
+
+
+def _write_json(path: str, payload: dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(payload, fh, ensure_ascii=False, indent=2)
+        fh.write("\n")
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    defaults = SyntheticSpec()
+    parser = argparse.ArgumentParser(description="VPK engine micro-benchmarks")
+    parser.add_argument("--entries", type=int, default=defaults.entries)
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--size-distribution", choices=SIZE_DISTRIBUTIONS, default=defaults.size_distribution)
+    parser.add_argument("--median-bytes", type=int, default=defaults.median_bytes)
+    parser.add_argument("--max-bytes", type=int, default=defaults.max_bytes)
+    parser.add_argument("--keep-ratio", type=float, default=defaults.keep_ratio)
+    parser.add_argument("--name-encoding", choices=NAME_ENCODINGS, default=defaults.name_encoding)
+    parser.add_argument("--cjk-ratio", type=float, default=defaults.cjk_ratio)
+    parser.add_argument("--no-addoninfo", dest="addoninfo", action="store_false",
+                        help="omit addoninfo.txt so validate_vpk takes the failure path")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--only", action="append", help="run only this benchmark (repeatable)")
+    parser.add_argument("--rules", default=DEFAULT_RULES)
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR, help="directory for generated files (default: /dev/shm)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown versus baseline, 0.3 = 30%%")
+    parser.add_argument("--update-baseline", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    spec = SyntheticSpec(**{field.name: getattr(args, field.name) for field in fields(SyntheticSpec)})
+    spec.validate()
+    report = run(spec, max(1, args.repeats), args.rules, set(args.only or ()), args.workdir)
+
+    for name, result in report["results"].items():
+        print(f"{name:<20} median {result['median_seconds'] * 1000:10.2f} ms  min {result['min_seconds'] * 1000:10.2f} ms")
+
+    if args.update_baseline:
+        _write_json(args.baseline, report)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    exit_code = 0
+    if os.path.isfile(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        try:
+            regressions = compare(report, baseline, args.threshold)
+        except ValueError as exc:
+            print(f"baseline skipped: {exc}", file=sys.stderr)
+            regressions = []
+        report["baseline"] = {"path": args.baseline, "threshold": args.threshold, "regressions": regressions}
+        for item in regressions:
+            print(
+                f"REGRESSION {item['name']}: {item['baseline_seconds'] * 1000:.2f} ms -> "
+                f"{item['current_seconds'] * 1000:.2f} ms (x{item['ratio']})",
+                file=sys.stderr,
+            )
+        if regressions:
+            exit_code = 1
+    else:
+        print(f"no baseline at {args.baseline}; run with --update-baseline to record one", file=sys.stderr)
+
+    _write_json(args.output, report)
+    print(f"results written to {args.output}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
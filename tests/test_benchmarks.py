@@ -0,0 +1,75 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from app.vpk_reader import open_vpk
+from benchmarks.synthetic import SyntheticSpec, synthetic_entries, write_synthetic_vpk
+from app.vpkcheck import validate_vpk
+from benchmarks.vpk_engine import DEFAULT_RULES as RULES_PATH, compare
+
+
+def _digest(path: str) -> str:
+    with open(path, "rb") as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
+
+class SyntheticVpkTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+
+    def test_generator_is_deterministic_and_readable(self):
+        spec = SyntheticSpec(entries=60, depth=4, median_bytes=512, max_bytes=4096, keep_ratio=0.5)
+        first = os.path.join(self.tmp, "a.vpk")
+        second = os.path.join(self.tmp, "b.vpk")
+        info = write_synthetic_vpk(spec, first)
+        write_synthetic_vpk(spec, second)
+
+        self.assertEqual(_digest(first), _digest(second))
+        self.assertEqual(info["entries"], 60)
+        with open_vpk(first) as arch:
+            self.assertEqual(len(arch.tree), 60)
+            for name in arch:
+                self.assertTrue(arch.get_file(name).verify())
+        self.assertNotEqual(synthetic_entries(spec), synthetic_entries(SyntheticSpec(entries=60, seed=2)))
+
+    def test_gbk_names_fall_back_to_gb18030(self):
+        spec = SyntheticSpec(entries=30, median_bytes=64, name_encoding="gbk", cjk_ratio=1.0)
+        path = os.path.join(self.tmp, "gbk.vpk")
+        write_synthetic_vpk(spec, path)
+        with open_vpk(path) as arch:
+            self.assertEqual(arch.path_encoding, "gb18030")
+            self.assertTrue(any("地图" in name or "救援" in name for name in arch.tree))
+
+    def test_compare_flags_only_slower_results(self):
+        scenario = SyntheticSpec().to_dict()
+        baseline = {"scenario": scenario, "results": {"open_vpk": {"min_seconds": 0.010}, "new": {"min_seconds": 0}}}
+        current = {"scenario": scenario, "results": {
+            "open_vpk": {"min_seconds": 0.014},
+            "new": {"min_seconds": 1.0},
+        }}
+        self.assertEqual([item["name"] for item in compare(current, baseline, 0.3)], ["open_vpk"])
+        self.assertEqual(compare(current, baseline, 0.5), [])
+        with self.assertRaises(ValueError):
+            compare({**current, "scenario": {}}, baseline, 0.3)
+
+    def test_compare_refuses_baseline_from_another_machine(self):
+        scenario = SyntheticSpec().to_dict()
+        baseline = {"scenario": scenario, "python": "3.11.7", "platform": "Linux-a", "results": {}}
+        self.assertEqual(compare({**baseline, "results": {}}, baseline, 0.3), [])
+        for key, value in (("python", "3.12.1"), ("platform", "Linux-b")):
+            with self.assertRaisesRegex(ValueError, key):
+                compare({**baseline, key: value}, baseline, 0.3)
+
+    def test_default_archive_passes_validation(self):
+        path = os.path.join(self.tmp, "valid.vpk")
+        write_synthetic_vpk(SyntheticSpec(entries=40, median_bytes=256), path)
+        self.assertTrue(validate_vpk(path, RULES_PATH).ok)
+        write_synthetic_vpk(SyntheticSpec(entries=40, median_bytes=256, addoninfo=False), path)
+        self.assertFalse(validate_vpk(path, RULES_PATH).ok)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app.docker_manager import DockerManager
+
+
+class NotFound(Exception):
+    response = SimpleNamespace(status_code=404)
+
+
+class FakeContainer:
+    def __init__(self, name, tracker, fail=False, health=None):
+        self.id = name * 8
+        self.name = name
+        self.status = "running"
+        self.attrs = {"State": {"Health": {"Status": health}} if health else {}}
+        self.tracker = tracker
+        self.fail = fail
+
+    def _run(self, status):
+        with self.tracker["lock"]:
+            self.tracker["active"] += 1
+            self.tracker["peak"] = max(self.tracker["peak"], self.tracker["active"])
+            self.tracker["order"].append(self.name)
+        time.sleep(0.02)
+        with self.tracker["lock"]:
+            self.tracker["active"] -= 1
+        if self.fail:
+            raise RuntimeError("restart failed")
+        self.status = status
+
+    def restart(self, timeout=10):
+        self._run("running")
+
+    def stop(self, timeout=10):
+        self._run("exited")
+
+    def start(self):
+        self._run("running")
+
+    def reload(self):
+        pass
+
+
+def _manager(containers):
+    by_reference = {}
+    for container in containers:
+        by_reference[container.id] = container
+        by_reference[container.name] = container
+
+    def get(reference):
+        if reference not in by_reference:
+            raise NotFound(reference)
+        return by_reference[reference]
+
+    def list_containers(all=False, filters=None):
+        return [container for container in containers if filters["label"] == "game=l4d2"]
+
+    return DockerManager(client=SimpleNamespace(containers=SimpleNamespace(get=get, list=list_containers)))
+
+
+def _tracker():
+    return {"lock": threading.Lock(), "active": 0, "peak": 0, "order": []}
+
+
+class BulkActionTest(unittest.TestCase):
+    def test_parallel_pool_is_bounded_and_reports_missing(self):
+        tracker = _tracker()
+        containers = [FakeContainer(name, tracker) for name in "abcdef"]
+        result = _manager(containers).bulk_action("stop", names=["a", "zz"], label="game=l4d2", concurrency=3)
+
+        self.assertLessEqual(tracker["peak"], 3)
+        self.assertGreater(tracker["peak"], 1)
+        self.assertEqual(result["succeeded"], 6)
+        self.assertEqual(result["failed"], 1)
+        self.assertEqual(result["results"][0]["status"], "missing")
+        self.assertEqual({item["status"] for item in result["results"][1:]}, {"exited"})
+
+    def test_rolling_mode_limits_downtime_and_halts_on_failure(self):
+        tracker = _tracker()
+        containers = [FakeContainer("a", tracker), FakeContainer("b", tracker, fail=True), FakeContainer("c", tracker)]
+        result = _manager(containers).bulk_action("restart", names=["a", "b", "c"], concurrency=8, rolling=True)
+
+        self.assertEqual(tracker["peak"], 1)
+        self.assertEqual(tracker["order"], ["a", "b"])
+        self.assertEqual([item["status"] for item in result["results"]], ["running", "failed", "skipped"])
+        self.assertFalse(result["ok"])
+
+    def test_rolling_restart_waits_for_healthcheck(self):
+        tracker = _tracker()
+        container = FakeContainer("a", tracker, health="starting")
+        states = iter(["starting", "healthy"])
+
+        def reload():
+            container.attrs["State"]["Health"]["Status"] = next(states, "healthy")
+
+        container.reload = reload
+        with patch("app.docker_manager.ROLLING_POLL_SECONDS", 0):
+            result = _manager([container]).bulk_action("restart", ids=[container.id], rolling=True)
+        self.assertTrue(result["ok"])
+
+        with self.assertRaises(ValueError):
+            _manager([container]).bulk_action("remove", ids=[container.id])
+
+
+if __name__ == "__main__":
+    unittest.main()
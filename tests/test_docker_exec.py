@@ -0,0 +1,114 @@
+import threading
+import unittest
+from types import SimpleNamespace
+
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+
+from app.docker_exec import stream_container_exec
+from app.docker_manager import DockerManager
+
+
+class FakeApi:
+    def __init__(self, frames, block_until_cancel=False):
+        self.frames = frames
+        self.block_until_cancel = block_until_cancel
+        self.killed = threading.Event()
+        self.created = []
+
+    def exec_create(self, container_id, cmd, **kwargs):
+        self.created.append((container_id, cmd, kwargs))
+        return {"Id": "exec-1"}
+
+    def exec_start(self, exec_id, stream=False, demux=False):
+        yield from self.frames
+        if self.block_until_cancel:
+            while not self.killed.wait(0.01):
+                yield b"tick\n", None
+
+    def exec_inspect(self, exec_id):
+        return {"ExitCode": 143 if self.killed.is_set() else 0}
+
+
+class FakeContainer:
+    def __init__(self, api, mounts=()):
+        self.id = "c" * 64
+        self.status = "running"
+        self.attrs = {"Mounts": list(mounts)}
+        self.api = api
+        self.cancel_commands = []
+
+    def exec_run(self, cmd, **kwargs):
+        self.cancel_commands.append(cmd)
+        self.api.killed.set()
+
+
+def _client(container):
+    api = container.api
+    docker_client = SimpleNamespace(api=api, containers=SimpleNamespace(get=lambda container_id: container))
+    manager = DockerManager(client=docker_client)
+    app = FastAPI()
+
+    @app.websocket("/exec/{container_id}")
+    async def exec_stream(websocket: WebSocket, container_id: str):
+        await websocket.accept()
+        await stream_container_exec(websocket, lambda: manager, container_id, "test")
+
+    return TestClient(app)
+
+
+class ExecStreamTest(unittest.TestCase):
+    def test_streams_frames_and_reports_exit(self):
+        api = FakeApi([(b"hel", None), (b"lo \xe4\xb8", None), (None, b"warn\n"), (b"\xad\n", None)])
+        container = FakeContainer(api)
+        with _client(container).websocket_connect(f"/exec/{container.id}") as websocket:
+            websocket.send_json({"command": "echo hello"})
+            messages = []
+            while True:
+                message = websocket.receive_json()
+                messages.append(message)
+                if message["type"] in ("exit", "error"):
+                    break
+
+        self.assertEqual(messages[0]["type"], "started")
+        stdout = "".join(item["data"] for item in messages if item["type"] == "stdout")
+        self.assertEqual(stdout, "hello 中\n")
+        self.assertEqual([item["data"] for item in messages if item["type"] == "stderr"], ["warn\n"])
+        self.assertEqual(messages[-1]["exit_code"], 0)
+        self.assertFalse(messages[-1]["cancelled"])
+        _, cmd, kwargs = api.created[0]
+        self.assertEqual(cmd[-1], "echo hello")
+        self.assertIn("VPK_EXEC_SESSION", kwargs["environment"])
+
+    def test_cancel_signals_session_processes(self):
+        api = FakeApi([(b"start\n", None)], block_until_cancel=True)
+        container = FakeContainer(api)
+        with _client(container).websocket_connect(f"/exec/{container.id}") as websocket:
+            websocket.send_json({"command": "tail -f log"})
+            self.assertEqual(websocket.receive_json()["type"], "started")
+            self.assertEqual(websocket.receive_json()["data"], "start\n")
+            websocket.send_json({"type": "cancel"})
+            while True:
+                message = websocket.receive_json()
+                if message["type"] == "exit":
+                    break
+
+        self.assertTrue(message["cancelled"])
+        self.assertEqual(message["exit_code"], 143)
+        marker = api.created[0][2]["environment"]["VPK_EXEC_SESSION"]
+        self.assertEqual(container.cancel_commands[0][-1], marker)
+
+    def test_rejects_unsafe_container_before_exec(self):
+        api = FakeApi([])
+        container = FakeContainer(api, mounts=[{"Source": "/var/run/docker.sock", "Destination": "/var/run/docker.sock"}])
+        with _client(container).websocket_connect(f"/exec/{container.id}") as websocket:
+            websocket.send_json({"command": "id"})
+            message = websocket.receive_json()
+
+        self.assertEqual(message["type"], "error")
+        self.assertIn("Docker Socket", message["detail"])
+        self.assertEqual(api.created, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
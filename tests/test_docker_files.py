@@ -0,0 +1,115 @@
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from app.docker_manager import DockerManager
+
+
+def _tar_bytes(name: str, data: bytes) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class FakeContainer:
+    def __init__(self, listing: bytes = b"", archive: bytes = b"", stat=None, du_kb: int = 0):
+        self.id = "c" * 64
+        self.listing = listing
+        self.archive = archive
+        self.stat = stat or {}
+        self.du_kb = du_kb
+        self.commands = []
+
+    def exec_run(self, cmd, demux=False):
+        self.commands.append(cmd)
+        if cmd[0] == "du":
+            return SimpleNamespace(exit_code=0, output=(f"{self.du_kb}\t{cmd[-1]}\n".encode(), None))
+        return SimpleNamespace(exit_code=0, output=(self.listing, None))
+
+    def get_archive(self, path, chunk_size=None):
+        data = self.archive
+        return (data[index:index + 7] for index in range(0, len(data), 7)), self.stat
+
+
+class ShellContainer(FakeContainer):
+    """在本机执行列目录命令，检查 shell 脚本本身的行为。"""
+
+    def exec_run(self, cmd, demux=False):
+        completed = subprocess.run(cmd, capture_output=True)
+        return SimpleNamespace(exit_code=completed.returncode, output=(completed.stdout or None, completed.stderr or None))
+
+
+def _manager(container):
+    return DockerManager(client=SimpleNamespace(containers=SimpleNamespace(get=lambda container_id: container)))
+
+
+class ContainerFilesTest(unittest.TestCase):
+    def test_recursive_listing_is_limited_and_cached(self):
+        container = FakeContainer(listing=(
+            b"d\t4096\t1.0\tcfg\n"
+            b"f\t12\t2.0\tcfg/server.cfg\n"
+            b"f\t5\t3.0\treadme.txt\n"
+        ))
+        manager = _manager(container)
+
+        listing = manager.list_files(container.id, "/srv/", depth=3, limit=2)
+        self.assertTrue(listing["truncated"])
+        self.assertEqual([item["path"] for item in listing["entries"]], ["/srv/cfg", "/srv/cfg/server.cfg"])
+        self.assertEqual(listing["entries"][1]["depth"], 2)
+        self.assertEqual(container.commands[0][-3:], ["/srv", "3", "3"])
+
+        manager.list_files(container.id, "/srv", depth=3, limit=2)
+        self.assertEqual(len(container.commands), 1)
+        manager.list_files(container.id, "/srv", depth=3, limit=2, refresh=True)
+        self.assertEqual(len(container.commands), 2)
+
+    def test_missing_directory_is_an_error_not_an_empty_listing(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        with open(os.path.join(root, "server.cfg"), "w", encoding="utf-8") as fh:
+            fh.write("hostname test\n")
+        manager = _manager(ShellContainer())
+
+        listing = manager.list_files("c", root, depth=2, limit=10)
+        self.assertEqual([item["name"] for item in listing["entries"]], ["server.cfg"])
+        with self.assertRaisesRegex(ValueError, "目录不存在"):
+            manager.list_files("c", os.path.join(root, "missing"))
+
+    def test_regular_file_download_streams_member_content(self):
+        payload = b"hostname \"test\"\n" * 50
+        container = FakeContainer(
+            archive=_tar_bytes("server.cfg", payload),
+            stat={"name": "server.cfg", "size": len(payload), "mode": 0o644},
+        )
+        download = _manager(container).open_download(container.id, "/srv/cfg/server.cfg", 1024 * 1024)
+
+        self.assertEqual(download["filename"], "server.cfg")
+        self.assertEqual(download["size"], len(payload))
+        self.assertEqual(b"".join(download["chunks"]), payload)
+
+    def test_directory_download_is_tar_and_capped(self):
+        archive = _tar_bytes("maps/a.vpk", b"x" * 100)
+        directory = {"name": "maps", "size": 4096, "mode": (1 << 31) | 0o755}
+        manager = _manager(FakeContainer(archive=archive, stat=directory, du_kb=1))
+
+        download = manager.open_download("c", "/srv/maps", 1024 * 1024)
+        self.assertEqual(download["filename"], "maps.tar")
+        self.assertEqual(download["media_type"], "application/x-tar")
+        self.assertEqual(b"".join(download["chunks"]), archive)
+
+        with self.assertRaises(ValueError):
+            _manager(FakeContainer(archive=archive, stat=directory, du_kb=4096)).open_download("c", "/srv/maps", 1024 * 1024)
+        with self.assertRaises(ValueError):
+            manager.open_download("c", "/", 1024 * 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import threading
+import unittest
+from types import SimpleNamespace
+
+from app.docker_manager import DockerManager, DockerStatsCollector
+
+
+def _sample(total_usage: int, system_usage: int, memory: int) -> dict:
+    return {
+        "cpu_stats": {"cpu_usage": {"total_usage": total_usage}, "system_cpu_usage": system_usage, "online_cpus": 2},
+        "precpu_stats": {"cpu_usage": {"total_usage": total_usage - 50}, "system_cpu_usage": system_usage - 100},
+        "memory_stats": {"usage": memory, "limit": 1000},
+        "networks": {"eth0": {"rx_bytes": 10, "tx_bytes": 20}},
+    }
+
+
+def _row(container_id: str, name: str, state: str) -> dict:
+    return {
+        "Id": container_id,
+        "Names": [f"/{name}"],
+        "Image": "l4d2:latest",
+        "Created": 1767225600,
+        "State": state,
+        "Ports": [{"PrivatePort": 27015, "PublicPort": 27015, "Type": "udp", "IP": "0.0.0.0"}],
+        "Mounts": [{"Type": "bind", "Source": "/srv/maps", "Destination": "/maps", "RW": False}],
+    }
+
+
+class FakeApi:
+    def __init__(self, rows, samples=None):
+        self.rows = rows
+        self.samples = samples or {}
+        self.list_calls = []
+        self.stream_calls = []
+        self.release = threading.Event()
+
+    def containers(self, all=False, filters=None):
+        self.list_calls.append(filters)
+        if filters and "id" in filters:
+            return [row for row in self.rows if row["Id"].startswith(filters["id"])]
+        return list(self.rows)
+
+    def stats(self, container_id, stream=False, decode=False):
+        if not stream:
+            raise AssertionError("collector must not take blocking stats samples")
+        self.stream_calls.append(container_id)
+        return self._stream(container_id)
+
+    def _stream(self, container_id):
+        yield from self.samples.get(container_id, [])
+        self.release.wait(2)
+
+
+def _collector(api, **kwargs):
+    manager = DockerManager(client=SimpleNamespace(api=api))
+    return DockerStatsCollector(lambda: manager, **kwargs)
+
+
+class DockerStatsCollectorTest(unittest.TestCase):
+    def wait_for(self, predicate):
+        for _ in range(200):
+            if predicate():
+                return
+            threading.Event().wait(0.01)
+        self.fail("condition not reached")
+
+    def tearDown(self):
+        if hasattr(self, "api"):
+            self.api.release.set()
+
+    def test_snapshot_serves_latest_streamed_sample(self):
+        running, stopped = "a" * 64, "b" * 64
+        self.api = FakeApi(
+            [_row(running, "l4d2-1", "running"), _row(stopped, "l4d2-2", "exited")],
+            {running: [_sample(100, 1000, 300), _sample(200, 2000, 400)]},
+        )
+        samples = []
+        collector = _collector(self.api, on_sample=lambda container, metrics: samples.append(container["name"]))
+
+        self.assertFalse(collector.ready)
+        collector.refresh()
+        self.assertTrue(collector.ready)
+        self.wait_for(lambda: collector.snapshot()[0]["memory_usage"] == 400)
+
+        by_name = {item["name"]: item for item in collector.snapshot()}
+        self.assertEqual(by_name["l4d2-1"]["memory_percent"], 40.0)
+        self.assertEqual(by_name["l4d2-1"]["cpu_percent"], 100.0)
+        self.assertEqual(by_name["l4d2-1"]["ports"], {"27015/udp": [{"HostIp": "0.0.0.0", "HostPort": "27015"}]})
+        self.assertEqual(by_name["l4d2-1"]["created"], "2026-01-01T00:00:00Z")
+        self.assertEqual(by_name["l4d2-2"]["memory_usage"], 0)
+        self.assertEqual(self.api.stream_calls, [running])
+        self.assertEqual(samples, ["l4d2-1", "l4d2-1"])
+
+    def test_events_patch_single_containers_without_relisting(self):
+        first, second = "a" * 64, "c" * 64
+        self.api = FakeApi([_row(first, "web", "exited")])
+        collector = _collector(self.api)
+        collector.refresh()
+        self.assertEqual(self.api.list_calls, [None])
+
+        collector.refresh()
+        self.assertEqual(self.api.list_calls, [None])
+
+        self.api.rows = [_row(first, "web-renamed", "exited"), _row(second, "new", "created")]
+        collector.record_event({"Action": "rename", "Actor": {"ID": first}})
+        collector.refresh()
+        self.assertEqual(self.api.list_calls, [None, {"id": first}])
+        self.assertEqual([item["name"] for item in collector.snapshot()], ["web-renamed"])
+
+        self.api.rows = [_row(second, "new", "created")]
+        collector.record_event({"Action": "destroy", "Actor": {"ID": first}})
+        collector.refresh()
+        self.assertEqual(collector.snapshot(), [])
+
+        collector.resync()
+        collector.refresh()
+        self.assertEqual(self.api.list_calls[-1], None)
+        self.assertEqual([item["name"] for item in collector.snapshot()], ["new"])
+
+    def test_refresh_failure_is_reported_and_recovers(self):
+        calls = []
+
+        def factory():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("socket missing")
+            return DockerManager(client=SimpleNamespace(api=FakeApi([])))
+
+        collector = DockerStatsCollector(factory)
+        collector.refresh()
+        self.assertEqual(collector.error, "socket missing")
+        self.assertFalse(collector.ready)
+        collector.refresh()
+        self.assertTrue(collector.ready)
+        self.assertEqual(collector.snapshot(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import unittest
+
+from app.docker_manager import DockerStatsCollector
+from app.docker_stream import SUBSCRIBER_QUEUE_SIZE, DashboardBroadcaster
+
+
+class FakeCollector:
+    def __init__(self):
+        self.ready = True
+        self.error = None
+        self.containers = []
+        self.snapshot_calls = 0
+        self.events = []
+
+    @property
+    def event_seq(self):
+        return self.events[-1]["seq"] if self.events else 0
+
+    def events_since(self, seq):
+        return [item for item in self.events if item["seq"] > seq]
+
+    def snapshot(self):
+        self.snapshot_calls += 1
+        return [dict(item) for item in self.containers]
+
+
+def _decode(message):
+    event, data = message.strip().split("\n")
+    return event.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+
+class DashboardBroadcasterTest(unittest.TestCase):
+    def test_tick_sends_snapshot_then_changed_fields_only(self):
+        collector = FakeCollector()
+        collector.containers = [
+            {"id": "a", "status": "running", "cpu_percent": 1.0, "memory_usage": 10},
+            {"id": "b", "status": "exited", "cpu_percent": 0.0, "memory_usage": 0},
+        ]
+        broadcaster = DashboardBroadcaster(collector, clock=lambda: "now")
+
+        event, data = _decode(broadcaster.tick()[0])
+        self.assertEqual(event, "snapshot")
+        self.assertEqual(len(data["containers"]), 2)
+
+        self.assertEqual(broadcaster.tick(), [])
+
+        collector.containers = [{"id": "a", "status": "running", "cpu_percent": 5.0, "memory_usage": 10}]
+        collector.events.append({"seq": 1, "id": "b", "name": "b", "action": "destroy"})
+        messages = [_decode(message) for message in broadcaster.tick()]
+        self.assertEqual(messages[0], ("container", collector.events[0]))
+        self.assertEqual(messages[1][0], "delta")
+        self.assertEqual(messages[1][1]["changed"], [{"id": "a", "cpu_percent": 5.0}])
+        self.assertEqual(messages[1][1]["removed"], ["b"])
+
+    def test_failure_is_reported_once_and_followed_by_snapshot(self):
+        collector = FakeCollector()
+        collector.ready = False
+        collector.error = "socket missing"
+        broadcaster = DashboardBroadcaster(collector)
+
+        self.assertEqual(_decode(broadcaster.tick()[0]), ("failure", {"detail": "socket missing"}))
+        self.assertEqual(broadcaster.tick(), [])
+        collector.ready = True
+        collector.error = None
+        self.assertEqual(_decode(broadcaster.tick()[0])[0], "snapshot")
+
+    def test_single_producer_fans_out_and_drops_slow_clients(self):
+        async def scenario():
+            collector = FakeCollector()
+            collector.containers = [{"id": "a", "status": "running", "cpu_percent": 0.0}]
+            broadcaster = DashboardBroadcaster(collector, interval=0.01)
+            fast = [broadcaster.subscribe() for _ in range(5)]
+            slow = broadcaster.subscribe()
+            for tick in range(SUBSCRIBER_QUEUE_SIZE + 5):
+                collector.containers = [{"id": "a", "status": "running", "cpu_percent": float(tick + 1)}]
+                await asyncio.sleep(0.025)
+                for queue in fast:
+                    while not queue.empty():
+                        queue.get_nowait()
+            calls = collector.snapshot_calls
+            await broadcaster.stop()
+            return calls, slow, broadcaster
+
+        calls, slow, broadcaster = asyncio.run(scenario())
+        # 每个 tick 只读取一次快照，与连接数无关
+        self.assertLess(calls, 6 * (SUBSCRIBER_QUEUE_SIZE + 5) / 2)
+        self.assertEqual(broadcaster.subscriber_count, 0)
+        self.assertIsNone(slow.get_nowait())
+
+
+class CollectorEventTest(unittest.TestCase):
+    def test_lifecycle_events_are_logged_and_wake_refresh(self):
+        collector = DockerStatsCollector(lambda: None)
+        self.assertIsNone(collector.record_event({"Type": "container", "Action": "exec_start: sh", "Actor": {"ID": "a"}}))
+        item = collector.record_event({
+            "Type": "container",
+            "Action": "die",
+            "time": 100,
+            "Actor": {"ID": "abc", "Attributes": {"name": "web", "exitCode": "137"}},
+        })
+        self.assertEqual(item["seq"], 1)
+        self.assertEqual(item["exit_code"], "137")
+        self.assertEqual(collector.events_since(0), [item])
+        self.assertEqual(collector.events_since(1), [])
+        self.assertTrue(collector._wakeup.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+from benchmarks.http_load import Sample, check_limits, parse_mix, percentile, summarize_routes, timeline
+
+
+class HttpLoadReportTest(unittest.TestCase):
+    def test_mix_and_percentiles(self):
+        self.assertEqual(parse_mix("download=10, maps"), {"download": 10, "maps": 1})
+        with self.assertRaises(ValueError):
+            parse_mix("download=10,unknown=1")
+        with self.assertRaises(ValueError):
+            parse_mix("download=0")
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([], 99), 0.0)
+
+    def test_routes_timeline_and_limits(self):
+        samples = [
+            Sample("download", 10.0, 0.1, 200, 1024),
+            Sample("download", 10.5, 0.9, 200, 1024),
+            Sample("upload_vpk", 10.2, 1.5, 302, 4096),
+            Sample("upload_archive", 10.3, 0.2, 500, 2048),
+        ]
+        routes = summarize_routes(samples, 2.0)
+        self.assertEqual(routes["download"]["requests"], 2)
+        self.assertEqual(routes["download"]["p99_ms"], 900.0)
+        self.assertEqual(routes["upload_archive"]["errors"], 1)
+        self.assertEqual(routes["upload_vpk"]["statuses"], {"302": 1})
+
+        server = [{"t": 5.4, "lag_ms": 3.0, "rss_bytes": 100}, {"t": 6.2, "lag_ms": 40.0, "rss_bytes": 120}]
+        rows = timeline(samples, server, 10.0, 12.0, offset=5.0)
+        self.assertEqual([row["completed"] for row in rows], [2, 2, 0])
+        self.assertEqual([row["loop_lag_max_ms"] for row in rows], [3.0, 40.0, None])
+
+        self.assertEqual(check_limits(routes, {"download": 1000}), [])
+        self.assertEqual(len(check_limits(routes, {"download": 500, "maps": 100})), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
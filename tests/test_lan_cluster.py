@@ -0,0 +1,136 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.lan_cluster import LanCluster, LinkProfile
+from benchmarks.synthetic import SyntheticSpec
+
+
+class LanClusterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+
+    def test_full_disk_and_dropped_link_leave_no_reservations(self):
+        async def scenario():
+            cluster = LanCluster(os.path.join(self.tmp, "cluster"), 3)
+            try:
+                source, normal, full = cluster.nodes
+                full.fill_disk()
+                cluster.set_link(source.node_id, normal.node_id, LinkProfile(drop_after_bytes=64 * 1024))
+                artifacts = source.seed([
+                    SyntheticSpec(entries=20, median_bytes=8 * 1024, seed=seed) for seed in (1, 2)
+                ])
+
+                first = await cluster.replicate(source, artifacts)
+                self.assertEqual(first["statuses"], {"node-1": "completed", "node-2": "skipped_capacity"})
+                self.assertTrue(cluster.link_stats(source.node_id, normal.node_id).dropped)
+                self.assertGreaterEqual(first["wire_bytes"], first["payload_bytes"])
+                self.assertEqual(cluster.reservation_problems(), [])
+                self.assertEqual(set(normal.inventory()), {item.sha256 for item in artifacts})
+                self.assertEqual(full.inventory(), {})
+
+                cluster.set_link(source.node_id, normal.node_id, LinkProfile(offline=True))
+                second = await cluster.replicate(source, artifacts)
+                self.assertEqual(second["statuses"], {"node-1": "offline", "node-2": "skipped_capacity"})
+                self.assertEqual(cluster.reservation_problems(), [])
+            finally:
+                await cluster.aclose()
+                cluster.dispose()
+
+        asyncio.run(scenario())
+
+    def _set_expiry(self, node, sha256, expires_at):
+        """改写节点上该文件的过期时间，返回原来的值。"""
+        db = node.db.SessionLocal()
+        try:
+            row = db.query(node.db.Upload).filter(node.db.Upload.sha256 == sha256).one()
+            previous = node.main._as_aware_utc(row.expires_at)
+            row.expires_at = expires_at
+            db.commit()
+            return previous
+        finally:
+            db.close()
+
+    def test_anti_entropy_stops_once_peer_reports_its_own_copy(self):
+        async def scenario():
+            cluster = LanCluster(os.path.join(self.tmp, "cluster"), 2)
+            try:
+                source, peer = cluster.nodes
+                spec = SyntheticSpec(entries=10, median_bytes=4 * 1024, seed=3)
+                artifact = source.seed([spec])[0]
+                db = source.db.SessionLocal()
+                try:
+                    source.main._mark_lan_replicated([db.get(source.db.Upload, artifact.upload_id)])
+                finally:
+                    db.close()
+                # 对方通过自己的（访客）上传已经有同一个文件，但还没有计入内网组
+                self.assertEqual(peer.seed([spec])[0].sha256, artifact.sha256)
+                guest_expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+                self._set_expiry(peer, artifact.sha256, guest_expiry)
+
+                first = await source.main.run_lan_anti_entropy()
+                self.assertEqual(first["queued"], 1)
+                self.assertEqual(await source.main.LAN_REPLICATION_QUEUE.run_once(), 1)
+                second = await source.main.run_lan_anti_entropy()
+                self.assertEqual(second["queued"], 0)
+                self.assertEqual(len(peer.inventory()), 1)
+
+                # 计入副本不改变对方原有的保存期，到期后以删除标记出现在摘要里
+                self.assertEqual(self._set_expiry(peer, artifact.sha256, datetime.now(timezone.utc)), guest_expiry)
+                peer.main.cleanup_expired()
+                digest = peer.main.lan_replication_digest_payload({"prefixes": [artifact.sha256[:2]]})
+                self.assertEqual(digest["items"][0]["state"], "deleted")
+                third = await source.main.run_lan_anti_entropy()
+                self.assertEqual(third["queued"], 0)
+            finally:
+                await cluster.aclose()
+                cluster.dispose()
+
+        asyncio.run(scenario())
+
+    def test_pair_digests_match_once_replicas_are_placed(self):
+        async def scenario():
+            cluster = LanCluster(os.path.join(self.tmp, "cluster"), 3, env={"LAN_REPLICATION_FACTOR": "2"})
+            try:
+                source = cluster.nodes[0]
+                artifacts = source.seed([
+                    SyntheticSpec(entries=6, median_bytes=2 * 1024, seed=seed) for seed in range(10, 16)
+                ])
+                db = source.db.SessionLocal()
+                try:
+                    source.main._mark_lan_replicated([db.get(source.db.Upload, item.upload_id) for item in artifacts])
+                finally:
+                    db.close()
+                source.main.LAN_REPLICATION_QUEUE.enqueue(artifacts, place=True)
+                self.assertEqual(await source.main.LAN_REPLICATION_QUEUE.run_once(), len(artifacts))
+                for node in cluster.nodes:
+                    await node.main.run_lan_anti_entropy()
+
+                for item in artifacts:
+                    holders = [node.node_id for node in cluster.nodes if item.sha256 in node.inventory()]
+                    self.assertEqual(len(holders), 2)
+                # 每个节点只持有一部分文件，全量摘要不同；按节点对比较的摘要在稳态下一致
+                full = [node.main.lan_replication_digest_payload({})["root"] for node in cluster.nodes]
+                self.assertGreater(len(set(full)), 1)
+                for node in cluster.nodes:
+                    for peer in cluster.nodes:
+                        if peer is not node:
+                            self.assertEqual(
+                                node.main.lan_replication_digest_payload({}, peer.node_id)["root"],
+                                peer.main.lan_replication_digest_payload({}, node.node_id)["root"],
+                            )
+                for node in cluster.nodes:
+                    self.assertEqual((await node.main.run_lan_anti_entropy())["queued"], 0)
+            finally:
+                await cluster.aclose()
+                cluster.dispose()
+
+        asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    unittest.main()
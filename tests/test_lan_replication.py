@@ -3,23 +3,45 @@ import hashlib
 import json
 import os
 import tempfile
+import time
 import unittest
+from datetime import datetime
+from unittest.mock import patch
 
 import httpx
+from starlette.requests import Request as StarletteRequest
 
 from app.lan_replication import (
+    BandwidthShaper,
     LanPeer,
+    LanPeerPool,
     LanReplicationConfig,
     ReplicationArtifact,
+    STORAGE_CACHE_SECONDS,
     load_lan_replication_config,
+    negotiate_codec,
     peer_host_is_private,
+    peer_storage,
+    place_artifact,
+    reconcile_peer,
+    relay_plan,
     replicate_artifacts,
+    replication_digest,
+    scheduled_limit,
+    TokenBucket,
 )
 
 
 TOKEN = "a" * 64
 
 
+def _single_body(body: bytes):
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return receive
+
+
 class LanReplicationConfigTest(unittest.TestCase):
     def test_loads_json_peers_and_filters_local_node(self):
         config = load_lan_replication_config({
@@ -51,11 +73,155 @@ class LanReplicationConfigTest(unittest.TestCase):
         self.assertFalse(config.enabled)
         self.assertGreaterEqual(config.public_status()["config_error_count"], 2)
 
+    def test_relay_plan_builds_chain_and_tree(self):
+        peers = tuple(LanPeer(f"node-{index}", f"Node {index}", f"http://10.0.0.{index}") for index in range(1, 6))
+
+        chain = relay_plan(peers, "chain", 3)
+        tree = relay_plan(peers, "tree", 2)
+        direct = relay_plan(peers, "direct", 2)
+
+        self.assertEqual([(head.node_id, [p.node_id for p in rest]) for head, rest in chain], [
+            ("node-1", ["node-2", "node-3", "node-4", "node-5"]),
+        ])
+        self.assertEqual([(head.node_id, [p.node_id for p in rest]) for head, rest in tree], [
+            ("node-1", ["node-3", "node-5"]),
+            ("node-2", ["node-4"]),
+        ])
+        self.assertEqual(len(direct), 5)
+        self.assertTrue(all(not rest for _, rest in direct))
+
+    def test_compression_negotiates_a_codec_both_sides_support(self):
+        config = load_lan_replication_config({"LAN_REPLICATION_COMPRESSION": "auto"})
+        self.assertEqual(negotiate_codec(config, {"codecs": ["gzip"]}), "gzip")
+        self.assertEqual(negotiate_codec(config, {}), "")
+        self.assertEqual(negotiate_codec(load_lan_replication_config({}), {"codecs": ["gzip"]}), "")
+        invalid = load_lan_replication_config({"LAN_REPLICATION_COMPRESSION": "brotli"})
+        self.assertEqual(invalid.compression, "off")
+        self.assertTrue(invalid.errors)
+
+    def test_placement_is_deterministic_and_replaces_departed_nodes(self):
+        peers = tuple(LanPeer(f"node-{index}", f"Node {index}", f"http://10.20.0.{index}:8080") for index in range(2, 8))
+        config = LanReplicationConfig(
+            node_id="node-1",
+            group="room-1",
+            token=TOKEN,
+            allowed_cidrs="10.20.0.0/24",
+            peers=peers,
+            replication_factor=3,
+        )
+        storage = {f"node-{index}": {"used_bytes": 0, "available_bytes": 10 ** 12} for index in range(1, 8)}
+        counts = {node_id: 0 for node_id in storage}
+        for index in range(600):
+            sha256 = hashlib.sha256(str(index).encode()).hexdigest()
+            placed = place_artifact(config, sha256, 100, storage)
+            self.assertEqual(placed, place_artifact(config, sha256, 100, dict(reversed(storage.items()))))
+            self.assertEqual(len(set(placed)), 3)
+            for node_id in placed:
+                counts[node_id] += 1
+        self.assertTrue(all(150 < count < 370 for count in counts.values()), counts)
+
+        sha256 = hashlib.sha256(b"campaign").hexdigest()
+        placed = place_artifact(config, sha256, 100, storage)
+        departed = placed[0]
+        replaced = place_artifact(config, sha256, 100, {**storage, departed: None})
+        self.assertEqual(replaced[:2], placed[1:])
+        self.assertNotIn(departed, replaced)
+
+        full = {**storage, placed[1]: {"used_bytes": 10 ** 12, "available_bytes": 10}}
+        self.assertNotIn(placed[1], place_artifact(config, sha256, 100, full))
+        self.assertIn(placed[1], place_artifact(config, sha256, 100, full, holders={placed[1]}))
+
+    def test_placement_counts_the_seed_and_prefers_free_space(self):
+        peers = tuple(LanPeer(f"node-{index}", f"Node {index}", f"http://10.20.0.{index}:8080") for index in range(2, 8))
+        config = LanReplicationConfig(
+            node_id="node-1",
+            group="room-1",
+            token=TOKEN,
+            allowed_cidrs="10.20.0.0/24",
+            peers=peers,
+            replication_factor=2,
+        )
+        storage = {f"node-{index}": {"used_bytes": 0, "available_bytes": 10 ** 11} for index in range(1, 8)}
+        storage["node-7"] = {"used_bytes": 0, "available_bytes": 10 ** 12}
+        counts = {node_id: 0 for node_id in storage}
+        for index in range(1000):
+            sha256 = hashlib.sha256(str(index).encode()).hexdigest()
+            placed = place_artifact(config, sha256, 100, storage, holders={"node-1"})
+            self.assertEqual(len(placed), 2)
+            self.assertEqual(placed[0], "node-1")
+            counts[placed[1]] += 1
+        self.assertEqual(counts["node-1"], 0)
+        self.assertGreater(counts["node-7"], max(count for node_id, count in counts.items() if node_id != "node-7") * 3)
+
+        # 不可达的节点不参与放置；可达但没有公布容量的旧节点按权重 1 参与
+        only_legacy = {"node-1": storage["node-1"], "node-2": {}}
+        self.assertEqual(place_artifact(config, "ab" * 32, 100, only_legacy, holders={"node-1"}), ["node-1", "node-2"])
+        self.assertEqual(place_artifact(config, "ab" * 32, 100, {"node-1": storage["node-1"]}, holders={"node-1"}), ["node-1"])
+
     def test_private_peer_detection_rejects_public_literal(self):
         self.assertTrue(peer_host_is_private(LanPeer("private", "Private", "http://10.0.0.2:8080")))
         self.assertFalse(peer_host_is_private(LanPeer("public", "Public", "https://8.8.8.8")))
 
 
+class BandwidthShapingTest(unittest.TestCase):
+    def test_token_bucket_waits_for_debt_after_burst(self):
+        clock = [0.0]
+        sleeps = []
+
+        async def fake_sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        async def consume():
+            bucket = TokenBucket(100 * 1024, clock=lambda: clock[0], sleep=fake_sleep)
+            await bucket.consume(100 * 1024)
+            await bucket.consume(50 * 1024)
+            await bucket.consume(50 * 1024)
+
+        asyncio.run(consume())
+        self.assertEqual(len(sleeps), 2)
+        self.assertAlmostEqual(sum(sleeps), 1.0)
+
+    def test_schedule_overrides_limit_across_midnight(self):
+        config = load_lan_replication_config({
+            "LAN_BANDWIDTH_LIMIT_MB": "50",
+            "LAN_BANDWIDTH_SCHEDULE": "18:00-02:00=5, 02:00-03:00=0",
+        })
+        self.assertEqual(config.errors, ())
+        schedule = config.bandwidth_schedule
+
+        self.assertEqual(scheduled_limit(config.send_limit_bytes, schedule, datetime(2026, 1, 1, 23, 30)), 5 * 1024 * 1024)
+        self.assertEqual(scheduled_limit(config.send_limit_bytes, schedule, datetime(2026, 1, 1, 1, 0)), 5 * 1024 * 1024)
+        self.assertEqual(scheduled_limit(config.send_limit_bytes, schedule, datetime(2026, 1, 1, 2, 30)), 0)
+        self.assertEqual(scheduled_limit(config.send_limit_bytes, schedule, datetime(2026, 1, 1, 12, 0)), 50 * 1024 * 1024)
+
+    def test_shaper_applies_peer_and_global_limits_and_records_throughput(self):
+        clock = [0.0]
+
+        async def fake_sleep(seconds):
+            clock[0] += seconds
+
+        config = LanReplicationConfig(
+            node_id="node-a",
+            group="room-1",
+            token=TOKEN,
+            allowed_cidrs="10.20.0.0/24",
+            send_limit_bytes=200 * 1024,
+            peer_send_limit_bytes=100 * 1024,
+        )
+        shaper = BandwidthShaper(config, clock=lambda: clock[0], sleep=fake_sleep)
+        peer = LanPeer("node-b", "Node B", "http://10.20.0.12:8080")
+
+        async def send():
+            for _ in range(4):
+                await shaper.throttle_send(peer, 100 * 1024)
+
+        asyncio.run(send())
+        shaper.record_sent("node-b", 400 * 1024, clock[0])
+        self.assertAlmostEqual(clock[0], 3.0)
+        self.assertEqual(shaper.stats()["sent"]["node-b"]["average_bytes_per_second"], int(400 * 1024 / 3))
+
+
 class LanReplicationClientTest(unittest.TestCase):
     def _config(self) -> LanReplicationConfig:
         return LanReplicationConfig(
@@ -131,6 +297,74 @@ class LanReplicationClientTest(unittest.TestCase):
             "/api/lan/replication/reservations/" + "1" * 48 + "/complete",
         ])
 
+    def test_multipart_fallback_is_shaped_and_parses_as_a_form(self):
+        received = {}
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path.endswith("/capabilities"):
+                return httpx.Response(200, json={"protocol_version": 1, "node_id": "node-b", "lan_group": "room-1"})
+            if request.url.path.endswith("/preflight"):
+                payload = json.loads((await request.aread()).decode())
+                return httpx.Response(200, json={
+                    "status": "reserved",
+                    "reservation_id": "1" * 48,
+                    "accepted": payload["artifacts"],
+                    "already_present": [],
+                    "storage": {"available_bytes": 10_000},
+                })
+            if request.url.path.endswith("/uploads"):
+                body = await request.aread()
+                received["length"] = int(request.headers["content-length"])
+                received["body"] = len(body)
+                form = await StarletteRequest({
+                    "type": "http",
+                    "method": "POST",
+                    "headers": [(b"content-type", request.headers["content-type"].encode())],
+                }, receive=_single_body(body)).form()
+                received["fields"] = {key: form[key] for key in ("original_name", "sha256", "size")}
+                received["file"] = await form["file"].read()
+                return httpx.Response(200, json={"status": "stored", "upload": {"id": 8}})
+            return httpx.Response(200, json={"status": "completed"})
+
+        data = b"map-bytes" * 1000
+        with tempfile.NamedTemporaryFile(suffix=".vpk", delete=False) as handle:
+            handle.write(data)
+            path = handle.name
+        self.addCleanup(os.unlink, path)
+        artifact = ReplicationArtifact(
+            upload_id=7,
+            original_name="地图 \"a\".vpk",
+            stored_name='map "server".vpk',
+            path=path,
+            size=len(data),
+            sha256=hashlib.sha256(data).hexdigest(),
+        )
+        config = self._config()
+        pool = LanPeerPool(config, transport=httpx.MockTransport(handler))
+        throttled = []
+
+        async def throttle_send(peer, amount):
+            throttled.append(amount)
+
+        async def replicate():
+            try:
+                return await replicate_artifacts(config, [artifact], pool=pool)
+            finally:
+                await pool.aclose()
+
+        with patch.object(pool.shaper, "throttle_send", throttle_send):
+            result = asyncio.run(replicate())
+
+        self.assertTrue(result["complete"], result)
+        self.assertEqual(received["length"], received["body"])
+        self.assertEqual(sum(throttled), received["body"])
+        self.assertEqual(received["fields"], {
+            "original_name": artifact.original_name,
+            "sha256": artifact.sha256,
+            "size": str(len(data)),
+        })
+        self.assertEqual(received["file"], data)
+
     def test_capacity_shortage_skips_transfer(self):
         calls = []
 
@@ -178,6 +412,367 @@ class LanReplicationClientTest(unittest.TestCase):
             "/api/lan/replication/preflight",
         ])
 
+    def test_resumable_transfer_continues_from_committed_offset(self):
+        received = bytearray()
+        puts = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            path = request.url.path
+            if path.endswith("/capabilities"):
+                return httpx.Response(200, json={
+                    "protocol_version": 1,
+                    "node_id": "node-b",
+                    "lan_group": "room-1",
+                    "features": ["resume"],
+                })
+            if path.endswith("/preflight"):
+                payload = json.loads((await request.aread()).decode())
+                return httpx.Response(200, json={
+                    "status": "reserved",
+                    "reservation_id": "1" * 48,
+                    "accepted": payload["artifacts"],
+                    "already_present": [],
+                })
+            if "/items/" in path and request.method == "GET":
+                return httpx.Response(200, json={"status": "pending", "offset": len(received)})
+            if "/items/" in path and request.method == "PUT":
+                body = await request.aread()
+                puts.append(request.headers["content-range"])
+                if not received:
+                    # 第一次只落盘前 4 个字节，然后模拟连接被重置。
+                    received.extend(body[:4])
+                    raise httpx.ReadError("connection reset")
+                received.extend(body)
+                return httpx.Response(200, json={"status": "stored", "upload": {"id": 8}})
+            return httpx.Response(200, json={"status": "completed"})
+
+        with tempfile.NamedTemporaryFile(suffix=".vpk", delete=False) as handle:
+            handle.write(b"map-bytes")
+            path = handle.name
+        try:
+            artifact = ReplicationArtifact(
+                upload_id=7,
+                original_name="map.vpk",
+                stored_name="map_server.vpk",
+                path=path,
+                size=9,
+                sha256=hashlib.sha256(b"map-bytes").hexdigest(),
+            )
+            result = asyncio.run(replicate_artifacts(
+                self._config(),
+                [artifact],
+                transport=httpx.MockTransport(handler),
+            ))
+        finally:
+            os.unlink(path)
+
+        self.assertEqual(result["peers"][0]["status"], "completed")
+        self.assertEqual(puts, ["bytes 0-8/9", "bytes 4-8/9"])
+        self.assertEqual(bytes(received), b"map-bytes")
+
+    def test_artifacts_stream_concurrently_and_report_each_failure(self):
+        in_flight = 0
+        peak = 0
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal in_flight, peak
+            if request.url.path.endswith("/capabilities"):
+                return httpx.Response(200, json={
+                    "protocol_version": 1,
+                    "node_id": "node-b",
+                    "lan_group": "room-1",
+                })
+            if request.url.path.endswith("/preflight"):
+                payload = json.loads((await request.aread()).decode())
+                return httpx.Response(200, json={
+                    "status": "reserved",
+                    "reservation_id": "1" * 48,
+                    "accepted": payload["artifacts"],
+                    "already_present": [],
+                })
+            if request.url.path.endswith("/uploads"):
+                body = await request.aread()
+                in_flight += 1
+                peak = max(peak, in_flight)
+                await asyncio.sleep(0.05)
+                in_flight -= 1
+                if b"broken.vpk" in body:
+                    return httpx.Response(500, json={"detail": "disk error"})
+                return httpx.Response(200, json={"status": "stored", "upload": {"id": 9}})
+            return httpx.Response(200, json={"status": "partial"})
+
+        paths = []
+        artifacts = []
+        try:
+            for name in ("a.vpk", "b.vpk", "broken.vpk"):
+                data = name.encode() * 4
+                with tempfile.NamedTemporaryFile(suffix=".vpk", delete=False) as handle:
+                    handle.write(data)
+                    paths.append(handle.name)
+                artifacts.append(ReplicationArtifact(
+                    upload_id=len(paths),
+                    original_name=name,
+                    stored_name=name,
+                    path=handle.name,
+                    size=len(data),
+                    sha256=hashlib.sha256(data).hexdigest(),
+                ))
+            config = LanReplicationConfig(
+                node_id="node-a",
+                group="room-1",
+                token=TOKEN,
+                allowed_cidrs="10.20.0.0/24",
+                peers=(LanPeer("node-b", "Node B", "http://10.20.0.12:8080"),),
+                retries=0,
+                max_streams_per_peer=3,
+            )
+            result = asyncio.run(replicate_artifacts(
+                config,
+                artifacts,
+                transport=httpx.MockTransport(handler),
+            ))
+        finally:
+            for path in paths:
+                os.unlink(path)
+
+        peer = result["peers"][0]
+        self.assertEqual(peak, 3)
+        self.assertEqual(peer["status"], "partial")
+        self.assertEqual(len(peer["uploaded"]), 2)
+        self.assertEqual([item["original_name"] for item in peer["failed"]], ["broken.vpk"])
+
+    def _relay_handler(self, calls, relay_status=200):
+        async def handler(request: httpx.Request) -> httpx.Response:
+            host = request.url.host
+            path = request.url.path
+            calls.append((host, path))
+            node_id = {"10.20.0.12": "node-b", "10.20.0.13": "node-c", "10.20.0.14": "node-d"}[host]
+            if path.endswith("/capabilities"):
+                return httpx.Response(200, json={
+                    "protocol_version": 1,
+                    "node_id": node_id,
+                    "lan_group": "room-1",
+                })
+            if path.endswith("/preflight"):
+                payload = json.loads((await request.aread()).decode())
+                return httpx.Response(200, json={
+                    "status": "reserved",
+                    "reservation_id": "1" * 48,
+                    "accepted": payload["artifacts"],
+                    "already_present": [],
+                })
+            if path.endswith("/uploads"):
+                await request.aread()
+                return httpx.Response(200, json={"status": "stored", "upload": {"id": 8}})
+            if path.endswith("/relay"):
+                if relay_status != 200:
+                    return httpx.Response(relay_status, json={"detail": "not found"})
+                payload = json.loads((await request.aread()).decode())
+                self.assertEqual(payload["targets"], ["node-c", "node-d"])
+                self.assertEqual(payload["hops"], 1)
+                return httpx.Response(200, json={"ok": True, "peers": [
+                    {"node_id": "node-c", "status": "completed", "uploaded": [{"id": 3}]},
+                    {"node_id": "node-d", "status": "completed", "via": "node-c", "uploaded": [{"id": 4}]},
+                ]})
+            return httpx.Response(200, json={"status": "completed"})
+        return handler
+
+    def _run_chain(self, handler):
+        config = LanReplicationConfig(
+            node_id="node-a",
+            group="room-1",
+            token=TOKEN,
+            allowed_cidrs="10.20.0.0/24",
+            peers=(
+                LanPeer("node-b", "Node B", "http://10.20.0.12:8080"),
+                LanPeer("node-c", "Node C", "http://10.20.0.13:8080"),
+                LanPeer("node-d", "Node D", "http://10.20.0.14:8080"),
+            ),
+            topology="chain",
+        )
+        with tempfile.NamedTemporaryFile(suffix=".vpk", delete=False) as handle:
+            handle.write(b"map-bytes")
+            path = handle.name
+        try:
+            return asyncio.run(replicate_artifacts(config, [ReplicationArtifact(
+                upload_id=7,
+                original_name="map.vpk",
+                stored_name="map_server.vpk",
+                path=path,
+                size=9,
+                sha256=hashlib.sha256(b"map-bytes").hexdigest(),
+            )], transport=httpx.MockTransport(handler)))
+        finally:
+            os.unlink(path)
+
+    def test_chain_topology_uploads_once_and_aggregates_relay_results(self):
+        calls = []
+        result = self._run_chain(self._relay_handler(calls))
+
+        uploads = [host for host, path in calls if path.endswith("/uploads")]
+        self.assertEqual(uploads, ["10.20.0.12"])
+        self.assertTrue(result["complete"])
+        self.assertEqual([peer["node_id"] for peer in result["peers"]], ["node-b", "node-c", "node-d"])
+        self.assertEqual([peer.get("via") for peer in result["peers"]], [None, "node-b", "node-c"])
+
+    def test_failed_relay_falls_back_to_direct_transfers(self):
+        calls = []
+        result = self._run_chain(self._relay_handler(calls, relay_status=404))
+
+        uploads = sorted(host for host, path in calls if path.endswith("/uploads"))
+        self.assertEqual(uploads, ["10.20.0.12", "10.20.0.13", "10.20.0.14"])
+        self.assertEqual(result["completed_peer_count"], 3)
+
+    def test_shared_pool_reuses_client_and_cached_checks(self):
+        calls = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request.url.path)
+            if request.url.path.endswith("/capabilities"):
+                return httpx.Response(200, json={
+                    "protocol_version": 1,
+                    "node_id": "node-b",
+                    "lan_group": "room-1",
+                })
+            return httpx.Response(200, json={
+                "status": "already_present",
+                "already_present": [{"id": 3}],
+                "storage": {},
+            })
+
+        config = LanReplicationConfig(
+            node_id="node-a",
+            group="room-1",
+            token=TOKEN,
+            allowed_cidrs="10.20.0.0/24",
+            peers=(LanPeer("node-b", "Node B", "http://node-b.lan:8080"),),
+        )
+        artifact = ReplicationArtifact(
+            upload_id=7,
+            original_name="map.vpk",
+            stored_name="map_server.vpk",
+            path="/nonexistent/map_server.vpk",
+            size=9,
+            sha256=hashlib.sha256(b"map-bytes").hexdigest(),
+        )
+
+        async def replicate_twice(pool: LanPeerPool):
+            first = await replicate_artifacts(config, [artifact], pool=pool)
+            client = pool.client(config.peers[0])
+            second = await replicate_artifacts(config, [artifact], pool=pool)
+            same_client = client is pool.client(config.peers[0])
+            await pool.aclose()
+            return first, second, same_client, client.is_closed
+
+        lookup = [(2, 1, 6, "", ("10.20.0.12", 0))]
+        with patch("app.lan_replication.socket.getaddrinfo", return_value=lookup) as getaddrinfo:
+            pool = LanPeerPool(config, transport=httpx.MockTransport(handler))
+            first, second, same_client, closed = asyncio.run(replicate_twice(pool))
+
+        self.assertEqual(first["peers"][0]["status"], "already_present")
+        self.assertEqual(second["peers"][0]["status"], "already_present")
+        self.assertTrue(same_client)
+        self.assertTrue(closed)
+        self.assertEqual(getaddrinfo.call_count, 1)
+        self.assertEqual(calls, [
+            "/api/lan/replication/capabilities",
+            "/api/lan/replication/preflight",
+            "/api/lan/replication/preflight",
+        ])
+
+    def test_pool_closes_clients_of_a_previous_loop_and_refreshes_storage(self):
+        calls = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request.url.path)
+            return httpx.Response(200, json={
+                "protocol_version": 1,
+                "node_id": "node-b",
+                "lan_group": "room-1",
+                "storage": {"available_bytes": 100 * len(calls)},
+            })
+
+        config = self._config()
+        pool = LanPeerPool(config, transport=httpx.MockTransport(handler))
+
+        async def client():
+            return pool.client(config.peers[0])
+
+        first = asyncio.run(client())
+        second = asyncio.run(client())
+        self.assertIsNot(first, second)
+        self.assertFalse(first.is_closed)
+        asyncio.run(pool.aclose())
+        self.assertTrue(first.is_closed)
+        self.assertTrue(second.is_closed)
+
+        async def storage_twice():
+            storage = await peer_storage(config, pool)
+            cached = await peer_storage(config, pool)
+            pool._capability_cache["node-b"] = (time.monotonic() - STORAGE_CACHE_SECONDS, {})
+            refreshed = await peer_storage(config, pool)
+            await pool.aclose()
+            return storage, cached, refreshed
+
+        storage, cached, refreshed = asyncio.run(storage_twice())
+        self.assertEqual(storage["node-b"]["available_bytes"], 100)
+        self.assertEqual(cached["node-b"]["available_bytes"], 100)
+        self.assertEqual(refreshed["node-b"]["available_bytes"], 200)
+        self.assertEqual(len(calls), 2)
+
+    def test_digest_reconciliation_fetches_only_differing_buckets(self):
+        shared = {"aa" + "0" * 62: (10, "active"), "bb" + "1" * 62: (20, "active")}
+        missing = "cc" + "2" * 62
+        deleted_remotely = "dd" + "3" * 62
+        local_items = {**shared, missing: (30, "active"), deleted_remotely: (40, "active")}
+        remote_items = {**shared, deleted_remotely: (40, "deleted")}
+        requests = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path.endswith("/capabilities"):
+                return httpx.Response(200, json={
+                    "protocol_version": 1,
+                    "node_id": "node-b",
+                    "lan_group": "room-1",
+                    "features": ["resume", "relay", "digest"],
+                })
+            body = json.loads(request.content)
+            requests.append(body)
+            if "prefixes" not in body:
+                return httpx.Response(200, json=replication_digest(remote_items))
+            return httpx.Response(200, json={"items": [
+                {"sha256": sha256, "size": size, "state": state}
+                for sha256, (size, state) in remote_items.items()
+                if sha256[:2] in body["prefixes"]
+            ]})
+
+        config = LanReplicationConfig(
+            node_id="node-a",
+            group="room-1",
+            token=TOKEN,
+            allowed_cidrs="10.20.0.0/24",
+            peers=(LanPeer("node-b", "Node B", "http://10.20.0.12:8080"),),
+        )
+
+        async def reconcile(items):
+            pool = LanPeerPool(config, transport=httpx.MockTransport(handler))
+            try:
+                return await reconcile_peer(config, pool, config.peers[0], items)
+            finally:
+                await pool.aclose()
+
+        report, failure = asyncio.run(reconcile(local_items))
+        self.assertIsNone(failure)
+        self.assertEqual(report["missing"], [missing])
+        self.assertEqual(report["deleted"], [deleted_remotely])
+        self.assertEqual(requests[1]["prefixes"], ["cc", "dd"])
+
+        requests.clear()
+        report, failure = asyncio.run(reconcile(remote_items))
+        self.assertIsNone(failure)
+        self.assertEqual((report["missing"], report["deleted"]), ([], []))
+        self.assertEqual(len(requests), 1)
+
     def test_incomplete_security_config_is_not_reported_as_complete(self):
         config = LanReplicationConfig(
             node_id="node-a",
@@ -1,11 +1,16 @@
 import asyncio
+import gzip
 import hashlib
 import io
 import json
 import os
 import shutil
 import tempfile
+import struct
+import threading
 import unittest
+import zlib
+from dataclasses import replace
 from unittest.mock import patch
 
 import httpx
@@ -23,7 +28,24 @@ os.environ["LAN_DISK_RESERVE_MB"] = "0"
 from starlette.datastructures import UploadFile  # noqa: E402
 
 from app import main  # noqa: E402
-from app.db import ReplicationReservation, SessionLocal, Upload  # noqa: E402
+from app.db import ReplicationJob, ReplicationReservation, ReplicationTask, SessionLocal, Upload  # noqa: E402
+from app.lan_replication import (  # noqa: E402
+    DECOMPRESS_STEP_BYTES,
+    BoundedDecompressor,
+    LanPeer,
+    LanPeerPool,
+    LanReplicationConfig,
+    ReplicationArtifact,
+    ZSTD_FEED_BYTES,
+    ZSTD_MAX_EXPANSION,
+    _auth_headers,
+    _send_artifact_delta,
+    _send_artifact_resumable,
+    available_codecs,
+)
+from app.vpk_reader import verify_vpk_crc, vpk_segments  # noqa: E402
+from app.vpk_tools import build_vpk_from_dir  # noqa: E402
+from app.replication_queue import ReplicationQueue  # noqa: E402
 from app.vpkcheck import ValidationResult  # noqa: E402
 
 
@@ -41,11 +63,11 @@ def valid_result() -> ValidationResult:
     )
 
 
-class LanReplicationStorageTest(unittest.TestCase):
-    @classmethod
-    def tearDownClass(cls):
-        shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
+def tearDownModule():
+    shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
+
 
+class LanReplicationStorageTest(unittest.TestCase):
     def setUp(self):
         db = SessionLocal()
         try:
@@ -107,6 +129,317 @@ class LanReplicationStorageTest(unittest.TestCase):
         self.assertEqual(accepted.status_code, 200)
         self.assertEqual(accepted.json()["node_id"], "node-b")
 
+    def test_resumable_upload_appends_from_reported_offset(self):
+        data = b"resumable-server-vpk"
+        sha256 = hashlib.sha256(data).hexdigest()
+        preflight = main._replication_preflight("node-a", self._payload(data, sha256))
+        item_path = f"/api/lan/replication/reservations/{preflight['reservation_id']}/items/{sha256}"
+        headers = {
+            "Authorization": "Bearer " + "b" * 64,
+            "X-LAN-Group": "room-1",
+            "X-LAN-Node": "node-a",
+        }
+
+        async def transfer():
+            transport = httpx.ASGITransport(app=main.app, client=("10.20.0.5", 51000))
+            async with httpx.AsyncClient(transport=transport, base_url="http://uploader.test") as client:
+                first = await client.put(item_path, headers={
+                    **headers,
+                    "Content-Range": f"bytes 0-5/{len(data)}",
+                }, content=data[:6])
+                status = await client.get(item_path, headers=headers)
+                mismatch = await client.put(item_path, headers={
+                    **headers,
+                    "Content-Range": f"bytes 0-{len(data) - 1}/{len(data)}",
+                }, content=data)
+                rest = await client.put(item_path, headers={
+                    **headers,
+                    "Content-Range": f"bytes 6-{len(data) - 1}/{len(data)}",
+                }, content=data[6:])
+                return first, status, mismatch, rest
+
+        writer_threads = []
+        write_batch = main._write_lan_batch
+
+        def recording_write(*args):
+            writer_threads.append(threading.get_ident())
+            return write_batch(*args)
+
+        with patch.object(main, "validate_vpk", return_value=valid_result()), \
+                patch.object(main, "_write_lan_batch", recording_write):
+            first, status, mismatch, rest = asyncio.run(transfer())
+
+        self.assertEqual(len(writer_threads), 2)
+        self.assertNotIn(threading.get_ident(), writer_threads)
+
+        self.assertEqual(first.json()["status"], "pending")
+        self.assertEqual(status.json()["offset"], 6)
+        self.assertEqual(status.json()["prefix_sha256"], hashlib.sha256(data[:6]).hexdigest())
+        self.assertEqual(mismatch.status_code, 409)
+        self.assertEqual(mismatch.json()["offset"], 6)
+        self.assertEqual(rest.json()["status"], "stored")
+        target_path = os.path.join(main.UPLOAD_DIR, rest.json()["upload"]["stored_name"])
+        with open(target_path, "rb") as handle:
+            self.assertEqual(handle.read(), data)
+        self.assertFalse(any(name.startswith(".lan-") for name in os.listdir(main.UPLOAD_DIR)))
+
+    def test_delta_transfer_reuses_local_entries_of_previous_version(self):
+        work = tempfile.mkdtemp(dir=TEST_DATA_DIR)
+        bsp = os.urandom(64 * 1024)
+
+        def build(version: str, script: bytes) -> str:
+            source = os.path.join(work, version)
+            os.makedirs(os.path.join(source, "maps"))
+            os.makedirs(os.path.join(source, "scripts", "vscripts"))
+            with open(os.path.join(source, "addoninfo.txt"), "wb") as handle:
+                handle.write(b'"AddonInfo" { addonversion "' + version.encode() + b'" }')
+            with open(os.path.join(source, "maps", "c1m1.bsp"), "wb") as handle:
+                handle.write(bsp)
+            with open(os.path.join(source, "scripts", "vscripts", "director.nut"), "wb") as handle:
+                handle.write(script)
+            path = os.path.join(work, f"{version}.vpk")
+            build_vpk_from_dir(source, path)
+            return path
+
+        old_path = build("1.1", b"MobSpawnMinTime <- 5")
+        new_path = build("1.2", b"MobSpawnMinTime <- 8")
+        shutil.copy(old_path, os.path.join(main.UPLOAD_DIR, "campaign_v11_server.vpk"))
+        db = SessionLocal()
+        try:
+            db.add(Upload(
+                original_name="campaign_v11.vpk",
+                stored_name="campaign_v11_server.vpk",
+                size=os.path.getsize(old_path),
+                role="admin",
+                created_at=main.now_utc(),
+                vpk_valid=True,
+                status="active",
+            ))
+            db.commit()
+        finally:
+            db.close()
+        main._mark_vpk_index_dirty(os.path.join(main.UPLOAD_DIR, "campaign_v11_server.vpk"))
+
+        with open(new_path, "rb") as handle:
+            data = handle.read()
+        sha256 = hashlib.sha256(data).hexdigest()
+        preflight = main._replication_preflight("node-a", self._payload(data, sha256))
+        config = LanReplicationConfig(
+            node_id="node-a",
+            group="room-1",
+            token="b" * 64,
+            allowed_cidrs="10.20.0.0/24",
+        )
+        peer = LanPeer("node-b", "Node B", "http://uploader.test")
+        artifact = ReplicationArtifact(
+            upload_id=7,
+            original_name="map.vpk",
+            stored_name="map_server.vpk",
+            path=new_path,
+            size=len(data),
+            sha256=sha256,
+        )
+
+        async def transfer():
+            transport = httpx.ASGITransport(app=main.app, client=("10.20.0.5", 51000))
+            pool = LanPeerPool(config, transport=transport)
+            try:
+                return await _send_artifact_delta(
+                    peer,
+                    pool,
+                    pool.client(peer),
+                    _auth_headers(config),
+                    preflight["reservation_id"],
+                    artifact,
+                )
+            finally:
+                await pool.aclose()
+
+        with patch.object(main, "validate_vpk", return_value=valid_result()):
+            payload, _, sent_bytes = asyncio.run(transfer())
+
+        self.assertEqual(payload["status"], "stored")
+        self.assertEqual(payload["delta"]["reused_bytes"], len(bsp))
+        self.assertEqual(sent_bytes, len(data) - len(bsp))
+        with open(os.path.join(main.UPLOAD_DIR, payload["upload"]["stored_name"]), "rb") as handle:
+            self.assertEqual(handle.read(), data)
+
+    def test_entry_index_follows_added_and_removed_uploads(self):
+        source = tempfile.mkdtemp(dir=TEST_DATA_DIR)
+        with open(os.path.join(source, "addoninfo.txt"), "wb") as handle:
+            handle.write(b'"AddonInfo" { addonversion "1.0" }')
+        with open(os.path.join(source, "index_probe.bin"), "wb") as handle:
+            handle.write(os.urandom(16 * 1024))
+        path = os.path.join(main.UPLOAD_DIR, "index_probe_server.vpk")
+        build_vpk_from_dir(source, path)
+        segments = [segment for segment in vpk_segments(path) if segment["path"] == "index_probe.bin"]
+        db = SessionLocal()
+        try:
+            upload = Upload(
+                original_name="index_probe.vpk",
+                stored_name="index_probe_server.vpk",
+                size=os.path.getsize(path),
+                role="admin",
+                created_at=main.now_utc(),
+                vpk_valid=True,
+                status="active",
+            )
+            db.add(upload)
+            db.commit()
+            upload_id = upload.id
+        finally:
+            db.close()
+        main._mark_vpk_index_dirty(path)
+
+        self.assertEqual(main._plan_lan_delta(segments)[0][1], (path, segments[0]["offset"], 0))
+        with patch.object(main, "SessionLocal", side_effect=AssertionError("索引不应重新查询数据库")):
+            self.assertEqual(main._plan_lan_delta(segments)[0][1], (path, segments[0]["offset"], 0))
+        main.delete_upload_item(upload_id)
+        self.assertIsNone(main._plan_lan_delta(segments)[0][1])
+        self.assertNotIn(path, main._vpk_segment_cache)
+
+    def test_delta_reuses_entries_with_preload_bytes(self):
+        def write_vpk(path: str, entries: list[tuple[str, bytes, bytes]]) -> None:
+            """写出单文件 VPK v1，条目为 (扩展名, 预载数据, 数据区)，都放在 maps 目录下。"""
+            tree = bytearray()
+            body = bytearray()
+            for index, (ext, preload, data) in enumerate(entries):
+                tree += ext.encode() + b"\x00maps\x00" + f"entry{index}".encode() + b"\x00"
+                tree += struct.pack(
+                    "<IHHIIH",
+                    zlib.crc32(data, zlib.crc32(preload)) & 0xFFFFFFFF,
+                    len(preload),
+                    0x7FFF,
+                    len(body),
+                    len(data),
+                    0xFFFF,
+                )
+                tree += preload + b"\x00\x00\x00"
+                body += data
+            tree += b"\x00"
+            with open(path, "wb") as handle:
+                handle.write(struct.pack("<3I", 0x55AA1234, 1, len(tree)) + bytes(tree) + bytes(body))
+
+        bsp = os.urandom(32 * 1024)
+        old_path = os.path.join(main.UPLOAD_DIR, "preload_old_server.vpk")
+        new_path = os.path.join(TEST_DATA_DIR, "preload_new.vpk")
+        write_vpk(old_path, [("bsp", b"LUMP-HEADER", bsp), ("nut", b"", b"old script")])
+        write_vpk(new_path, [("bsp", b"LUMP-HEADER", bsp), ("nut", b"", b"new script")])
+        self.assertEqual(verify_vpk_crc(old_path), [])
+        db = SessionLocal()
+        try:
+            db.add(Upload(
+                original_name="preload_old.vpk",
+                stored_name="preload_old_server.vpk",
+                size=os.path.getsize(old_path),
+                role="admin",
+                created_at=main.now_utc(),
+                vpk_valid=True,
+                status="active",
+            ))
+            db.commit()
+        finally:
+            db.close()
+        main._mark_vpk_index_dirty(old_path)
+
+        segments = vpk_segments(new_path)
+        plan = main._plan_lan_delta(segments)
+        segment, source = next((segment, source) for segment, source in plan if segment["path"] == "maps/entry0.bsp")
+        self.assertEqual(source[2], zlib.crc32(b"LUMP-HEADER"))
+        output = io.BytesIO()
+        checksum = main._copy_local_segment(source, segment["length"], output, hashlib.sha256())
+        self.assertEqual(checksum, segment["crc32"])
+        self.assertEqual(output.getvalue(), bsp)
+
+    def test_compressed_transfer_is_decoded_and_verified(self):
+        config = LanReplicationConfig(
+            node_id="node-a",
+            group="room-1",
+            token="b" * 64,
+            allowed_cidrs="10.20.0.0/24",
+        )
+        peer = LanPeer("node-b", "Node B", "http://uploader.test")
+
+        async def transfer(artifact, reservation_id, codec):
+            transport = httpx.ASGITransport(app=main.app, client=("10.20.0.5", 51000))
+            pool = LanPeerPool(config, transport=transport)
+            try:
+                return await _send_artifact_resumable(
+                    config,
+                    peer,
+                    pool,
+                    pool.client(peer),
+                    _auth_headers(config),
+                    reservation_id,
+                    artifact,
+                    codec,
+                )
+            finally:
+                await pool.aclose()
+
+        for codec in available_codecs():
+            data = (codec.encode() + b" lump data ") * 20000
+            sha256 = hashlib.sha256(data).hexdigest()
+            path = os.path.join(TEST_DATA_DIR, f"compressed-{codec}.vpk")
+            with open(path, "wb") as handle:
+                handle.write(data)
+            preflight = main._replication_preflight("node-a", self._payload(data, sha256))
+            artifact = ReplicationArtifact(
+                upload_id=7,
+                original_name="map.vpk",
+                stored_name="map_server.vpk",
+                path=path,
+                size=len(data),
+                sha256=sha256,
+            )
+            with patch.object(main, "validate_vpk", return_value=valid_result()):
+                payload, detail, sent_bytes = asyncio.run(transfer(artifact, preflight["reservation_id"], codec))
+
+            self.assertEqual(payload["status"], "stored", detail)
+            self.assertLess(sent_bytes, len(data) // 10)
+            with open(os.path.join(main.UPLOAD_DIR, payload["upload"]["stored_name"]), "rb") as handle:
+                self.assertEqual(handle.read(), data)
+
+    def test_decompression_bomb_is_rejected_without_inflating(self):
+        data = b"small-server-vpk"
+        sha256 = hashlib.sha256(data).hexdigest()
+        bomb = bytes(64 * 1024 * 1024)
+        headers = {
+            "Authorization": "Bearer " + "b" * 64,
+            "X-LAN-Group": "room-1",
+            "X-LAN-Node": "node-a",
+            "Content-Range": f"bytes 0-{len(data) - 1}/{len(data)}",
+        }
+        bodies = {"gzip": gzip.compress(bomb, compresslevel=1)}
+        if "zstd" in available_codecs():
+            import zstandard
+
+            bodies["zstd"] = zstandard.ZstdCompressor().compress(bomb)
+
+        async def send(item_path, codec, body):
+            transport = httpx.ASGITransport(app=main.app, client=("10.20.0.5", 51000))
+            async with httpx.AsyncClient(transport=transport, base_url="http://uploader.test") as client:
+                return await client.put(item_path, headers={**headers, "Content-Encoding": codec}, content=body)
+
+        for codec, body in bodies.items():
+            preflight = main._replication_preflight("node-a", self._payload(data, sha256))
+            item_path = f"/api/lan/replication/reservations/{preflight['reservation_id']}/items/{sha256}"
+            decoded_steps = []
+            original_step = BoundedDecompressor.step
+
+            def step(decoder):
+                piece = original_step(decoder)
+                decoded_steps.append(len(piece))
+                return piece
+
+            with patch.object(BoundedDecompressor, "step", step):
+                response = asyncio.run(send(item_path, codec, body))
+
+            self.assertEqual(response.status_code, 413, codec)
+            self.assertLessEqual(max(decoded_steps), DECOMPRESS_STEP_BYTES + ZSTD_FEED_BYTES * ZSTD_MAX_EXPANSION, codec)
+            self.assertLess(sum(decoded_steps), 8 * DECOMPRESS_STEP_BYTES, codec)
+            main.complete_lan_replication_reservation("node-a", preflight["reservation_id"])
+
     def test_preflight_reserves_capacity_and_completion_releases_it(self):
         data = b"server-vpk"
         result = main._replication_preflight("node-a", self._payload(data))
@@ -125,15 +458,65 @@ class LanReplicationStorageTest(unittest.TestCase):
         finally:
             db.close()
 
+    def test_completed_reservation_keeps_partial_for_the_next_attempt(self):
+        data = b"interrupted-server-vpk"
+        sha256 = hashlib.sha256(data).hexdigest()
+        headers = {
+            "Authorization": "Bearer " + "b" * 64,
+            "X-LAN-Group": "room-1",
+            "X-LAN-Node": "node-a",
+        }
+
+        def item_path(reservation_id):
+            return f"/api/lan/replication/reservations/{reservation_id}/items/{sha256}"
+
+        async def interrupted(reservation_id):
+            transport = httpx.ASGITransport(app=main.app, client=("10.20.0.5", 51000))
+            async with httpx.AsyncClient(transport=transport, base_url="http://uploader.test") as client:
+                await client.put(item_path(reservation_id), headers={
+                    **headers,
+                    "Content-Range": f"bytes 0-7/{len(data)}",
+                }, content=data[:8])
+                return await client.post(f"/api/lan/replication/reservations/{reservation_id}/complete", headers=headers)
+
+        async def retry(reservation_id):
+            transport = httpx.ASGITransport(app=main.app, client=("10.20.0.5", 51000))
+            async with httpx.AsyncClient(transport=transport, base_url="http://uploader.test") as client:
+                status = await client.get(item_path(reservation_id), headers=headers)
+                rest = await client.put(item_path(reservation_id), headers={
+                    **headers,
+                    "Content-Range": f"bytes 8-{len(data) - 1}/{len(data)}",
+                }, content=data[8:])
+                return status, rest
+
+        first = main._replication_preflight("node-a", self._payload(data, sha256))
+        completed = asyncio.run(interrupted(first["reservation_id"]))
+        self.assertEqual(completed.json()["status"], "partial")
+        self.assertTrue(any(name.startswith(".lan-resume-") for name in os.listdir(main.UPLOAD_DIR)))
+
+        second = main._replication_preflight("node-a", self._payload(data, sha256))
+        self.assertNotEqual(second["reservation_id"], first["reservation_id"])
+        with patch.object(main, "validate_vpk", return_value=valid_result()):
+            status, rest = asyncio.run(retry(second["reservation_id"]))
+
+        self.assertEqual(status.json()["offset"], 8)
+        self.assertEqual(status.json()["prefix_sha256"], hashlib.sha256(data[:8]).hexdigest())
+        self.assertEqual(rest.json()["status"], "stored")
+        with open(os.path.join(main.UPLOAD_DIR, rest.json()["upload"]["stored_name"]), "rb") as handle:
+            self.assertEqual(handle.read(), data)
+        self.assertFalse(any(name.startswith(".lan-") for name in os.listdir(main.UPLOAD_DIR)))
+
     def test_cleanup_removes_stale_lan_partial_file(self):
         partial_path = os.path.join(main.UPLOAD_DIR, ".lan-stale.part")
         with open(partial_path, "wb") as handle:
             handle.write(b"partial")
         stale_time = main.time.time() - main.LAN_REPLICATION.reservation_ttl_seconds - 10
         os.utime(partial_path, (stale_time, stale_time))
+        main._lan_partial_hashes[partial_path] = (7, hashlib.sha256(b"partial"))
 
         main.cleanup_tmp_and_work()
         self.assertFalse(os.path.exists(partial_path))
+        self.assertNotIn(partial_path, main._lan_partial_hashes)
 
     def test_sftp_scan_imports_existing_vpk_once(self):
         path = os.path.join(main.UPLOAD_DIR, "sftp-map.vpk")
@@ -246,6 +629,268 @@ class LanReplicationStorageTest(unittest.TestCase):
         finally:
             db.close()
 
+    def test_digest_covers_replicated_uploads_and_remembers_deletions(self):
+        def add_upload(name: str, status: str, report: dict):
+            db = SessionLocal()
+            try:
+                db.add(Upload(
+                    original_name=name,
+                    stored_name=name,
+                    sha256=hashlib.sha256(name.encode()).hexdigest(),
+                    size=len(name),
+                    role="admin",
+                    created_at=main.now_utc(),
+                    vpk_valid=True,
+                    vpk_report=json.dumps(report),
+                    status=status,
+                ))
+                db.commit()
+            finally:
+                db.close()
+
+        add_upload("local.vpk", "active", {"upload_source": {"source": "vpk"}})
+        add_upload("kept.vpk", "active", {"replication": {"lan_group": "room-1"}})
+        add_upload("removed.vpk", "deleted", {"replication": {"lan_group": "room-1"}})
+        add_upload("other.vpk", "active", {"replication": {"lan_group": "room-2"}})
+
+        digest = main.lan_replication_digest_payload({})
+        self.assertEqual(digest["item_count"], 2)
+        listing = main.lan_replication_digest_payload({"prefixes": list(digest["buckets"])})
+        states = {item["sha256"]: item["state"] for item in listing["items"]}
+        self.assertEqual(states, {
+            hashlib.sha256(b"kept.vpk").hexdigest(): "active",
+            hashlib.sha256(b"removed.vpk").hexdigest(): "deleted",
+        })
+
+
+class ReplicationQueueTest(unittest.TestCase):
+    def setUp(self):
+        db = SessionLocal()
+        try:
+            db.query(ReplicationTask).delete()
+            db.query(ReplicationJob).delete()
+            db.commit()
+        finally:
+            db.close()
+        self.now = [main.now_utc()]
+        self.config = LanReplicationConfig(
+            node_id="node-a",
+            group="room-1",
+            token="a" * 64,
+            allowed_cidrs="10.20.0.0/24",
+            peers=(
+                LanPeer("node-b", "Node B", "http://10.20.0.12:8080"),
+                LanPeer("node-c", "Node C", "http://10.20.0.13:8080"),
+            ),
+            job_max_attempts=3,
+            job_retry_base_seconds=10,
+        )
+        self.artifacts = []
+        for name in ("one.vpk", "two.vpk"):
+            path = os.path.join(main.UPLOAD_DIR, f"queue_{name}")
+            with open(path, "wb") as handle:
+                handle.write(name.encode())
+            self.artifacts.append(ReplicationArtifact(
+                upload_id=len(self.artifacts) + 1,
+                original_name=name,
+                stored_name=os.path.basename(path),
+                path=path,
+                size=len(name),
+                sha256=hashlib.sha256(name.encode()).hexdigest(),
+            ))
+
+    def test_queue_retries_failed_items_with_backoff_until_complete(self):
+        calls = []
+
+        async def fake_replicate(config, artifacts, pool=None):
+            calls.append(([peer.node_id for peer in config.peers], [artifact.sha256 for artifact in artifacts]))
+            if len(calls) == 1:
+                return {"peers": [
+                    {
+                        "node_id": "node-b",
+                        "status": "partial",
+                        "failed": [{"sha256": self.artifacts[1].sha256, "detail": "连接中断"}],
+                    },
+                    {"node_id": "node-c", "status": "offline", "detail": "timeout"},
+                ]}
+            return {"peers": [{"node_id": peer.node_id, "status": "completed"} for peer in config.peers]}
+
+        queue = ReplicationQueue(self.config, replicate=fake_replicate, clock=lambda: self.now[0])
+        job = queue.enqueue(self.artifacts)
+        self.assertEqual(job["status"], "queued")
+        self.assertEqual(job["pending_task_count"], 4)
+
+        self.assertEqual(asyncio.run(queue.run_once()), 4)
+        status = queue.job_status(job["job_id"])
+        self.assertEqual(status["status"], "retrying")
+        self.assertEqual(status["completed_task_count"], 1)
+        self.assertEqual(asyncio.run(queue.run_once()), 0)
+
+        self.now[0] += main.timedelta(seconds=10)
+        self.assertEqual(asyncio.run(queue.run_once()), 3)
+        self.assertEqual(sorted(len(shas) for _, shas in calls[1:]), [1, 2])
+        status = queue.job_status(job["job_id"])
+        self.assertEqual(status["status"], "completed")
+        self.assertEqual(status["failed_task_count"], 0)
+
+    def test_queue_resumes_interrupted_tasks_and_gives_up_after_max_attempts(self):
+        async def always_offline(config, artifacts, pool=None):
+            return {"peers": [{"node_id": peer.node_id, "status": "offline", "detail": "down"} for peer in config.peers]}
+
+        queue = ReplicationQueue(self.config, replicate=always_offline, clock=lambda: self.now[0])
+        job = queue.enqueue(self.artifacts[:1])
+        db = SessionLocal()
+        try:
+            db.query(ReplicationTask).update({"status": "running"})
+            db.commit()
+        finally:
+            db.close()
+        self.assertEqual(queue.recover(), 2)
+
+        for _ in range(3):
+            asyncio.run(queue.run_once())
+            self.now[0] += main.timedelta(hours=1)
+        status = queue.job_status(job["job_id"])
+        self.assertEqual(status["status"], "failed")
+        self.assertTrue(all(item["attempts"] == 3 for peer in status["peers"] for item in peer["artifacts"]))
+
+    def test_slow_job_does_not_block_others_and_finished_jobs_expire(self):
+        fast_done = asyncio.Event()
+
+        async def replicate(config, artifacts, pool=None):
+            if artifacts[0].sha256 == self.artifacts[0].sha256:
+                # 第一个任务要等第二个任务完成才会返回，串行执行时会超时
+                await asyncio.wait_for(fast_done.wait(), timeout=2)
+            else:
+                fast_done.set()
+            return {"peers": [{"node_id": peer.node_id, "status": "completed"} for peer in config.peers]}
+
+        queue = ReplicationQueue(self.config, replicate=replicate, clock=lambda: self.now[0])
+        slow = queue.enqueue(self.artifacts[:1])
+        fast = queue.enqueue(self.artifacts[1:])
+        self.assertEqual(asyncio.run(queue.run_once()), 4)
+        self.assertEqual(queue.job_status(slow["job_id"])["status"], "completed")
+        self.assertEqual(queue.job_status(fast["job_id"])["status"], "completed")
+
+        pending = queue.enqueue(self.artifacts[:1])
+        self.now[0] += main.timedelta(days=self.config.job_retention_days + 1)
+        self.assertEqual(queue.prune(), 2)
+        self.assertIsNone(queue.job_status(slow["job_id"]))
+        self.assertIsNotNone(queue.job_status(pending["job_id"]))
+        db = SessionLocal()
+        try:
+            self.assertEqual(db.query(ReplicationTask).count(), 2)
+        finally:
+            db.close()
+
+
+    def test_loop_starts_new_jobs_while_a_slow_job_is_sending(self):
+        release = asyncio.Event()
+        calls = []
+
+        async def replicate(config, artifacts, pool=None):
+            calls.append(artifacts[0].sha256)
+            if artifacts[0].sha256 == self.artifacts[0].sha256:
+                await release.wait()
+            return {"peers": [{"node_id": peer.node_id, "status": "completed"} for peer in config.peers]}
+
+        config = replace(self.config, peers=self.config.peers[:1], job_concurrency=2)
+        queue = ReplicationQueue(config, replicate=replicate)
+
+        async def scenario():
+            queue.start()
+            slow = queue.enqueue(self.artifacts[:1])
+            while not calls:
+                await asyncio.sleep(0.01)
+            fast = queue.enqueue(self.artifacts[1:])
+            for _ in range(200):
+                if queue.job_status(fast["job_id"])["status"] == "completed":
+                    break
+                await asyncio.sleep(0.01)
+            statuses = (queue.job_status(slow["job_id"])["status"], queue.job_status(fast["job_id"])["status"])
+            release.set()
+            await queue.stop()
+            return statuses
+
+        self.assertEqual(asyncio.run(scenario()), ("running", "completed"))
+
+    def test_run_once_claims_only_free_slots(self):
+        async def replicate(config, artifacts, pool=None):
+            return {"peers": [{"node_id": peer.node_id, "status": "completed"} for peer in config.peers]}
+
+        queue = ReplicationQueue(replace(self.config, job_concurrency=1), replicate=replicate, clock=lambda: self.now[0])
+        first = queue.enqueue(self.artifacts[:1])
+        second = queue.enqueue(self.artifacts[1:])
+        self.assertEqual(asyncio.run(queue.run_once()), 2)
+        self.assertEqual(queue.job_status(first["job_id"])["status"], "completed")
+        self.assertEqual(queue.job_status(second["job_id"])["status"], "queued")
+        self.assertEqual(asyncio.run(queue.run_once()), 2)
+        self.assertEqual(queue.job_status(second["job_id"])["status"], "completed")
+
+    def test_placement_is_decided_by_the_worker(self):
+        calls = []
+        storage_reads = []
+
+        async def replicate(config, artifacts, pool=None):
+            calls.append([peer.node_id for peer in config.peers])
+            return {"peers": [{"node_id": peer.node_id, "status": "completed"} for peer in config.peers]}
+
+        async def fake_storage(config, pool):
+            storage_reads.append(config.node_id)
+            return {"node-b": {"available_bytes": 10 ** 9}, "node-c": None}
+
+        queue = ReplicationQueue(
+            replace(self.config, replication_factor=2),
+            replicate=replicate,
+            clock=lambda: self.now[0],
+            local_storage=lambda: {"available_bytes": 10 ** 9},
+        )
+        with patch("app.replication_queue.peer_storage", fake_storage):
+            job = queue.enqueue(self.artifacts[:1], place=True)
+            self.assertEqual(storage_reads, [])
+            self.assertEqual(job["peer_count"], 0)
+            self.assertEqual(job["placement"][0]["status"], "pending")
+            self.assertEqual(asyncio.run(queue.run_once()), 1)
+
+        self.assertEqual(calls, [["node-b"]])
+        status = queue.job_status(job["job_id"])
+        self.assertEqual(status["status"], "completed")
+        self.assertEqual([peer["node_id"] for peer in status["peers"]], ["node-b"])
+        single = ReplicationQueue(replace(self.config, replication_factor=1), clock=lambda: self.now[0])
+        self.assertIsNone(single.enqueue(self.artifacts, place=True))
+
+
+    def test_placement_short_of_the_factor_is_retried(self):
+        calls = []
+        storage = {"node-b": None, "node-c": {}}
+
+        async def replicate(config, artifacts, pool=None):
+            calls.append([peer.node_id for peer in config.peers])
+            return {"peers": [{"node_id": peer.node_id, "status": "completed"} for peer in config.peers]}
+
+        async def fake_storage(config, pool):
+            return dict(storage)
+
+        queue = ReplicationQueue(replace(self.config, replication_factor=3), replicate=replicate, clock=lambda: self.now[0])
+        with patch("app.replication_queue.peer_storage", fake_storage):
+            job = queue.enqueue(self.artifacts[:1], place=True)
+            self.assertEqual(job["replica_shortfall"], 2)
+            asyncio.run(queue.run_once())
+            status = queue.job_status(job["job_id"])
+            self.assertEqual(calls, [["node-c"]])
+            self.assertEqual(status["status"], "retrying")
+            self.assertEqual(status["replica_shortfall"], 1)
+            self.assertIn("副本不足", status["placement"][0]["detail"])
+
+            storage["node-b"] = {"available_bytes": 10 ** 9}
+            self.now[0] += main.timedelta(seconds=self.config.job_retry_base_seconds)
+            asyncio.run(queue.run_once())
+
+        self.assertEqual(calls, [["node-c"], ["node-b"]])
+        status = queue.job_status(job["job_id"])
+        self.assertEqual(status["status"], "completed")
+        self.assertEqual(status["replica_shortfall"], 0)
+
 
 if __name__ == "__main__":
     unittest.main()
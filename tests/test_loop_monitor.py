@@ -0,0 +1,59 @@
+import asyncio
+import time
+import unittest
+
+from app.loop_monitor import LoopMonitor
+from app.metrics import LOOP_STALLS
+
+
+def _stall_total():
+    line = LOOP_STALLS.render().splitlines()[-1]
+    return float(line.split()[-1])
+
+
+def _blocking_capacity_lock():
+    time.sleep(0.25)
+
+
+class LoopMonitorTest(unittest.TestCase):
+    def _run(self, monitor, work):
+        async def scenario():
+            monitor.start()
+            await asyncio.sleep(0.05)
+            await work()
+            await asyncio.sleep(0.05)
+            await monitor.stop()
+
+        asyncio.run(scenario())
+        return monitor.status()
+
+    def test_debug_mode_captures_blocking_stack(self):
+        stalls_before = _stall_total()
+
+        async def work():
+            _blocking_capacity_lock()
+
+        status = self._run(LoopMonitor(interval=0.01, threshold=0.05, debug=True), work)
+        self.assertFalse(status["running"])
+        self.assertEqual(status["stalls"], 1)
+        self.assertEqual(_stall_total(), stalls_before + 1)
+        stall = status["recent_stalls"][0]
+        self.assertGreaterEqual(stall["lag_ms"], 150)
+        self.assertIn("_blocking_capacity_lock", stall["culprit"])
+        self.assertTrue(any("work" in line for line in stall["stack"]))
+        self.assertGreaterEqual(status["max_ms"], stall["lag_ms"])
+
+    def test_without_debug_only_lag_is_recorded(self):
+        async def work():
+            await asyncio.to_thread(time.sleep, 0.1)
+            _blocking_capacity_lock()
+
+        status = self._run(LoopMonitor(interval=0.01, threshold=0.05), work)
+        self.assertEqual(status["stalls"], 1)
+        self.assertNotIn("stack", status["recent_stalls"][0])
+        self.assertGreater(status["window_samples"], 5)
+        self.assertLess(status["p50_ms"], 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
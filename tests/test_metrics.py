@@ -0,0 +1,46 @@
+import unittest
+
+from app.metrics import MetricsRegistry, validation_failure_rules
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    def test_renders_prometheus_text_format(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("demo_bytes", "Bytes.", ("peer", "status"))
+        gauge = registry.gauge("demo_storage_bytes", "Storage.")
+        counter.labels(peer='a"b', status="completed").inc(10)
+        counter.labels(peer='a"b', status="completed").inc(5)
+        gauge.set(3)
+
+        text = registry.render()
+        self.assertIn("# TYPE demo_bytes_total counter\n", text)
+        self.assertIn('demo_bytes_total{peer="a\\"b",status="completed"} 15\n', text)
+        self.assertIn("demo_storage_bytes 3\n", text)
+        self.assertTrue(text.endswith("\n"))
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("demo_seconds", "Stage time.", ("stage",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.labels(stage="hash").observe(value)
+
+        lines = registry.render().splitlines()
+        self.assertIn('demo_seconds_bucket{stage="hash",le="0.1"} 2', lines)
+        self.assertIn('demo_seconds_bucket{stage="hash",le="1"} 3', lines)
+        self.assertIn('demo_seconds_bucket{stage="hash",le="+Inf"} 4', lines)
+        self.assertIn('demo_seconds_sum{stage="hash"} 3.65', lines)
+        self.assertIn('demo_seconds_count{stage="hash"} 4', lines)
+
+        with self.assertRaises(ValueError):
+            histogram.observe(1.0)
+        with self.assertRaises(ValueError):
+            registry.counter("demo_seconds", "Duplicate.")
+
+    def test_validation_failures_map_to_rule_keys(self):
+        report = {"size_mb": 700, "max_size_mb": 600, "missing_required": ["addoninfo.txt"], "blocked_hits": []}
+        self.assertEqual(validation_failure_rules(report), ["max_size_mb", "require_files"])
+        self.assertEqual(validation_failure_rules({"size_mb": 1, "max_size_mb": 600}), ["unknown"])
+
+
+if __name__ == "__main__":
+    unittest.main()
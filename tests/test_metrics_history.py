@@ -0,0 +1,74 @@
+import shutil
+import tempfile
+import unittest
+
+from app.metrics_history import MetricsHistory, RingSeries
+
+
+def _sample(cpu: float, rx: int) -> dict:
+    return {"cpu_percent": cpu, "memory_usage": cpu * 10, "network_rx": rx}
+
+
+class RingSeriesTest(unittest.TestCase):
+    def test_buckets_average_gauges_and_keep_last_counter(self):
+        ring = RingSeries(step=60, capacity=4)
+        ring.add(600, _sample(10, 100))
+        ring.add(630, _sample(30, 150))
+        ring.add(660, _sample(50, 200))
+
+        points = ring.points(0, 1000)
+        self.assertEqual([timestamp for timestamp, _ in points], [600, 660])
+        self.assertAlmostEqual(points[0][1]["cpu_percent"], 20.0)
+        self.assertEqual(points[0][1]["network_rx"], 150)
+
+    def test_wraparound_keeps_memory_fixed(self):
+        ring = RingSeries(step=1, capacity=10)
+        size = ring.nbytes
+        for second in range(1000, 1035):
+            ring.add(second, _sample(second, second))
+        ring.add(1020, _sample(0, 0))
+
+        points = ring.points(0, 2000)
+        self.assertEqual(ring.nbytes, size)
+        self.assertEqual([timestamp for timestamp, _ in points], list(range(1025, 1035)))
+
+
+class MetricsHistoryTest(unittest.TestCase):
+    def test_series_picks_resolution_for_window(self):
+        history = MetricsHistory(tiers=((1, 60), (60, 60)), clock=lambda: 7200)
+        for second in range(3600, 7200, 5):
+            history.record("c1", _sample(1, second), timestamp=second)
+
+        fine = history.series("c1", 60)
+        coarse = history.series("c1", 3600)
+        self.assertEqual(fine["resolution_seconds"], 1)
+        self.assertEqual(len(fine["timestamps"]), 12)
+        self.assertEqual(coarse["resolution_seconds"], 60)
+        self.assertEqual(len(coarse["timestamps"]), 60)
+        self.assertIsNone(history.series("missing", 60))
+
+    def test_evicts_least_recent_container(self):
+        history = MetricsHistory(tiers=((1, 10),), max_containers=2)
+        history.record("a", _sample(1, 1), timestamp=1)
+        history.record("b", _sample(1, 1), timestamp=1)
+        history.record("a", _sample(1, 1), timestamp=2)
+        history.record("c", _sample(1, 1), timestamp=3)
+        self.assertEqual(history.container_ids(), ["a", "c"])
+
+    def test_spill_round_trip_restores_coarse_rings(self):
+        spill_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spill_dir, True)
+        history = MetricsHistory(tiers=((1, 60), (60, 60)), spill_dir=spill_dir, clock=lambda: 600)
+        history.record("c1", _sample(42, 9), timestamp=540, name="web")
+        self.assertEqual(history.save(), 1)
+
+        restored = MetricsHistory(tiers=((1, 60), (60, 60)), spill_dir=spill_dir, clock=lambda: 600)
+        self.assertEqual(restored.load(), 1)
+        series = restored.series("c1", 600)
+        self.assertEqual(series["timestamps"], [540])
+        self.assertEqual(series["series"]["cpu_percent"], [42.0])
+        self.assertEqual(restored.series("c1", 60)["timestamps"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from app.profiling import Profiler, profile_handler, profile_stage
+
+
+def _work():
+    return sum(len(str(index)) for index in range(20000))
+
+
+def _handler_work():
+    return sum(len(str(index)) for index in range(20000))
+
+
+def _other_work():
+    return sum(len(str(index)) for index in range(20000))
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.profiler = Profiler(os.path.join(self.tmp, "profiles"), keep=2)
+
+    def test_disarmed_profiler_adds_nothing(self):
+        first = self.profiler.session("upload", "a.vpk")
+        self.assertIs(first, self.profiler.session("upload", "b.vpk"))
+        self.assertIs(profile_stage("build.extract"), profile_stage("validate.rules"))
+        with first as session:
+            self.assertIsNone(session)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(self.profiler.recent(), [])
+
+    def test_next_upload_records_stages_and_files(self):
+        self.profiler.arm(1)
+        with self.profiler.session("upload", "map.vpk") as session:
+            with profile_stage("validate.read_index"):
+                _work()
+            with profile_stage("build.repack"):
+                _work()
+            session.upload_ids.append(7)
+
+        self.assertEqual(self.profiler.status()["remaining"], 0)
+        self.assertFalse(tracemalloc.is_tracing())
+        with open(self.profiler.path_for(session.id, "json"), encoding="utf-8") as fh:
+            summary = json.load(fh)
+        self.assertEqual([stage["name"] for stage in summary["stages"]], ["validate.read_index", "build.repack"])
+        self.assertEqual(summary["upload_ids"], [7])
+        self.assertTrue(any("_work" in row["function"] for row in summary["stages"][0]["top_functions"]))
+        self.assertGreater(summary["peak_rss_bytes"], 0)
+        stats = pstats.Stats(self.profiler.path_for(session.id, "pstats"))
+        self.assertTrue(any(function == "_work" for _, _, function in stats.stats))
+
+        with self.profiler.session("upload", "next.vpk") as session:
+            self.assertIsNone(session)
+
+    def test_route_mode_matches_requests_and_keeps_latest(self):
+        self.profiler.arm(3, "/api/federation/*")
+        with self.profiler.session("upload", "direct.vpk") as session:
+            self.assertIsNone(session)
+        with self.profiler.session("request", "GET /healthz", path="/healthz") as session:
+            self.assertIsNone(session)
+        for _ in range(3):
+            with self.profiler.session("request", "POST", path="/api/federation/uploads") as outer:
+                with self.profiler.session("upload", "nested.vpk") as inner:
+                    self.assertIs(inner, outer)
+
+        self.assertFalse(self.profiler.status()["armed"])
+        self.assertEqual(len(self.profiler.recent()), 2)
+        with self.assertRaises(ValueError):
+            self.profiler.path_for("../../etc/pass", "json")
+        with self.assertRaises(ValueError):
+            self.profiler.arm(0)
+
+    def _request_functions(self, session) -> set[str]:
+        stats = pstats.Stats(self.profiler.path_for(session.id, "pstats"))
+        return {function for _, _, function in stats.stats}
+
+    def test_request_profile_covers_only_the_async_handler(self):
+        @profile_handler
+        async def endpoint():
+            for _ in range(3):
+                _handler_work()
+                await asyncio.sleep(0.01)
+
+        async def neighbour(stop):
+            while not stop.is_set():
+                _other_work()
+                await asyncio.sleep(0.001)
+
+        async def scenario():
+            stop = asyncio.Event()
+            other = asyncio.create_task(neighbour(stop))
+            with self.profiler.session("request", "GET /api/x", path="/api/x") as session:
+                await endpoint()
+            stop.set()
+            await other
+            return session
+
+        self.profiler.arm(1, "/api/*")
+        functions = self._request_functions(asyncio.run(scenario()))
+        self.assertIn("_handler_work", functions)
+        self.assertNotIn("_other_work", functions)
+
+    def test_request_profile_follows_sync_handler_into_threadpool(self):
+        @profile_handler
+        def endpoint():
+            return _handler_work()
+
+        async def scenario():
+            with self.profiler.session("request", "GET /api/y", path="/api/y") as session:
+                await asyncio.to_thread(endpoint)
+            return session
+
+        self.profiler.arm(1, "/api/*")
+        self.assertIn("_handler_work", self._request_functions(asyncio.run(scenario())))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from app.tracing import (
+    TRACEPARENT_HEADER,
+    JsonlExporter,
+    Tracer,
+    format_trace,
+    otlp_payload,
+    parse_traceparent,
+    spans_from_otlp,
+)
+
+
+class TracerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.path = os.path.join(self.tmp, "traces", "spans.jsonl")
+        self.tracer = Tracer()
+        self.tracer.configure(JsonlExporter(self.path), {"service.instance.id": "node-a"})
+
+    def test_disabled_tracer_shares_null_context(self):
+        tracer = Tracer()
+        self.assertIs(tracer.span("a"), tracer.span("b", peer="x"))
+        with tracer.span("upload.vpk") as span:
+            span.set(upload_id=1)
+            self.assertEqual(tracer.inject({}), {})
+        self.assertEqual(tracer.recent_traces(), [])
+
+    def test_spans_nest_across_tasks_and_threads_and_propagate(self):
+        upstream = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+        headers = {}
+
+        async def scenario():
+            with self.tracer.span("POST /api/federation/uploads", kind="server", parent=parse_traceparent(upstream)):
+                await asyncio.to_thread(self._stage, "upload.validate")
+                with self.tracer.span("lan.replicate", peer="node-b"):
+                    headers.update(self.tracer.inject({"Authorization": "Bearer x"}))
+                    await asyncio.gather(asyncio.sleep(0), asyncio.to_thread(self._stage, "lan.send"))
+
+        asyncio.run(scenario())
+        spans = self.tracer.trace("0af7651916cd43dd8448eb211c80319c")
+        by_name = {span["name"]: span for span in spans}
+        self.assertEqual(by_name["POST /api/federation/uploads"]["parent_span_id"], "b7ad6b7169203331")
+        self.assertEqual(by_name["lan.send"]["parent_span_id"], by_name["lan.replicate"]["span_id"])
+        self.assertEqual(parse_traceparent(headers[TRACEPARENT_HEADER]).span_id, by_name["lan.replicate"]["span_id"])
+        self.assertEqual(by_name["upload.validate"]["status"], "error")
+        self.assertIn("ValueError", by_name["upload.validate"]["error"])
+        tree = format_trace(spans)
+        self.assertTrue(tree[0].startswith("POST /api/federation/uploads "))
+        self.assertTrue(tree[1].startswith("  upload.validate ") and tree[1].endswith("!"))
+
+        # 写文件在后台线程里进行，关闭导出器会等它把队列写完
+        self.tracer.configure(None)
+        with open(self.path, encoding="utf-8") as fh:
+            written = [json.loads(line) for line in fh]
+        self.assertEqual(len(written), 4)
+        self.assertEqual(written[0]["resource"]["service.instance.id"], "node-a")
+        self.assertIsNone(parse_traceparent("00-" + "0" * 32 + "-b7ad6b7169203331-01"))
+        self.assertIsNone(parse_traceparent("garbage"))
+
+    def test_jsonl_export_only_enqueues(self):
+        exporter = JsonlExporter(os.path.join(self.tmp, "queued.jsonl"))
+        writers = []
+        write = exporter._write
+
+        def recording_write(sink, batch):
+            writers.append(threading.current_thread().name)
+            write(sink, batch)
+
+        exporter._write = recording_write
+        for index in range(3):
+            exporter.export({"name": f"span-{index}"})
+        exporter.close()
+        self.assertNotIn(threading.current_thread().name, writers)
+        with open(exporter.path, encoding="utf-8") as fh:
+            self.assertEqual([json.loads(line)["name"] for line in fh], ["span-0", "span-1", "span-2"])
+
+    def test_otlp_round_trip(self):
+        with self.tracer.span("lan.send", peer="node-b", size=12, ratio=0.5, resumed=True) as span:
+            span.fail("HTTP 507")
+        exported = self.tracer.trace(span.context.trace_id)
+        decoded = spans_from_otlp(otlp_payload(exported, {"service.instance.id": "node-a"}))
+        self.assertEqual(len(decoded), 1)
+        self.assertEqual(decoded[0]["attributes"], {"peer": "node-b", "size": 12, "ratio": 0.5, "resumed": True})
+        self.assertEqual(decoded[0]["status"], "error")
+        self.assertEqual(decoded[0]["error"], "HTTP 507")
+        self.assertEqual(decoded[0]["resource"], {"service.instance.id": "node-a"})
+        self.assertEqual(decoded[0]["span_id"], exported[0]["span_id"])
+
+    def _stage(self, name):
+        try:
+            with self.tracer.span(name):
+                if name == "upload.validate":
+                    raise ValueError("bad vpk")
+        except ValueError:
+            pass
+
+
+if __name__ == "__main__":
+    unittest.main()
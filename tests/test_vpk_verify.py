@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import vpk_reader
+from app.metrics import validation_failure_rules
+from app.vpk_reader import open_vpk, verify_vpk_crc
+from benchmarks.synthetic import SyntheticSpec, write_synthetic_vpk
+
+
+class VerifyVpkCrcTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.path = os.path.join(self.tmp, "map.vpk")
+        write_synthetic_vpk(SyntheticSpec(entries=80, median_bytes=2048, max_bytes=64 * 1024), self.path)
+        with open_vpk(self.path) as arch:
+            entries = sorted(
+                (int(metadata[4]), int(metadata[5]), str(path))
+                for path, metadata in arch.tree.items()
+                if metadata[5]
+            )
+        self.middle = entries[len(entries) // 2]
+        self.last = entries[-1]
+
+    def _corrupt(self, offset):
+        with open(self.path, "r+b") as fh:
+            fh.seek(offset)
+            byte = fh.read(1)
+            fh.seek(offset)
+            fh.write(bytes([byte[0] ^ 0xFF]))
+
+    def test_intact_archive_passes_serial_and_parallel(self):
+        self.assertEqual(verify_vpk_crc(self.path, workers=1), [])
+        self.assertEqual(verify_vpk_crc(self.path, workers=4), [])
+
+    def test_mismatch_reports_bad_entry(self):
+        offset, length, path = self.middle
+        self._corrupt(offset + length // 2)
+        original = vpk_reader.CRC_BATCH_BYTES
+        vpk_reader.CRC_BATCH_BYTES = 16 * 1024
+        self.addCleanup(setattr, vpk_reader, "CRC_BATCH_BYTES", original)
+
+        for workers in (1, 4):
+            bad = verify_vpk_crc(self.path, workers=workers)
+            self.assertEqual([item["path"] for item in bad], [path])
+            self.assertEqual(bad[0]["error"], "CRC32 不匹配")
+            self.assertNotEqual(bad[0]["expected_crc32"], bad[0]["actual_crc32"])
+        self.assertIn("crc32", validation_failure_rules({"crc_errors": bad}))
+
+    def test_truncated_archive_reports_missing_data(self):
+        offset, length, path = self.last
+        with open(self.path, "r+b") as fh:
+            fh.truncate(offset + length - 1)
+        bad = verify_vpk_crc(self.path)
+        self.assertEqual([item["path"] for item in bad], [path])
+        self.assertIn("截断", bad[0]["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()